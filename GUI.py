@@ -1,64 +1,63 @@
+import importlib.util
+import sys
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
 import serial.tools.list_ports
-import pandas as pd
 import numpy as np
-import serial
-import time
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-import random
-import pandas as pd
-from obspy.clients.fdsn import Client
-from obspy import UTCDateTime
-from obspy.geodetics import gps2dist_azimuth
+from shakebot import compensation, iris, preprocess, pulses, stations, telemetry
+from shakebot.archive import Archive
+from shakebot.device import INTERPOLATION_MODES, MOTION_COMPLETED, Shakebot, record_sample_rate
+from shakebot.feasibility import describe, make_feasible
+from shakebot.multichannel import MultiChannelRecord
+from shakebot.plotting import RecordPlot
+from shakebot.records import RECORD_FILETYPES, load_record
+from shakebot.serial_worker import SerialWorker
+from shakebot.signals import random_ground_motion
 
 # Initialize global variables
 displacement_data = np.array([])  # Array to store displacement data
-arduino = None
-fig = None
-canvas = None
+table = Shakebot()  # Table parameters (pulse/rev, max RPM, lead, max acceleration, total length)
+serial_worker = None  # Background thread that owns the serial port once connected
+record_plot = None  # Persistent plot; see shakebot.plotting.RecordPlot
+station_record = None  # All channels of the last IRIS download; see shakebot.multichannel
 connected = False  # Track connection status
+telemetry_on = False  # Whether the controller streams accelerometer samples during START (SET_TELEMETRY)
+recorded_data = None  # Record being played while the accelerometer is recorded
 sample_rate = 100  # Default sample rate
-
-pulsePerRev = 200 # Number of steps per revolution
-maxRPM = 1200 # Increase maximum speed in RPM
-lead = 0.02 # Distance traveled per revolution in meters
-maxAcceleration = 5.1 # Maximum acceleration in g
-totalLength = 0.6 # Total length of the shakebot in meters
+experiment_archive = None  # Opened on the first archived run; see shakebot.archive
+current_run = None  # Archive run of the motion in progress
+motion_completed = None  # Completion line of the current run, kept until its accelerometer capture is closed
+capture_pending = False  # Whether the current run waits for its accelerometer capture before it is finished
+record_source = {"source": None, "metadata": {}}  # Where displacement_data came from, stored with archived runs
+PULSE_TYPES = {"Cosine": "cosine", "Tapered Sine": "tapered-sine", "Ricker": "ricker",
+               "Mavroeidis-Papageorgiou": "mp"}  # Pulse shapes offered in Option 1
 
 
-# Function to list available COM ports
+# Function to list available COM ports, plus any given on the command line (e.g. a simulator pty)
 def list_ports():
     ports = serial.tools.list_ports.comports()
-    return [port.device for port in ports]
+    return [port.device for port in ports] + sys.argv[1:]
 
 # Function to toggle connection to Arduino (connect or disconnect)
 def connect_arduino():
-    global arduino, connected
+    global table, serial_worker, connected
     com_port = com_var.get()  # Get the selected COM port
     baud_rate = baud_var.get()  # Get the selected baud rate
 
     if not connected:  # If not connected, try to connect
         try:
-            # Step 1: Connect to Arduino using the selected baud rate
-            arduino = serial.Serial(com_port, baudrate=int(baud_rate), timeout=1)
+            # Step 1: Connect, switch the Arduino to the selected baud rate and send the shakebot parameters
+            table = Shakebot.connect(com_port, int(baud_rate), board=table.board, **table.parameters)
             messagebox.showinfo("Connection", f"Connected to {com_port} at {baud_rate} baud rate.")
 
-            # Step 2: Send the new baud rate to the Arduino
-            arduino.write(f"BR:{baud_rate}\n".encode())  # Send "BR:<new_baud_rate>" command
-
-            # Step 3: Reconnect with the new baud rate
-            time.sleep(0.1)  # Short delay to ensure the Arduino receives the baud rate change
-            arduino.close()  # Close the current connection
-            arduino = serial.Serial(com_port, baudrate=int(baud_rate), timeout=1)  # Reopen with the new baud rate
-
-            # Step 4: Send the shakebot parameters to Arduino
-            send_parameters()
+            # Step 2: From here on the serial worker thread owns the port
+            serial_worker = SerialWorker(table.port)
+            serial_worker.start()
 
-            # Step 5: Update the status and button
+            # Step 3: Update the status and button
             connected = True
             update_status_light("green")  # Change status light to green
             connect_button.config(text="Disconnect")  # Update button text to "Disconnect"
@@ -68,44 +67,80 @@ def connect_arduino():
         except Exception as e:
             messagebox.showerror("Error", f"Failed to connect: {e}")
     else:  # If already connected, disconnect
-        if arduino:
-            arduino.close()  # Close the connection
+        finish_run("cancelled")
+        if serial_worker:
+            serial_worker.stop()  # Stop the worker thread and close the connection
+            serial_worker = None
+        table.port = None
         messagebox.showinfo("Disconnection", "Arduino disconnected.")
         connected = False
         update_status_light("red")  # Change status light back to red
         connect_button.config(text="Connect to Arduino")  # Update button text to "Connect to Arduino"
 
-def send_parameters():
-    global arduino
-    try:
-        # Create a parameter string in the format:
-        # SET_PARAMS pulsePerRev=<value> maxRPM=<value> lead=<value> maxAcceleration=<value> totalLength=<value>
-        param_str = f"SET_PARAMS pulsePerRev={pulsePerRev} maxRPM={maxRPM} lead={lead} maxAcceleration={maxAcceleration} totalLength={totalLength}\n"
-        arduino.write(param_str.encode())
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to send parameters: {e}")
-
-# Function to read serial data from Arduino and display it in the text widget
+# Function to drain the serial worker's queue and display the received lines in the text widget
 def read_serial_data():
-    if arduino and arduino.is_open:
-        try:
-            data = arduino.readline().decode('utf-8').strip()  # Read a line of serial data
-            if data:
-                serial_text.insert(tk.END, data + "\n")  # Insert the data into the Text widget
-                serial_text.see(tk.END)  # Scroll to the end of the Text widget
-        except Exception as e:
-            print(f"Error reading serial data: {e}")
-
-    # Call this function again after 100 ms to continuously check for new serial data
+    if serial_worker:
+        lines = []
+        for kind, value in serial_worker.drain():
+            if kind == "line":
+                lines.append(value)
+            elif kind == "done":
+                # A queued job finished; run its callback on the GUI thread
+                on_done, result, error = value
+                if on_done:
+                    on_done(result, error)
+            elif kind == "telemetry":
+                lines.append(report_telemetry(value))
+            elif kind == "error":
+                print(f"Error reading serial data: {value}")
+        if lines and current_run is not None:
+            archive_lines(lines)
+        if lines:
+            serial_text.insert(tk.END, "\n".join(lines) + "\n")  # Insert the whole batch at once
+            serial_text.see(tk.END)  # Scroll to the end of the Text widget
+
+    # Call this function again after 50 ms to continuously check for new serial data
     if connected:
-        serial_text.after(100, read_serial_data)
+        serial_text.after(50, read_serial_data)
+
+# Function to close a finished accelerometer capture and compare it with the record that was played
+def report_telemetry(recorder):
+    samples = recorder.close()
+    try:
+        report = telemetry.acceleration_report(samples, recorded_data, meters_per_step=table.lead / table.pulse_per_rev)
+    except ValueError:
+        report = None
+    finish_run("done", motion_completed, report["peak_measured"] if report else None)
+    return f"{telemetry.describe(recorder.stats, report)}. Saved to {recorder.path}."
+
+# Function to store controller lines with the archived run; the run ends with the motion unless a capture is pending
+def archive_lines(lines):
+    global motion_completed
+    current_run.log(lines)
+    completed = next((line for line in lines if MOTION_COMPLETED in line), None)
+    if completed:
+        motion_completed = completed
+        if not capture_pending:
+            finish_run("done", completed)
+
+# Function to close the archived run, if one is in progress
+def finish_run(status, completed=None, measured_pga=None):
+    global current_run
+    if current_run is not None:
+        current_run.finish(status, completed, measured_pga)
+        current_run = None
+
+# Function to remember where the current record came from, for the experiment archive
+def set_record_source(source, **metadata):
+    global record_source
+    record_source = {"source": source, "metadata": metadata}
 
 # Function to update the status light
 def update_status_light(color):
     status_light.delete("all")  # Clear existing content
     status_light.create_oval(10, 10, 30, 30, fill=color)  # Draw circle with the specified color
 
-# Function to generate cosine displacement data
+# Function to generate cosine displacement data, or another pulse shape from shakebot.pulses
 def generate_cosine_displacement():
     global displacement_data
     try:
@@ -117,124 +152,85 @@ def generate_cosine_displacement():
             messagebox.showerror("Error", "Peak Ground Acceleration cannot be zero.")
             return
 
-        PGV_2_PGA = pgv / pga
-        F = 1./(2*np.pi*PGV_2_PGA)
-        A = 9.807*pga/(4*np.pi**2*F**2)
-        T = 1./F
-        global sample_rate
-        # Generate time vector and scale it to the period
-        time_steps = np.linspace(0, T * cycle_number, int(sample_rate * cycle_number * T))
-        # Generate cosine displacement using the provided parameters: D = A - A*cos(2*pi*t/T)
-        displacement_data = A - A * np.cos(2 * np.pi * time_steps / T)
-        # combine the time steps and displacement data
-        displacement_data = np.column_stack((time_steps, displacement_data))
+        # Every shape, including the cosine displacement D = A - A*cos(2*pi*t/T), peaks at the entered PGV (m/s)
+        # and PGA (g), so the pulse is the one PulseGrid plans for
+        displacement_data = pulses.pulse(PULSE_TYPES[pulse_var.get()], pgv, pga, cycle_number, sample_rate)
+        set_station_record(None)
+        set_record_source(f"{pulse_var.get()} pulse", pgv=pgv, pga=pga, cycles=cycle_number)
         plot_data(displacement_data)
     except ValueError:
         messagebox.showerror("Error", "Please enter valid numerical values for the parameters.")
 
-# Function to load CSV ground motion displacement file
+# Function to load a ground motion displacement file (CSV, NumPy, Parquet, HDF5 or MiniSEED)
 def load_csv_file():
     global displacement_data
-    file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
+    file_path = filedialog.askopenfilename(filetypes=RECORD_FILETYPES)
     if file_path:
         try:
-            # Load the CSV file using pandas
-            df = pd.read_csv(file_path)
-
-            # Clean up the headers in case there are extra spaces or invisible characters
-            df.columns = df.columns.str.strip()
-
-            # Try to match the columns more flexibly (ignoring spaces and casing issues)
-            possible_time_columns = [col for col in df.columns if "time" in col.lower()]
-            possible_displacement_columns = [col for col in df.columns if "displacement" in col.lower()]
-
-            # Check if we found valid columns
-            if not possible_time_columns or not possible_displacement_columns:
-                messagebox.showerror("Error", "Required columns not found.")
-                return
-
-            # Use the first matching columns
-            time_column = possible_time_columns[0]
-            displacement_column = possible_displacement_columns[0]
-
-            # Extract time and displacement values
-            time = df[time_column].values
-            displacement = df[displacement_column].values
-
-            # Combine time and displacement into a 2D array
-            displacement_data = np.column_stack((time, displacement))
+            # Load the time and displacement columns into a 2D array, resampled to the playback rate
+            # and cut to the most energetic part that fits the controller buffer
+            pieces, info = preprocess.prepare_record(load_record(file_path), sample_rate, table.buffer_size,
+                                                     fit="strongest")
+            displacement_data = pieces[0]
+            set_station_record(None)
+            set_record_source(file_path, preprocess=info)
+            serial_text.insert(tk.END, f"Loaded {file_path}: {preprocess.describe(info)}\n")
+            serial_text.see(tk.END)
 
             # Plot the loaded data
             plot_data(displacement_data)
             
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load CSV: {e}")
-
-
-def convert_displacement_to_steps(displacement):
-    """
-    Convert displacement in meters to motor steps.
-
-    Args:
-        displacement (float or np.ndarray): Displacement(s) in meters.
-
-    Returns:
-        int or np.ndarray: Corresponding motor step count(s).
-    """
-    return (displacement / lead * pulsePerRev).astype(int) if isinstance(displacement, np.ndarray) else int(displacement / lead * pulsePerRev)
-
+            messagebox.showerror("Error", f"Failed to load file: {e}")
 
 
 # Function to send data to Arduino with confirmation before starting the experiment
 def send_data():
-    global displacement_data
+    global displacement_data, telemetry_on
     # Check if there is data to send
     if displacement_data.size == 0:
         messagebox.showwarning("No Data", "No data to send. Please generate or load ground motion data.")
         return
 
     try:
-        # Extract all displacement values from the second column (index 1)
-        displacements = displacement_data[:, 1]
-
-        # if displacement exceeds the total length of the shakebot [-0.6, 0.6], show an error message
-        if np.any(np.abs(displacements) > totalLength):
-            messagebox.showerror("Error", "Displacement exceeds the maximum limit. Please reduce the displacement.")
-
-        # Convert all displacements to step counts
-        steps_all = convert_displacement_to_steps(displacements)
-
-        # Ensure steps_all is a NumPy array for vectorized operations
-        steps_all = np.array(steps_all)
+        # Check speed and acceleration; AccelStepper would otherwise clip an infeasible record silently
+        report = table.check_record(displacement_data)
+        if not report["feasible"]:
+            answer = messagebox.askyesnocancel(
+                "Record Exceeds Table Limits",
+                describe(report) + "\n\nLow-pass filter and scale the record so it fits before sending?\n"
+                "(No sends the record unchanged.)")
+            if answer is None:
+                return
+            if answer:
+                displacement_data, _ = make_feasible(displacement_data, table.limits)
+                plot_data(displacement_data)
 
-        # Check if any step count exceeds Arduino's int limit
-        if np.any(np.abs(steps_all) > 2147483647):
-            messagebox.showerror("Error", "Displacement exceeds the maximum limit. Please reduce the displacement.")
+        # Check the displacement limits and convert all displacements to step counts
+        try:
+            steps_all = table.record_to_steps(displacement_data)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
             return
 
-        if arduino and arduino.is_open:
-            # Send the step counts to Arduino
-            for steps in steps_all:
-                arduino.write(f"{steps}\n".encode())
-                # Wait for acknowledgment (optional, based on Arduino implementation)
-                # ack = arduino.readline().decode().strip()
-                # if ack != "STEP_RECEIVED":
-                #     messagebox.showwarning("Warning", f"Unexpected acknowledgment: {ack}")
-                #     break
-                time.sleep(0.001)  # 1 ms delay for high baud rates
-
-            # After sending all step counts, prompt for confirmation to start the experiment
-            response = messagebox.askyesno(
-                "Confirmation",
-                "Data sent to Arduino successfully.\nDo you want to start the experiment?"
-            )
-
-            if response:
-                # User confirmed to start the experiment
-                arduino.write("START\n".encode())
-            else:
-                # User canceled the experiment start
-                arduino.write("CANCEL\n".encode())
+        if serial_worker and serial_worker.is_alive():
+            # The upload runs on the serial worker thread; confirm_start is called once it is done.
+            # SET_PLAYBACK goes first so the controller plays the record at its own sample rate.
+            binary = upload_var.get() == "Binary"
+            table.interpolation = playback_var.get().lower()  # ValueError if the board cannot play it
+            rate = record_sample_rate(displacement_data)
+            # SET_TELEMETRY follows when the accelerometer should be recorded, or to switch it off again
+            telemetry_rate = telemetry.DEFAULT_TELEMETRY_RATE if acceleration_var.get() else 0
+            switch_telemetry = telemetry_rate or telemetry_on
+            telemetry_on = bool(telemetry_rate)
+
+            def job(port):
+                stats = table.with_port(port).upload(steps_all, binary=binary, sample_rate=rate)
+                if switch_telemetry:
+                    table.with_port(port).set_telemetry(telemetry_rate)
+                return stats
+
+            serial_worker.submit(job, on_done=confirm_start)
         else:
             messagebox.showerror("Error", "Arduino is not connected.")
 
@@ -242,66 +238,156 @@ def send_data():
         messagebox.showerror("Error", f"Failed to send data: {e}")
 
 
+# Function to play the record repeatedly and correct the drive signal until the table reproduces it (Due only)
+def compensate_data():
+    global telemetry_on
+    if displacement_data.size == 0:
+        messagebox.showwarning("No Data", "No data to compensate. Please generate or load ground motion data.")
+        return
+    if not (serial_worker and serial_worker.is_alive()):
+        messagebox.showerror("Error", "Arduino is not connected.")
+        return
+    try:
+        table.interpolation = playback_var.get().lower()
+    except ValueError as e:
+        messagebox.showerror("Error", str(e))
+        return
+    if not messagebox.askyesno("Compensate Drive Signal",
+                               f"The record will be played up to {compensation.DEFAULT_ITERATIONS} times while the "
+                               "step positions are recorded.\nMake sure the table is clear. Continue?"):
+        return
+
+    target = displacement_data
+    binary = upload_var.get() == "Binary"
+    telemetry_on = True  # The plays leave the accelerometer stream on; the next send switches it as needed
+
+    def job(port):
+        def progress(entry):
+            port.forward(f"Compensation play {entry['iteration'] + 1}: NRMSE {entry['nrmse']:.2%}, "
+                         f"RMS error {entry['rms_error'] * 1000:.2f} mm")
 
-# Function to plot the displacement data or display an empty canvas
-def plot_data(data=None):
-    global fig, canvas
-    # Clear the figure if it exists
-    if fig:
-        fig.clf()
-
-    # Create a new figure and plot the data or an empty plot
-    fig = plt.Figure(figsize=(5, 4), dpi=100)
-    ax = fig.add_subplot(111)
-    
-    if data is None:
-        # Display empty plot with title only
-        ax.set_title('Ground Motion')
-        ax.set_xlabel('Time Steps')
-        ax.plot([], [])  # Empty plot
-        # set axis limits 0 to 60 seconds
-        ax.set_xlim(0, 60)
+        plant = compensation.table_plant(table.with_port(port), binary=binary)
+        return compensation.compensate(target, plant, limits=table.limits, on_iteration=progress)
+
+    serial_worker.submit(job, on_done=finish_compensation)
+
+# Function to replace the record with the compensated drive signal once the iterations have finished
+def finish_compensation(result, error):
+    global displacement_data
+    if error:
+        messagebox.showerror("Error", f"Compensation failed: {error}")
+        return
+    drive, info = result
+    displacement_data = drive
+    set_record_source("compensated drive", target=record_source["source"], nrmse=info["nrmse"],
+                      iterations=info["iterations"], **record_source["metadata"])
+    plot_data(displacement_data)
+    status = "converged" if info["converged"] else f"best of {info['iterations']} plays"
+    serial_text.insert(tk.END, f"Compensated drive signal ready (NRMSE {info['history'][0]['nrmse']:.2%} -> "
+                               f"{info['nrmse']:.2%}, {status}). Send it to play it.\n")
+    serial_text.see(tk.END)
+
+
+# Function to prompt for confirmation to start the experiment once the upload has finished
+def confirm_start(stats, error):
+    global recorded_data, experiment_archive, current_run, capture_pending, motion_completed
+    if error:
+        messagebox.showerror("Error", f"Failed to send data: {error}")
+        return
+
+    if stats["frames"]:
+        serial_text.insert(tk.END, f"Uploaded {stats['samples']} samples in {stats['seconds']:.2f} s "
+                                   f"({stats['retransmissions']} retransmissions).\n")
+        serial_text.see(tk.END)
+
+    response = messagebox.askyesno(
+        "Confirmation",
+        "Data sent to Arduino successfully.\nDo you want to start the experiment?"
+    )
+
+    if response:
+        # Keep the record, its source and everything the controller and accelerometer report in the archive
+        finish_run("cancelled")
+        on_samples = None
+        if archive_var.get():
+            try:
+                experiment_archive = experiment_archive or Archive()
+                current_run = experiment_archive.start_run(
+                    displacement_data, table.record_to_steps(displacement_data), table_name=com_var.get(),
+                    board=table.board, parameters=table.parameters, source=record_source["source"],
+                    metadata=record_source["metadata"])
+                on_samples = lambda samples, run=current_run: run.append("telemetry", samples)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to archive the run: {e}")
+        motion_completed = None
+        capture_pending = acceleration_var.get()
+        # User confirmed to start the experiment; the accelerometer samples go straight to a memory-mapped file
+        if acceleration_var.get():
+            recorded_data = displacement_data
+            duration = len(displacement_data) / record_sample_rate(displacement_data)
+            path = f"acceleration_{time.strftime('%Y%m%d_%H%M%S')}.npy"
+            serial_worker.record(telemetry.TelemetryRecorder.for_record(duration, path=path, on_samples=on_samples))
+        serial_worker.write("START\n")
     else:
-        # Plot the provided data
-        time_steps = data[:, 0]
-        displacement = data[:, 1]
-        ax.plot(time_steps, displacement)
-        ax.set_title('Ground Motion Displacement')
-        ax.set_xlabel('Time Steps (s)')
-        ax.set_ylabel('Displacement (m)')
+        # User canceled the experiment start
+        serial_worker.write("CANCEL\n")
 
 
-    # add grid with minor ticks and dashed lines
-    ax.grid(which='both', linestyle='--')
 
-    # If the canvas already exists, remove it and update with a new plot
-    if canvas:
-        canvas.get_tk_widget().destroy()
+# Function to plot the displacement data or display an empty plot
+def plot_data(data=None):
+    global record_plot
+    # Create the figure once; later calls only replace the line data
+    if record_plot is None:
+        record_plot = RecordPlot(plot_frame)
+    record_plot.set_data(data)
+
+    # Report speed and acceleration violations as soon as a record is loaded
+    if data is not None and len(data):
+        serial_text.insert(tk.END, describe(table.check_record(data)) + "\n")
+        serial_text.see(tk.END)
+
+# Function to remember the channels of a downloaded station record and offer them in the component menu
+def set_station_record(record):
+    global station_record
+    station_record = record
+    if record is None:
+        component_var.set("")
+        component_combobox.config(values=[], state="disabled")
+        return
+    # Channels as recorded, north/east/vertical, radial/transverse, or any azimuth typed in degrees
+    components = list(record.channels) + ["N", "E", "R", "T"]
+    component_combobox.config(values=components, state="normal")
+    component_var.set(record.channels[0])
 
-    canvas = FigureCanvasTkAgg(fig, master=plot_frame)
-    canvas.draw()
-    canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+# Function to plot the selected component of the downloaded station record
+def select_component(event=None):
+    global displacement_data
+    if station_record is None:
+        return
+    component = component_var.get().strip()
+    try:
+        displacement_data = station_record.component(component)
+    except (KeyError, ValueError):
+        messagebox.showerror("Error", f"Unknown component '{component}'. Use a channel, N, E, R, T or an azimuth.")
+        return
+    record_source["metadata"]["component"] = component
+    plot_data(displacement_data)
 
 def send_displacement():
-    global arduino
-    if arduino and arduino.is_open:
+    if serial_worker and serial_worker.is_alive():
         displacement = displacement_slider.get()
-        displacement = convert_displacement_to_steps(displacement / 1000.0)
+        displacement = table.displacement_to_steps(displacement / 1000.0)
         # First, write displacement to arduino and then send the command
-        arduino.write(f"{displacement}\n".encode())
-        time.sleep(0.1)
-        arduino.write("SET_DISPLACEMENT\n".encode())
+        serial_worker.submit(lambda port: table.with_port(port).set_displacement(displacement))
     else:
         messagebox.showerror("Error", "Arduino is not connected.")
 
 def calibrate_displacement():
-    global arduino
-    if arduino and arduino.is_open:
+    if serial_worker and serial_worker.is_alive():
         displacement = displacement_slider.get()
-        displacement = convert_displacement_to_steps(displacement / 1000.0)
-        arduino.write(f"{displacement}\n".encode())
-        time.sleep(0.1)
-        arduino.write("CALIBRATE_DISPLACEMENT\n".encode())
+        displacement = table.displacement_to_steps(displacement / 1000.0)
+        serial_worker.submit(lambda port: table.with_port(port).calibrate(displacement))
         messagebox.showinfo("Displacement Calibration", "Calibration started. Please wait for the process to complete.")
     else:
         messagebox.showerror("Error", "Arduino is not connected.")
@@ -314,96 +400,40 @@ def download_iris_data():
             duration = float(duration_entry.get())
             if duration <= 0:
                 raise ValueError("Duration must be a positive number.")
-            
-            # Initialize a client to download data from IRIS
-            client = Client("IRIS")
 
-            # Define a random time range for event search (past 5 years)
-            end_time = UTCDateTime()  # Current time
-            start_time = end_time - (365 * 5 * 24 * 60 * 60)  # 5 years ago
-
-            # Fetch random events in the given time range (min magnitude 6.0 for example)
-            cat = client.get_events(starttime=start_time, endtime=end_time, minmagnitude=6.0, limit=50)
-            
-            if not cat:
-                messagebox.showerror("Error", "No events found in the specified time range.")
-                return
-
-            # Randomly select an event from the fetched catalog
-            event = random.choice(cat)
-            origin = event.origins[0]
-            event_time = origin.time
-            eq_lat = origin.latitude
-            eq_lon = origin.longitude
-            eq_depth = origin.depth / 1000  # Depth in km
-            magnitude = event.magnitudes[0].mag
-
-            print(f"Random Event Selected: Time: {event_time}, Lat: {eq_lat}, Lon: {eq_lon}, Depth: {eq_depth} km, Mag: {magnitude}")
-
-            # Define the station details (ANMO as an example)
-            network = "IU"
-            station = "ANMO"
-            location = "00"
-            # Fetch only horizontal components BH1 and BH2
-            channels = ["BH1", "BH2"]
-            inv = client.get_stations(network=network, station=station, level="station")
-            station_lat = inv[0][0].latitude
-            station_lon = inv[0][0].longitude
-
-            # Calculate the distance between the earthquake and the station (in meters)
-            distance_m, az, baz = gps2dist_azimuth(eq_lat, eq_lon, station_lat, station_lon)
-            distance_km = distance_m / 1000  # Convert to kilometers
-
-            # Assume an average P-wave velocity of 6 km/s
-            p_wave_velocity = 6.0  # km/s
-
-            # Calculate the P-wave travel time (distance / velocity)
-            p_wave_travel_time = distance_km / p_wave_velocity
-            p_wave_arrival_time = event_time + p_wave_travel_time
-
-            # Define the pre-filter for response removal (this should match the frequency range of interest)
-            pre_filt = (0.01, 0.02, 30.0, 35.0)  # Lowpass and highpass filter corner frequencies
-
-            # Download waveform data for horizontal components (BH1 and BH2)
-            start_time = event_time
-            end_time = p_wave_arrival_time + duration  # Dynamic duration based on user input
-            st = client.get_waveforms(network, station, location, ",".join(channels), start_time, end_time)
-
-            # Download the instrument response information
-            inv = client.get_stations(network=network, station=station, location=location, 
-                                      channel="BH*", starttime=start_time, endtime=end_time, level="response")
-
-            # Remove the instrument response to convert the raw data to acceleration (m/s²)
-            st.remove_response(inventory=inv, output="ACC", pre_filt=pre_filt)
-
-            # Convert acceleration to displacement by performing double integration
-            st_disp = st.copy()
-            st_disp.integrate()  # First integration to get velocity
-            st_disp.integrate()  # Second integration to get displacement
-
-            # Resample the data to 100 Hz (if the original sampling rate is different)
-            target_sampling_rate = 100.0  # Desired frequency in Hz
-            for tr in st_disp:
-                tr.resample(sampling_rate=target_sampling_rate)
-
-            # Trim the waveform to the duration after the P-wave arrival
-            for tr in st_disp:
-                tr.trim(starttime=p_wave_arrival_time, endtime=p_wave_arrival_time + duration)
-
-            # Prepare the horizontal displacement data for plotting (BH1 and BH2)
-            displacement_data_ = []
-            for tr in st_disp:
-                time = tr.times(reftime=p_wave_arrival_time)
-                displacement = tr.data
-                displacement_data_.append([time, displacement])
+            # Optional distance limit; the record then comes from the nearest station instead of IU.ANMO
+            max_km = float(distance_entry.get()) if distance_entry.get().strip() else None
+            if max_km is not None and max_km <= 0:
+                raise ValueError("Distance must be a positive number.")
+
+            # Download (or load from the local cache) a random M6+ event from the past 5 years,
+            # processed to displacement after the P-wave arrival
+            client = iris.default_client(offline=offline_var.get())
+            # The station index must already be in the cache; the worldwide inventory is too slow for the UI
+            station_index = stations.load_index(client, update=False) if max_km is not None else None
+            event, record = iris.fetch_random_event(client, duration, channels=iris.ALL_CHANNELS,
+                                                    stations=station_index, max_km=max_km)
+            client.cache.close()
+
+            # Remove the drift left by the double integration and fit the record to the controller buffer
+            pieces, _ = preprocess.prepare_record(record.data, sample_rate, table.buffer_size, fit="strongest",
+                                                  baseline=2, taper_seconds=1.0)
+            record = MultiChannelRecord(pieces[0], record.channels, record.orientations, record.back_azimuth)
+
+            print(f"Random Event Selected: Time: {event['time']}, Lat: {event['latitude']}, "
+                  f"Lon: {event['longitude']}, Depth: {event['depth_km']} km, Mag: {event['magnitude']}")
+            print(f"Station: {event['network']}.{event['station']}.{event['location']}, "
+                  f"Distance: {event['distance_km']:.1f} km")
 
             # Close the window
             new_window.destroy()
 
-            # Combine the time and displacement data into a single array for plotting
-            combined_displacement_data = np.column_stack(displacement_data_[0])  # Assume plotting BH1 channel
-            plot_data(combined_displacement_data)
-            displacement_data = combined_displacement_data
+            # Plot the BH1 channel; the component menu switches to other channels or rotations
+            set_station_record(record)
+            displacement_data = record.channel("BH1")
+            set_record_source("iris", **dict(event, event_id=event["resource_id"], component="BH1",
+                                             station=f"{event['network']}.{event['station']}.{event['location']}"))
+            plot_data(displacement_data)
 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to download and process data: {e}")
@@ -411,13 +441,22 @@ def download_iris_data():
     # Create a new window for the user to input the duration
     new_window = tk.Toplevel(root)
     new_window.title("Download IRIS Data")
-    new_window.geometry("300x150")
+    new_window.geometry("300x240")
 
     # Label and entry for the duration input
     tk.Label(new_window, text="Enter Duration (seconds):").pack(pady=10)
     duration_entry = tk.Entry(new_window)
     duration_entry.pack(pady=5)
 
+    # Entry for the largest epicentral distance; leave it empty to use IU.ANMO
+    tk.Label(new_window, text="Nearest Station Within (km, optional):").pack()
+    distance_entry = tk.Entry(new_window)
+    distance_entry.pack(pady=5)
+
+    # Checkbox to use only data already in the local cache
+    offline_var = tk.BooleanVar(new_window, value=False)
+    tk.Checkbutton(new_window, text="Offline (cached data only)", variable=offline_var).pack()
+
     # Button to start the data download process
     fetch_button = tk.Button(new_window, text="Download Data", command=fetch_iris_data)
     fetch_button.pack(pady=10)
@@ -434,35 +473,11 @@ def generate_random_data():
             if duration >= 150:
                 raise ValueError("Duration must be less than 150 seconds.")
             
-            # Parameters for the synthetic ground motion
-            sampling_rate = 100  # Sampling rate in Hz (100 samples per second)
-            time = np.arange(0, duration, 1/sampling_rate)  # Time array
-
-            # Generate random frequencies and amplitudes
-            num_frequencies = np.random.randint(3, 6)  # Random number of frequency components (between 3 and 5)
-            frequencies = np.random.uniform(0.5, 5.0, num_frequencies)  # Frequencies between 0.5 Hz and 5 Hz
-            amplitudes = np.random.uniform(0.01, 0.05, num_frequencies)  # Amplitudes between 0.01 and 0.05 meters
-
-            # Generate random phase shifts
-            phases = np.random.uniform(0, 2 * np.pi, num_frequencies)
-
-            # Generate a synthetic displacement signal with random frequencies, amplitudes, and phases
-            displacement = np.zeros_like(time)
-            for freq, amp, phase in zip(frequencies, amplitudes, phases):
-                displacement += amp * np.sin(2 * np.pi * freq * time + phase)
-
-            # Add a decaying envelope to simulate how seismic waves taper off over time
-            decay_rate = np.random.uniform(0.01, 0.05)  # Random decay rate between 0.01 and 0.05
-            envelope = np.exp(-decay_rate * time)
-            displacement *= envelope
-
-            # Add random noise to simulate real-world variability
-            noise_amplitude = np.random.uniform(0.002, 0.01)  # Random noise amplitude between 0.002 and 0.01
-            displacement += noise_amplitude * np.random.randn(len(time))
-
-            # Combine time and displacement into a 2D array
+            # Generate the synthetic ground motion as a 2D array of time and displacement
             global displacement_data
-            displacement_data = np.column_stack((time, displacement))
+            displacement_data = random_ground_motion(duration)
+            set_station_record(None)
+            set_record_source("random ground motion", duration=duration)
 
             # Close the window
             new_window.destroy()
@@ -570,7 +585,7 @@ def main():
     velocity_entry = tk.Entry(control_frame)
     velocity_entry.grid(row=10, column=1, padx=10, pady=5, sticky="ew")
 
-    tk.Label(control_frame, text="Peak Ground Acceleration (m/s^2):").grid(row=11, column=0, padx=10, pady=5, sticky="ew")
+    tk.Label(control_frame, text="Peak Ground Acceleration (g):").grid(row=11, column=0, padx=10, pady=5, sticky="ew")
     global acceleration_entry
     acceleration_entry = tk.Entry(control_frame)
     acceleration_entry.grid(row=11, column=1, padx=10, pady=5, sticky="ew")
@@ -580,9 +595,16 @@ def main():
     cycles_entry = tk.Entry(control_frame)
     cycles_entry.grid(row=12, column=1, padx=10, pady=5, sticky="ew")
 
-    # Button to generate cosine displacement
-    generate_button = tk.Button(control_frame, text="Generate Cosine Displacement", command=generate_cosine_displacement)
-    generate_button.grid(row=13, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+    # Dropdown menu for the pulse shape, next to the button that generates it
+    global pulse_var
+    pulse_var = tk.StringVar(control_frame)
+    pulse_var.set("Cosine")  # Default pulse shape
+    pulse_dropdown = tk.OptionMenu(control_frame, pulse_var, *PULSE_TYPES)
+    pulse_dropdown.grid(row=13, column=0, padx=10, pady=5, sticky="ew")
+
+    # Button to generate the pulse displacement
+    generate_button = tk.Button(control_frame, text="Generate Pulse Displacement", command=generate_cosine_displacement)
+    generate_button.grid(row=13, column=1, padx=10, pady=5, sticky="ew")
 
     # Divider for Option 2
     ttk.Separator(control_frame, orient="horizontal").grid(row=14, column=0, columnspan=2, sticky="ew", padx=10, pady=5)
@@ -597,13 +619,58 @@ def main():
     random_button.grid(row=16, column=1, columnspan=1, padx=10, pady=5, sticky="ew")
 
     # Button to load CSV ground motion file (Option 2)
-    load_button = tk.Button(control_frame, text="Load CSV Ground Motion File", command=load_csv_file)
+    load_button = tk.Button(control_frame, text="Load Ground Motion File", command=load_csv_file)
     load_button.grid(row=17, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
 
+    # Component of a downloaded station record: a channel, N/E/Z, R/T or an azimuth in degrees
+    tk.Label(control_frame, text="Component:").grid(row=18, column=0, padx=10, pady=5, sticky="ew")
+    global component_var, component_combobox
+    component_var = tk.StringVar(control_frame)
+    component_combobox = ttk.Combobox(control_frame, textvariable=component_var, state="disabled")
+    component_combobox.grid(row=18, column=1, padx=10, pady=5, sticky="ew")
+    component_combobox.bind("<<ComboboxSelected>>", select_component)
+    component_combobox.bind("<Return>", select_component)
+
     # Button to send data to Arduino
-    ttk.Separator(control_frame, orient="horizontal").grid(row=18, column=0, columnspan=2, sticky="ew", padx=10, pady=5)
+    ttk.Separator(control_frame, orient="horizontal").grid(row=19, column=0, columnspan=2, sticky="ew", padx=10, pady=5)
+
+    # Dropdown menu for upload mode: ASCII lines or binary frames
+    tk.Label(control_frame, text="Upload Mode:").grid(row=20, column=0, padx=10, pady=5, sticky="ew")
+    global upload_var
+    upload_var = tk.StringVar(control_frame)
+    upload_var.set("Binary")  # Default upload mode
+    upload_dropdown = tk.OptionMenu(control_frame, upload_var, "ASCII", "Binary")
+    upload_dropdown.grid(row=20, column=1, padx=10, pady=5, sticky="ew")
+
+    # Dropdown menu for playback: one target per sample, or interpolated at the 1 kHz control rate (Due only)
+    tk.Label(control_frame, text="Playback:").grid(row=21, column=0, padx=10, pady=5, sticky="ew")
+    global playback_var
+    playback_var = tk.StringVar(control_frame)
+    playback_var.set("Step")  # Default playback mode
+    playback_modes = [mode.capitalize() for mode in INTERPOLATION_MODES[table.board]]  # Only what the board plays
+    playback_dropdown = tk.OptionMenu(control_frame, playback_var, *playback_modes)
+    playback_dropdown.grid(row=21, column=1, padx=10, pady=5, sticky="ew")
+
+    # Record the table accelerometer during the motion (Due only)
+    global acceleration_var
+    acceleration_var = tk.BooleanVar(control_frame, value=False)
+    acceleration_check = tk.Checkbutton(control_frame, text="Record Acceleration", variable=acceleration_var)
+    acceleration_check.grid(row=22, column=0, padx=10, pady=5, sticky="w")
+
+    # Store every started run with its record and measurements in the experiment archive (~/shakebot-archive);
+    # off by default, and unavailable without h5py
+    global archive_var
+    archive_var = tk.BooleanVar(control_frame, value=False)
+    archive_state = tk.NORMAL if importlib.util.find_spec("h5py") else tk.DISABLED
+    archive_check = tk.Checkbutton(control_frame, text="Archive Runs", variable=archive_var, state=archive_state)
+    archive_check.grid(row=22, column=1, padx=10, pady=5, sticky="w")
+
     send_button = tk.Button(control_frame, text="Send Data to Arduino", command=send_data)
-    send_button.grid(row=19, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+    send_button.grid(row=23, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
+
+    # Button to iterate the drive signal against the recorded step positions (Due only)
+    compensate_button = tk.Button(control_frame, text="Compensate Drive Signal", command=compensate_data)
+    compensate_button.grid(row=24, column=0, columnspan=2, padx=10, pady=5, sticky="ew")
 
     # Initialize an empty plot
     plot_data()
@@ -1,12 +1,43 @@
 #include <AccelStepper.h>
+#include <CommandParser.h>  // arduino/libraries/CommandParser; shared with micro.ino
 #include <DueTimer.h>
+#include <SPI.h>
 
 #define STEP_PIN 2         // Pin for step signal
 #define DIR_PIN 3          // Pin for direction signal
 #define LEFT_LIMIT_PIN 4   // Pin for left limit switch; motor is at the left side
 #define RIGHT_LIMIT_PIN 5  // Pin for right limit switch
+#define ACCEL_CS_PIN 10    // Chip Select (CS) pin of the ADXL362 accelerometer on the table
+
+#define CREDIT_INTERVAL 20     // Report consumed samples every 20 samples while streaming
+#define RX_FULL 127            // Serial.available() of a full UART receive buffer; further bytes are lost
+#define RX_BATCH 16            // Received bytes parsed per loop pass, so a burst does not hold up the stepper
+
+// Playback modes (SET_PLAYBACK)
+#define INTERP_STEP 0          // One moveTo() per sample; the ISR runs at the sample rate
+#define INTERP_LINEAR 1        // Straight lines between samples; the ISR runs at the control rate
+#define INTERP_CUBIC 2         // Catmull-Rom spline through the samples; the ISR runs at the control rate
+#define PHASE_ONE 65536UL      // One sample in the 16.16 fixed-point playback phase
+#define MAX_CONTROL_RATE 5000  // Highest accepted control rate in Hz
+#define POSITION_GAIN 0.1      // Share of the position error corrected per control tick while interpolating
+
+// ADXL362 registers (see test/accelerometer/test.ino)
+#define ADXL362_REG_XDATA_L 0x0E       // First of the six X/Y/Z data bytes
+#define ADXL362_REG_SOFT_RESET 0x1F
+#define ADXL362_REG_FILTER_CTL 0x2C
+#define ADXL362_REG_POWER_CTL 0x2D
+#define ADXL362_RANGE_8G_ODR_400 0x85  // +-8 g range (4 mg/LSB), 400 Hz output data rate
+#define ADXL362_MEASURE 0x02           // Measurement mode
+
+// Accelerometer telemetry (packet layout documented in shakebot/telemetry.py)
+#define FRAME_TELEMETRY 0x10           // Packet type following the sync bytes
+#define TELEMETRY_SAMPLE_SIZE 18       // time (4) + index (4) + position (4) + x, y, z (2 each)
+#define TELEMETRY_PACKET_SAMPLES 4     // Samples per packet; a full packet fits the 128-byte transmit buffer
+#define TELEMETRY_RING 256             // Samples queued for the serial port
+#define MAX_TELEMETRY_RATE 400         // The ADXL362's highest output data rate
 
 AccelStepper stepper(AccelStepper::DRIVER, STEP_PIN, DIR_PIN);  // Use AccelStepper in driver mode
+CommandParser parser;  // Serial input, parsed as it arrives (commands, step counts and binary frames)
 
 int pulsePerRev = 200;        // Number of steps per revolution
 float maxRPM = 1200;          // Increase maximum speed in RPM
@@ -26,6 +57,58 @@ unsigned long endTime = 0;
 bool isSettingDisplacement = false;  // Flag to indicate setting displacement data
 bool isCalibrating = false;          // Flag to indicate calibration (moving to left limit)
 
+// Streaming playback: displacementData is used as a ring buffer indexed by absolute sample numbers
+volatile bool streamMode = false;               // Flag to indicate streaming playback
+volatile bool streamEnded = false;              // Flag set by STREAM_END once the host has sent every sample
+volatile bool streamFinished = false;           // Flag set by the ISR when the stream has been played out
+volatile unsigned long streamWritten = 0;       // Number of samples received since STREAM
+volatile unsigned long streamConsumed = 0;      // Number of samples played since STREAM
+volatile unsigned long underrunCount = 0;       // ISR ticks that found the ring buffer empty
+unsigned long lastCreditReport = 0;             // streamConsumed at the last CREDIT message
+bool frameInOrder = false;                      // The frame being received continues the buffer
+bool frameFits = false;                         // The frame being received fits in the buffer
+
+// Playback timing: samples are played at sampleRate; with interpolation the ISR runs at controlRate and
+// every tick drives the motor at a constant speed towards the interpolated position one tick ahead
+float sampleRate = 100;                          // Samples per second of the uploaded record
+float controlRate = 1000;                        // ISR ticks per second while interpolating
+uint8_t interpolation = INTERP_STEP;             // INTERP_STEP, INTERP_LINEAR or INTERP_CUBIC
+unsigned long phaseIncrement = PHASE_ONE;        // Samples per ISR tick, 16.16 fixed point
+volatile unsigned long playbackPhase = 0;        // Playback position in samples, 16.16 fixed point
+volatile bool segmentMode = false;               // Flag to drive the motor with runSpeed() at segmentSpeed
+volatile float segmentSpeed = 0;                 // Speed of the current segment in steps per second
+volatile float segmentTarget = 0;                // Interpolated position the current segment ends on
+
+// Accelerometer telemetry: Timer2 samples the ADXL362 while a motion executes, loop() sends the samples
+struct TelemetrySample {
+  unsigned long sequence;  // Sample number since START; not sent, a gap means dropped samples
+  unsigned long time;      // micros() when the sample was taken
+  unsigned long index;     // Samples handed to the motor so far
+  long position;           // Executed step position
+  int16_t x, y, z;         // Raw readings, 4 mg/LSB
+};
+float telemetryRate = 0;                                  // Accelerometer samples per second, 0 for off
+volatile TelemetrySample telemetryRing[TELEMETRY_RING];   // Samples waiting for the serial port
+volatile unsigned long telemetryHead = 0;                 // Samples queued
+volatile unsigned long telemetryTail = 0;                 // Samples sent
+volatile unsigned long telemetrySequence = 0;             // Samples taken since START, including dropped ones
+volatile bool telemetryActive = false;                    // Flag set while sampling a motion
+volatile bool telemetryEnded = false;                     // Flag to send the end-of-capture packet once drained
+
+// Instrumentation reported (and restarted) by STATS: ISR period jitter against the nominal timer period,
+// ticks lost while interrupts were blocked, receive buffer overflows and stepper loop passes
+unsigned long tickPeriod = 10000;                   // Nominal timer period in microseconds
+volatile unsigned long lastTickMicros = 0;          // micros() at the previous ISR call, 0 after a timer restart
+volatile unsigned long statsTicks = 0;              // ISR calls in the current window
+volatile unsigned long statsPeriods = 0;            // Measured ISR periods in the current window
+volatile unsigned long statsJitterSum = 0;          // Sum of |period - tickPeriod| in microseconds
+volatile unsigned long long statsJitterSquares = 0; // Sum of squared deviations, for the RMS
+volatile unsigned long statsJitterMax = 0;          // Largest |period - tickPeriod|
+volatile unsigned long statsMissedTicks = 0;        // Timer periods that passed without an ISR call
+unsigned long statsLoops = 0;                       // Stepper loop passes (stepper.run() calls)
+unsigned long statsRxFull = 0;                      // Loop passes that found the receive buffer full
+unsigned long statsWindowStart = 0;                 // micros() when the current window started
+
 bool leftLimitReached = false;  // Flag to indicate left limit reached
 bool rightLimitReached = false; // Flag to indicate right limit reached
 
@@ -39,88 +122,180 @@ void setup() {
   pinMode(LEFT_LIMIT_PIN, INPUT_PULLUP);   // Initialize limit switch pin with pullup resistor
   pinMode(RIGHT_LIMIT_PIN, INPUT_PULLUP);  // Initialize right limit switch pin
 
-  Timer1.attachInterrupt(updateMotorPosition).start(10000);  // 10 ms timer interrupt (100 Hz)
+  Timer1.attachInterrupt(updateMotorPosition).start(tickPeriod);  // 10 ms timer interrupt (100 Hz); see setPlayback()
+  statsWindowStart = micros();
+
+  SPI.begin();
+  pinMode(ACCEL_CS_PIN, OUTPUT);
+  digitalWrite(ACCEL_CS_PIN, HIGH);  // CS pin is idle HIGH
+  setupAccelerometer();
+  Timer2.attachInterrupt(sampleAccelerometer);  // Started by SET_TELEMETRY
 }
 void loop() {
-  stepper.run();
-  if (Serial.available() > 0) {
-    String command = Serial.readStringUntil('\n');  // Read a command from the GUI
+  runStepper();
+  if (Serial.available() >= RX_FULL) {
+    statsRxFull++;
+  }
+  reportStream();
+  sendTelemetry();
+  // Parse what has arrived without waiting for the rest of a line or frame (see CommandParser.h)
+  unsigned long now = millis();
+  for (int i = 0; i < RX_BATCH && Serial.available() > 0; i++) {
+    runCommand(parser.feed(Serial.read(), now));
+  }
+  if (Serial.available() == 0) {
+    runCommand(parser.poll(now));
+  }
+}
+
+
+// Function to act on a command, step count or frame element completed by the parser
+void runCommand(CommandType command) {
+  switch (command) {
+    case COMMAND_NONE:
+      break;
+
+    case COMMAND_STEP:
+      receiveStepData(parser.value());  // Process normal displacement data
+      break;
+
+    case COMMAND_FRAME_START:
+      startStepFrame();  // Binary frame of step counts
+      break;
+
+    case COMMAND_FRAME_VALUE:
+      storeFrameValue(parser.frameIndex(), parser.value());
+      break;
+
+    case COMMAND_FRAME_END:
+      finishStepFrame();
+      break;
+
+    case COMMAND_FRAME_ERROR:
+      replyFrame(false, (const __FlashStringHelper *)parser.frameError());
+      break;
 
     // Check if the command is a baud rate change request (e.g., "BR:9600")
-    if (command.startsWith("BR:")) {
-      long newBaudRate = command.substring(3).toInt();  // Extract the baud rate value
-      if (newBaudRate > 0) {
-        changeBaudRate(newBaudRate);  // Change the baud rate
+    case COMMAND_BAUD_RATE:
+      if (parser.value() > 0) {
+        changeBaudRate(parser.value());  // Change the baud rate
       }
-    }  else if (command.startsWith("SET_PARAMS")) {
-    // Example command:
-    // SET_PARAMS pulsePerRev=200 maxRPM=1200 lead=0.02 maxAcceleration=1.1 totalLength=0.6
-
-    // Split the command into tokens
-    int pulseIdx = command.indexOf("pulsePerRev=");
-    int rpmIdx = command.indexOf("maxRPM=");
-    int leadIdx = command.indexOf("lead=");
-    int accIdx = command.indexOf("maxAcceleration=");
-    int lengthIdx = command.indexOf("totalLength=");
-
-      if (pulseIdx != -1 && rpmIdx != -1 && leadIdx != -1 && accIdx != -1 && lengthIdx != -1) {
-        pulsePerRev = command.substring(pulseIdx + 12, command.indexOf(' ', pulseIdx)).toInt();
-        maxRPM = command.substring(rpmIdx + 7, command.indexOf(' ', rpmIdx)).toFloat();
-        lead = command.substring(leadIdx + 5, command.indexOf(' ', leadIdx)).toFloat();
-        maxAcceleration = command.substring(accIdx + 16, command.indexOf(' ', accIdx)).toFloat();
-        totalLength = command.substring(lengthIdx + 12).toFloat();  // Assuming it's the last parameter
-
-        // Update motor settings based on new parameters
-        stepper.setMaxSpeed(pulsePerRev * maxRPM);
-        stepper.setAcceleration(int(maxAcceleration * pulsePerRev * 9.8 / lead));
-
-        Serial.println("Parameters updated successfully.");
-        // print out the updated parameters using F macro
-        Serial.print(F("totalLength: "));
-        Serial.println(totalLength);
-        Serial.print(F("pulsePerRev: "));
-        Serial.println(pulsePerRev);
-        Serial.print(F("maxRPM: "));
-        Serial.println(maxRPM);
-        Serial.print(F("lead: "));
-        Serial.println(lead);
-        Serial.print(F("maxAcceleration: "));
-        Serial.println(maxAcceleration);
-
-        
+      break;
+
+    case COMMAND_SET_PARAMS:
+      setParameters();
+      break;
+
+    case COMMAND_SET_PLAYBACK:
+      setPlayback();  // Sample rate, interpolation and control rate of the next playback
+      break;
+
+    case COMMAND_SET_TELEMETRY:
+      setTelemetry();  // Accelerometer sample rate during START
+      break;
+
+    case COMMAND_STREAM:
+      startStream();  // Switch to streaming playback
+      break;
+
+    case COMMAND_STREAM_END:
+      streamEnded = true;  // No more samples will follow; finish once the ring buffer drains
+      break;
+
+    case COMMAND_ARM:
+      armPlayback();  // First phase of a synchronized start: report whether START would play
+      break;
+
+    case COMMAND_START:
+      // print the number of data points to be executed
+      if (streamMode) {
+        Serial.print(F("Number of data points buffered: "));
+        Serial.println(streamWritten - streamConsumed);
       } else {
-        Serial.println(F("Invalid parameters."));
+        Serial.print(F("Number of data points to be executed: "));
+        Serial.println(dataSize);
       }
-    }
-    
-    else if (command == "START") {
-      // print the number of data points to be executed
-      Serial.println("Number of data points to be executed: " + String(dataSize));
       Serial.println(F("Start executing displacement data."));
-      // If we receive the "START" command, set the flag to start executing the motion
+      // If we receive the "START" command, set the flag to start executing the motion.
+      // Restarting the timer puts the first sample one period after START, so tables
+      // started together (ARM, then START on every port) stay within a tick of each other
+      Timer1.stop();
+      lastTickMicros = 0;
+      Timer1.start(tickPeriod);
+      noInterrupts();
+      startTelemetry();
+      playbackPhase = 0;
       executeMotion = true;
-    }
+      interrupts();
+      break;
 
-    else if (command == "CANCEL"){
-      stepper.stop();  // Stop the motor
-      Serial.println("Motion cancelled.");
+    case COMMAND_CANCEL:
       executeMotion = false;  // Stop execution after finishing the current displacement data
+      stopSegments();         // Leave constant-speed segments so stop() can brake
+      stepper.stop();  // Stop the motor
+      Serial.println(F("Motion cancelled."));
+      streamMode = false;     // Leave streaming playback
       dataSize = 0;           // Reset data size to indicate that no data is left
       currentIndex = 0;       // Reset the current index
-    }
-    
-    else if (command == "SET_DISPLACEMENT") {
+      break;
+
+    case COMMAND_STATS:
+      printStats();  // Timing and serial statistics since the last STATS
+      break;
+
+    case COMMAND_SET_DISPLACEMENT:
       setDisplacementData();  // Set displacement data
-    }
-    
-    else if (command == "CALIBRATE_DISPLACEMENT") {
+      break;
+
+    case COMMAND_CALIBRATE_DISPLACEMENT:
       startCalibration();  // Begin the calibration process
-    }
-    
-    else {
-      receiveStepData(command);  // Process normal displacement data
-    }
+      break;
+
+    case COMMAND_TOO_LONG:
+      Serial.println(F("Command too long."));
+      break;
+
+    default:
+      Serial.print(F("Unknown command: "));
+      Serial.println(parser.line());
+      break;
+  }
+}
+
+
+// Function to set the table parameters, e.g.
+// SET_PARAMS pulsePerRev=200 maxRPM=1200 lead=0.02 maxAcceleration=5.1 totalLength=0.6
+void setParameters() {
+  long newPulsePerRev;
+  float newMaxRPM, newLead, newMaxAcceleration, newTotalLength;
+  if (!parser.fieldLong(PSTR("pulsePerRev"), newPulsePerRev) || !parser.fieldFloat(PSTR("maxRPM"), newMaxRPM) ||
+      !parser.fieldFloat(PSTR("lead"), newLead) || !parser.fieldFloat(PSTR("maxAcceleration"), newMaxAcceleration) ||
+      !parser.fieldFloat(PSTR("totalLength"), newTotalLength)) {
+    Serial.println(F("Invalid parameters."));
+    return;
   }
+  pulsePerRev = newPulsePerRev;
+  maxRPM = newMaxRPM;
+  lead = newLead;
+  maxAcceleration = newMaxAcceleration;
+  totalLength = newTotalLength;
+
+  // Update motor settings based on new parameters
+  stepper.setMaxSpeed(pulsePerRev * maxRPM);
+  stepper.setAcceleration(int(maxAcceleration * pulsePerRev * 9.8 / lead));
+
+  Serial.println(F("Parameters updated successfully."));
+  // print out the updated parameters using F macro
+  Serial.print(F("totalLength: "));
+  Serial.println(totalLength);
+  Serial.print(F("pulsePerRev: "));
+  Serial.println(pulsePerRev);
+  Serial.print(F("maxRPM: "));
+  Serial.println(maxRPM);
+  Serial.print(F("lead: "));
+  Serial.println(lead);
+  Serial.print(F("maxAcceleration: "));
+  Serial.println(maxAcceleration);
 }
 
 
@@ -146,9 +321,247 @@ void startCalibration() {
 }
 
 
+// Function to set the playback timing, e.g.
+// SET_PLAYBACK sampleRate=100 interpolation=cubic controlRate=1000
+// Missing fields keep their value; the timer runs at sampleRate for step playback and at controlRate otherwise
+void setPlayback() {
+  if (executeMotion) {
+    Serial.println(F("Cannot change playback while moving."));
+    return;
+  }
+  float newSampleRate = sampleRate;
+  float newControlRate = controlRate;
+  parser.fieldFloat(PSTR("sampleRate"), newSampleRate);
+  parser.fieldFloat(PSTR("controlRate"), newControlRate);
+  int newInterpolation = interpolation;
+  if (parser.field(PSTR("interpolation")) != NULL) {
+    newInterpolation = parser.fieldIs(PSTR("interpolation"), PSTR("step")) ? INTERP_STEP :
+                       parser.fieldIs(PSTR("interpolation"), PSTR("linear")) ? INTERP_LINEAR :
+                       parser.fieldIs(PSTR("interpolation"), PSTR("cubic")) ? INTERP_CUBIC : -1;
+  }
+  if (newSampleRate <= 0 || newInterpolation < 0 || newControlRate < newSampleRate ||
+      newControlRate > MAX_CONTROL_RATE) {
+    Serial.println(F("Invalid playback settings."));
+    return;
+  }
+
+  sampleRate = newSampleRate;
+  controlRate = newControlRate;
+  interpolation = newInterpolation;
+  float tickRate = interpolation == INTERP_STEP ? sampleRate : controlRate;
+  noInterrupts();
+  phaseIncrement = (unsigned long)(sampleRate / tickRate * PHASE_ONE + 0.5);
+  playbackPhase = 0;
+  interrupts();
+  Timer1.stop();
+  tickPeriod = (unsigned long)(1000000.0 / tickRate + 0.5);
+  lastTickMicros = 0;  // The first period after a restart is not a full one
+  Timer1.start(tickPeriod);  // Timer period in microseconds
+
+  Serial.print(F("Playback set: sampleRate="));
+  Serial.print(sampleRate);
+  Serial.print(F(" interpolation="));
+  Serial.print(interpolation == INTERP_STEP ? F("step") : interpolation == INTERP_LINEAR ? F("linear") : F("cubic"));
+  Serial.print(F(" controlRate="));
+  Serial.println(controlRate);
+}
+
+
+// Function to set the accelerometer sample rate during START, e.g. SET_TELEMETRY rate=400 (0 switches it off)
+void setTelemetry() {
+  float newRate = -1;
+  parser.fieldFloat(PSTR("rate"), newRate);
+  if (newRate < 0 || newRate > MAX_TELEMETRY_RATE) {
+    Serial.println(F("Invalid telemetry rate."));
+    return;
+  }
+  telemetryRate = newRate;
+  Timer2.stop();
+  if (telemetryRate > 0) {
+    Timer2.start((long)(1000000.0 / telemetryRate + 0.5));  // Timer period in microseconds
+  }
+  Serial.print(F("Telemetry set: rate="));
+  Serial.println(telemetryRate);
+}
+
+
+// Number the samples of a new motion from 0, unless the previous capture is still being sent (interrupts off)
+void startTelemetry() {
+  if (telemetryHead == telemetryTail && !telemetryActive) {
+    telemetrySequence = 0;
+    telemetryEnded = false;
+  }
+}
+
+
+// Timer2 ISR: queue one accelerometer sample while a motion executes; a full ring drops the sample
+void sampleAccelerometer() {
+  if (!executeMotion) {
+    if (telemetryActive) {
+      telemetryActive = false;
+      telemetryEnded = true;  // loop() sends the end-of-capture packet after the last sample
+    }
+    return;
+  }
+  telemetryActive = true;
+  unsigned long sequence = telemetrySequence++;
+  if (telemetryHead - telemetryTail >= TELEMETRY_RING) {
+    return;  // The serial port fell behind; the gap in the sequence numbers shows the loss
+  }
+  int16_t x, y, z;
+  readAcceleration(x, y, z);
+  volatile TelemetrySample &sample = telemetryRing[telemetryHead % TELEMETRY_RING];
+  sample.sequence = sequence;
+  sample.time = micros();
+  sample.index = streamMode ? streamConsumed : (unsigned long)currentIndex;
+  sample.position = stepper.currentPosition();
+  sample.x = x;
+  sample.y = y;
+  sample.z = z;
+  telemetryHead++;
+}
+
+
+// Function to send queued samples as binary packets of consecutive sequence numbers.
+// A packet is only written when it fits in the transmit buffer, so loop() never blocks on the serial port.
+void sendTelemetry() {
+  noInterrupts();
+  unsigned long head = telemetryHead;
+  unsigned long tail = telemetryTail;
+  bool ended = telemetryEnded;
+  interrupts();
+  unsigned long queued = head - tail;
+  if (queued == 0 && !ended) {
+    return;
+  }
+  if (queued < TELEMETRY_PACKET_SAMPLES && !ended) {
+    return;  // Wait for a full packet while the motion runs
+  }
+
+  uint8_t packet[FRAME_HEADER_SIZE + TELEMETRY_PACKET_SAMPLES * TELEMETRY_SAMPLE_SIZE + 2];
+  unsigned long first = queued ? telemetryRing[tail % TELEMETRY_RING].sequence : telemetrySequence;
+  unsigned int count = 0;
+  while (count < queued && count < TELEMETRY_PACKET_SAMPLES &&
+         telemetryRing[(tail + count) % TELEMETRY_RING].sequence == first + count) {
+    count++;
+  }
+  size_t size = FRAME_HEADER_SIZE + count * TELEMETRY_SAMPLE_SIZE + 2;
+  if ((size_t)Serial.availableForWrite() < size) {
+    return;
+  }
+
+  packet[0] = FRAME_SYNC_0;
+  packet[1] = FRAME_SYNC_1;
+  packet[2] = FRAME_TELEMETRY;
+  putLittleEndian(packet + 3, first, 4);
+  putLittleEndian(packet + 7, count, 2);
+  uint8_t *field = packet + FRAME_HEADER_SIZE;
+  for (unsigned int i = 0; i < count; i++) {
+    volatile TelemetrySample &sample = telemetryRing[(tail + i) % TELEMETRY_RING];
+    putLittleEndian(field, sample.time, 4);
+    putLittleEndian(field + 4, sample.index, 4);
+    putLittleEndian(field + 8, (unsigned long)sample.position, 4);
+    putLittleEndian(field + 12, (uint16_t)sample.x, 2);
+    putLittleEndian(field + 14, (uint16_t)sample.y, 2);
+    putLittleEndian(field + 16, (uint16_t)sample.z, 2);
+    field += TELEMETRY_SAMPLE_SIZE;
+  }
+  putLittleEndian(field, crc16Update(0xFFFF, packet + 2, size - 4), 2);
+
+  // With interrupts off a line printed by an ISR cannot land inside the packet; the buffer has room, so this is quick
+  noInterrupts();
+  Serial.write(packet, size);
+  telemetryTail = tail + count;
+  if (count == 0) {
+    telemetryEnded = false;  // End-of-capture packet sent
+  }
+  interrupts();
+}
+
+
+// Function to store `length` bytes of `value` least significant first
+void putLittleEndian(uint8_t *buffer, unsigned long value, int length) {
+  for (int i = 0; i < length; i++) {
+    buffer[i] = (value >> (8 * i)) & 0xFF;
+  }
+}
+
+
+// Function to answer ARM with "ARMED <samples>" when START would play a record now, or
+// "NOT_ARMED BUSY" / "NOT_ARMED EMPTY"; the host arms every table before starting them together
+void armPlayback() {
+  noInterrupts();
+  unsigned long buffered = streamMode ? streamWritten - streamConsumed : (unsigned long)dataSize;
+  bool busy = executeMotion || isSettingDisplacement || isCalibrating;
+  interrupts();
+  if (busy) {
+    Serial.println(F("NOT_ARMED BUSY"));
+  } else if (buffered == 0) {
+    Serial.println(F("NOT_ARMED EMPTY"));
+  } else {
+    Serial.print(F("ARMED "));
+    Serial.println(buffered);
+  }
+}
+
+
+void startStream() {
+  // Reset the ring buffer and wait for binary frames followed by START
+  noInterrupts();
+  executeMotion = false;
+  streamMode = true;
+  streamEnded = false;
+  streamFinished = false;
+  streamWritten = 0;
+  streamConsumed = 0;
+  underrunCount = 0;
+  dataSize = 0;
+  currentIndex = 0;
+  interrupts();
+  lastCreditReport = 0;
+  Serial.print(F("STREAM_READY "));
+  Serial.println(maxDisplacement);
+}
+
+
+// Function to report streaming progress: "CREDIT <consumed> <underruns>" and "STREAM_DONE <consumed> <underruns>"
+void reportStream() {
+  if (!streamMode && !streamFinished) {
+    return;
+  }
+  noInterrupts();
+  unsigned long consumed = streamConsumed;
+  unsigned long underruns = underrunCount;
+  bool finished = streamFinished;
+  streamFinished = false;
+  interrupts();
+
+  if (finished) {
+    Serial.print(F("STREAM_DONE "));
+  } else if (consumed - lastCreditReport >= CREDIT_INTERVAL) {
+    Serial.print(F("CREDIT "));
+  } else {
+    return;
+  }
+  lastCreditReport = consumed;
+  Serial.print(consumed);
+  Serial.print(' ');
+  Serial.println(underruns);
+
+  if (finished) {
+    Serial.print(F("Motion completed in "));
+    Serial.print(endTime - startTime);
+    Serial.println(F(" milliseconds."));
+  }
+}
+
+
 // Function to receive step counts
-void receiveStepData(String dataString) {
-  int steps = dataString.toInt();
+void receiveStepData(long steps) {
+  if (streamMode) {
+    Serial.println(F("Use binary frames while streaming."));
+    return;
+  }
   if (dataSize < maxDisplacement) {
     noInterrupts();
     displacementData[dataSize] = steps;  // Store steps directly
@@ -160,8 +573,155 @@ void receiveStepData(String dataString) {
 }
 
 
-// Interrupt Service Routine (ISR) to update the motor position at 100 Hz
+// Function to check a binary frame header: the frame must continue the buffer and fit in it.
+// Samples are written past dataSize (or the ring buffer head) and only committed
+// once the CRC matches, so the ISR never sees a partially received frame
+void startStepFrame() {
+  noInterrupts();
+  unsigned long buffered = streamMode ? streamWritten - streamConsumed : (unsigned long)dataSize;
+  interrupts();
+  frameInOrder = parser.frameOffset() == frameOffset();
+  frameFits = parser.frameCount() <= maxDisplacement - buffered;
+}
+
+
+// Function to store one step count of the frame being received
+void storeFrameValue(unsigned int i, long value) {
+  if (frameInOrder && frameFits && streamMode) {
+    displacementData[(streamWritten + i) % maxDisplacement] = value;
+  } else if (frameInOrder && frameFits) {
+    displacementData[dataSize + i] = value;
+  }
+}
+
+
+// Function to commit a frame whose CRC matched and reply with ACK/NAK
+void finishStepFrame() {
+  if (!frameInOrder) {
+    replyFrame(false, F("OFFSET"));
+  } else if (!frameFits) {
+    replyFrame(false, F("FULL"));
+  } else {
+    noInterrupts();
+    if (streamMode) {
+      streamWritten += parser.frameCount();
+    } else {
+      dataSize += parser.frameCount();
+    }
+    interrupts();
+    replyFrame(true, NULL);
+  }
+}
+
+
+// Offset the next frame must carry: the buffer size, or the absolute sample number while streaming
+unsigned long frameOffset() {
+  noInterrupts();
+  unsigned long offset = streamMode ? streamWritten : (unsigned long)dataSize;
+  interrupts();
+  return offset;
+}
+
+
+// Function to answer a binary frame with "ACK <offset>" or "NAK <offset> <reason>"
+void replyFrame(bool accepted, const __FlashStringHelper *reason) {
+  Serial.print(accepted ? F("ACK ") : F("NAK "));
+  Serial.print(frameOffset());
+  if (reason != NULL) {
+    Serial.print(' ');
+    Serial.print(reason);
+  }
+  Serial.println();
+}
+
+
+// Function to step the motor: constant-speed segments during interpolated playback, AccelStepper ramps otherwise
+void runStepper() {
+  statsLoops++;
+  if (segmentMode) {
+    stepper.runSpeed();
+  } else {
+    stepper.run();
+  }
+}
+
+
+// Function to leave constant-speed segments; setCurrentPosition() zeroes AccelStepper's speed state
+void stopSegments() {
+  if (!segmentMode) {
+    return;
+  }
+  segmentMode = false;
+  segmentSpeed = 0;
+  stepper.setCurrentPosition(stepper.currentPosition());
+}
+
+
+// Function to measure the ISR period against the nominal timer period; called first thing in the ISR
+void recordTick() {
+  unsigned long now = micros();
+  if (lastTickMicros != 0) {
+    unsigned long period = now - lastTickMicros;
+    unsigned long deviation = period > tickPeriod ? period - tickPeriod : tickPeriod - period;
+    statsJitterSum += deviation;
+    statsJitterSquares += (unsigned long long)deviation * deviation;
+    if (deviation > statsJitterMax) {
+      statsJitterMax = deviation;
+    }
+    if (period > tickPeriod + tickPeriod / 2) {
+      statsMissedTicks += (period + tickPeriod / 2) / tickPeriod - 1;  // Whole periods without a call
+    }
+    statsPeriods++;
+  }
+  lastTickMicros = now;
+  statsTicks++;
+}
+
+
+// Function to report the statistics of the current window and start a new one, e.g.
+// STATS window_us=1000000 ticks=100 period_us=10000 jitter_mean_us=2.10 jitter_rms_us=2.50 jitter_max_us=9
+//       missed=0 rx_full=0 loop_hz=84211 (on one line)
+void printStats() {
+  noInterrupts();
+  unsigned long ticks = statsTicks;
+  unsigned long periods = statsPeriods;
+  unsigned long jitterSum = statsJitterSum;
+  unsigned long long jitterSquares = statsJitterSquares;
+  unsigned long jitterMax = statsJitterMax;
+  unsigned long missed = statsMissedTicks;
+  statsTicks = statsPeriods = statsJitterSum = statsJitterMax = statsMissedTicks = 0;
+  statsJitterSquares = 0;
+  interrupts();
+  unsigned long now = micros();
+  unsigned long window = now - statsWindowStart;
+  statsWindowStart = now;
+
+  Serial.print(F("STATS window_us="));
+  Serial.print(window);
+  Serial.print(F(" ticks="));
+  Serial.print(ticks);
+  Serial.print(F(" period_us="));
+  Serial.print(tickPeriod);
+  Serial.print(F(" jitter_mean_us="));
+  Serial.print(periods ? (float)jitterSum / periods : 0.0);
+  Serial.print(F(" jitter_rms_us="));
+  Serial.print(periods ? sqrt((float)jitterSquares / periods) : 0.0);
+  Serial.print(F(" jitter_max_us="));
+  Serial.print(jitterMax);
+  Serial.print(F(" missed="));
+  Serial.print(missed);
+  Serial.print(F(" rx_full="));
+  Serial.print(statsRxFull);
+  Serial.print(F(" loop_hz="));
+  Serial.println(window ? (unsigned long)(statsLoops * 1000000.0 / window) : 0);
+  statsRxFull = 0;
+  statsLoops = 0;
+}
+
+
+// Interrupt Service Routine (ISR) to update the motor position at the sample rate (or the control rate)
 void updateMotorPosition() {
+    recordTick();
   
     if (isCalibrating) {
       if (digitalRead(LEFT_LIMIT_PIN) == LOW && !leftLimitReached)
@@ -236,24 +796,152 @@ void updateMotorPosition() {
   }
   
 
+  if (streamMode) {
+    // Consume one sample per sample period, whatever the ISR rate
+    playbackPhase += phaseIncrement;
+    if (playbackPhase >= PHASE_ONE) {
+      playbackPhase -= PHASE_ONE;
+      updateStreamPosition();
+    }
+    return;
+  }
+
   if (dataSize == 0 || !executeMotion) {
     startTime = millis();
     return;  // Do nothing if no data or not started
   }
 
+  if (interpolation != INTERP_STEP) {
+    updateInterpolatedPosition();
+    return;
+  }
+
   stepper.moveTo(displacementData[currentIndex]);
   currentIndex++;
   if (currentIndex >= dataSize) {
-    // Once all data has been executed, reset necessary variables
-    currentIndex = 0;
-    executeMotion = false;  // Stop execution after finishing the current displacement data
-    dataSize = 0;           // Reset data size to indicate that no data is left
-    endTime = millis();
-    // print the time taken to execute the motion
-    Serial.print(F("Motion completed in "));
-    Serial.print(endTime - startTime);
-    Serial.println(F(" milliseconds."));
+    finishPlayback();
+  }
+}
+
+
+// Interpolated playback: one constant-speed segment per control tick, ending on the trajectory one tick ahead.
+// The segment speed is the slope of the interpolated trajectory plus a small correction of the position error,
+// so the whole-step position never enters the speed at full gain (which would make it jitter).
+void updateInterpolatedPosition() {
+  unsigned long next = playbackPhase + phaseIncrement;
+  unsigned long index = next >> 16;
+  if (index >= (unsigned long)(dataSize - 1)) {
+    // Past the last sample: settle on it with the usual AccelStepper ramp
+    stopSegments();
+    stepper.moveTo(displacementData[dataSize - 1]);
+    finishPlayback();
+    return;
+  }
+  currentIndex = index;
+  long position = stepper.currentPosition();
+  if (!segmentMode) {
+    segmentTarget = position;  // First segment starts where the carriage is
   }
+  float target = interpolateSample(index, (next & (PHASE_ONE - 1)) / (float)PHASE_ONE);
+
+  // Speed along the trajectory plus the correction, changed by at most the acceleration limit
+  float speed = ((target - segmentTarget) + POSITION_GAIN * (segmentTarget - position)) * controlRate;
+  segmentTarget = target;
+  float maxChange = maxAcceleration * pulsePerRev * 9.8 / lead / controlRate;
+  speed = constrain(speed, segmentSpeed - maxChange, segmentSpeed + maxChange);
+  segmentSpeed = speed;
+  stepper.setSpeed(speed);
+  segmentMode = true;
+  playbackPhase = next;
+}
+
+
+// Position between samples index and index + 1 at fraction t: linear, or a Catmull-Rom spline through the samples
+float interpolateSample(unsigned long index, float t) {
+  float p1 = displacementData[index];
+  float p2 = displacementData[index + 1];
+  if (interpolation == INTERP_LINEAR) {
+    return p1 + (p2 - p1) * t;
+  }
+  float p0 = index > 0 ? displacementData[index - 1] : p1;
+  float p3 = index + 2 < (unsigned long)dataSize ? displacementData[index + 2] : p2;
+  return p1 + 0.5 * t * (p2 - p0 + t * (2 * p0 - 5 * p1 + 4 * p2 - p3 + t * (3 * (p1 - p2) + p3 - p0)));
+}
+
+
+// Once all data has been executed, reset necessary variables and report the duration
+void finishPlayback() {
+  currentIndex = 0;
+  executeMotion = false;  // Stop execution after finishing the current displacement data
+  dataSize = 0;           // Reset data size to indicate that no data is left
+  endTime = millis();
+  // print the time taken to execute the motion
+  Serial.print(F("Motion completed in "));
+  Serial.print(endTime - startTime);
+  Serial.println(F(" milliseconds."));
+}
+
+
+// Streaming counterpart of the playback step above: consume one sample from the ring buffer
+void updateStreamPosition() {
+  if (!executeMotion) {
+    startTime = millis();
+    return;  // Keep filling the ring buffer until START
+  }
+
+  if (streamConsumed == streamWritten) {
+    if (streamEnded) {
+      // Every sample has been played; loop() reports STREAM_DONE
+      executeMotion = false;
+      streamMode = false;
+      streamFinished = true;
+      endTime = millis();
+    } else {
+      underrunCount++;  // Host fell behind; hold the last target until data arrives
+    }
+    return;
+  }
+
+  stepper.moveTo(displacementData[streamConsumed % maxDisplacement]);
+  streamConsumed++;
+}
+
+
+// Function to reset the ADXL362 and start measuring at +-8 g and 400 Hz
+void setupAccelerometer() {
+  writeAccelerometerRegister(ADXL362_REG_SOFT_RESET, 0x52);  // Soft reset command
+  delay(10);  // Wait after reset
+  writeAccelerometerRegister(ADXL362_REG_FILTER_CTL, ADXL362_RANGE_8G_ODR_400);
+  writeAccelerometerRegister(ADXL362_REG_POWER_CTL, ADXL362_MEASURE);
+}
+
+
+// Function to read the raw X, Y and Z readings in one burst read
+void readAcceleration(int16_t &x, int16_t &y, int16_t &z) {
+  uint8_t data[6];
+  SPI.beginTransaction(SPISettings(4000000, MSBFIRST, SPI_MODE0));
+  digitalWrite(ACCEL_CS_PIN, LOW);  // Select the sensor
+  SPI.transfer(0x0B);               // Read command
+  SPI.transfer(ADXL362_REG_XDATA_L);
+  for (int i = 0; i < 6; i++) {
+    data[i] = SPI.transfer(0x00);
+  }
+  digitalWrite(ACCEL_CS_PIN, HIGH);  // Deselect the sensor
+  SPI.endTransaction();
+  x = (int16_t)(data[0] | (data[1] << 8));
+  y = (int16_t)(data[2] | (data[3] << 8));
+  z = (int16_t)(data[4] | (data[5] << 8));
+}
+
+
+void writeAccelerometerRegister(uint8_t reg, uint8_t value) {
+  SPI.beginTransaction(SPISettings(4000000, MSBFIRST, SPI_MODE0));
+  digitalWrite(ACCEL_CS_PIN, LOW);  // Select the sensor
+  SPI.transfer(0x0A);               // Write command
+  SPI.transfer(reg);                // Register address
+  SPI.transfer(value);              // Value
+  digitalWrite(ACCEL_CS_PIN, HIGH);  // Deselect the sensor
+  SPI.endTransaction();
 }
 
 
@@ -265,5 +953,6 @@ void changeBaudRate(long newBaudRate) {
 
   baudRate = newBaudRate;  // Set the new baud rate
   Serial.begin(baudRate);  // Reinitialize the serial communication with the new baud rate
-  Serial.println("Baud rate changed to: " + String(baudRate));
+  Serial.print(F("Baud rate changed to: "));
+  Serial.println(baudRate);
 }
@@ -0,0 +1,268 @@
+#include "CommandParser.h"
+
+static const char ERROR_SYNC[] PROGMEM = "SYNC";
+static const char ERROR_TYPE[] PROGMEM = "TYPE";
+static const char ERROR_TIMEOUT[] PROGMEM = "TIMEOUT";
+static const char ERROR_CRC[] PROGMEM = "CRC";
+
+CommandParser::CommandParser() {
+  reset();
+}
+
+void CommandParser::reset() {
+  state = PARSE_LINE;
+  text[0] = '\0';
+  length = 0;
+  overflow = false;
+  numeric = true;
+  negative = false;
+  digits = 0;
+  number = 0;
+  error = NULL;
+}
+
+CommandType CommandParser::feed(uint8_t byte, unsigned long now) {
+  if (state == PARSE_LINE) {
+    if (byte != FRAME_SYNC_0) {
+      return feedLine(byte);
+    }
+    // 0xA5 never appears in a text command, so it starts a frame even after a partial line (which is dropped)
+    reset();
+    state = PARSE_FRAME_HEADER;
+  }
+  lastByte = now;
+  return state == PARSE_DISCARD ? COMMAND_NONE : feedFrame(byte);
+}
+
+CommandType CommandParser::poll(unsigned long now) {
+  if (state == PARSE_DISCARD) {
+    state = PARSE_LINE;  // Everything that was pending has been dropped
+  } else if (state != PARSE_LINE && now - lastByte > FRAME_TIMEOUT_MS) {
+    return rejectFrame(ERROR_TIMEOUT, PARSE_LINE);
+  }
+  return COMMAND_NONE;
+}
+
+// Text lines: bytes are collected up to the newline, and step counts are decoded on the way
+CommandType CommandParser::feedLine(uint8_t byte) {
+  if (byte == '\n') {
+    return endLine();
+  }
+  if (byte == '\r') {
+    return COMMAND_NONE;
+  }
+  if (length >= COMMAND_LINE_SIZE - 1) {
+    overflow = true;  // Keep counting nothing until the newline; the line is rejected
+    return COMMAND_NONE;
+  }
+  if (numeric) {
+    if (byte >= '0' && byte <= '9') {
+      digits = digits * 10 + (byte - '0');
+    } else if (length == 0 && (byte == '-' || byte == '+')) {
+      negative = byte == '-';
+    } else {
+      numeric = false;
+    }
+  }
+  text[length++] = byte;
+  return COMMAND_NONE;
+}
+
+CommandType CommandParser::endLine() {
+  text[length] = '\0';
+  bool tooLong = overflow;
+  bool isNumber = numeric && length > (size_t)(text[0] == '-' || text[0] == '+');
+  bool empty = length == 0;
+  long steps = negative ? -(long)digits : (long)digits;
+  length = 0;
+  overflow = false;
+  numeric = true;
+  negative = false;
+  digits = 0;
+
+  if (tooLong) {
+    return COMMAND_TOO_LONG;
+  }
+  if (isNumber) {
+    number = steps;
+    return COMMAND_STEP;
+  }
+  if (empty) {
+    return COMMAND_NONE;
+  }
+  if (startsWith(PSTR("BR:"))) {
+    number = parseLong(text + 3);
+    return COMMAND_BAUD_RATE;
+  }
+  if (startsWith(PSTR("SET_"))) {
+    if (startsWith(PSTR("SET_PARAMS"))) return COMMAND_SET_PARAMS;
+    if (startsWith(PSTR("SET_PLAYBACK"))) return COMMAND_SET_PLAYBACK;
+    if (startsWith(PSTR("SET_TELEMETRY"))) return COMMAND_SET_TELEMETRY;
+    if (strcmp_P(text, PSTR("SET_DISPLACEMENT")) == 0) return COMMAND_SET_DISPLACEMENT;
+    return COMMAND_UNKNOWN;
+  }
+  if (strcmp_P(text, PSTR("START")) == 0) return COMMAND_START;
+  if (strcmp_P(text, PSTR("CANCEL")) == 0) return COMMAND_CANCEL;
+  if (strcmp_P(text, PSTR("ARM")) == 0) return COMMAND_ARM;
+  if (strcmp_P(text, PSTR("STREAM")) == 0) return COMMAND_STREAM;
+  if (strcmp_P(text, PSTR("STREAM_END")) == 0) return COMMAND_STREAM_END;
+  if (strcmp_P(text, PSTR("STATS")) == 0) return COMMAND_STATS;
+  if (strcmp_P(text, PSTR("CALIBRATE_DISPLACEMENT")) == 0) return COMMAND_CALIBRATE_DISPLACEMENT;
+  return COMMAND_UNKNOWN;
+}
+
+bool CommandParser::startsWith(const char *prefix) const {
+  return strncmp_P(text, prefix, strlen_P(prefix)) == 0;
+}
+
+// Binary frames: header, then one value per step count (int32, or int16 differences after the first), then the CRC
+CommandType CommandParser::feedFrame(uint8_t byte) {
+  uint8_t *bytes = (uint8_t *)text;
+  bytes[length++] = byte;
+
+  if (state == PARSE_FRAME_HEADER) {
+    if (length < FRAME_HEADER_SIZE) {
+      return COMMAND_NONE;
+    }
+    if (bytes[1] != FRAME_SYNC_1) {
+      return rejectFrame(ERROR_SYNC, PARSE_LINE);
+    }
+    encoding = bytes[2];
+    if (encoding != FRAME_INT32 && encoding != FRAME_DELTA16) {
+      return rejectFrame(ERROR_TYPE, PARSE_DISCARD);  // Payload length is unknown; drop what is pending
+    }
+    offset = (unsigned long)bytes[3] | ((unsigned long)bytes[4] << 8) |
+             ((unsigned long)bytes[5] << 16) | ((unsigned long)bytes[6] << 24);
+    count = bytes[7] | (bytes[8] << 8);
+    crc = crc16Update(0xFFFF, bytes + 2, FRAME_HEADER_SIZE - 2);
+    index = 0;
+    number = 0;
+    length = 0;
+    state = count > 0 ? PARSE_FRAME_VALUE : PARSE_FRAME_CRC;
+    return COMMAND_FRAME_START;
+  }
+
+  if (state == PARSE_FRAME_VALUE) {
+    size_t width = (encoding == FRAME_DELTA16 && index > 0) ? 2 : 4;
+    if (length < width) {
+      return COMMAND_NONE;
+    }
+    crc = crc16Update(crc, bytes, width);
+    if (width == 4) {
+      number = (int32_t)((uint32_t)bytes[0] | ((uint32_t)bytes[1] << 8) |
+                         ((uint32_t)bytes[2] << 16) | ((uint32_t)bytes[3] << 24));
+    } else {
+      number += (int16_t)(bytes[0] | (bytes[1] << 8));
+    }
+    index++;
+    length = 0;
+    if (index == count) {
+      state = PARSE_FRAME_CRC;
+    }
+    return COMMAND_FRAME_VALUE;
+  }
+
+  if (length < 2) {
+    return COMMAND_NONE;
+  }
+  if ((uint16_t)(bytes[0] | (bytes[1] << 8)) != crc) {
+    return rejectFrame(ERROR_CRC, PARSE_LINE);
+  }
+  length = 0;
+  state = PARSE_LINE;
+  return COMMAND_FRAME_END;
+}
+
+CommandType CommandParser::rejectFrame(const char *reason, State next) {
+  reset();
+  state = next;
+  error = reason;
+  return COMMAND_FRAME_ERROR;
+}
+
+const char *CommandParser::field(const char *key) const {
+  size_t keyLength = strlen_P(key);
+  for (const char *p = text; *p != '\0'; p++) {
+    // Whole keys only, so "lead=" does not match inside another key
+    if ((p == text || p[-1] == ' ') && strncmp_P(p, key, keyLength) == 0 && p[keyLength] == '=') {
+      return p + keyLength + 1;
+    }
+  }
+  return NULL;
+}
+
+bool CommandParser::fieldLong(const char *key, long &value) const {
+  const char *found = field(key);
+  if (found == NULL) {
+    return false;
+  }
+  value = parseLong(found);
+  return true;
+}
+
+bool CommandParser::fieldFloat(const char *key, float &value) const {
+  const char *found = field(key);
+  if (found == NULL) {
+    return false;
+  }
+  value = parseFloat(found);
+  return true;
+}
+
+bool CommandParser::fieldIs(const char *key, const char *word) const {
+  const char *found = field(key);
+  size_t wordLength = strlen_P(word);
+  return found != NULL && strncmp_P(found, word, wordLength) == 0 &&
+         (found[wordLength] == ' ' || found[wordLength] == '\0');
+}
+
+long parseLong(const char *text) {
+  bool negative = *text == '-';
+  if (*text == '-' || *text == '+') {
+    text++;
+  }
+  long value = 0;
+  while (*text >= '0' && *text <= '9') {
+    value = value * 10 + (*text++ - '0');
+  }
+  return negative ? -value : value;
+}
+
+float parseFloat(const char *text) {
+  bool negative = *text == '-';
+  if (*text == '-' || *text == '+') {
+    text++;
+  }
+  // Digits are collected as an integer and scaled once, so 0.02 is as close as a float gets
+  float mantissa = 0;
+  int exponent = 0;
+  while (*text >= '0' && *text <= '9') {
+    mantissa = mantissa * 10 + (*text++ - '0');
+  }
+  if (*text == '.') {
+    text++;
+    while (*text >= '0' && *text <= '9') {
+      mantissa = mantissa * 10 + (*text++ - '0');
+      exponent--;
+    }
+  }
+  if (*text == 'e' || *text == 'E') {
+    exponent += (int)parseLong(text + 1);
+  }
+  float scale = 1;
+  for (int i = exponent < 0 ? -exponent : exponent; i > 0; i--) {
+    scale *= 10;
+  }
+  float value = exponent < 0 ? mantissa / scale : mantissa * scale;
+  return negative ? -value : value;
+}
+
+uint16_t crc16Update(uint16_t crc, const uint8_t *data, size_t length) {
+  for (size_t i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
@@ -0,0 +1,131 @@
+// Byte-at-a-time parser for the shakebot serial protocol, shared by due.ino and micro.ino.
+//
+// loop() hands every received byte to feed() and acts on the command it returns once a line or
+// frame element is complete, so it never waits for the rest of a line and never allocates:
+//
+//   text lines   BR:<baud>, SET_PARAMS, SET_PLAYBACK, SET_TELEMETRY, STREAM, STREAM_END, ARM,
+//                START, CANCEL, STATS, SET_DISPLACEMENT, CALIBRATE_DISPLACEMENT and step counts,
+//                kept in a fixed buffer; key=value fields are read with field(), fieldLong() and
+//                fieldFloat(). Step counts are decoded while their digits arrive.
+//   step frames  binary frames starting with FRAME_SYNC_0 FRAME_SYNC_1 (layout documented in
+//                shakebot/protocol.py), reported as a header, one value per step count and a
+//                CRC-checked end, so the sketch stores the values as they arrive.
+//
+// Outside the Arduino build (g++ on Linux) the file compiles without Arduino.h; see
+// test/command_parser for the unit tests and the throughput benchmark.
+#ifndef COMMAND_PARSER_H
+#define COMMAND_PARSER_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#ifdef ARDUINO
+#include <Arduino.h>  // PROGMEM, PSTR() and the *_P string functions
+#else
+#include <string.h>
+#define PROGMEM
+#define PSTR(s) (s)
+#define strlen_P strlen
+#define strcmp_P strcmp
+#define strncmp_P strncmp
+#endif
+
+#define COMMAND_LINE_SIZE 128  // Longest text line plus the terminator; longer lines are rejected whole
+
+// Binary step frames (layout documented in shakebot/protocol.py)
+#define FRAME_SYNC_0 0xA5      // First sync byte; never the start of an ASCII command
+#define FRAME_SYNC_1 0x5A      // Second sync byte
+#define FRAME_INT32 0x01       // Payload: int32 step counts
+#define FRAME_DELTA16 0x02     // Payload: int32 first step count, then int16 differences
+#define FRAME_HEADER_SIZE 9    // sync (2) + encoding (1) + offset (4) + count (2)
+#define FRAME_TIMEOUT_MS 100   // Give up on a frame whose bytes stop arriving
+
+// What feed() and poll() found
+enum CommandType {
+  COMMAND_NONE,                    // Nothing complete yet
+  COMMAND_STEP,                    // Step count line; value()
+  COMMAND_BAUD_RATE,               // BR:<baud>; value() (0 if it is not a number)
+  COMMAND_SET_PARAMS,              // SET_PARAMS pulsePerRev=... maxRPM=... lead=... maxAcceleration=... totalLength=...
+  COMMAND_SET_PLAYBACK,            // SET_PLAYBACK sampleRate=... interpolation=... controlRate=...
+  COMMAND_SET_TELEMETRY,           // SET_TELEMETRY rate=...
+  COMMAND_STREAM,
+  COMMAND_STREAM_END,
+  COMMAND_ARM,
+  COMMAND_START,
+  COMMAND_CANCEL,
+  COMMAND_STATS,
+  COMMAND_SET_DISPLACEMENT,
+  COMMAND_CALIBRATE_DISPLACEMENT,
+  COMMAND_UNKNOWN,                 // Text line that is none of the above; line()
+  COMMAND_TOO_LONG,                // Text line longer than COMMAND_LINE_SIZE - 1 bytes; dropped
+  COMMAND_FRAME_START,             // Frame header; frameOffset() and frameCount()
+  COMMAND_FRAME_VALUE,             // One step count of the frame; frameIndex() and value()
+  COMMAND_FRAME_END,               // Every value arrived and the CRC matches
+  COMMAND_FRAME_ERROR              // Frame rejected; frameError() is "SYNC", "TYPE", "TIMEOUT" or "CRC" (in PROGMEM)
+};
+
+class CommandParser {
+ public:
+  CommandParser();
+
+  // Consume one received byte; `now` is millis(), for the frame timeout
+  CommandType feed(uint8_t byte, unsigned long now);
+
+  // Call when no byte is waiting: ends a frame whose bytes stopped arriving (COMMAND_FRAME_ERROR
+  // "TIMEOUT") and the discarding of a frame of unknown type
+  CommandType poll(unsigned long now);
+
+  // Forget any partial line or frame
+  void reset();
+
+  const char *line() const { return text; }  // Current text line, without the newline
+  long value() const { return number; }       // Step count, baud rate or frame value
+
+  // Value of a key=value field of the current line, or NULL if the key is missing; `key` is in PROGMEM
+  const char *field(const char *key) const;
+  // Read a field like String::toInt()/toFloat() (a value that is not a number reads as 0);
+  // false, leaving `value` unchanged, if the key is missing
+  bool fieldLong(const char *key, long &value) const;
+  bool fieldFloat(const char *key, float &value) const;
+  // Whether the field's value is `word` (both in PROGMEM)
+  bool fieldIs(const char *key, const char *word) const;
+
+  unsigned long frameOffset() const { return offset; }
+  unsigned int frameCount() const { return count; }
+  unsigned int frameIndex() const { return index - 1; }
+  const char *frameError() const { return error; }
+
+ private:
+  enum State { PARSE_LINE, PARSE_FRAME_HEADER, PARSE_FRAME_VALUE, PARSE_FRAME_CRC, PARSE_DISCARD };
+
+  CommandType feedLine(uint8_t byte);
+  CommandType endLine();
+  CommandType feedFrame(uint8_t byte);
+  CommandType rejectFrame(const char *reason, State next);
+  bool startsWith(const char *prefix) const;
+
+  State state;
+  char text[COMMAND_LINE_SIZE];  // Text line; the frame header while receiving one
+  size_t length;                 // Bytes in text (or of the header, value or CRC being received)
+  bool overflow;                 // The line did not fit in text
+  bool numeric;                  // The line so far is an optional sign followed by digits
+  bool negative;
+  unsigned long digits;          // Value of the digits so far
+  long number;
+  unsigned long lastByte;        // millis() of the last frame byte
+  uint8_t encoding;
+  unsigned long offset;
+  unsigned int count;
+  unsigned int index;            // Values of the frame decoded so far
+  uint16_t crc;
+  const char *error;
+};
+
+// Read a number like String::toInt()/toFloat(): optional sign, digits, fraction and exponent; 0 if there is none
+long parseLong(const char *text);
+float parseFloat(const char *text);
+
+// CRC-16/CCITT-FALSE (polynomial 0x1021), matching binascii.crc_hqx on the host
+uint16_t crc16Update(uint16_t crc, const uint8_t *data, size_t length);
+
+#endif
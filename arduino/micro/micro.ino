@@ -1,4 +1,5 @@
 #include <AccelStepper.h>
+#include <CommandParser.h>  // arduino/libraries/CommandParser; shared with due.ino
 #include <TimerOne.h>
 
 #define STEP_PIN 2         // Pin for step signal
@@ -6,7 +7,12 @@
 #define LEFT_LIMIT_PIN 4   // Pin for left limit switch; motor is at the left side
 #define RIGHT_LIMIT_PIN 5  // Pin for right limit switch
 
+#define CREDIT_INTERVAL 20     // Report consumed samples every 20 ISR ticks while streaming
+#define RX_FULL 64             // Serial.available() of a full USB endpoint; the host waits until it is read
+#define RX_BATCH 16            // Received bytes parsed per loop pass, so a burst does not hold up stepper.run()
+
 AccelStepper stepper(AccelStepper::DRIVER, STEP_PIN, DIR_PIN);  // Use AccelStepper in driver mode
+CommandParser parser;  // Serial input, parsed as it arrives (commands, step counts and binary frames)
 
 int pulsePerRev = 200;        // Number of steps per revolution
 float maxRPM = 1200;          // Increase maximum speed in RPM
@@ -26,6 +32,33 @@ unsigned long endTime = 0;
 bool isSettingDisplacement = false;  // Flag to indicate setting displacement data
 bool isCalibrating = false;          // Flag to indicate calibration (moving to left limit)
 
+// Streaming playback: displacementData is used as a ring buffer indexed by absolute sample numbers
+volatile bool streamMode = false;               // Flag to indicate streaming playback
+volatile bool streamEnded = false;              // Flag set by STREAM_END once the host has sent every sample
+volatile bool streamFinished = false;           // Flag set by the ISR when the stream has been played out
+volatile unsigned long streamWritten = 0;       // Number of samples received since STREAM
+volatile unsigned long streamConsumed = 0;      // Number of samples played since STREAM
+volatile unsigned long underrunCount = 0;       // ISR ticks that found the ring buffer empty
+unsigned long lastCreditReport = 0;             // streamConsumed at the last CREDIT message
+bool frameInOrder = false;                      // The frame being received continues the buffer
+bool frameFits = false;                         // The frame being received fits in the buffer
+
+float sampleRate = 100;  // Samples per second of the uploaded record; the ISR plays one sample per tick
+
+// Instrumentation reported (and restarted) by STATS: ISR period jitter against the nominal timer period,
+// ticks lost while interrupts were blocked, receive buffer overflows and stepper loop passes
+unsigned long tickPeriod = 10000;                   // Nominal timer period in microseconds
+volatile unsigned long lastTickMicros = 0;          // micros() at the previous ISR call, 0 after a timer restart
+volatile unsigned long statsTicks = 0;              // ISR calls in the current window
+volatile unsigned long statsPeriods = 0;            // Measured ISR periods in the current window
+volatile unsigned long statsJitterSum = 0;          // Sum of |period - tickPeriod| in microseconds
+volatile unsigned long long statsJitterSquares = 0; // Sum of squared deviations, for the RMS
+volatile unsigned long statsJitterMax = 0;          // Largest |period - tickPeriod|
+volatile unsigned long statsMissedTicks = 0;        // Timer periods that passed without an ISR call
+unsigned long statsLoops = 0;                       // Stepper loop passes (stepper.run() calls)
+unsigned long statsRxFull = 0;                      // Loop passes that found the receive buffer full
+unsigned long statsWindowStart = 0;                 // micros() when the current window started
+
 bool leftLimitReached = false;  // Flag to indicate left limit reached
 bool rightLimitReached = false; // Flag to indicate right limit reached
 
@@ -39,93 +72,172 @@ void setup() {
   pinMode(LEFT_LIMIT_PIN, INPUT_PULLUP);   // Initialize limit switch pin with pullup resistor
   pinMode(RIGHT_LIMIT_PIN, INPUT_PULLUP);  // Initialize right limit switch pin
 
-  Timer1.initialize(10000);                     // 10 ms timer interrupt (100 Hz)
+  Timer1.initialize(tickPeriod);                // 10 ms timer interrupt (100 Hz); see setPlayback()
   Timer1.attachInterrupt(updateMotorPosition);  // Attach the interrupt handler
+  statsWindowStart = micros();
 }
 
 void loop() {
   stepper.run();
-  if (Serial.available() > 0) {
-    String command = Serial.readStringUntil('\n');  // Read a command from the GUI
+  statsLoops++;
+  if (Serial.available() >= RX_FULL) {
+    statsRxFull++;
+  }
+  reportStream();
+  // Parse what has arrived without waiting for the rest of a line or frame (see CommandParser.h)
+  unsigned long now = millis();
+  for (int i = 0; i < RX_BATCH && Serial.available() > 0; i++) {
+    runCommand(parser.feed(Serial.read(), now));
+  }
+  if (Serial.available() == 0) {
+    runCommand(parser.poll(now));
+  }
+}
+
+
+// Function to act on a command, step count or frame element completed by the parser
+void runCommand(CommandType command) {
+  switch (command) {
+    case COMMAND_NONE:
+      break;
+
+    case COMMAND_STEP:
+      receiveStepData(parser.value());  // Process normal displacement data
+      break;
+
+    case COMMAND_FRAME_START:
+      startStepFrame();  // Binary frame of step counts
+      break;
+
+    case COMMAND_FRAME_VALUE:
+      storeFrameValue(parser.frameIndex(), parser.value());
+      break;
+
+    case COMMAND_FRAME_END:
+      finishStepFrame();
+      break;
+
+    case COMMAND_FRAME_ERROR:
+      replyFrame(false, (const __FlashStringHelper *)parser.frameError());
+      break;
 
     // Check if the command is a baud rate change request (e.g., "BR:9600")
-    if (command.startsWith("BR:")) {
-      long newBaudRate = command.substring(3).toInt();  // Extract the baud rate value
-      if (newBaudRate > 0) {
-        changeBaudRate(newBaudRate);  // Change the baud rate
+    case COMMAND_BAUD_RATE:
+      if (parser.value() > 0) {
+        changeBaudRate(parser.value());  // Change the baud rate
       }
-    }  else if (command.startsWith("SET_PARAMS")) {
-    // Example command:
-    // SET_PARAMS pulsePerRev=200 maxRPM=1200 lead=0.02 maxAcceleration=1.1 totalLength=0.6
-
-    // Split the command into tokens
-    int pulseIdx = command.indexOf("pulsePerRev=");
-    int rpmIdx = command.indexOf("maxRPM=");
-    int leadIdx = command.indexOf("lead=");
-    int accIdx = command.indexOf("maxAcceleration=");
-    int lengthIdx = command.indexOf("totalLength=");
-
-      if (pulseIdx != -1 && rpmIdx != -1 && leadIdx != -1 && accIdx != -1 && lengthIdx != -1) {
-        pulsePerRev = command.substring(pulseIdx + 12, command.indexOf(' ', pulseIdx)).toInt();
-        maxRPM = command.substring(rpmIdx + 7, command.indexOf(' ', rpmIdx)).toFloat();
-        lead = command.substring(leadIdx + 5, command.indexOf(' ', leadIdx)).toFloat();
-        maxAcceleration = command.substring(accIdx + 16, command.indexOf(' ', accIdx)).toFloat();
-        totalLength = command.substring(lengthIdx + 12).toFloat();  // Assuming it's the last parameter
-
-        // Update motor settings based on new parameters
-        stepper.setMaxSpeed(pulsePerRev * maxRPM);
-        stepper.setAcceleration(int(maxAcceleration * pulsePerRev * 9.8 / lead));
-
-        Serial.println("Parameters updated successfully.");
-        // print out the updated parameters using F macro
-        Serial.print(F("totalLength: "));
-        Serial.println(totalLength);
-        Serial.print(F("pulsePerRev: "));
-        Serial.println(pulsePerRev);
-        Serial.print(F("maxRPM: "));
-        Serial.println(maxRPM);
-        Serial.print(F("lead: "));
-        Serial.println(lead);
-        Serial.print(F("maxAcceleration: "));
-        Serial.println(maxAcceleration);
-
-        
+      break;
+
+    case COMMAND_SET_PARAMS:
+      setParameters();
+      break;
+
+    case COMMAND_SET_PLAYBACK:
+      setPlayback();  // Sample rate of the next playback
+      break;
+
+    case COMMAND_STREAM:
+      startStream();  // Switch to streaming playback
+      break;
+
+    case COMMAND_STREAM_END:
+      streamEnded = true;  // No more samples will follow; finish once the ring buffer drains
+      break;
+
+    case COMMAND_ARM:
+      armPlayback();  // First phase of a synchronized start: report whether START would play
+      break;
+
+    case COMMAND_START:
+      // print the number of data points to be executed
+      if (streamMode) {
+        Serial.print(F("Number of data points buffered: "));
+        Serial.println(streamWritten - streamConsumed);
       } else {
-        Serial.println(F("Invalid parameters."));
+        Serial.print(F("Number of data points to be executed: "));
+        Serial.println(dataSize);
       }
-    }
-    
-    else if (command == "START") {
-      // print the number of data points to be executed
-      Serial.println("Number of data points to be executed: " + String(dataSize));
       Serial.println(F("Start executing displacement data."));
-      // If we receive the "START" command, set the flag to start executing the motion
+      // If we receive the "START" command, set the flag to start executing the motion.
+      // Restarting the timer puts the first sample one period after START, so tables
+      // started together (ARM, then START on every port) stay within a tick of each other
+      noInterrupts();
+      Timer1.restart();
+      lastTickMicros = 0;
       executeMotion = true;
-    }
+      interrupts();
+      break;
 
-    else if (command == "CANCEL"){
+    case COMMAND_CANCEL:
       stepper.stop();  // Stop the motor
-      Serial.println("Motion cancelled.");
+      Serial.println(F("Motion cancelled."));
       executeMotion = false;  // Stop execution after finishing the current displacement data
+      streamMode = false;     // Leave streaming playback
       dataSize = 0;           // Reset data size to indicate that no data is left
       currentIndex = 0;       // Reset the current index
-    }
-    
-    else if (command == "SET_DISPLACEMENT") {
+      break;
+
+    case COMMAND_STATS:
+      printStats();  // Timing and serial statistics since the last STATS
+      break;
+
+    case COMMAND_SET_DISPLACEMENT:
       setDisplacementData();  // Set displacement data
-    }
-    
-    else if (command == "CALIBRATE_DISPLACEMENT") {
+      break;
+
+    case COMMAND_CALIBRATE_DISPLACEMENT:
       startCalibration();  // Begin the calibration process
-    }
-    
-    else {
-      receiveStepData(command);  // Process normal displacement data
-    }
+      break;
+
+    case COMMAND_TOO_LONG:
+      Serial.println(F("Command too long."));
+      break;
+
+    default:
+      // Includes SET_TELEMETRY: the Micro has no accelerometer
+      Serial.print(F("Unknown command: "));
+      Serial.println(parser.line());
+      break;
   }
 }
 
 
+// Function to set the table parameters, e.g.
+// SET_PARAMS pulsePerRev=200 maxRPM=1200 lead=0.02 maxAcceleration=1.1 totalLength=0.6
+void setParameters() {
+  long newPulsePerRev;
+  float newMaxRPM, newLead, newMaxAcceleration, newTotalLength;
+  if (!parser.fieldLong(PSTR("pulsePerRev"), newPulsePerRev) || !parser.fieldFloat(PSTR("maxRPM"), newMaxRPM) ||
+      !parser.fieldFloat(PSTR("lead"), newLead) || !parser.fieldFloat(PSTR("maxAcceleration"), newMaxAcceleration) ||
+      !parser.fieldFloat(PSTR("totalLength"), newTotalLength)) {
+    Serial.println(F("Invalid parameters."));
+    return;
+  }
+  pulsePerRev = newPulsePerRev;
+  maxRPM = newMaxRPM;
+  lead = newLead;
+  maxAcceleration = newMaxAcceleration;
+  totalLength = newTotalLength;
+
+  // Update motor settings based on new parameters
+  stepper.setMaxSpeed(pulsePerRev * maxRPM);
+  stepper.setAcceleration(int(maxAcceleration * pulsePerRev * 9.8 / lead));
+
+  Serial.println(F("Parameters updated successfully."));
+  // print out the updated parameters using F macro
+  Serial.print(F("totalLength: "));
+  Serial.println(totalLength);
+  Serial.print(F("pulsePerRev: "));
+  Serial.println(pulsePerRev);
+  Serial.print(F("maxRPM: "));
+  Serial.println(maxRPM);
+  Serial.print(F("lead: "));
+  Serial.println(lead);
+  Serial.print(F("maxAcceleration: "));
+  Serial.println(maxAcceleration);
+}
+
+
 void setDisplacementData() {
   // Move the motor slowly to the left until the left limit switch is triggered
   Serial.println(F("Starting moving displacement..."));
@@ -148,9 +260,111 @@ void startCalibration() {
 }
 
 
+// Function to set the playback sample rate, e.g. SET_PLAYBACK sampleRate=100 interpolation=step
+// The Micro plays one sample per timer tick; interpolation between samples needs the Due
+void setPlayback() {
+  if (executeMotion) {
+    Serial.println(F("Cannot change playback while moving."));
+    return;
+  }
+  float newSampleRate = sampleRate;
+  parser.fieldFloat(PSTR("sampleRate"), newSampleRate);
+  if (parser.field(PSTR("interpolation")) != NULL && !parser.fieldIs(PSTR("interpolation"), PSTR("step"))) {
+    Serial.println(F("Interpolation is not supported on this board."));
+    return;
+  }
+  if (newSampleRate <= 0 || newSampleRate > 1000) {
+    Serial.println(F("Invalid playback settings."));
+    return;
+  }
+
+  sampleRate = newSampleRate;
+  noInterrupts();
+  tickPeriod = (unsigned long)(1000000.0 / sampleRate + 0.5);
+  lastTickMicros = 0;  // The first period after a restart is not a full one
+  interrupts();
+  Timer1.setPeriod(tickPeriod);  // Timer period in microseconds
+  Serial.print(F("Playback set: sampleRate="));
+  Serial.print(sampleRate);
+  Serial.println(F(" interpolation=step"));
+}
+
+
+// Function to answer ARM with "ARMED <samples>" when START would play a record now, or
+// "NOT_ARMED BUSY" / "NOT_ARMED EMPTY"; the host arms every table before starting them together
+void armPlayback() {
+  noInterrupts();
+  unsigned long buffered = streamMode ? streamWritten - streamConsumed : (unsigned long)dataSize;
+  bool busy = executeMotion || isSettingDisplacement || isCalibrating;
+  interrupts();
+  if (busy) {
+    Serial.println(F("NOT_ARMED BUSY"));
+  } else if (buffered == 0) {
+    Serial.println(F("NOT_ARMED EMPTY"));
+  } else {
+    Serial.print(F("ARMED "));
+    Serial.println(buffered);
+  }
+}
+
+
+void startStream() {
+  // Reset the ring buffer and wait for binary frames followed by START
+  noInterrupts();
+  executeMotion = false;
+  streamMode = true;
+  streamEnded = false;
+  streamFinished = false;
+  streamWritten = 0;
+  streamConsumed = 0;
+  underrunCount = 0;
+  dataSize = 0;
+  currentIndex = 0;
+  interrupts();
+  lastCreditReport = 0;
+  Serial.print(F("STREAM_READY "));
+  Serial.println(maxDisplacement);
+}
+
+
+// Function to report streaming progress: "CREDIT <consumed> <underruns>" and "STREAM_DONE <consumed> <underruns>"
+void reportStream() {
+  if (!streamMode && !streamFinished) {
+    return;
+  }
+  noInterrupts();
+  unsigned long consumed = streamConsumed;
+  unsigned long underruns = underrunCount;
+  bool finished = streamFinished;
+  streamFinished = false;
+  interrupts();
+
+  if (finished) {
+    Serial.print(F("STREAM_DONE "));
+  } else if (consumed - lastCreditReport >= CREDIT_INTERVAL) {
+    Serial.print(F("CREDIT "));
+  } else {
+    return;
+  }
+  lastCreditReport = consumed;
+  Serial.print(consumed);
+  Serial.print(' ');
+  Serial.println(underruns);
+
+  if (finished) {
+    Serial.print(F("Motion completed in "));
+    Serial.print(endTime - startTime);
+    Serial.println(F(" milliseconds."));
+  }
+}
+
+
 // Function to receive step counts
-void receiveStepData(String dataString) {
-  long steps = dataString.toInt();
+void receiveStepData(long steps) {
+  if (streamMode) {
+    Serial.println(F("Use binary frames while streaming."));
+    return;
+  }
   if (dataSize < maxDisplacement) {
     noInterrupts();
     displacementData[dataSize] = steps;  // Store steps directly
@@ -161,8 +375,134 @@ void receiveStepData(String dataString) {
   }
 }
 
-// Interrupt Service Routine (ISR) to update the motor position at 100 Hz
+
+// Function to check a binary frame header: the frame must continue the buffer and fit in it.
+// Samples are written past dataSize (or the ring buffer head) and only committed
+// once the CRC matches, so the ISR never sees a partially received frame
+void startStepFrame() {
+  noInterrupts();
+  unsigned long buffered = streamMode ? streamWritten - streamConsumed : (unsigned long)dataSize;
+  interrupts();
+  frameInOrder = parser.frameOffset() == frameOffset();
+  frameFits = parser.frameCount() <= maxDisplacement - buffered;
+}
+
+
+// Function to store one step count of the frame being received
+void storeFrameValue(unsigned int i, long value) {
+  if (frameInOrder && frameFits && streamMode) {
+    displacementData[(streamWritten + i) % maxDisplacement] = value;
+  } else if (frameInOrder && frameFits) {
+    displacementData[dataSize + i] = value;
+  }
+}
+
+
+// Function to commit a frame whose CRC matched and reply with ACK/NAK
+void finishStepFrame() {
+  if (!frameInOrder) {
+    replyFrame(false, F("OFFSET"));
+  } else if (!frameFits) {
+    replyFrame(false, F("FULL"));
+  } else {
+    noInterrupts();
+    if (streamMode) {
+      streamWritten += parser.frameCount();
+    } else {
+      dataSize += parser.frameCount();
+    }
+    interrupts();
+    replyFrame(true, NULL);
+  }
+}
+
+
+// Offset the next frame must carry: the buffer size, or the absolute sample number while streaming
+unsigned long frameOffset() {
+  noInterrupts();
+  unsigned long offset = streamMode ? streamWritten : (unsigned long)dataSize;
+  interrupts();
+  return offset;
+}
+
+
+// Function to answer a binary frame with "ACK <offset>" or "NAK <offset> <reason>"
+void replyFrame(bool accepted, const __FlashStringHelper *reason) {
+  Serial.print(accepted ? F("ACK ") : F("NAK "));
+  Serial.print(frameOffset());
+  if (reason != NULL) {
+    Serial.print(' ');
+    Serial.print(reason);
+  }
+  Serial.println();
+}
+
+
+// Function to measure the ISR period against the nominal timer period; called first thing in the ISR
+void recordTick() {
+  unsigned long now = micros();
+  if (lastTickMicros != 0) {
+    unsigned long period = now - lastTickMicros;
+    unsigned long deviation = period > tickPeriod ? period - tickPeriod : tickPeriod - period;
+    statsJitterSum += deviation;
+    statsJitterSquares += (unsigned long long)deviation * deviation;
+    if (deviation > statsJitterMax) {
+      statsJitterMax = deviation;
+    }
+    if (period > tickPeriod + tickPeriod / 2) {
+      statsMissedTicks += (period + tickPeriod / 2) / tickPeriod - 1;  // Whole periods without a call
+    }
+    statsPeriods++;
+  }
+  lastTickMicros = now;
+  statsTicks++;
+}
+
+
+// Function to report the statistics of the current window and start a new one, e.g.
+// STATS window_us=1000000 ticks=100 period_us=10000 jitter_mean_us=2.10 jitter_rms_us=2.50 jitter_max_us=9
+//       missed=0 rx_full=0 loop_hz=84211 (on one line)
+void printStats() {
+  noInterrupts();
+  unsigned long ticks = statsTicks;
+  unsigned long periods = statsPeriods;
+  unsigned long jitterSum = statsJitterSum;
+  unsigned long long jitterSquares = statsJitterSquares;
+  unsigned long jitterMax = statsJitterMax;
+  unsigned long missed = statsMissedTicks;
+  statsTicks = statsPeriods = statsJitterSum = statsJitterMax = statsMissedTicks = 0;
+  statsJitterSquares = 0;
+  interrupts();
+  unsigned long now = micros();
+  unsigned long window = now - statsWindowStart;
+  statsWindowStart = now;
+
+  Serial.print(F("STATS window_us="));
+  Serial.print(window);
+  Serial.print(F(" ticks="));
+  Serial.print(ticks);
+  Serial.print(F(" period_us="));
+  Serial.print(tickPeriod);
+  Serial.print(F(" jitter_mean_us="));
+  Serial.print(periods ? (float)jitterSum / periods : 0.0);
+  Serial.print(F(" jitter_rms_us="));
+  Serial.print(periods ? sqrt((float)jitterSquares / periods) : 0.0);
+  Serial.print(F(" jitter_max_us="));
+  Serial.print(jitterMax);
+  Serial.print(F(" missed="));
+  Serial.print(missed);
+  Serial.print(F(" rx_full="));
+  Serial.print(statsRxFull);
+  Serial.print(F(" loop_hz="));
+  Serial.println(window ? (unsigned long)(statsLoops * 1000000.0 / window) : 0);
+  statsRxFull = 0;
+  statsLoops = 0;
+}
+
+
+// Interrupt Service Routine (ISR) to update the motor position at the sample rate
 void updateMotorPosition() {
+    recordTick();
   
     if (isCalibrating) {
       if (digitalRead(LEFT_LIMIT_PIN) == LOW && !leftLimitReached)
@@ -237,6 +577,11 @@ void updateMotorPosition() {
   }
   
 
+  if (streamMode) {
+    updateStreamPosition();
+    return;
+  }
+
   if (dataSize == 0 || !executeMotion) {
     startTime = millis();
     return;  // Do nothing if no data or not started
@@ -258,6 +603,31 @@ void updateMotorPosition() {
 }
 
 
+// Streaming counterpart of the playback step above: consume one sample from the ring buffer
+void updateStreamPosition() {
+  if (!executeMotion) {
+    startTime = millis();
+    return;  // Keep filling the ring buffer until START
+  }
+
+  if (streamConsumed == streamWritten) {
+    if (streamEnded) {
+      // Every sample has been played; loop() reports STREAM_DONE
+      executeMotion = false;
+      streamMode = false;
+      streamFinished = true;
+      endTime = millis();
+    } else {
+      underrunCount++;  // Host fell behind; hold the last target until data arrives
+    }
+    return;
+  }
+
+  stepper.moveTo(displacementData[streamConsumed % maxDisplacement]);
+  streamConsumed++;
+}
+
+
 // Function to change the baud rate dynamically
 void changeBaudRate(long newBaudRate) {
   Serial.println(F("Changing baud rate..."));
@@ -266,5 +636,6 @@ void changeBaudRate(long newBaudRate) {
 
   baudRate = newBaudRate;  // Set the new baud rate
   Serial.begin(baudRate);  // Reinitialize the serial communication with the new baud rate
-  Serial.println("Baud rate changed to: " + String(baudRate));
+  Serial.print(F("Baud rate changed to: "));
+  Serial.println(baudRate);
 }
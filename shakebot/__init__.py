@@ -0,0 +1,8 @@
+"""
+Host-side API for the Seismove shakebot controllers.
+
+Importing the package only loads numpy; serial, pandas, obspy and matplotlib
+are imported by the functions that need them.
+"""
+from shakebot.device import Shakebot
+from shakebot.signals import cosine_pulse, random_ground_motion
@@ -0,0 +1,3 @@
+from shakebot.cli import main
+
+raise SystemExit(main())
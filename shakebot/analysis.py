@@ -0,0 +1,315 @@
+"""
+Commanded-versus-achieved analysis of table runs.
+
+A run pairs the commanded record (the (N, 2) time/displacement array that was
+uploaded) with a logged response: the executed step positions or the
+accelerometer of a telemetry capture (see shakebot.telemetry and
+telemetry_response()). analyze_runs() processes a whole suite at once:
+
+    1. align()                resample the response onto the command's time grid
+                              and remove the delay found by FFT cross-correlation
+    2. tracking error         RMS, peak and normalised RMS error per run
+    3. transfer_function()    H(f) = Pxy / Pxx and coherence |Pxy|² / (Pxx Pyy) (Welch)
+    4. response_spectrum()    5 %-damped pseudo-spectral acceleration (PSA) of
+                              the target and the achieved motion
+    5. qualify()              gain, coherence and PSA ratio inside a frequency band
+
+Stages 3 to 5 work on (runs, samples) arrays. Runs of different length are
+zero-padded to a common length, which changes neither the Welch ratios (empty
+segments add nothing to Pxy, Pxx or Pyy) nor the response spectra (the padding
+is free vibration), so hundreds of runs cost a handful of FFT calls.
+"""
+import numpy as np
+
+from shakebot.feasibility import kinematics
+
+DEFAULT_PERIODS = np.geomspace(0.05, 5.0, 60)  # Seconds; 0.2 to 20 Hz
+DEFAULT_DAMPING = 0.05
+DEFAULT_SEGMENT_SECONDS = 2.56                 # Welch segment length; 0.39 Hz resolution
+MIN_WELCH_SEGMENTS = 8                         # Shorter segments on short runs; one segment has coherence 1
+MAX_LAG_SECONDS = 1.0                          # Largest delay align() searches
+RESPONSE_KINDS = ("displacement", "acceleration")
+
+
+def telemetry_response(samples, meters_per_step, kind="displacement", axis=0):
+    """
+    Response of a telemetry capture.
+
+    Args:
+        samples (np.ndarray): Samples of one motion (shakebot.telemetry.SAMPLE_DTYPE).
+        meters_per_step (float): lead / pulse_per_rev of the table.
+        kind (str): "displacement" for the executed step positions, "acceleration"
+            for the accelerometer axis `axis` (offset removed).
+        axis (int): Accelerometer axis along the table.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Time since START (s) and the response
+        (m or m/s²).
+    """
+    from shakebot.telemetry import to_physical
+
+    physical = to_physical(samples)
+    if kind == "displacement":
+        return physical["time"], physical["position"] * meters_per_step
+    if kind == "acceleration":
+        values = physical["acceleration"][:, axis]
+        return physical["time"], values - values.mean()
+    raise ValueError(f"Unknown response kind {kind!r}; choose one of {', '.join(RESPONSE_KINDS)}.")
+
+
+def commanded(data, kind="displacement"):
+    """The commanded displacement, or its acceleration, of a (N, 2) record."""
+    _, displacement, _, acceleration = kinematics(data)
+    return displacement if kind == "displacement" else acceleration
+
+
+def align(data, time, response, kind="displacement", max_lag=MAX_LAG_SECONDS):
+    """
+    Put a response on the command's time grid, delayed so it lines up best.
+
+    The delay is the peak of the FFT cross-correlation of the two signals,
+    refined to a fraction of a sample by a parabola through the peak.
+
+    Args:
+        data (np.ndarray): (N, 2) commanded time/displacement record.
+        time (np.ndarray): Response times in seconds since the command started.
+        response (np.ndarray): Response values (m, or m/s² for kind="acceleration").
+        kind (str): "displacement" or "acceleration".
+        max_lag (float): Largest delay in seconds to consider (at most a
+            quarter of the record).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, float]: The command and the aligned
+        response (both (N,), in the units of `kind`) and the delay in seconds.
+    """
+    data = np.asarray(data, dtype=float)
+    grid = data[:, 0] - data[0, 0]
+    dt = float(np.median(np.diff(grid)))
+    target = commanded(data, kind)
+    resampled = np.interp(grid, time, response)
+
+    # Circular cross-correlation of the mean-free signals, padded so lags do not wrap
+    n = len(grid)
+    nfft = int(2 ** np.ceil(np.log2(2 * n)))
+    spectrum = np.fft.rfft(resampled - resampled.mean(), nfft) * np.conj(np.fft.rfft(target - target.mean(), nfft))
+    correlation = np.fft.irfft(spectrum, nfft)
+    lags = max(min(int(max_lag / dt), n // 4), 1)  # Short records: at most a quarter of their length
+    window = np.concatenate((correlation[nfft - lags:], correlation[:lags + 1]))  # Lags -lags .. lags
+    peak = int(np.argmax(window))
+    shift = float(peak - lags)
+    if 0 < peak < len(window) - 1:
+        left, centre, right = window[peak - 1:peak + 2]
+        curvature = left - 2 * centre + right
+        if curvature < 0:
+            shift += 0.5 * (left - right) / curvature
+    delay = shift * dt
+    return target, np.interp(grid + delay, time, response), delay
+
+
+def tracking_error(target, achieved):
+    """
+    Tracking error of aligned runs.
+
+    Args:
+        target, achieved (np.ndarray): (N,) or (runs, N) aligned signals.
+
+    Returns:
+        dict: rms_error, max_error and nrmse (RMS error over RMS target), one value per run.
+    """
+    error = np.asarray(achieved) - np.asarray(target)
+    rms = np.sqrt(np.mean(error**2, axis=-1))
+    scale = np.sqrt(np.mean(np.asarray(target)**2, axis=-1))
+    return {"rms_error": rms, "max_error": np.abs(error).max(axis=-1),
+            "nrmse": np.divide(rms, scale, out=np.full_like(rms, np.nan), where=scale > 0)}
+
+
+def transfer_function(target, achieved, sample_rate, segment_seconds=DEFAULT_SEGMENT_SECONDS):
+    """
+    Welch estimate of the transfer function from target to achieved motion.
+
+    Args:
+        target, achieved (np.ndarray): (N,) or (runs, N) aligned signals.
+        sample_rate (float): Sample rate in Hz.
+        segment_seconds (float): Welch segment length (Hann window, 50 % overlap);
+            shortened so at least MIN_WELCH_SEGMENTS are averaged.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: Frequencies (F,), complex
+        H(f) and coherence, each (F,) or (runs, F).
+    """
+    from scipy.signal import csd, welch
+
+    target = np.asarray(target, dtype=float)
+    achieved = np.asarray(achieved, dtype=float)
+    nperseg = min(int(round(segment_seconds * sample_rate)), 2 * target.shape[-1] // (MIN_WELCH_SEGMENTS + 1))
+    nperseg = max(nperseg, min(16, target.shape[-1]))
+    frequencies, pxx = welch(target, sample_rate, nperseg=nperseg, axis=-1)
+    _, pyy = welch(achieved, sample_rate, nperseg=nperseg, axis=-1)
+    _, pxy = csd(target, achieved, sample_rate, nperseg=nperseg, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        transfer = pxy / pxx
+        coherence = np.abs(pxy)**2 / (pxx * pyy)
+    return frequencies, transfer, coherence
+
+
+def response_spectrum(acceleration, sample_rate, periods=DEFAULT_PERIODS, damping=DEFAULT_DAMPING):
+    """
+    Pseudo-spectral acceleration of one or many acceleration records.
+
+    The relative displacement of every damped oscillator is computed exactly
+    in the frequency domain, u(ω) = -A(ω) / (ωn² - ω² + 2iζωnω), on records
+    zero-padded until the longest-period oscillator has decayed, so each
+    period costs one inverse FFT for all runs together.
+
+    Args:
+        acceleration (np.ndarray): (N,) or (runs, N) ground accelerations in m/s².
+        sample_rate (float): Sample rate in Hz.
+        periods (np.ndarray): Oscillator periods in seconds.
+        damping (float): Damping ratio.
+
+    Returns:
+        np.ndarray: PSA = ωn² max|u| in m/s², (periods,) or (runs, periods).
+    """
+    from scipy.fft import irfft, next_fast_len, rfft
+
+    acceleration = np.asarray(acceleration, dtype=float)
+    periods = np.asarray(periods, dtype=float)
+    samples = acceleration.shape[-1]
+    # Free vibration decays to 1 % within ln(100) / (ζ ωn) seconds
+    decay = np.log(100.0) / (damping * 2 * np.pi / periods.max())
+    nfft = next_fast_len(samples + int(np.ceil(decay * sample_rate)), real=True)
+    spectrum = rfft(acceleration, nfft, axis=-1, workers=-1)
+    omega = 2 * np.pi * np.fft.rfftfreq(nfft, 1.0 / sample_rate)
+
+    psa = np.empty(acceleration.shape[:-1] + periods.shape)
+    for i, period in enumerate(periods):
+        natural = 2 * np.pi / period
+        # Oscillator response once per period, shared by every run
+        oscillator = -1.0 / (natural**2 - omega**2 + 2j * damping * natural * omega)
+        displacement = irfft(spectrum * oscillator, nfft, axis=-1, workers=-1)
+        psa[..., i] = natural**2 * np.maximum(displacement.max(axis=-1), -displacement.min(axis=-1))
+    return psa
+
+
+def _pad(signals, length):
+    # Stack 1-D signals into a (runs, length) array, zero-padded at the end
+    out = np.zeros((len(signals), length))
+    for row, signal in zip(out, signals):
+        row[:len(signal)] = signal
+    return out
+
+
+def analyze_runs(commands, responses, kind="displacement", periods=DEFAULT_PERIODS, damping=DEFAULT_DAMPING,
+                 segment_seconds=DEFAULT_SEGMENT_SECONDS, band=None, max_lag=MAX_LAG_SECONDS):
+    """
+    Compare many runs with their commands.
+
+    Args:
+        commands (list[np.ndarray]): (N, 2) commanded records, all at the same sample rate.
+        responses (list[tuple]): (time, values) per run, e.g. from telemetry_response().
+        kind (str): What the responses measure, "displacement" or "acceleration".
+        periods, damping: Oscillators for the response spectra.
+        segment_seconds (float): Welch segment length.
+        band (tuple): (low, high) Hz; adds qualify() results when given.
+        max_lag (float): Largest delay in seconds align() considers.
+
+    Returns:
+        dict: Per run: delay (s), rms_error, max_error, nrmse, transfer and
+        coherence ((runs, F) at "frequencies"), psa_target and psa_achieved
+        ((runs, P) at "periods"), plus the qualify() fields with a band.
+    """
+    if kind not in RESPONSE_KINDS:
+        raise ValueError(f"Unknown response kind {kind!r}; choose one of {', '.join(RESPONSE_KINDS)}.")
+    if len(commands) != len(responses) or not commands:
+        raise ValueError("Expected one response per command.")
+    rates = np.array([(len(data) - 1) / (data[-1, 0] - data[0, 0]) for data in map(np.asarray, commands)])
+    if np.ptp(rates) > 1e-6 * rates.max():
+        raise ValueError("All commands must share one sample rate; resample them first (shakebot.preprocess).")
+    sample_rate = float(rates[0])
+
+    targets, achieved, delays = [], [], []
+    for data, (time, values) in zip(commands, responses):
+        target, response, delay = align(data, np.asarray(time, dtype=float), np.asarray(values, dtype=float),
+                                        kind, max_lag)
+        targets.append(target)
+        achieved.append(response)
+        delays.append(delay)
+    length = max(len(target) for target in targets)
+    targets, achieved = _pad(targets, length), _pad(achieved, length)
+
+    result = {"sample_rate": sample_rate, "kind": kind, "delay": np.array(delays)}
+    # Padding is zero error, so the per-run means use each run's own length
+    lengths = np.array([len(data) for data in commands])
+    error = achieved - targets
+    rms = np.sqrt((error**2).sum(axis=-1) / lengths)
+    scale = np.sqrt((targets**2).sum(axis=-1) / lengths)
+    result.update(rms_error=rms, max_error=np.abs(error).max(axis=-1),
+                  nrmse=np.divide(rms, scale, out=np.full_like(rms, np.nan), where=scale > 0))
+
+    nperseg_seconds = min(segment_seconds, 2 * lengths.min() / ((MIN_WELCH_SEGMENTS + 1) * sample_rate))
+    frequencies, transfer, coherence = transfer_function(targets, achieved, sample_rate, nperseg_seconds)
+    result.update(frequencies=frequencies, transfer=transfer, coherence=coherence)
+
+    if kind == "displacement":
+        # Second differences of the padded rows; the step at the end of a short run is outside its own length
+        target_acceleration = np.gradient(np.gradient(targets, axis=-1), axis=-1) * sample_rate**2
+        achieved_acceleration = np.gradient(np.gradient(achieved, axis=-1), axis=-1) * sample_rate**2
+        for row, n in enumerate(lengths):
+            target_acceleration[row, n - 1:] = 0.0
+            achieved_acceleration[row, n - 1:] = 0.0
+    else:
+        target_acceleration, achieved_acceleration = targets, achieved
+    result["periods"] = np.asarray(periods, dtype=float)
+    result["psa_target"] = response_spectrum(target_acceleration, sample_rate, periods, damping)
+    result["psa_achieved"] = response_spectrum(achieved_acceleration, sample_rate, periods, damping)
+    if band is not None:
+        result.update(qualify(result, band))
+    return result
+
+
+def qualify(result, band, gain_tolerance_db=1.0, min_coherence=0.9, psa_tolerance=0.2):
+    """
+    Decide per run whether the table reproduces a frequency band.
+
+    Args:
+        result (dict): Output of analyze_runs().
+        band (tuple): (low, high) frequencies in Hz.
+        gain_tolerance_db (float): Largest allowed |20 log10 |H|| in the band.
+        min_coherence (float): Smallest allowed coherence in the band.
+        psa_tolerance (float): Largest allowed |PSA achieved / PSA target - 1|
+            for periods inside the band.
+
+    Returns:
+        dict: band, gain_error_db, phase_lag_deg (largest in the band),
+        min_coherence, psa_error and qualified (bool), one value per run.
+    """
+    low, high = band
+    in_band = (result["frequencies"] >= low) & (result["frequencies"] <= high)
+    in_periods = (result["periods"] >= 1.0 / high) & (result["periods"] <= 1.0 / low)
+    if not in_band.any() or not in_periods.any():
+        raise ValueError(f"The band {low:g}-{high:g} Hz holds no frequency bin or period; widen it.")
+    transfer = result["transfer"][..., in_band]
+    gain_error = np.abs(20 * np.log10(np.abs(transfer))).max(axis=-1)
+    phase_lag = -np.degrees(np.angle(transfer)).min(axis=-1)
+    coherence = result["coherence"][..., in_band].min(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = result["psa_achieved"][..., in_periods] / result["psa_target"][..., in_periods]
+    psa_error = np.abs(ratio - 1).max(axis=-1)
+    qualified = (gain_error <= gain_tolerance_db) & (coherence >= min_coherence) & (psa_error <= psa_tolerance)
+    return {"band": (low, high), "gain_error_db": gain_error, "phase_lag_deg": phase_lag,
+            "min_coherence": coherence, "psa_error": psa_error, "qualified": qualified}
+
+
+def describe(result, run=0, names=None):
+    """One-line summary of run `run` of an analyze_runs() result."""
+    unit = "mm" if result["kind"] == "displacement" else "m/s²"
+    factor = 1000.0 if result["kind"] == "displacement" else 1.0
+    text = (f"{names[run] if names else f'run {run}'}: delay {result['delay'][run] * 1000:.0f} ms, "
+            f"RMS error {result['rms_error'][run] * factor:.2f} {unit} (NRMSE {result['nrmse'][run]:.1%}), "
+            f"max {result['max_error'][run] * factor:.2f} {unit}")
+    if "qualified" in result:
+        low, high = result["band"]
+        text += (f"; {low:g}-{high:g} Hz: gain error {result['gain_error_db'][run]:.2f} dB, "
+                 f"coherence >= {result['min_coherence'][run]:.2f}, PSA error {result['psa_error'][run]:.0%} -> "
+                 f"{'QUALIFIED' if result['qualified'][run] else 'NOT QUALIFIED'}")
+    return text
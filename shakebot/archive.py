@@ -0,0 +1,320 @@
+"""
+Experiment archive: every played record with its telemetry and controller output.
+
+Each run is one HDF5 file (requires h5py) with chunked, compressed datasets,
+and its metadata is a row in a SQLite index next to them, so a query never
+opens the array data:
+
+    <root>/index.sqlite           one row per run: table, source, event, PGD/PGV/PGA, status, ...
+    <root>/runs/000042.h5
+        command     (N, 2) time/displacement as played
+        steps       (N,) step targets sent to the controller
+        telemetry   accelerometer samples (shakebot.telemetry.SAMPLE_DTYPE), appended while the table moves
+        serial      controller lines, appended as they arrive, with their host times in serial_time
+
+The run's table parameters and free-form metadata are stored as JSON in the
+index and as attributes of the file. Telemetry and serial lines are appended
+as they arrive and flushed at most every FLUSH_INTERVAL seconds, so a crash
+loses at most that much of a run:
+
+    archive = Archive()
+    run = archive.start_run(data, steps, table_name="table2", parameters=table.parameters)
+    run.log(lines); run.append("telemetry", samples); run.finish("done", completed)
+    archive.find(table_name="table2", min_pga=3.0)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.expanduser("~"), "shakebot-archive")
+CHUNK_ROWS = 4096      # Rows per HDF5 chunk of the array datasets
+FLUSH_INTERVAL = 1.0   # Seconds between flushes of a run that is being appended to
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL,
+    status TEXT NOT NULL DEFAULT 'running',
+    completed TEXT,
+    error TEXT,
+    table_name TEXT,
+    board TEXT,
+    source TEXT,
+    event_id TEXT, magnitude REAL, station TEXT, distance_km REAL,
+    sample_rate REAL, samples INTEGER, duration REAL,
+    pgd REAL, pgv REAL, pga REAL,
+    measured_pga REAL,
+    telemetry_samples INTEGER NOT NULL DEFAULT 0,
+    parameters TEXT,
+    metadata TEXT,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS runs_table ON runs (table_name, started);
+CREATE INDEX IF NOT EXISTS runs_pga ON runs (pga);
+CREATE INDEX IF NOT EXISTS runs_pgv ON runs (pgv);
+"""
+COLUMNS = ("id", "started", "finished", "status", "completed", "error", "table_name", "board", "source", "event_id",
+           "magnitude", "station", "distance_km", "sample_rate", "samples", "duration", "pgd", "pgv", "pga",
+           "measured_pga", "telemetry_samples", "parameters", "metadata", "path")
+# Keys of start_run(metadata=...) that get their own index column
+METADATA_COLUMNS = ("event_id", "magnitude", "station", "distance_km")
+
+
+class Archive:
+    """
+    Directory of run files with a SQLite index.
+
+    Args:
+        root (str): Archive directory; created if it does not exist.
+    """
+
+    def __init__(self, root=DEFAULT_ARCHIVE_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, "runs"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()  # Runs finish from whichever thread saw the motion end
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def start_run(self, command, steps=None, table_name=None, board=None, parameters=None, source=None,
+                  metadata=None):
+        """
+        Create a run and write the record it plays.
+
+        Args:
+            command (np.ndarray): (N, 2) time/displacement record as played.
+            steps (np.ndarray): Step targets sent to the controller.
+            table_name (str): Which table played it (e.g. the device or a label).
+            board (str): Controller board.
+            parameters (dict): Table parameters (Shakebot.parameters).
+            source (str): Where the record came from (file path, "iris", "cosine pulse", ...).
+            metadata (dict): JSON-serializable details, e.g. the IRIS event summary or the pulse
+                parameters; event_id, magnitude, station and distance_km are also indexed.
+
+        Returns:
+            Run: The open run; call finish() when the motion is over.
+        """
+        import h5py
+
+        from shakebot.device import record_sample_rate
+        from shakebot.feasibility import kinematics
+
+        command = np.asarray(command, dtype=np.float64)
+        metadata = dict(metadata or {})
+        _, displacement, velocity, acceleration = kinematics(command)
+        peaks = [float(np.abs(values).max()) if values.size else 0.0
+                 for values in (displacement, velocity, acceleration)]
+        sample_rate = record_sample_rate(command) if len(command) > 1 else None
+        row = {"started": time.time(), "table_name": table_name, "board": board, "source": source,
+               "sample_rate": sample_rate, "samples": len(command),
+               "duration": float(command[-1, 0] - command[0, 0]) if len(command) else 0.0,
+               "pgd": peaks[0], "pgv": peaks[1], "pga": peaks[2],
+               "parameters": json.dumps(parameters or {}), "metadata": json.dumps(metadata, default=str), "path": ""}
+        row.update({name: _plain(metadata.get(name)) for name in METADATA_COLUMNS})
+        with self._lock:
+            run_id = self.db.execute(f"INSERT INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                                     tuple(row.values())).lastrowid
+            path = os.path.join("runs", f"{run_id:06d}.h5")
+            self.db.execute("UPDATE runs SET path = ? WHERE id = ?", (path, run_id))
+            self.db.commit()
+
+        f = h5py.File(os.path.join(self.root, path), "w")
+        f.attrs["run_id"] = run_id
+        f.attrs["started"] = row["started"]
+        f.attrs["parameters"] = row["parameters"]
+        f.attrs["metadata"] = row["metadata"]
+        _write(f, "command", command)
+        if steps is not None:
+            _write(f, "steps", np.asarray(steps, dtype=np.int32))
+        f.flush()
+        return Run(self, run_id, f)
+
+    def _finish(self, run_id, status, completed, error, measured_pga, telemetry_samples):
+        with self._lock:
+            self.db.execute("UPDATE runs SET status = ?, completed = ?, error = ?, finished = ?, measured_pga = ?, "
+                            "telemetry_samples = ? WHERE id = ?",
+                            (status, completed, error, time.time(), measured_pga, telemetry_samples, run_id))
+            self.db.commit()
+
+    def find(self, table_name=None, status=None, source=None, min_pga=None, max_pga=None, min_pgv=None,
+             max_pgv=None, min_magnitude=None, since=None, until=None, limit=None):
+        """
+        Query the run index without opening any run file.
+
+        Args:
+            table_name, status, source (str): Exact matches.
+            min_pga, max_pga (float): Commanded peak acceleration bounds in m/s².
+            min_pgv, max_pgv (float): Commanded peak velocity bounds in m/s.
+            min_magnitude (float): Only runs of events at least this large.
+            since, until (float): Start time bounds (time.time() seconds).
+            limit (int): Most recent runs only.
+
+        Returns:
+            list[dict]: Index rows (parameters and metadata decoded), oldest first.
+        """
+        clauses, values = [], []
+        for column, operator, value in (("table_name", "=", table_name), ("status", "=", status),
+                                        ("source", "=", source), ("pga", ">=", min_pga), ("pga", "<=", max_pga),
+                                        ("pgv", ">=", min_pgv), ("pgv", "<=", max_pgv),
+                                        ("magnitude", ">=", min_magnitude), ("started", ">=", since),
+                                        ("started", "<=", until)):
+            if value is not None:
+                clauses.append(f"{column} {operator} ?")
+                values.append(value)
+        query = f"SELECT {', '.join(COLUMNS)} FROM runs"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY started DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        rows = [dict(zip(COLUMNS, row)) for row in self.db.execute(query, values)]
+        for row in rows:
+            row["parameters"] = json.loads(row["parameters"] or "{}")
+            row["metadata"] = json.loads(row["metadata"] or "{}")
+        return rows[::-1]
+
+    def load(self, run_id):
+        """
+        Read a run's arrays.
+
+        Returns:
+            dict: "command", "steps", "telemetry", "serial" (list of str) and
+            "serial_time" for the datasets the run has, plus "attributes".
+        """
+        import h5py
+
+        (path,) = self.db.execute("SELECT path FROM runs WHERE id = ?", (run_id,)).fetchone()
+        with h5py.File(os.path.join(self.root, path), "r") as f:
+            result = {"attributes": dict(f.attrs)}
+            for name, dataset in f.items():
+                result[name] = ([line.decode() for line in dataset[()]] if name == "serial" else dataset[()])
+        return result
+
+
+class Run:
+    """
+    One run being recorded; created by Archive.start_run().
+
+    append() and log() may be called from any thread.
+    """
+
+    def __init__(self, archive, run_id, file):
+        self.archive = archive
+        self.id = run_id
+        self.file = file
+        self.finished = False
+        self._lock = threading.Lock()
+        self._flushed = time.perf_counter()
+
+    @property
+    def path(self):
+        return self.file.filename
+
+    def append(self, name, rows):
+        """
+        Append rows to a resizable dataset, creating it on the first call.
+
+        Args:
+            name (str): Dataset name, e.g. "telemetry".
+            rows (np.ndarray): Rows to append (structured arrays are kept as compound datasets).
+        """
+        rows = np.asarray(rows)
+        if not len(rows):
+            return
+        with self._lock:
+            if self.finished:
+                return
+            if name not in self.file:
+                _write(self.file, name, rows[:0], resizable=True)
+            dataset = self.file[name]
+            start = dataset.shape[0]
+            dataset.resize(start + len(rows), axis=0)
+            dataset[start:] = rows
+            self._maybe_flush()
+
+    def log(self, lines):
+        """Append controller lines (str or list of str) with the current host time."""
+        import h5py
+
+        lines = [lines] if isinstance(lines, str) else list(lines)
+        # HDF5 strings cannot hold NUL bytes, which appear when binary data is read as text
+        lines = [line.replace("\x00", "") for line in lines]
+        if not lines:
+            return
+        now = np.full(len(lines), time.time())
+        with self._lock:
+            if self.finished:
+                return
+            if "serial" not in self.file:
+                self.file.create_dataset("serial", shape=(0,), maxshape=(None,), chunks=(256,),
+                                         dtype=h5py.string_dtype(), compression="gzip")
+                self.file.create_dataset("serial_time", shape=(0,), maxshape=(None,), chunks=(256,),
+                                         dtype=np.float64, compression="gzip")
+            for name, values in (("serial", np.array(lines, dtype=object)), ("serial_time", now)):
+                dataset = self.file[name]
+                start = dataset.shape[0]
+                dataset.resize(start + len(lines), axis=0)
+                dataset[start:] = values
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.perf_counter() - self._flushed >= FLUSH_INTERVAL:
+            self.file.flush()
+            self._flushed = time.perf_counter()
+
+    def finish(self, status="done", completed=None, measured_pga=None, error=None):
+        """
+        Close the run file and record the outcome in the index; later calls do nothing.
+
+        Args:
+            status (str): "done", "failed" or "cancelled".
+            completed (str): The controller's completion line.
+            measured_pga (float): Peak acceleration measured on the table in m/s², if recorded.
+            error (str): Why the run failed.
+        """
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            samples = self.file["telemetry"].shape[0] if "telemetry" in self.file else 0
+            self.file.attrs["status"] = status
+            self.file.close()
+        self.archive._finish(self.id, status, completed, error, measured_pga, samples)
+
+
+def _write(f, name, data, resizable=False):
+    # Chunked, gzip-compressed dataset; resizable ones grow along the first axis
+    rows = CHUNK_ROWS if resizable else max(1, min(CHUNK_ROWS, len(data)))
+    f.create_dataset(name, data=data, chunks=(rows,) + data.shape[1:], compression="gzip", shuffle=True,
+                     maxshape=((None,) + data.shape[1:]) if resizable else None)
+
+
+def _plain(value):
+    # numpy scalars and UTCDateTime to something sqlite3 accepts
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def describe(rows):
+    """One line per index row from Archive.find()."""
+    lines = []
+    for row in rows:
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["started"]))
+        measured = f", measured {row['measured_pga']:.2f} m/s²" if row["measured_pga"] is not None else ""
+        lines.append(f"{row['id']:>6} {started} {row['table_name'] or '-':<14} {row['status']:<9} "
+                     f"PGA {row['pga']:.2f} m/s², PGV {row['pgv']:.3f} m/s{measured}  {row['source'] or ''}")
+    return "\n".join(lines)
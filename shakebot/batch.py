@@ -0,0 +1,229 @@
+"""
+Prepare displacement records for many events and stations in parallel.
+
+Every (event, station) pair is one task: download (or load from the cache),
+remove the response, integrate twice, resample to 100 Hz and trim, exactly as
+shakebot.iris.process_stream does for the GUI. Tasks run in a process pool,
+each worker with its own CachedClient on the shared cache directory, and the
+results are written to one Parquet file with one row per channel:
+
+    event_id, event_time, magnitude, latitude, longitude, depth_km,
+    network, station, location, channel, channel_azimuth, channel_dip,
+    distance_km, azimuth, back_azimuth, sampling_rate, start_time,
+    displacement (list of float64)
+
+channel_azimuth/channel_dip are the sensor orientation from the inventory, so
+the rows of one station can be rotated with shakebot.multichannel.
+
+Read it back with pandas.read_parquet() or pyarrow.parquet.read_table().
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from shakebot.iris import HORIZONTAL_CHANNELS, TARGET_SAMPLING_RATE
+
+STAGES = ("stations", "waveforms", "response", "remove_response", "integrate", "resample", "trim")
+
+_client = None  # Per-process CachedClient, created by _init_worker
+
+
+def parse_station(spec, location="00"):
+    """
+    Split a "NET.STA[.LOC]" station code.
+
+    Returns:
+        tuple[str, str, str]: Network, station and location.
+    """
+    parts = spec.split(".")
+    if len(parts) == 2:
+        return parts[0], parts[1], location
+    if len(parts) == 3:
+        return tuple(parts)
+    raise ValueError(f"Station must be NET.STA or NET.STA.LOC, got {spec!r}.")
+
+
+def make_tasks(events, stations, duration, channels=HORIZONTAL_CHANNELS):
+    """
+    Build the event × station task list.
+
+    Args:
+        events (list[dict]): Event summaries (resource_id, time, latitude, longitude, depth_km, magnitude).
+        stations (list[tuple]): (network, station, location) tuples.
+        duration (float): Seconds to keep after the P arrival.
+        channels (tuple[str]): Channel codes.
+
+    Returns:
+        list[dict]: One picklable task per pair.
+    """
+    return [{"event": {name: (str(value) if name == "time" else value) for name, value in event.items()},
+             "network": network, "station": station, "location": location,
+             "channels": tuple(channels), "duration": duration}
+            for event in events for network, station, location in stations]
+
+
+def make_pair_tasks(events, index, pairs, duration, channels=HORIZONTAL_CHANNELS):
+    """
+    Build tasks for selected event × station pairs only.
+
+    Args:
+        events (list[dict]): Event summaries, as passed to StationIndex.pairs().
+        index (shakebot.stations.StationIndex): Stations the pairs refer to.
+        pairs (dict): From index.pairs(events, ...).
+        duration (float): Seconds to keep after the P arrival.
+        channels (tuple[str]): Channel codes.
+
+    Returns:
+        list[dict]: One picklable task per pair.
+    """
+    return [make_tasks([events[event]], [index.code(station)], duration, channels)[0]
+            for event, station in zip(pairs["event"].tolist(), pairs["station"].tolist())]
+
+
+def _init_worker(cache_root, offline):
+    global _client
+    from shakebot.iris import default_client
+
+    _client = default_client(offline=offline, root=cache_root)
+
+
+def prepare_task(task, client=None):
+    """
+    Run one task; never raises so a bad station does not stop the batch.
+
+    Returns:
+        dict: The task plus "records", "orientations", "distance_km", "azimuth", "back_azimuth",
+        "timings" (seconds per stage), "seconds" and "error" (None on success).
+    """
+    from shakebot.iris import prepare_station_records
+
+    client = client or _client
+    timings = {}
+    result = dict(task, records={}, orientations={}, timings=timings, error=None)
+    start = time.perf_counter()
+    try:
+        prepared = prepare_station_records(client, task["event"], task["duration"], task["network"],
+                                           task["station"], task["location"], task["channels"], timings=timings)
+        result.update(records=prepared["records"], orientations=prepared["orientations"],
+                      distance_km=prepared["distance_km"], azimuth=prepared["azimuth"],
+                      back_azimuth=prepared["back_azimuth"])
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def run_batch(tasks, workers=None, cache_root=None, offline=False, on_progress=None):
+    """
+    Run tasks in a process pool.
+
+    Args:
+        tasks (list[dict]): From make_tasks().
+        workers (int): Pool size (default: os.cpu_count()); 1 runs in this process.
+        cache_root (str): Cache directory shared by the workers (default: the IRIS cache).
+        offline (bool): Only use cached data.
+        on_progress (callable): Called as on_progress(done, total, result) after each task.
+
+    Returns:
+        list[dict]: Results from prepare_task(), in completion order.
+    """
+    from shakebot.traveltimes import load_table
+
+    workers = workers or os.cpu_count() or 1
+    results = []
+    load_table()  # Fail here, before any download, when the travel-time table has not been generated
+    if workers == 1:
+        _init_worker(cache_root, offline)
+        for task in tasks:
+            results.append(prepare_task(task))
+            if on_progress:
+                on_progress(len(results), len(tasks), results[-1])
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cache_root, offline)) as pool:
+        futures = [pool.submit(prepare_task, task) for task in tasks]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if on_progress:
+                on_progress(len(results), len(tasks), results[-1])
+    return results
+
+
+def summarize_timings(results):
+    """
+    Total seconds per processing stage over all results, plus "total".
+
+    Stages that never ran (e.g. everything came from the processed-array cache) are reported as 0.
+    """
+    totals = {stage: 0.0 for stage in STAGES}
+    for result in results:
+        for stage, seconds in result["timings"].items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+    totals["total"] = sum(result["seconds"] for result in results)
+    return totals
+
+
+def write_parquet(path, results, sampling_rate=TARGET_SAMPLING_RATE):
+    """
+    Write the records of successful results to a Parquet file, one row per channel.
+
+    Returns:
+        int: Number of rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = {name: [] for name in ("event_id", "event_time", "magnitude", "latitude", "longitude", "depth_km",
+                                     "network", "station", "location", "channel", "channel_azimuth",
+                                     "channel_dip", "distance_km", "azimuth", "back_azimuth", "sampling_rate",
+                                     "start_time")}
+    offsets = [0]
+    values = []
+    for result in results:
+        if result["error"]:
+            continue
+        event = result["event"]
+        for channel, record in result["records"].items():
+            if not len(record):
+                continue
+            columns["event_id"].append(event.get("resource_id"))
+            columns["event_time"].append(str(event["time"]))
+            for name in ("magnitude", "latitude", "longitude", "depth_km"):
+                columns[name].append(event.get(name))
+            for name in ("network", "station", "location", "distance_km", "azimuth", "back_azimuth"):
+                columns[name].append(result[name])
+            columns["channel"].append(channel)
+            azimuth, dip = result.get("orientations", {}).get(channel, (None, None))
+            columns["channel_azimuth"].append(azimuth)
+            columns["channel_dip"].append(dip)
+            columns["sampling_rate"].append(float(sampling_rate))
+            columns["start_time"].append(float(record[0, 0]))
+            values.append(np.asarray(record[:, 1], dtype=np.float64))
+            offsets.append(offsets[-1] + len(record))
+
+    # Build the list column from one flat buffer instead of per-row Python lists
+    flat = np.concatenate(values) if values else np.empty(0, dtype=np.float64)
+    displacement = pa.ListArray.from_arrays(pa.array(np.asarray(offsets, dtype=np.int32)), pa.array(flat))
+    table = pa.table(dict(columns, displacement=displacement))
+    pq.write_table(table, path, compression="zstd")
+    return table.num_rows
+
+
+def load_parquet(path):
+    """
+    Read a batch file back.
+
+    Returns:
+        list[dict]: One dict per row; "displacement" becomes an (N, 2) time/displacement array.
+    """
+    import pyarrow.parquet as pq
+
+    rows = pq.read_table(path).to_pylist()
+    for row in rows:
+        samples = np.asarray(row["displacement"], dtype=np.float64)
+        times = row["start_time"] + np.arange(len(samples)) / row["sampling_rate"]
+        row["displacement"] = np.column_stack((times, samples))
+    return rows
@@ -0,0 +1,382 @@
+"""
+Local on-disk cache for IRIS (FDSN) downloads.
+
+Every cached object is stored once under objects/ with a name derived from the
+SHA-256 of its request (network/station/location/channel, time window and any
+processing parameters), so repeated requests load from disk instead of the web
+service:
+
+    <root>/index.sqlite              entries, event catalog, station inventory and LRU bookkeeping
+    <root>/objects/ab/abcdef....mseed  raw waveforms (MiniSEED)
+    <root>/objects/cd/cdef01....xml    station inventories (StationXML) and catalogs (QuakeML)
+    <root>/objects/ef/ef0123....npy    processed displacement arrays
+
+The total size is kept under `max_bytes` by evicting the least recently used
+entries. In offline mode a miss raises CacheMiss instead of contacting IRIS.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "shakebot", "iris")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GiB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    network TEXT, station TEXT, location TEXT, channel TEXT,
+    starttime TEXT, endtime TEXT,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+CREATE TABLE IF NOT EXISTS events (
+    resource_id TEXT PRIMARY KEY,
+    time TEXT NOT NULL,
+    latitude REAL, longitude REAL, depth_km REAL, magnitude REAL
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_magnitude ON events (magnitude);
+CREATE TABLE IF NOT EXISTS stations (
+    network TEXT NOT NULL, station TEXT NOT NULL, location TEXT NOT NULL,
+    channels TEXT NOT NULL,
+    latitude REAL NOT NULL, longitude REAL NOT NULL, elevation REAL,
+    starttime TEXT, endtime TEXT,
+    PRIMARY KEY (network, station, location)
+);
+"""
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode when a request is not in the cache."""
+
+
+def request_key(kind, **fields):
+    """
+    Build the content address of a request.
+
+    Args:
+        kind (str): Object kind ("events", "stations", "waveforms", "displacement").
+        **fields: Request parameters; values are formatted with str().
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    text = kind + "|" + "|".join(f"{name}={fields[name]}" for name in sorted(fields))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class WaveformCache:
+    """
+    Content-addressed store with a SQLite index and size-based LRU eviction.
+
+    Args:
+        root (str): Cache directory.
+        max_bytes (int): Size limit for all cached objects.
+        offline (bool): Raise CacheMiss instead of downloading on a miss.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, offline=False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.offline = offline
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _object_path(self, key, suffix):
+        return os.path.join(self.root, "objects", key[:2], key + suffix)
+
+    def lookup(self, key):
+        """
+        Return the file path of a cached entry and mark it as recently used.
+
+        Args:
+            key (str): Content address from request_key().
+
+        Returns:
+            str | None: Path of the cached file, or None on a miss.
+        """
+        row = self.db.execute("SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        path = os.path.join(self.root, row[0])
+        if not os.path.exists(path):
+            # File removed behind our back; forget the entry
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.db.commit()
+            return None
+        self.db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+        return path
+
+    def store(self, key, kind, suffix, write, **fields):
+        """
+        Write a new entry and evict old ones if the cache grew past its limit.
+
+        Args:
+            key (str): Content address from request_key().
+            kind (str): Object kind, recorded in the index.
+            suffix (str): File extension including the dot.
+            write (callable): Called with a temporary path to write the object to.
+            **fields: network, station, location, channel, starttime, endtime.
+
+        Returns:
+            str: Path of the stored file.
+        """
+        path = self._object_path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        write(temporary)
+        os.replace(temporary, path)  # Atomic, so readers never see a partial file
+
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries (key, kind, network, station, location, channel, starttime, endtime, "
+            "path, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, kind, fields.get("network"), fields.get("station"), fields.get("location"),
+             fields.get("channel"), _str(fields.get("starttime")), _str(fields.get("endtime")),
+             os.path.relpath(path, self.root), os.path.getsize(path), now, now))
+        self.db.commit()
+        self.evict()
+        return path
+
+    def size(self):
+        """Total size of all cached objects in bytes."""
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """
+        Delete least recently used entries until the cache fits in `max_bytes`.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        excess = self.size() - limit
+        removed = 0
+        if excess <= 0:
+            return removed
+        for key, path, size in self.db.execute(
+                "SELECT key, path, size FROM entries ORDER BY last_access").fetchall():
+            try:
+                os.remove(os.path.join(self.root, path))
+            except FileNotFoundError:
+                pass
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            removed += 1
+            excess -= size
+            if excess <= 0:
+                break
+        self.db.commit()
+        return removed
+
+    def index_events(self, catalog):
+        """Add the preferred origin and magnitude of every event in an obspy Catalog to the event index."""
+        rows = []
+        for event in catalog:
+            origin = event.preferred_origin() or event.origins[0]
+            magnitude = event.preferred_magnitude() or (event.magnitudes[0] if event.magnitudes else None)
+            rows.append((str(event.resource_id), str(origin.time), origin.latitude, origin.longitude,
+                         origin.depth / 1000 if origin.depth is not None else None,
+                         magnitude.mag if magnitude else None))
+        self.db.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+
+    def index_stations(self, inventory):
+        """
+        Add every location of a channel-level obspy Inventory to the station index.
+
+        A location that is already indexed keeps the channels it had and gains the new ones, so
+        inventories downloaded for different bands add up.
+        """
+        rows = {}
+        for network in inventory:
+            for station in network:
+                for channel in station:
+                    key = (network.code, station.code, channel.location_code)
+                    row = rows.setdefault(key, {"channels": set(), "starttime": None, "endtime": None,
+                                                "latitude": channel.latitude, "longitude": channel.longitude,
+                                                "elevation": channel.elevation})
+                    row["channels"].add(channel.code)
+                    start, end = _str(channel.start_date), _str(channel.end_date)
+                    if start and (row["starttime"] is None or start < row["starttime"]):
+                        row["starttime"] = start
+                    # An open epoch (no end date) means the channel is still running
+                    if end is None or row["endtime"] == "":
+                        row["endtime"] = ""
+                    elif row["endtime"] is None or end > row["endtime"]:
+                        row["endtime"] = end
+        for (network, station, location), row in rows.items():
+            known = self.db.execute("SELECT channels FROM stations WHERE network = ? AND station = ? AND location = ?",
+                                    (network, station, location)).fetchone()
+            if known:
+                row["channels"].update(known[0].split(","))
+            self.db.execute("INSERT OR REPLACE INTO stations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (network, station, location, ",".join(sorted(row["channels"])), row["latitude"],
+                             row["longitude"], row["elevation"], row["starttime"], row["endtime"] or None))
+        self.db.commit()
+        return len(rows)
+
+    def find_stations(self, network=None):
+        """
+        Query the local station index without touching the network.
+
+        Args:
+            network (str): Only stations of this network.
+
+        Returns:
+            list[dict]: Locations with network, station, location, channels (comma-separated codes),
+            latitude, longitude, elevation, starttime and endtime (None while still running).
+        """
+        query = ("SELECT network, station, location, channels, latitude, longitude, elevation, starttime, endtime "
+                 "FROM stations")
+        values = []
+        if network is not None:
+            query += " WHERE network = ?"
+            values.append(network)
+        columns = ("network", "station", "location", "channels", "latitude", "longitude", "elevation", "starttime",
+                   "endtime")
+        return [dict(zip(columns, row)) for row in self.db.execute(query + " ORDER BY network, station, location",
+                                                                    values)]
+
+    def find_events(self, starttime=None, endtime=None, min_magnitude=None, limit=None):
+        """
+        Query the local event index without touching the network.
+
+        Returns:
+            list[dict]: Events with resource_id, time, latitude, longitude, depth_km and magnitude.
+        """
+        clauses, values = [], []
+        if starttime is not None:
+            clauses.append("time >= ?")
+            values.append(_str(starttime))
+        if endtime is not None:
+            clauses.append("time <= ?")
+            values.append(_str(endtime))
+        if min_magnitude is not None:
+            clauses.append("magnitude >= ?")
+            values.append(min_magnitude)
+        query = "SELECT resource_id, time, latitude, longitude, depth_km, magnitude FROM events"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY time"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        columns = ("resource_id", "time", "latitude", "longitude", "depth_km", "magnitude")
+        return [dict(zip(columns, row)) for row in self.db.execute(query, values)]
+
+
+class CachedClient:
+    """
+    Drop-in replacement for the obspy FDSN client methods the repo uses, backed by WaveformCache.
+
+    Args:
+        cache (WaveformCache): Cache to read from and write to.
+        client (obspy.clients.fdsn.Client): Client used on a miss; created as
+            Client("IRIS") on the first miss when omitted.
+    """
+
+    def __init__(self, cache, client=None):
+        self.cache = cache
+        self._client = client
+
+    @property
+    def client(self):
+        if self.cache.offline:
+            raise CacheMiss("Request is not cached and the cache is in offline mode.")
+        if self._client is None:
+            from obspy.clients.fdsn import Client
+
+            self._client = Client("IRIS")
+        return self._client
+
+    def get_events(self, **kwargs):
+        """Cached Client.get_events; the catalog is stored as QuakeML and added to the event index."""
+        from obspy import read_events
+
+        key = request_key("events", **kwargs)
+        path = self.cache.lookup(key)
+        if path:
+            return read_events(path, format="QUAKEML")
+        catalog = self.client.get_events(**kwargs)
+        self.cache.store(key, "events", ".xml", lambda p: catalog.write(p, format="QUAKEML"),
+                         starttime=kwargs.get("starttime"), endtime=kwargs.get("endtime"))
+        self.cache.index_events(catalog)
+        return catalog
+
+    def get_stations(self, **kwargs):
+        """
+        Cached Client.get_stations; the inventory is stored as StationXML.
+
+        Channel- and response-level inventories are also added to the station index (see index_stations()).
+        """
+        from obspy import read_inventory
+
+        key = request_key("stations", **kwargs)
+        path = self.cache.lookup(key)
+        if path:
+            return read_inventory(path, format="STATIONXML")
+        inventory = self.client.get_stations(**kwargs)
+        self.cache.store(key, "stations", ".xml", lambda p: inventory.write(p, format="STATIONXML"),
+                         **_fields(kwargs))
+        if kwargs.get("level") in ("channel", "response"):
+            self.cache.index_stations(inventory)
+        return inventory
+
+    def get_waveforms(self, network, station, location, channel, starttime, endtime, **kwargs):
+        """Cached Client.get_waveforms; the stream is stored as MiniSEED."""
+        from obspy import read
+
+        fields = dict(network=network, station=station, location=location, channel=channel,
+                      starttime=starttime, endtime=endtime)
+        key = request_key("waveforms", **fields, **kwargs)
+        path = self.cache.lookup(key)
+        if path:
+            return read(path, format="MSEED")
+        stream = self.client.get_waveforms(network, station, location, channel, starttime, endtime, **kwargs)
+        self.cache.store(key, "waveforms", ".mseed", lambda p: stream.write(p, format="MSEED"), **fields)
+        return stream
+
+    def get_array(self, compute, kind="displacement", **fields):
+        """
+        Return a processed array from the cache, computing and storing it on a miss.
+
+        Args:
+            compute (callable): Returns the np.ndarray to cache; only called on a miss.
+            kind (str): Object kind, recorded in the index.
+            **fields: Everything the array depends on (request and processing parameters).
+
+        Returns:
+            np.ndarray: The cached or freshly computed array.
+        """
+        key = request_key(kind, **fields)
+        path = self.cache.lookup(key)
+        if path:
+            return np.load(path)
+        array = np.asarray(compute())
+
+        def write(p):
+            with open(p, "wb") as f:
+                np.save(f, array)
+
+        self.cache.store(key, kind, ".npy", write, **_fields(fields))
+        return array
+
+
+def _fields(kwargs):
+    # Index columns present in a request's keyword arguments
+    return {name: kwargs.get(name) for name in ("network", "station", "location", "channel", "starttime", "endtime")}
+
+
+def _str(value):
+    return None if value is None else str(value)
@@ -0,0 +1,1072 @@
+"""
+Command line runner for unattended experiments.
+
+    python -m shakebot run /dev/ttyACM0 records/*.csv --repeat 3
+    python -m shakebot run /dev/ttyACM0 @queue.txt        (one argument per line)
+    python -m shakebot run /dev/ttyACM0 records/*.csv --interpolation cubic --control-rate 2000
+    python -m shakebot run /dev/ttyACM0 long.csv --fit segment --baseline 2 --band 0.1 20 --taper 1
+    python -m shakebot run /dev/ttyACM0 records/*.csv --telemetry captures/   (Due: record the table accelerometer)
+    python -m shakebot schedule campaign.sqlite records/*.csv --repeat 100 --device /dev/ttyACM0 --settle 10
+    python -m shakebot schedule campaign.sqlite --device /dev/ttyACM0   (resume after a crash or reconnect)
+    python -m shakebot analyze captures/ --band 0.5 10 -o tracking.npz
+    python -m shakebot compensate /dev/ttyACM0 record.csv -o drive.csv --iterations 5
+    python -m shakebot generate cosine --pgv 0.5 --pga 1.0 --cycles 2 -o pulse.csv
+    python -m shakebot generate random --duration 60 --seed 1 -o random.csv
+    python -m shakebot generate pulse --type ricker --pgv 0.3 --pga 0.5 -o ricker.csv
+    python -m shakebot generate sweep --type mp --pgv 0.01 1 300 --pga 0.01 3 300 --cycles 1.5 2 3 -o sweep.npz
+    python -m shakebot generate batch --count 10000 --duration 60 --seed 1 -o motions.npz
+    python -m shakebot run /dev/ttyACM0 records/*.csv --metrics metrics.csv   (upload timings and firmware STATS)
+    python -m shakebot sync /dev/ttyACM0 /dev/ttyACM1 --records records/*.csv --home-mm 300
+    python -m shakebot stats /dev/ttyACM0 --interval 1 --count 60 -o stats.csv
+    python -m shakebot check records/*.csv --board micro --fix lowpass
+    python -m shakebot simulate                     (prints a pty path to pass to run or the GUI)
+    python -m shakebot simulate --benchmark --baud 115200 250000 --speedup 4
+    python -m shakebot batch IU.ANMO IU.COLA --min-magnitude 7 --limit 20 -o records.parquet
+    python -m shakebot batch --max-distance 50 --bands HH,BH --channels HHE,HHN -o near.parquet
+    python -m shakebot stations --max-distance 50 --min-magnitude 6 --limit 2000 -o pairs.csv
+    python -m shakebot traveltimes --generate --check
+    python -m shakebot run /dev/ttyACM0 records/*.csv --archive --table-name table2
+    python -m shakebot archive --table-name table2 --min-pga 3
+"""
+import argparse
+import sys
+import time
+
+from shakebot.analysis import RESPONSE_KINDS
+from shakebot.archive import DEFAULT_ARCHIVE_DIR
+from shakebot.compensation import (DEFAULT_GAIN, DEFAULT_ITERATIONS, DEFAULT_MIN_COHERENCE,
+                                   DEFAULT_TOLERANCE)
+from shakebot.device import DEFAULT_CONTROL_RATE, DEFAULT_SAMPLE_RATE, DUE_PARAMETERS
+from shakebot.feasibility import FEASIBILITY_METHODS
+from shakebot.instrumentation import DEFAULT_STATS_INTERVAL
+from shakebot.iris import HORIZONTAL_CHANNELS
+from shakebot.preprocess import FIT_MODES
+from shakebot.pulses import PULSE_SHAPES
+from shakebot.scheduler import DEFAULT_MAX_ATTEMPTS, DEFAULT_SETTLE_SECONDS, REHOME_MODES
+from shakebot.stations import DEFAULT_BANDS
+from shakebot.telemetry import DEFAULT_TELEMETRY_RATE
+from shakebot.traveltimes import DEFAULT_MODEL
+
+HOMING_TIMEOUT = 120.0  # Seconds allowed for SET_DISPLACEMENT / CALIBRATE_DISPLACEMENT
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="shakebot", fromfile_prefix_chars="@",
+                                     description="Run shakebot experiments without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", fromfile_prefix_chars="@", help="Play a queue of CSV records.")
+    run.add_argument("device", help="Serial device, e.g. /dev/ttyACM0 or COM3.")
+    run.add_argument("records", nargs="+", help="Records to play (CSV, .npy, Parquet, HDF5 or MiniSEED), in order (@file reads a list).")
+    run.add_argument("--baud", type=int, default=250000, help="Baud rate (default: 250000).")
+    run.add_argument("--board", choices=("due", "micro"), default="due", help="Controller board (default: due).")
+    run.add_argument("--ascii", action="store_true", help="Upload one ASCII line per sample instead of binary frames.")
+    run.add_argument("--stream", action="store_true",
+                     help="Stream every record while it plays, so records longer than the controller buffer play "
+                          "whole (binary frames, one target per sample).")
+    run.add_argument("--interpolation", choices=("step", "linear", "cubic"), default="step",
+                     help="Play one target per sample, or interpolate between samples (Due only; default: step).")
+    run.add_argument("--control-rate", type=int, default=DEFAULT_CONTROL_RATE,
+                     help=f"Firmware control rate in Hz while interpolating (default: {DEFAULT_CONTROL_RATE}).")
+    run.add_argument("--repeat", type=int, default=1, help="Play the whole queue this many times.")
+    run.add_argument("--pause", type=float, default=0.0, help="Seconds to wait between records.")
+    run.add_argument("--calibrate", action="store_true", help="Calibrate against both limits before the first record.")
+    run.add_argument("--home-mm", type=float, default=None,
+                     help="Re-home with SET_DISPLACEMENT to this position (mm) before every record.")
+    run.add_argument("--keep-going", action="store_true", help="Continue with the next record after a failure.")
+    run.add_argument("--sample-rate", type=float, default=DEFAULT_SAMPLE_RATE,
+                     help=f"Resample every record to this rate in Hz (default: {DEFAULT_SAMPLE_RATE:g}).")
+    run.add_argument("--fit", choices=FIT_MODES, default="strongest",
+                     help="How to fit records longer than the controller buffer: keep the start, the most energetic "
+                          "window, or play consecutive segments (default: strongest).")
+    run.add_argument("--baseline", type=int, default=None, metavar="ORDER",
+                     help="Subtract a polynomial of this order (2 removes double-integration drift).")
+    run.add_argument("--band", type=float, nargs=2, default=None, metavar=("LOW", "HIGH"),
+                     help="Zero-phase band-pass corners in Hz (0 skips a side).")
+    run.add_argument("--taper", type=float, default=0.0, metavar="SECONDS",
+                     help="Cosine ramps at both ends so the table starts and ends at rest.")
+    run.add_argument("--telemetry", default=None, metavar="DIR",
+                     help="Record the table accelerometer during every run (Due only) to DIR/<record>_<run>.npy, "
+                          "next to the played command as <record>_<run>_command.npy, and compare it with the "
+                          "commanded acceleration.")
+    run.add_argument("--telemetry-rate", type=float, default=DEFAULT_TELEMETRY_RATE,
+                     help=f"Accelerometer sample rate in Hz (default: {DEFAULT_TELEMETRY_RATE}).")
+    run.add_argument("--metrics", default=None, metavar="PATH",
+                     help="Record upload timings and the controller's STATS as time series in a CSV (or .npz) file.")
+    run.add_argument("--stats-interval", type=float, default=DEFAULT_STATS_INTERVAL,
+                     help=f"Seconds between STATS requests with --metrics (default: {DEFAULT_STATS_INTERVAL:g}).")
+    run.add_argument("--archive", nargs="?", const=DEFAULT_ARCHIVE_DIR, default=None, metavar="DIR",
+                     help="Keep every run (command, steps, telemetry, controller lines) in an experiment archive "
+                          f"(default DIR: {DEFAULT_ARCHIVE_DIR}).")
+    run.add_argument("--table-name", default=None, help="Table name stored in the archive (default: the device).")
+    run.add_argument("--verbose", action="store_true", help="Print every controller line.")
+
+    schedule = commands.add_parser(
+        "schedule", fromfile_prefix_chars="@",
+        help="Run a resumable campaign of records unattended, re-homing between runs.")
+    schedule.add_argument("state", help="Campaign state file (SQLite); created on first use, resumed afterwards.")
+    schedule.add_argument("records", nargs="*",
+                          help="Records to queue in a new campaign (@file reads a list); omit to resume.")
+    schedule.add_argument("--device", default=None,
+                          help="Serial device to play on; without it, only print the campaign's progress.")
+    schedule.add_argument("--baud", type=int, default=250000, help="Baud rate (default: 250000).")
+    schedule.add_argument("--board", choices=("due", "micro"), default="due",
+                          help="Controller board (default: due).")
+    schedule.add_argument("--ascii", action="store_true", help="Upload ASCII lines instead of binary frames.")
+    schedule.add_argument("--interpolation", choices=("step", "linear", "cubic"), default="step",
+                          help="Play one target per sample, or interpolate between samples (Due only; default: step).")
+    schedule.add_argument("--control-rate", type=int, default=DEFAULT_CONTROL_RATE,
+                          help=f"Firmware control rate in Hz while interpolating (default: {DEFAULT_CONTROL_RATE}).")
+    schedule.add_argument("--repeat", type=int, default=1, help="Queue the whole list this many times.")
+    schedule.add_argument("--rehome", choices=REHOME_MODES, default="displacement",
+                          help="Before every record, home against the left limit switch, calibrate against both, "
+                               "or do not move (default: displacement).")
+    schedule.add_argument("--home-mm", type=float, default=None,
+                          help="Position to re-center to in mm (default: mid-stroke).")
+    schedule.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                          help=f"Seconds between homing and START; the upload runs meanwhile "
+                               f"(default: {DEFAULT_SETTLE_SECONDS:g}).")
+    schedule.add_argument("--calibrate", action="store_true",
+                          help="Calibrate against both limits before the first run.")
+    schedule.add_argument("--stop-on-failure", action="store_true", help="Stop the campaign when a run fails.")
+    schedule.add_argument("--retry-failed", action="store_true", help="Queue failed runs of the campaign again.")
+    schedule.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                          help="Plays of a run cut short by a lost connection before it counts as failed "
+                               f"(default: {DEFAULT_MAX_ATTEMPTS}).")
+    schedule.add_argument("--sample-rate", type=float, default=DEFAULT_SAMPLE_RATE,
+                          help=f"Resample every record to this rate in Hz (default: {DEFAULT_SAMPLE_RATE:g}).")
+    schedule.add_argument("--fit", choices=FIT_MODES, default="strongest",
+                          help="How to fit records longer than the controller buffer (default: strongest).")
+    schedule.add_argument("--baseline", type=int, default=None, metavar="ORDER",
+                          help="Subtract a polynomial of this order (2 removes double-integration drift).")
+    schedule.add_argument("--band", type=float, nargs=2, default=None, metavar=("LOW", "HIGH"),
+                          help="Zero-phase band-pass corners in Hz (0 skips a side).")
+    schedule.add_argument("--taper", type=float, default=0.0, metavar="SECONDS",
+                          help="Cosine ramps at both ends so the table starts and ends at rest.")
+    schedule.add_argument("--verbose", action="store_true", help="Print every controller line.")
+
+    check = commands.add_parser("check", fromfile_prefix_chars="@",
+                                help="Check CSV records against the table's speed and acceleration limits.")
+    check.add_argument("records", nargs="+", help="Records to check (@file reads a list).")
+    check.add_argument("--board", choices=("due", "micro"), default="due", help="Controller board (default: due).")
+    check.add_argument("--fix", choices=FEASIBILITY_METHODS, default=None,
+                       help="Write a feasible copy of every failing record next to it as <name>_feasible.csv.")
+
+    analyze = commands.add_parser("analyze",
+                                  help="Compare telemetry captures with their commands (see run --telemetry).")
+    analyze.add_argument("captures", nargs="+", help="Capture directories or .npy captures.")
+    analyze.add_argument("--response", choices=RESPONSE_KINDS, default="displacement",
+                         help="Compare the executed step positions or the accelerometer (default: displacement).")
+    analyze.add_argument("--band", type=float, nargs=2, default=None, metavar=("LOW", "HIGH"),
+                         help="Qualify the table in this frequency band in Hz.")
+    analyze.add_argument("--gain-tolerance", type=float, default=1.0, help="Allowed gain error in dB (default: 1).")
+    analyze.add_argument("--min-coherence", type=float, default=0.9, help="Required coherence (default: 0.9).")
+    analyze.add_argument("--psa-tolerance", type=float, default=0.2,
+                         help="Allowed relative error of the 5%% damped PSA (default: 0.2).")
+    analyze.add_argument("--lead", type=float, default=DUE_PARAMETERS["lead"],
+                         help=f"Meters per revolution (default: {DUE_PARAMETERS['lead']:g}).")
+    analyze.add_argument("--pulse-per-rev", type=int, default=DUE_PARAMETERS["pulse_per_rev"],
+                         help=f"Steps per revolution (default: {DUE_PARAMETERS['pulse_per_rev']}).")
+    analyze.add_argument("-o", "--output", default=None, help="Save all per-run arrays to this .npz file.")
+
+    compensate = commands.add_parser(
+        "compensate", help="Iterate a drive signal until the table reproduces a record (Due telemetry).")
+    compensate.add_argument("device", help="Serial device, e.g. /dev/ttyACM0 or COM3.")
+    compensate.add_argument("record", help="Target record (CSV, .npy, Parquet, HDF5 or MiniSEED).")
+    compensate.add_argument("-o", "--output", required=True, help="Output CSV path for the compensated drive.")
+    compensate.add_argument("--baud", type=int, default=250000, help="Baud rate (default: 250000).")
+    compensate.add_argument("--ascii", action="store_true", help="Upload ASCII lines instead of binary frames.")
+    compensate.add_argument("--interpolation", choices=("step", "linear", "cubic"), default="step",
+                            help="Playback mode to compensate for (default: step).")
+    compensate.add_argument("--control-rate", type=int, default=DEFAULT_CONTROL_RATE,
+                            help=f"Firmware control rate in Hz while interpolating (default: {DEFAULT_CONTROL_RATE}).")
+    compensate.add_argument("--sample-rate", type=float, default=DEFAULT_SAMPLE_RATE,
+                            help=f"Resample the record to this rate in Hz (default: {DEFAULT_SAMPLE_RATE:g}).")
+    compensate.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS,
+                            help=f"Most plays (default: {DEFAULT_ITERATIONS}).")
+    compensate.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                            help=f"Stop at this normalised RMS error (default: {DEFAULT_TOLERANCE:g}).")
+    compensate.add_argument("--gain", type=float, default=DEFAULT_GAIN,
+                            help=f"Learning gain (default: {DEFAULT_GAIN:g}).")
+    compensate.add_argument("--min-coherence", type=float, default=DEFAULT_MIN_COHERENCE,
+                            help="Only update frequencies with at least this coherence "
+                                 f"(default: {DEFAULT_MIN_COHERENCE:g}).")
+    compensate.add_argument("--cutoff", type=float, default=None, help="Highest frequency to update in Hz.")
+    compensate.add_argument("--home-mm", type=float, default=None,
+                            help="Re-home with SET_DISPLACEMENT to this position (mm) before every play.")
+    compensate.add_argument("--telemetry-rate", type=float, default=DEFAULT_TELEMETRY_RATE,
+                            help=f"Telemetry sample rate in Hz (default: {DEFAULT_TELEMETRY_RATE}).")
+    compensate.add_argument("--verbose", action="store_true", help="Print every controller line.")
+
+    sync = commands.add_parser("sync", fromfile_prefix_chars="@",
+                               help="Play records on several tables at once, started together.")
+    sync.add_argument("devices", nargs="+", help="Serial devices, one per table.")
+    sync.add_argument("--records", nargs="+", required=True,
+                      help="Records to play in turn on every table, or with --per-table one record per table.")
+    sync.add_argument("--per-table", action="store_true", help="Give each table its own record, in device order.")
+    sync.add_argument("--baud", type=int, default=250000, help="Baud rate (default: 250000).")
+    sync.add_argument("--board", choices=("due", "micro"), default="due", help="Controller board (default: due).")
+    sync.add_argument("--ascii", action="store_true", help="Upload ASCII lines instead of binary frames.")
+    sync.add_argument("--repeat", type=int, default=1, help="Play the whole queue this many times.")
+    sync.add_argument("--home-mm", type=float, default=None,
+                      help="Re-home every table with SET_DISPLACEMENT to this position (mm) before every record.")
+    sync.add_argument("--calibrate", action="store_true",
+                      help="Re-home with CALIBRATE_DISPLACEMENT (both limits) instead; needs --home-mm.")
+    sync.add_argument("--sample-rate", type=float, default=DEFAULT_SAMPLE_RATE,
+                      help=f"Resample every record to this rate in Hz (default: {DEFAULT_SAMPLE_RATE:g}).")
+    sync.add_argument("--fit", choices=("trim", "strongest"), default="strongest",
+                      help="How to fit records longer than the controller buffer (default: strongest).")
+    sync.add_argument("--archive", nargs="?", const=DEFAULT_ARCHIVE_DIR, default=None, metavar="DIR",
+                      help=f"Keep every table's runs in an experiment archive (default DIR: {DEFAULT_ARCHIVE_DIR}).")
+    sync.add_argument("--verbose", action="store_true", help="Print every controller line.")
+
+    stats = commands.add_parser("stats", help="Poll the controller's ISR timing and serial statistics (STATS).")
+    stats.add_argument("device", help="Serial device, e.g. /dev/ttyACM0 or COM3.")
+    stats.add_argument("--baud", type=int, default=250000, help="Baud rate (default: 250000).")
+    stats.add_argument("--board", choices=("due", "micro"), default="due", help="Controller board (default: due).")
+    stats.add_argument("--interval", type=float, default=DEFAULT_STATS_INTERVAL,
+                       help=f"Seconds per window (default: {DEFAULT_STATS_INTERVAL:g}).")
+    stats.add_argument("--count", type=int, default=10, help="Number of windows; 0 polls until Ctrl+C (default: 10).")
+    stats.add_argument("-o", "--output", default=None, help="Save the time series to this CSV (or .npz) file.")
+
+    simulate = commands.add_parser("simulate", help="Run the firmware simulator on a pseudo terminal or benchmark it.")
+    simulate.add_argument("--board", choices=("due", "micro"), default="due", help="Controller board (default: due).")
+    simulate.add_argument("--speedup", type=float, default=1.0, help="Run the simulated clock faster than real time.")
+    simulate.add_argument("--tables", type=int, default=1,
+                          help="Simulate this many controllers, each on its own pseudo terminal (default: 1).")
+    simulate.add_argument("--benchmark", action="store_true",
+                          help="Upload and play a record in every upload mode at each --baud rate, then exit.")
+    simulate.add_argument("--baud", type=int, nargs="+", default=[115200, 250000, 1000000],
+                          help="Baud rates for --benchmark (default: 115200 250000 1000000).")
+    simulate.add_argument("--record", default=None, help="Record for --benchmark (default: 20 s random motion).")
+    simulate.add_argument("--metrics", default=None, metavar="DIR",
+                          help="Save the time series of every --benchmark run to DIR/benchmark_<baud>_<mode>.csv.")
+
+    generate = commands.add_parser("generate", help="Write a synthetic record to CSV.")
+    shapes = generate.add_subparsers(dest="shape", required=True)
+    cosine = shapes.add_parser("cosine", help="One-sided cosine pulse.")
+    cosine.add_argument("--pgv", type=float, required=True, help="Peak ground velocity in m/s.")
+    cosine.add_argument("--pga", type=float, required=True, help="Peak ground acceleration in g.")
+    cosine.add_argument("--cycles", type=int, default=1, help="Number of cycles.")
+    cosine.add_argument("-o", "--output", required=True, help="Output CSV path.")
+    shape_pulse = shapes.add_parser("pulse", help="Velocity pulse of a given shape (see shakebot.pulses).")
+    shape_pulse.add_argument("--type", choices=PULSE_SHAPES, required=True, help="Pulse shape.")
+    shape_pulse.add_argument("--pgv", type=float, required=True, help="Peak ground velocity in m/s.")
+    shape_pulse.add_argument("--pga", type=float, required=True, help="Peak ground acceleration in g.")
+    shape_pulse.add_argument("--cycles", type=float, default=1.0, help="Cycles (gamma for mp; ignored for ricker).")
+    shape_pulse.add_argument("-o", "--output", required=True, help="Output CSV path.")
+    sweep = shapes.add_parser("sweep", help="Plan a PGV x PGA x cycles pulse sweep against the table limits.")
+    sweep.add_argument("--type", choices=PULSE_SHAPES, required=True, help="Pulse shape.")
+    sweep.add_argument("--pgv", type=float, nargs=3, required=True, metavar=("MIN", "MAX", "COUNT"),
+                       help="Peak ground velocities in m/s.")
+    sweep.add_argument("--pga", type=float, nargs=3, required=True, metavar=("MIN", "MAX", "COUNT"),
+                       help="Peak ground accelerations in g.")
+    sweep.add_argument("--cycles", type=float, nargs="+", default=[1.0], help="Cycle counts (default: 1).")
+    sweep.add_argument("--linear", action="store_true", help="Space PGV and PGA linearly instead of geometrically.")
+    sweep.add_argument("--board", choices=("due", "micro"), default="due", help="Table limits to use (default: due).")
+    sweep.add_argument("--margin", type=float, default=0.95, help="Fraction of each limit to allow (default: 0.95).")
+    sweep.add_argument("-o", "--output", required=True, help="Output .npz path for the grid and its masks.")
+    sweep.add_argument("--waveforms", default=None, metavar="PATH",
+                       help="Also write the feasible pulses as a batch .npz (see generate batch).")
+    random = shapes.add_parser("random", help="Random multi-sine ground motion.")
+    random.add_argument("--duration", type=float, required=True, help="Duration in seconds.")
+    random.add_argument("--seed", type=int, default=None, help="Random seed for a reproducible record.")
+    random.add_argument("-o", "--output", required=True, help="Output CSV path.")
+    many = shapes.add_parser("batch", help="Many seeded records in one .npz file.")
+    many.add_argument("--model", choices=("multisine", "kanai-tajimi"), default="kanai-tajimi",
+                      help="Random sinusoids or Kanai-Tajimi stochastic motion (default: kanai-tajimi).")
+    many.add_argument("--count", type=int, required=True, help="Number of records.")
+    many.add_argument("--components", type=int, default=1, help="Components per record.")
+    many.add_argument("--duration", type=float, required=True, help="Duration in seconds.")
+    many.add_argument("--pga", type=float, default=0.3, help="Peak ground acceleration in g (kanai-tajimi).")
+    many.add_argument("--seed", type=int, default=None, help="Random seed; the same seed gives the same batch.")
+    many.add_argument("-o", "--output", required=True, help="Output .npz path.")
+
+    batch = commands.add_parser("batch", fromfile_prefix_chars="@",
+                                help="Prepare IRIS displacement records for many events and stations.")
+    batch.add_argument("stations", nargs="*",
+                       help="Stations as NET.STA or NET.STA.LOC (@file reads a list); with --max-distance, "
+                            "only pairs with these stations (default: every indexed station).")
+    batch.add_argument("-o", "--output", required=True, help="Output Parquet path.")
+    batch.add_argument("--duration", type=float, default=60.0, help="Seconds to keep after the P arrival.")
+    batch.add_argument("--channels", default=",".join(HORIZONTAL_CHANNELS), help="Comma-separated channel codes.")
+    add_catalog_arguments(batch)
+    batch.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+
+    stations = commands.add_parser("stations", help="Find event x station pairs by distance and azimuth in the "
+                                                    "local station inventory.")
+    stations.add_argument("-o", "--output", default=None, help="Write the pairs to this CSV file.")
+    stations.add_argument("--update", action="store_true",
+                          help="Download the channel inventory of --bands into the index first.")
+    stations.add_argument("--network", default="*", help="Network code or wildcard for --update (default: *).")
+    add_catalog_arguments(stations)
+
+    archive = commands.add_parser("archive", help="List archived runs from the archive index.")
+    archive.add_argument("directory", nargs="?", default=DEFAULT_ARCHIVE_DIR,
+                         help=f"Archive directory (default: {DEFAULT_ARCHIVE_DIR}).")
+    archive.add_argument("--table-name", default=None, help="Only runs on this table.")
+    archive.add_argument("--status", default=None, help="Only runs with this status (done, failed, cancelled).")
+    archive.add_argument("--min-pga", type=float, default=None, help="Smallest commanded PGA in m/s².")
+    archive.add_argument("--max-pga", type=float, default=None, help="Largest commanded PGA in m/s².")
+    archive.add_argument("--min-pgv", type=float, default=None, help="Smallest commanded PGV in m/s.")
+    archive.add_argument("--min-magnitude", type=float, default=None, help="Only records of events this large.")
+    archive.add_argument("--limit", type=int, default=None, help="Only the most recent runs.")
+
+    traveltimes = commands.add_parser("traveltimes", help="Generate or check the P/S travel-time table.")
+    traveltimes.add_argument("--model", default=DEFAULT_MODEL, help=f"TauP Earth model (default: {DEFAULT_MODEL}).")
+    traveltimes.add_argument("--generate", "--regenerate", dest="generate", action="store_true",
+                             help="Compute the table with TauP (a few minutes), replacing any existing one.")
+    traveltimes.add_argument("--check", action="store_true", help="Compare the table with TauP at random points.")
+    traveltimes.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    return parser
+
+
+def add_catalog_arguments(parser):
+    # Event catalog and station selection shared by batch and stations
+    parser.add_argument("--start", help="Catalog start time (default: --years before --end).")
+    parser.add_argument("--end", help="Catalog end time (default: today, UTC).")
+    parser.add_argument("--years", type=float, default=5, help="Catalog length when --start is not given.")
+    parser.add_argument("--min-magnitude", type=float, default=6.0, help="Minimum event magnitude.")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum number of events.")
+    parser.add_argument("--max-distance", type=float, default=None, metavar="KM",
+                        help="Select stations from the local inventory (shakebot/stations.py) within this "
+                             "epicentral distance of each event.")
+    parser.add_argument("--min-distance", type=float, default=0.0, metavar="KM",
+                        help="Smallest epicentral distance with --max-distance.")
+    parser.add_argument("--azimuth", type=float, nargs=2, default=None, metavar=("FROM", "TO"),
+                        help="Event-to-station azimuth band in degrees, clockwise (e.g. 300 60).")
+    parser.add_argument("--bands", default=",".join(DEFAULT_BANDS),
+                        help=f"Band and instrument codes of the stations (default: {','.join(DEFAULT_BANDS)}).")
+    parser.add_argument("--cache-dir", default=None, help="IRIS cache directory.")
+    parser.add_argument("--offline", action="store_true", help="Only use cached events, stations and waveforms.")
+    return parser
+
+
+def run_queue(args):
+    import os
+
+    import numpy as np
+
+    from shakebot import instrumentation, telemetry
+    from shakebot.archive import Archive
+    from shakebot.device import Shakebot, CALIBRATION_COMPLETED, DISPLACEMENT_SET
+    from shakebot.preprocess import describe, prepare_record
+    from shakebot.records import load_record
+
+    if args.stream and (args.ascii or args.telemetry or args.interpolation != "step"):
+        print("--stream plays binary frames one target per sample; it cannot be combined with --ascii, "
+              "--telemetry or --interpolation.", file=sys.stderr)
+        return 1
+    band = tuple(corner or None for corner in args.band) if args.band else (None, None)
+    archive = Archive(args.archive) if args.archive else None
+    current = {"run": None}  # Archive run that receives the controller lines
+
+    def on_line(line):
+        if args.verbose:
+            print(f"  < {line}")
+        if current["run"] is not None:
+            current["run"].log(line)
+
+    metrics = instrumentation.Metrics() if args.metrics else None
+    table = Shakebot.connect(args.device, args.baud, board=args.board,
+                             on_line=on_line if args.verbose or archive is not None else None,
+                             interpolation=args.interpolation, control_rate=args.control_rate, metrics=metrics,
+                             stats_interval=args.stats_interval)
+    queue = [path for _ in range(args.repeat) for path in args.records]
+    failures = 0
+    captures = []
+    campaign_start = time.perf_counter()
+    if args.telemetry:
+        os.makedirs(args.telemetry, exist_ok=True)
+    try:
+        if args.calibrate:
+            table.calibrate(0)
+            table.wait_for(CALIBRATION_COMPLETED, HOMING_TIMEOUT)
+
+        for i, path in enumerate(queue, 1):
+            run_start = time.perf_counter()
+            try:
+                if args.home_mm is not None:
+                    table.set_displacement(table.displacement_to_steps(args.home_mm / 1000.0))
+                    table.wait_for(DISPLACEMENT_SET, HOMING_TIMEOUT)
+                # A streamed record is not limited by the buffer, so it is played whole
+                pieces, info = prepare_record(load_record(path), args.sample_rate,
+                                              None if args.stream else table.buffer_size, args.fit, args.baseline,
+                                              band, args.taper)
+                if args.verbose:
+                    print(f"  {describe(info)}")
+                # Segments are played back to back, each uploaded while the table stands still
+                stats = {"samples": 0, "seconds": 0.0}
+                captures = []
+                for k, piece in enumerate(pieces):
+                    recorder = None
+                    if archive is not None:
+                        current["run"] = archive.start_run(
+                            piece, table.record_to_steps(piece, check_buffer=not args.stream),
+                            table_name=args.table_name or args.device,
+                            board=args.board, parameters=dict(table.parameters, interpolation=args.interpolation),
+                            source=os.path.abspath(path), metadata={"repetition": i, "piece": k, "preprocess": info})
+                    if args.telemetry:
+                        table.record_to_steps(piece)  # Fail before creating the capture file
+                        name = f"{os.path.splitext(os.path.basename(path))[0]}_{i}"
+                        name += f"_{k}" if len(pieces) > 1 else ""
+                        recorder = telemetry.TelemetryRecorder.for_record(
+                            len(piece) / args.sample_rate, args.telemetry_rate,
+                            path=os.path.join(args.telemetry, name + ".npy"),
+                            on_samples=current["run"] and (lambda samples, run=current["run"]:
+                                                           run.append("telemetry", samples)))
+                        np.save(os.path.join(args.telemetry, name + "_command.npy"), piece)
+                    if args.stream:
+                        piece_stats = table.stream(piece)
+                    else:
+                        piece_stats = table.run_record(piece, binary=not args.ascii, recorder=recorder,
+                                                       telemetry_rate=args.telemetry_rate)
+                    stats.update(samples=stats["samples"] + piece_stats["samples"],
+                                 seconds=stats["seconds"] + piece_stats["seconds"],
+                                 completed=piece_stats["completed"])
+                    if recorder is not None:
+                        captures.append((recorder, piece, current["run"], piece_stats["completed"]))
+                    elif current["run"] is not None:
+                        current["run"].finish("done", piece_stats["completed"])
+                    current["run"] = None
+            except Exception as e:
+                for run in [current["run"]] + [capture[2] for capture in captures]:
+                    if run is not None:
+                        run.finish("failed", error=str(e))  # No-op for runs that already finished
+                current["run"] = None
+                failures += 1
+                print(f"[{i}/{len(queue)}] {path}: FAILED: {e}", file=sys.stderr)
+                if not args.keep_going:
+                    return 1
+                table.cancel()
+                continue
+            print(f"[{i}/{len(queue)}] {path}: {stats['samples']} samples uploaded in {stats['seconds']:.2f} s; "
+                  f"{stats['completed']} Run took {time.perf_counter() - run_start:.1f} s.")
+            for recorder, piece, run, completed in captures:
+                samples = recorder.close()
+                try:
+                    report = telemetry.acceleration_report(samples, piece,
+                                                           meters_per_step=table.lead / table.pulse_per_rev)
+                except ValueError:
+                    report = None
+                print(f"  {telemetry.describe(recorder.stats, report)} -> {recorder.path}")
+                if run is not None:
+                    run.finish("done", completed, report["peak_measured"] if report else None)
+            if args.pause and i < len(queue):
+                time.sleep(args.pause)
+    finally:
+        table.close()
+        if archive is not None:
+            print(f"Archived runs in {archive.root} ({len(archive)} in the index).")
+            archive.close()
+        if metrics is not None:
+            metrics.save(args.metrics)
+            print(instrumentation.describe(metrics.summary()))
+            print(f"Saved {len(metrics.names())} metrics to {args.metrics}")
+
+    hours = (time.perf_counter() - campaign_start) / 3600
+    print(f"Finished {len(queue) - failures}/{len(queue)} runs ({(len(queue) - failures) / hours:.1f} runs/hour).")
+    return 1 if failures else 0
+
+
+def schedule_campaign(args):
+    import functools
+    import os
+
+    from shakebot import scheduler
+    from shakebot.device import BOARDS, Shakebot
+    from shakebot.preprocess import prepare_record
+    from shakebot.records import load_record
+
+    campaign = scheduler.Campaign(args.state)
+    try:
+        if args.records:
+            if len(campaign):
+                print(f"{args.state} already holds a campaign; omit the records to resume it.", file=sys.stderr)
+                return 1
+            missing = [path for path in args.records if not os.path.exists(path)]
+            if missing:
+                print(f"Records not found: {', '.join(missing)}", file=sys.stderr)
+                return 1
+            # Stored so that a resumed campaign prepares its records exactly as the first session did
+            campaign.add(args.records, args.repeat, {
+                "sample_rate": args.sample_rate, "fit": args.fit, "baseline": args.baseline,
+                "band": [corner or None for corner in args.band] if args.band else [None, None],
+                "taper": args.taper})
+        if args.retry_failed:
+            print(f"Queued {campaign.retry_failed()} failed runs again.")
+        if args.device is None:
+            print(scheduler.describe(campaign.summary()))
+            return 0
+
+        settings = campaign.settings()
+        buffer_size = BOARDS[args.board][1]
+
+        def prepare(path):
+            pieces, _ = prepare_record(load_record(path), settings["sample_rate"], buffer_size, settings["fit"],
+                                       settings["baseline"], tuple(settings["band"]), settings["taper"])
+            return pieces
+
+        def report(run_id, path, status, timings, detail):
+            phases = ", ".join(f"{phase} {seconds:.1f} s" for phase, seconds in timings.items())
+            print(f"[run {run_id}] {os.path.basename(path)}: {status.upper()} ({phases}) {detail or ''}",
+                  file=sys.stderr if status != "done" else sys.stdout)
+
+        on_line = (lambda line: print(f"  < {line}")) if args.verbose else None
+        connect = functools.partial(Shakebot.connect, args.device, args.baud, board=args.board, on_line=on_line,
+                                    interpolation=args.interpolation, control_rate=args.control_rate)
+        home = None if args.home_mm is None else args.home_mm / 1000.0
+        summary = scheduler.run_campaign(campaign, connect, prepare, rehome=args.rehome, home=home,
+                                         settle=args.settle, binary=not args.ascii, calibrate_first=args.calibrate,
+                                         keep_going=not args.stop_on_failure, max_attempts=args.max_attempts,
+                                         on_run=report)
+        print(scheduler.describe(summary))
+        return 1 if summary["failed"] or summary["pending"] else 0
+    finally:
+        campaign.close()
+
+
+def analyze_captures(args):
+    import glob
+    import os
+
+    import numpy as np
+
+    from shakebot import analysis
+
+    paths = []
+    for path in args.captures:
+        paths += sorted(glob.glob(os.path.join(path, "*.npy"))) if os.path.isdir(path) else [path]
+    pairs = [(path, path[:-4] + "_command.npy") for path in paths if not path.endswith("_command.npy")]
+    pairs = [(capture, command) for capture, command in pairs if os.path.exists(command)]
+    if not pairs:
+        print("No captures with a matching <name>_command.npy found.", file=sys.stderr)
+        return 1
+
+    names, commands, responses = [], [], []
+    for capture, command in pairs:
+        samples = np.load(capture)
+        if len(samples) < 2:
+            print(f"{capture}: empty capture, skipped", file=sys.stderr)
+            continue
+        names.append(os.path.basename(capture))
+        commands.append(np.load(command)[:, :2])
+        responses.append(analysis.telemetry_response(samples, args.lead / args.pulse_per_rev, args.response))
+    start = time.perf_counter()
+    result = analysis.analyze_runs(commands, responses, args.response)
+    if args.band:
+        result.update(analysis.qualify(result, args.band, args.gain_tolerance, args.min_coherence,
+                                       args.psa_tolerance))
+    for run in range(len(names)):
+        print(analysis.describe(result, run, names))
+    print(f"Analyzed {len(names)} runs in {time.perf_counter() - start:.2f} s", end="")
+    if args.band:
+        print(f"; {int(result['qualified'].sum())}/{len(names)} qualified in {args.band[0]:g}-{args.band[1]:g} Hz",
+              end="")
+    print(".")
+    if args.output:
+        np.savez(args.output, names=np.array(names), **result)
+        print(f"Saved {args.output}")
+    return 0 if not args.band or result["qualified"].all() else 1
+
+
+def compensate_record(args):
+    from shakebot import compensation
+    from shakebot.device import Shakebot
+    from shakebot.preprocess import describe, prepare_record
+    from shakebot.records import load_record, save_csv
+
+    on_line = (lambda line: print(f"  < {line}")) if args.verbose else None
+    table = Shakebot.connect(args.device, args.baud, on_line=on_line, interpolation=args.interpolation,
+                             control_rate=args.control_rate)
+    try:
+        pieces, info = prepare_record(load_record(args.record), args.sample_rate, table.buffer_size, "strongest")
+        print(f"{args.record}: {describe(info)}")
+
+        def progress(entry):
+            print(f"[{entry['iteration'] + 1}/{args.iterations}] NRMSE {entry['nrmse']:.2%}, "
+                  f"RMS error {entry['rms_error'] * 1000:.2f} mm, max {entry['max_error'] * 1000:.2f} mm, "
+                  f"delay {entry['delay'] * 1000:.0f} ms (update {entry['update_seconds'] * 1000:.1f} ms)")
+
+        home = None if args.home_mm is None else args.home_mm / 1000.0
+        plant = compensation.table_plant(table, not args.ascii, args.telemetry_rate, home)
+        drive, result = compensation.compensate(pieces[0], plant, args.iterations, args.tolerance, table.limits,
+                                                progress, gain=args.gain, min_coherence=args.min_coherence,
+                                                cutoff=args.cutoff)
+    finally:
+        table.close()
+    save_csv(args.output, drive)
+    status = "converged" if result["converged"] else f"not converged after {result['iterations']} plays"
+    print(f"Best NRMSE {result['nrmse']:.2%} ({status}); saved the drive to {args.output}")
+    return 0
+
+
+def check_records(args):
+    import os
+
+    from shakebot.device import Shakebot
+    from shakebot.feasibility import describe, make_feasible
+    from shakebot.records import load_record, save_csv
+
+    table = Shakebot(board=args.board)
+    infeasible = 0
+    for path in args.records:
+        data = load_record(path)
+        report = table.check_record(data)
+        print(f"{path}: {'OK' if report['feasible'] else 'INFEASIBLE'}")
+        if report["feasible"]:
+            continue
+        infeasible += 1
+        print("  " + describe(report).replace("\n", "\n  "))
+        if args.fix:
+            fixed, info = make_feasible(data, table.limits, args.fix)
+            output = os.path.splitext(path)[0] + "_feasible.csv"
+            save_csv(output, fixed)
+            cutoff = f"{info['cutoff']:.2f} Hz" if info["cutoff"] else "none"
+            print(f"  Wrote {output} (low-pass {cutoff}, time x{info['time_factor']:.3f}, "
+                  f"amplitude x{info['amplitude_factor']:.3f})")
+    return 1 if infeasible and not args.fix else 0
+
+
+def run_synchronized(args):
+    import os
+
+    from shakebot.archive import Archive
+    from shakebot.group import GroupError, TableGroup
+    from shakebot.device import BOARDS
+    from shakebot.preprocess import prepare_record
+    from shakebot.records import load_record
+
+    if args.per_table and len(args.records) != len(args.devices):
+        print(f"--per-table needs one record per table ({len(args.devices)}), got {len(args.records)}.",
+              file=sys.stderr)
+        return 1
+    steps = [args.records] if args.per_table else [[path] * len(args.devices) for path in args.records]
+    queue = steps * args.repeat
+    buffer_size = BOARDS[args.board][1]
+    on_line = (lambda line: print(f"  < {line}")) if args.verbose else None
+    group = TableGroup.connect(args.devices, args.baud, board=args.board, on_line=on_line)
+    archive = Archive(args.archive) if args.archive else None
+    campaign_start = time.perf_counter()
+    failures = 0
+    try:
+        for i, paths in enumerate(queue, 1):
+            label = ", ".join(sorted({os.path.basename(path) for path in paths}))
+            runs = []
+            try:
+                records = [prepare_record(load_record(path), args.sample_rate, buffer_size, args.fit)[0][0]
+                           for path in paths]
+                if args.home_mm is not None:
+                    group.home(args.home_mm / 1000.0, calibrate=args.calibrate)
+                if archive is not None:
+                    runs = [archive.start_run(record, table.record_to_steps(record), table_name=name,
+                                              board=args.board, parameters=table.parameters,
+                                              source=os.path.abspath(path), metadata={"repetition": i, "group": label})
+                            for name, table, record, path in zip(group.names, group.tables, records, paths)]
+                result = group.play(records, binary=not args.ascii)
+            except (GroupError, ValueError, OSError) as e:
+                for run in runs:
+                    run.finish("failed", error=str(e))
+                failures += 1
+                print(f"[{i}/{len(queue)}] {label}: FAILED: {e}", file=sys.stderr)
+                group.cancel()
+                continue
+            for run, completed in zip(runs, result["completed"]):
+                run.finish("done", completed)
+            print(f"[{i}/{len(queue)}] {label}: {len(group)} tables started within "
+                  f"{result['start_skew'] * 1000:.1f} ms (START writes {result['write_spread'] * 1000:.2f} ms apart), "
+                  f"took {result['seconds']:.1f} s.")
+            if args.verbose:
+                for name, line in zip(group.names, result["completed"]):
+                    print(f"  {name}: {line}")
+    finally:
+        for status in group.status():
+            print(f"{status['name']}: {status['state']} {status['detail']}")
+        group.close()
+        if archive is not None:
+            archive.close()
+    hours = (time.perf_counter() - campaign_start) / 3600
+    print(f"Finished {len(queue) - failures}/{len(queue)} synchronized runs on {len(args.devices)} tables "
+          f"({(len(queue) - failures) / hours:.1f} runs/hour).")
+    return 1 if failures else 0
+
+
+def poll_stats(args):
+    from shakebot.device import Shakebot
+    from shakebot.instrumentation import Metrics, describe
+
+    metrics = Metrics()
+    table = Shakebot.connect(args.device, args.baud, board=args.board, metrics=metrics)
+    try:
+        table.read_stats()  # Discard the window since power-up
+        metrics = table.metrics = Metrics()
+        window = 0
+        while not args.count or window < args.count:
+            time.sleep(args.interval)
+            stats = table.read_stats()
+            window += 1
+            print(f"[{window}] {stats['ticks']:.0f} ticks of {stats['period_us']:.0f} us, jitter mean "
+                  f"{stats['jitter_mean_us']:.1f} us, RMS {stats['jitter_rms_us']:.1f} us, max "
+                  f"{stats['jitter_max_us']:.0f} us, {stats['missed']:.0f} missed, {stats['rx_full']:.0f} RX full, "
+                  f"loop {stats['loop_hz']:.0f} Hz", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        table.close()
+    if metrics.names():
+        print(describe(metrics.summary()))
+    if args.output:
+        metrics.save(args.output)
+        print(f"Saved {args.output}")
+    return 0
+
+
+def simulate(args):
+    from shakebot.simulator import FirmwareSimulator, PtyTransport, describe_run
+
+    if args.benchmark:
+        return benchmark_simulator(args)
+
+    simulators, transports = [], []
+    for i in range(args.tables):
+        prefix = f"[{i}] " if args.tables > 1 else ""
+        simulator = FirmwareSimulator(args.board, speedup=args.speedup,
+                                      on_run=lambda report, prefix=prefix: print(prefix + describe_run(report),
+                                                                                 flush=True)).start()
+        simulators.append(simulator)
+        transports.append(PtyTransport(simulator))
+        print(f"Simulated {args.board} controller on {transports[-1].device} (Ctrl+C to stop)", flush=True)
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for transport, simulator in zip(transports, simulators):
+            transport.close()
+            simulator.stop()
+    return 0
+
+
+def benchmark_simulator(args):
+    import os
+
+    import numpy as np
+
+    from shakebot.device import Shakebot, MOTION_COMPLETED
+    from shakebot.feasibility import make_feasible
+    from shakebot.instrumentation import Metrics
+    from shakebot.records import load_record
+    from shakebot.signals import random_ground_motion
+    from shakebot.simulator import FakeSerial, FirmwareSimulator
+
+    if args.record:
+        data = load_record(args.record)
+    else:
+        data, _ = make_feasible(random_ground_motion(20.0, rng=0), Shakebot(board=args.board).limits)
+    if args.metrics:
+        os.makedirs(args.metrics, exist_ok=True)
+    print(f"{'baud':>8} {'mode':<7} {'upload s':>9} {'run s':>7} {'kB/s':>7} {'frame ms':>8} {'p95 ms':>7} "
+          f"{'lag':>4} {'RMS mm':>7} {'max mm':>7} {'underruns':>9} {'rx full':>7}")
+    for baud_rate in args.baud:
+        for mode in ("ascii", "binary", "stream"):
+            simulator = FirmwareSimulator(args.board, baud_rate=baud_rate, speedup=args.speedup).start()
+            port = FakeSerial(simulator)
+            metrics = Metrics()
+            table = Shakebot(port, board=args.board, metrics=metrics)
+            steps = table.displacement_to_steps(data[:, 1])
+            try:
+                table.read_stats()  # Start a fresh window
+                start = time.perf_counter()
+                if mode == "stream":
+                    stats = table.stream(data)
+                    upload = "-"  # Uploading overlaps playback
+                    _, sizes = metrics.series("frame_bytes")
+                    throughput = sizes.sum() / stats["seconds"]
+                else:
+                    stats = table.upload(table.record_to_steps(data), binary=mode == "binary")
+                    upload = f"{stats['seconds']:.2f}"
+                    throughput = stats["bytes_per_second"]
+                    table.start()
+                    table.wait_for(MOTION_COMPLETED, steps.size / 100.0 / args.speedup + 30.0)
+                elapsed = time.perf_counter() - start
+                firmware = table.read_stats()
+            except Exception as e:
+                print(f"{baud_rate:>8} {mode:<7} FAILED: {e}")
+                continue
+            finally:
+                simulator.stop()
+            report = simulator.runs[-1]
+            _, latency = metrics.series("frame_latency")
+            latency_text = f"{'-':>8} {'-':>7}"  # ASCII uploads have no replies to time
+            if latency.size:
+                median, p95 = np.percentile(latency * 1000, [50, 95])
+                latency_text = f"{median:>8.2f} {p95:>7.2f}"
+            print(f"{baud_rate:>8} {mode:<7} {upload:>9} {elapsed:>7.2f} {throughput / 1000:>7.1f} {latency_text} "
+                  f"{report['lag_ticks']:>4} {report['rms_error_m'] * 1000:>7.2f} {report['max_error_m'] * 1000:>7.2f} "
+                  f"{report['underruns']:>9} {int(firmware['rx_full']):>7}")
+            if args.metrics:
+                metrics.save(os.path.join(args.metrics, f"benchmark_{baud_rate}_{mode}.csv"))
+    return 0
+
+
+def generate_record(args):
+    from shakebot.records import save_csv
+    from shakebot.pulses import pulse
+    from shakebot.signals import multisine_batch, random_ground_motion, save_batch, stochastic_batch
+
+    if args.shape == "batch":
+        start = time.perf_counter()
+        if args.model == "multisine":
+            batch = multisine_batch(args.count, args.duration, args.components, rng=args.seed)
+        else:
+            batch = stochastic_batch(args.count, args.duration, args.components, rng=args.seed, pga=args.pga)
+        save_batch(args.output, batch, model=args.model, seed=-1 if args.seed is None else args.seed)
+        print(f"Saved {args.count} x {args.components} records of {batch.shape[-1]} samples to {args.output} "
+              f"in {time.perf_counter() - start:.1f} s")
+        return 0
+    if args.shape == "sweep":
+        return plan_sweep(args)
+    if args.shape == "cosine":
+        data = pulse("cosine", args.pgv, args.pga, args.cycles)
+    elif args.shape == "pulse":
+        data = pulse(args.type, args.pgv, args.pga, args.cycles)
+    else:
+        data = random_ground_motion(args.duration, rng=args.seed)
+    save_csv(args.output, data)
+    print(f"Saved {len(data)} samples to {args.output}")
+    return 0
+
+
+def plan_sweep(args):
+    import numpy as np
+
+    from shakebot.device import Shakebot
+    from shakebot.pulses import PulseGrid
+    from shakebot.signals import save_batch
+
+    spacing = np.linspace if args.linear else np.geomspace
+    table = Shakebot(board=args.board)
+    start = time.perf_counter()
+    grid = PulseGrid(args.type, spacing(args.pgv[0], args.pgv[1], int(args.pgv[2])),
+                     spacing(args.pga[0], args.pga[1], int(args.pga[2])), args.cycles, table.limits,
+                     buffer_size=table.buffer_size, margin=args.margin)
+    elapsed = time.perf_counter() - start
+    counts = grid.summary()
+    print(f"{grid!r} in {elapsed * 1000:.0f} ms")
+    for check in ("displacement", "velocity", "acceleration", "resolution", "buffer"):
+        print(f"  {check:<13}{counts[check]:>9} of {counts['total']} within the limit")
+    grid.save(args.output)
+    print(f"Saved the grid to {args.output}")
+    if args.waveforms:
+        points = grid.points()
+        batch = grid.waveforms()
+        save_batch(args.waveforms, batch[:, None], model=args.type, pgv=points[:, 0], pga=points[:, 1],
+                   cycles=points[:, 2])
+        print(f"Saved {len(batch)} pulses of up to {batch.shape[-1]} samples to {args.waveforms}")
+    return 0
+
+
+def load_catalog(args, client):
+    from obspy import UTCDateTime
+
+    from shakebot.iris import event_summary
+
+    now = UTCDateTime()
+    end_time = UTCDateTime(args.end) if args.end else UTCDateTime(now.year, now.month, now.day)
+    start_time = UTCDateTime(args.start) if args.start else end_time - args.years * 365 * 24 * 60 * 60
+    if args.offline:
+        # Use the local event index so no catalog request is needed
+        return client.cache.find_events(start_time, end_time, args.min_magnitude, args.limit)
+    catalog = client.get_events(starttime=start_time, endtime=end_time, minmagnitude=args.min_magnitude,
+                                limit=args.limit)
+    return [event_summary(event) for event in catalog]
+
+
+def select_pairs(args, client, events, channels=None, codes=None):
+    # Event x station pairs in the --max-distance/--azimuth band from the local station index
+    from shakebot import stations
+
+    bands = tuple(args.bands.split(","))
+    index = stations.load_index(client, bands).select(bands=bands, channels=channels)
+    if codes:
+        index = stations.StationIndex([row for row in index.rows
+                                       if (row["network"], row["station"], row["location"]) in codes])
+    start = time.perf_counter()
+    pairs = index.pairs(events, args.max_distance, args.min_distance, args.azimuth)
+    elapsed = time.perf_counter() - start
+    print(f"{len(pairs['event'])} pairs within {args.max_distance:g} km among {len(events)} events x "
+          f"{len(index)} stations ({elapsed * 1000:.1f} ms)")
+    return index, pairs
+
+
+def require_travel_times():
+    # The travel-time table, or None after saying how to generate it; checked before any download
+    from shakebot import traveltimes
+
+    try:
+        return traveltimes.load_table()
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return None
+
+
+def run_batch_command(args):
+    from shakebot import batch
+    from shakebot.iris import default_client
+
+    if require_travel_times() is None:
+        return 1
+    client = default_client(offline=args.offline, root=args.cache_dir)
+    events = load_catalog(args, client)
+    channels = tuple(args.channels.split(","))
+    stations = [batch.parse_station(spec) for spec in args.stations]
+    if args.max_distance is not None:
+        index, pairs = select_pairs(args, client, events, channels, set(stations))
+        tasks = batch.make_pair_tasks(events, index, pairs, args.duration, channels)
+    elif stations:
+        tasks = batch.make_tasks(events, stations, args.duration, channels)
+        print(f"{len(events)} events x {len(stations)} stations = {len(tasks)} tasks")
+    else:
+        client.cache.close()
+        print("Give stations or --max-distance.", file=sys.stderr)
+        return 2
+    client.cache.close()
+
+    def progress(done, total, result):
+        name = f"{result['network']}.{result['station']} {result['event']['time']}"
+        status = f"FAILED: {result['error']}" if result["error"] else f"{len(result['records'])} channels"
+        print(f"[{done}/{total}] {name}: {status} ({result['seconds']:.1f} s)")
+
+    start = time.perf_counter()
+    results = batch.run_batch(tasks, args.workers, args.cache_dir, args.offline, progress)
+    rows = batch.write_parquet(args.output, results)
+    elapsed = time.perf_counter() - start
+
+    failures = sum(1 for result in results if result["error"])
+    print(f"Wrote {rows} records to {args.output} in {elapsed:.1f} s ({failures} failed tasks).")
+    print("Seconds per stage (summed over workers):")
+    for stage, seconds in batch.summarize_timings(results).items():
+        print(f"  {stage:<16}{seconds:8.2f}")
+    return 1 if failures == len(tasks) and tasks else 0
+
+
+def find_stations(args):
+    import csv
+
+    import numpy as np
+
+    from shakebot import stations
+    from shakebot.iris import default_client
+
+    table = require_travel_times() if args.max_distance is not None else None
+    if args.max_distance is not None and table is None:
+        return 1
+    client = default_client(offline=args.offline, root=args.cache_dir)
+    try:
+        if args.update:
+            index = stations.update_inventory(client, tuple(args.bands.split(",")), args.network)
+            print(f"{len(index)} stations in the index.")
+        if args.max_distance is None:
+            return 0
+        events = load_catalog(args, client)
+        index, pairs = select_pairs(args, client, events)
+    finally:
+        client.cache.close()
+
+    # P and S arrivals of all pairs in one lookup
+    depths = np.array([event["depth_km"] or 0.0 for event in events])
+    p_times, s_times = table.arrivals(pairs["distance_km"], depths[pairs["event"]])
+    rows = []
+    for event, station, distance, azimuth, back_azimuth, p_time, s_time in zip(*(pairs[name].tolist() for name in (
+            "event", "station", "distance_km", "azimuth", "back_azimuth")), p_times.tolist(), s_times.tolist()):
+        network, code, location = index.code(station)
+        rows.append((str(events[event]["time"]), events[event]["magnitude"], network, code, location,
+                     f"{distance:.2f}", f"{azimuth:.1f}", f"{back_azimuth:.1f}", f"{p_time:.2f}", f"{s_time:.2f}"))
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("event_time", "magnitude", "network", "station", "location", "distance_km", "azimuth",
+                             "back_azimuth", "p_seconds", "s_seconds"))
+            writer.writerows(rows)
+        print(f"Wrote {len(rows)} pairs to {args.output}.")
+    else:
+        for event_time, magnitude, network, code, location, distance, azimuth, _, p_time, s_time in rows:
+            print(f"{event_time} M{magnitude}  {network}.{code}.{location}  {distance} km  az {azimuth}  "
+                  f"P +{p_time} s  S +{s_time} s")
+    return 0
+
+
+def list_archive(args):
+    from shakebot.archive import Archive, describe
+
+    archive = Archive(args.directory)
+    try:
+        start = time.perf_counter()
+        rows = archive.find(table_name=args.table_name, status=args.status, min_pga=args.min_pga,
+                            max_pga=args.max_pga, min_pgv=args.min_pgv, min_magnitude=args.min_magnitude,
+                            limit=args.limit)
+        elapsed = time.perf_counter() - start
+    finally:
+        archive.close()
+    if rows:
+        print(describe(rows))
+    print(f"{len(rows)} runs ({elapsed * 1000:.1f} ms)")
+    return 0
+
+
+def travel_time_table(args):
+    import os
+
+    from shakebot import traveltimes
+
+    path = traveltimes.table_path(args.model)
+    if args.generate:
+        start = time.perf_counter()
+
+        def progress(done, total):
+            print(f"Depth {done}/{total} computed ({time.perf_counter() - start:.0f} s)", file=sys.stderr)
+
+        table = traveltimes.TravelTimeTable.generate(args.model, workers=args.workers, on_progress=progress)
+        table.save(path)
+        print(f"Computed {table.p.size} grid points in {time.perf_counter() - start:.1f} s.")
+    elif not os.path.exists(path):
+        print(f"No {args.model} travel-time table at {path}; create it with --generate.", file=sys.stderr)
+        return 1
+    table = traveltimes.load_table(args.model)
+    print(f"{path}: {len(table.distances)} distances (0-{table.distances[-1]:g} deg) x {len(table.depths)} depths "
+          f"(0-{table.depths[-1]:g} km), model {table.model}")
+    if args.check:
+        check = traveltimes.check_table(table)
+        print(f"Largest error against TauP: P {check['p_max_error']:.2f} s, S {check['s_max_error']:.2f} s; "
+              f"{check['seconds_per_lookup'] * 1e6:.2f} us per lookup")
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "run":
+        return run_queue(args)
+    if args.command == "batch":
+        return run_batch_command(args)
+    if args.command == "stations":
+        return find_stations(args)
+    if args.command == "archive":
+        return list_archive(args)
+    if args.command == "traveltimes":
+        return travel_time_table(args)
+    if args.command == "check":
+        return check_records(args)
+    if args.command == "schedule":
+        return schedule_campaign(args)
+    if args.command == "analyze":
+        return analyze_captures(args)
+    if args.command == "compensate":
+        return compensate_record(args)
+    if args.command == "sync":
+        return run_synchronized(args)
+    if args.command == "stats":
+        return poll_stats(args)
+    if args.command == "simulate":
+        return simulate(args)
+    return generate_record(args)
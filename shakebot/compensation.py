@@ -0,0 +1,219 @@
+"""
+Iterative drive-signal correction (offline iterative learning control).
+
+The stepper does not reproduce a record exactly: AccelStepper's speed and
+acceleration ramps, the playback mode and the mechanics low-pass and delay
+the motion. compensate() plays a drive signal, measures the response, and
+updates the drive in the frequency domain until the response matches the
+target record:
+
+    D[k+1](f) = D[k](f) + gain * W(f) * conj(H(f)) / (|H(f)|² + β) * E[k](f)
+
+E is the tracking error of the aligned response (shakebot.analysis.align), H
+the Welch estimate of the drive-to-response transfer function, interpolated
+onto the FFT grid, and W is 1 where the coherence is at least `min_coherence`
+(and below `cutoff`) and 0 elsewhere, so noise is never amplified into the
+drive. β, a small fraction of the largest |H|² among those bins, keeps the
+inversion bounded where the table barely responds. A play that turns out worse than the
+best one so far is undone and the gain halved, and updates that would leave
+the table limits are shortened.
+
+A plant is any callable play(drive) -> (time, response) taking an (N, 2)
+drive record. table_plant() plays on a controller with telemetry (a real Due
+or the firmware simulator); linear_plant() is a second-order model for tests.
+An update is a few FFTs of twice the record length, a few milliseconds for
+15000 samples, so the loop time is the playback.
+"""
+import time
+
+import numpy as np
+
+from shakebot.analysis import align, telemetry_response, tracking_error, transfer_function
+from shakebot.feasibility import check_record
+
+DEFAULT_ITERATIONS = 5
+DEFAULT_TOLERANCE = 0.02          # NRMSE at which compensate() stops
+DEFAULT_GAIN = 0.8                # Fraction of the inverse-model correction applied per iteration
+DEFAULT_MIN_COHERENCE = 0.8
+DEFAULT_REGULARIZATION = 1e-2     # β as a fraction of max |H|²
+DEFAULT_SEGMENT_SECONDS = 10.24   # Welch segments for H; 0.1 Hz resolution
+DEFAULT_TAPER_SECONDS = 0.5      # Ramps that keep the drive's first and last samples on the target
+MAX_STEP_HALVINGS = 6             # Times an update is shortened to stay within the limits
+
+
+def update_drive(drive, target, achieved, sample_rate, gain=DEFAULT_GAIN, min_coherence=DEFAULT_MIN_COHERENCE,
+                 cutoff=None, regularization=DEFAULT_REGULARIZATION, segment_seconds=DEFAULT_SEGMENT_SECONDS,
+                 taper_seconds=DEFAULT_TAPER_SECONDS):
+    """
+    One frequency-domain learning update.
+
+    Args:
+        drive (np.ndarray): (N,) displacement that was played.
+        target (np.ndarray): (N,) displacement the table should reproduce.
+        achieved (np.ndarray): (N,) response aligned with the drive (analysis.align()).
+        sample_rate (float): Sample rate in Hz.
+        gain (float): Fraction of the correction to apply.
+        min_coherence (float): Frequencies with a lower drive/response coherence are not updated.
+        cutoff (float): Highest frequency to update in Hz, or None for all.
+        regularization (float): β as a fraction of max |H|².
+        segment_seconds (float): Welch segment length for the transfer function.
+        taper_seconds (float): Half-cosine ramps on the correction, so the
+            drive still starts and ends where the carriage rests.
+
+    Returns:
+        tuple[np.ndarray, dict]: The correction to add to the drive (N,), and
+        the "frequencies", "transfer" and "coherence" of the estimate.
+    """
+    from scipy.fft import irfft, next_fast_len, rfft
+
+    drive = np.asarray(drive, dtype=float)
+    n = len(drive)
+    frequencies, transfer, coherence = transfer_function(drive, achieved, sample_rate, segment_seconds)
+    # The inverse filter is non-causal; padding to twice the length keeps its tails from wrapping around
+    nfft = next_fast_len(2 * n, real=True)
+    grid = np.fft.rfftfreq(nfft, 1.0 / sample_rate)
+    # The DC bin of a detrended Welch estimate is empty; below the first bin H is held constant
+    model = np.interp(grid, frequencies[1:], transfer[1:].real) + 1j * np.interp(grid, frequencies[1:],
+                                                                                  transfer[1:].imag)
+    weight = np.interp(grid, frequencies[1:], np.nan_to_num(coherence[1:])) >= min_coherence
+    if cutoff:
+        weight &= grid <= cutoff
+    estimate = {"frequencies": frequencies, "transfer": transfer, "coherence": coherence}
+    if not weight.any():
+        return np.zeros(n), estimate
+    power = np.abs(model)**2
+    inverse = np.conj(model) / (power + regularization * power[weight].max())
+    error = np.asarray(target, dtype=float) - np.asarray(achieved, dtype=float)
+    correction = irfft(rfft(error, nfft) * (gain * weight * inverse), nfft)[:n]
+    length = min(int(round(taper_seconds * sample_rate)), n // 2)
+    if length > 0:
+        ramp = 0.5 - 0.5 * np.cos(np.pi * np.arange(length) / length)
+        correction[:length] *= ramp
+        correction[n - length:] *= ramp[::-1]
+    return correction, estimate
+
+
+def compensate(data, play, iterations=DEFAULT_ITERATIONS, tolerance=DEFAULT_TOLERANCE, limits=None,
+               on_iteration=None, gain=DEFAULT_GAIN, **options):
+    """
+    Find a drive signal whose response reproduces a record.
+
+    Args:
+        data (np.ndarray): (N, 2) target time/displacement record.
+        play (callable): play(drive) -> (time, response) for an (N, 2) drive;
+            see table_plant() and linear_plant().
+        iterations (int): Most plays.
+        tolerance (float): Stop once the NRMSE of the response is at most this.
+        limits (dict): From feasibility.table_limits(); updates that would
+            exceed them are shortened.
+        on_iteration (callable): Called with each history entry as it is measured.
+        gain (float): Initial learning gain; halved whenever a play is worse than the best.
+        **options: min_coherence, cutoff, regularization, segment_seconds and
+            taper_seconds for update_drive().
+
+    Returns:
+        tuple[np.ndarray, dict]: The best drive played, (N, 2), and a dict with
+        its "nrmse", "converged", "iterations" and the "history" of every play
+        (iteration, nrmse, rms_error, max_error, delay, gain and update_seconds,
+        the time spent computing the next drive).
+    """
+    data = np.asarray(data, dtype=float)
+    sample_rate = (len(data) - 1) / (data[-1, 0] - data[0, 0])
+    drive = data[:, :2].copy()
+    best = None
+    history = []
+    for iteration in range(iterations):
+        response_time, response = play(drive)
+        _, achieved, delay = align(drive, response_time, response)
+        errors = tracking_error(data[:, 1], achieved)
+        entry = {"iteration": iteration, "delay": float(delay), "gain": gain, "update_seconds": 0.0,
+                 **{name: float(value) for name, value in errors.items()}}
+        history.append(entry)
+        if best is None or entry["nrmse"] < best[2]:
+            best = (drive, achieved, entry["nrmse"])
+        else:
+            gain /= 2  # Diverging: step again from the best drive, more carefully
+        if best[2] <= tolerance or iteration == iterations - 1:
+            if on_iteration:
+                on_iteration(entry)
+            break
+
+        start = time.perf_counter()
+        correction, _ = update_drive(best[0][:, 1], data[:, 1], best[1], sample_rate, gain, **options)
+        drive = best[0].copy()
+        drive[:, 1] += correction
+        for _ in range(MAX_STEP_HALVINGS):
+            if limits is None or check_record(drive, limits)["feasible"]:
+                break
+            correction /= 2
+            drive[:, 1] = best[0][:, 1] + correction
+        else:
+            drive = None
+        entry["update_seconds"] = time.perf_counter() - start
+        if on_iteration:
+            on_iteration(entry)
+        if drive is None:
+            break  # No update of the best drive stays within the table limits
+
+    result = best[0].copy()
+    return result, {"nrmse": best[2], "converged": best[2] <= tolerance, "iterations": len(history),
+                    "history": history}
+
+
+def table_plant(table, binary=True, telemetry_rate=None, home=None, home_timeout=120.0):
+    """
+    Plant that plays drives on a controller and measures the executed step positions.
+
+    Args:
+        table (shakebot.device.Shakebot): Connected table streaming telemetry (Due).
+        binary (bool): Upload with binary frames.
+        telemetry_rate (float): Telemetry sample rate in Hz (default: shakebot.telemetry.DEFAULT_TELEMETRY_RATE).
+        home (float): Re-home with SET_DISPLACEMENT to this position in meters before every play.
+        home_timeout (float): Seconds allowed for re-homing.
+
+    Returns:
+        callable: play(drive) -> (time, position in meters).
+    """
+    from shakebot.device import DISPLACEMENT_SET, record_sample_rate
+    from shakebot.telemetry import DEFAULT_TELEMETRY_RATE, TelemetryRecorder
+
+    rate = telemetry_rate or DEFAULT_TELEMETRY_RATE
+
+    def play(drive):
+        if home is not None:
+            table.set_displacement(table.displacement_to_steps(home))
+            table.wait_for(DISPLACEMENT_SET, home_timeout)
+        recorder = TelemetryRecorder.for_record(len(drive) / record_sample_rate(drive), rate)
+        table.run_record(drive, binary=binary, recorder=recorder, telemetry_rate=rate)
+        return telemetry_response(recorder.close(), table.lead / table.pulse_per_rev)
+
+    return play
+
+
+def linear_plant(natural_frequency=8.0, damping=0.4, delay=0.02, noise=0.0, seed=None):
+    """
+    Second-order model of a table, for exercising compensate() without hardware.
+
+    The response is the drive filtered by ωn² / (s² + 2ζωn s + ωn²)
+    (bilinear transform at the drive's sample rate), delayed by `delay`
+    seconds, plus white noise with standard deviation `noise` meters.
+
+    Returns:
+        callable: play(drive) -> (time, response).
+    """
+    from scipy.signal import bilinear, lfilter
+
+    rng = np.random.default_rng(seed)
+    omega = 2 * np.pi * natural_frequency
+
+    def play(drive):
+        drive = np.asarray(drive, dtype=float)
+        sample_rate = (len(drive) - 1) / (drive[-1, 0] - drive[0, 0])
+        b, a = bilinear([omega**2], [1.0, 2 * damping * omega, omega**2], sample_rate)
+        # Start from rest at the drive's first value, as the table does after homing
+        response = drive[0, 1] + lfilter(b, a, drive[:, 1] - drive[0, 1])
+        if noise:
+            response = response + rng.normal(0.0, noise, len(response))
+        return drive[:, 0] - drive[0, 0] + delay, response
+
+    return play
@@ -0,0 +1,464 @@
+"""
+Headless control of one shakebot table over its serial command protocol.
+"""
+import copy
+import time
+
+import numpy as np
+
+from shakebot.protocol import upload_steps
+
+# Table parameters sent with SET_PARAMS, per controller board
+DUE_PARAMETERS = {
+    "pulse_per_rev": 200,     # Number of steps per revolution
+    "max_rpm": 1200,          # Maximum speed in RPM
+    "lead": 0.02,             # Distance traveled per revolution in meters
+    "max_acceleration": 5.1,  # Maximum acceleration in g
+    "total_length": 0.6,      # Total length of the shakebot in meters
+}
+MICRO_PARAMETERS = dict(DUE_PARAMETERS, max_acceleration=1.1)
+
+# Step buffer size (maxDisplacement in the firmware), per controller board
+DUE_BUFFER_SIZE = 100 * 150
+MICRO_BUFFER_SIZE = 100 * 3
+
+BOARDS = {
+    "due": (DUE_PARAMETERS, DUE_BUFFER_SIZE),
+    "micro": (MICRO_PARAMETERS, MICRO_BUFFER_SIZE),
+}
+
+# Playback interpolation modes per controller board (SET_PLAYBACK); the Micro plays one sample per tick
+INTERPOLATION_MODES = {
+    "due": ("step", "linear", "cubic"),
+    "micro": ("step",),
+}
+DEFAULT_SAMPLE_RATE = 100.0   # Hz; the firmware's rate until SET_PLAYBACK says otherwise
+DEFAULT_CONTROL_RATE = 1000   # Hz; ISR rate while interpolating
+MAX_CONTROL_RATE = 5000       # MAX_CONTROL_RATE in the firmware
+
+# Boards whose firmware samples the table accelerometer during START (SET_TELEMETRY); see shakebot.telemetry
+TELEMETRY_BOARDS = ("due",)
+
+# Lines the firmware prints when an operation has finished
+MOTION_COMPLETED = "Motion completed"
+CALIBRATION_COMPLETED = "Completed calibration."
+DISPLACEMENT_SET = "Displacement set."
+MOTION_STARTED = "Start executing displacement data."
+
+
+def record_sample_rate(data):
+    """
+    Sample rate in Hz of a record's time column (column 0).
+
+    Returns DEFAULT_SAMPLE_RATE for records too short to tell.
+    """
+    time = np.asarray(data)[:, 0]
+    if len(time) < 2 or time[-1] <= time[0]:
+        return DEFAULT_SAMPLE_RATE
+    return float((len(time) - 1) / (time[-1] - time[0]))
+
+
+class Shakebot:
+    """
+    One shakebot table.
+
+    Args:
+        port (serial.Serial): Open connection to the controller, or any object
+            offering write() and readline(); may be attached later by connect().
+        board (str): "due" or "micro"; selects the default parameters and buffer size.
+        on_line (callable): Called with every controller line read while waiting.
+        interpolation (str): "step" (one moveTo() per sample), "linear" or
+            "cubic"; see INTERPOLATION_MODES for what each board supports.
+        control_rate (int): Firmware ISR rate in Hz while interpolating.
+        metrics (shakebot.instrumentation.Metrics): Collects upload timings and,
+            with `stats_interval`, the controller's STATS.
+        stats_interval (float): Seconds between STATS requests while waiting
+            for the controller (wait_for()); None never asks.
+        **parameters: Overrides for pulse_per_rev, max_rpm, lead, max_acceleration
+            and total_length.
+    """
+
+    def __init__(self, port=None, board="due", on_line=None, interpolation="step",
+                 control_rate=DEFAULT_CONTROL_RATE, metrics=None, stats_interval=None, **parameters):
+        defaults, self.buffer_size = BOARDS[board]
+        unknown = set(parameters) - set(defaults)
+        if unknown:
+            raise TypeError(f"Unknown table parameters: {', '.join(sorted(unknown))}")
+        self.board = board
+        self.port = port
+        self.on_line = on_line
+        if not 0 < control_rate <= MAX_CONTROL_RATE:
+            raise ValueError(f"Control rate must be between 1 and {MAX_CONTROL_RATE} Hz.")
+        self.interpolation = interpolation
+        self.control_rate = control_rate
+        self.telemetry_rate = 0
+        self.metrics = metrics
+        self.stats_interval = stats_interval
+        for name, value in dict(defaults, **parameters).items():
+            setattr(self, name, value)
+
+    @classmethod
+    def connect(cls, device, baud_rate=250000, **kwargs):
+        """
+        Open a serial port, switch the controller to `baud_rate` and send the table parameters.
+
+        Args:
+            device (str): Serial device, e.g. "/dev/ttyACM0" or "COM3".
+            baud_rate (int): Baud rate to use.
+            **kwargs: Passed on to Shakebot().
+
+        Returns:
+            Shakebot: The connected table.
+        """
+        import serial
+
+        port = serial.Serial(device, baudrate=int(baud_rate), timeout=1)
+        port.write(f"BR:{baud_rate}\n".encode())  # Send "BR:<new_baud_rate>" command
+        time.sleep(0.1)  # Short delay to ensure the Arduino receives the baud rate change
+        port.close()
+        port = serial.Serial(device, baudrate=int(baud_rate), timeout=1)  # Reopen with the new baud rate
+
+        table = cls(port, **kwargs)
+        table.send_parameters()
+        return table
+
+    def with_port(self, port):
+        """Return a copy of this table that talks through another port-like object."""
+        table = copy.copy(self)
+        table.port = port
+        return table
+
+    def close(self):
+        """Close the serial port."""
+        if self.port is not None:
+            self.port.close()
+            self.port = None
+
+    @property
+    def parameters(self):
+        """Table parameters as a dict."""
+        return {name: getattr(self, name) for name in DUE_PARAMETERS}
+
+    @property
+    def interpolation(self):
+        """Playback interpolation sent with SET_PLAYBACK; setting it checks INTERPOLATION_MODES for the board."""
+        return self._interpolation
+
+    @interpolation.setter
+    def interpolation(self, mode):
+        if mode not in INTERPOLATION_MODES[self.board]:
+            raise ValueError(f"The {self.board} controller supports {', '.join(INTERPOLATION_MODES[self.board])} "
+                             f"playback, not {mode!r}.")
+        self._interpolation = mode
+
+    @property
+    def limits(self):
+        """Displacement (m), velocity (m/s) and acceleration (m/s²) limits; see shakebot.feasibility."""
+        from shakebot.feasibility import table_limits
+
+        return table_limits(self)
+
+    def check_record(self, data):
+        """
+        Check a (N, 2) time/displacement record against the table's kinematic limits.
+
+        Returns:
+            dict: Report from shakebot.feasibility.check_record(); report["feasible"] is False
+            when AccelStepper would have to clip the motion.
+        """
+        from shakebot.feasibility import check_record
+
+        return check_record(data, self.limits)
+
+    def parameter_command(self):
+        """Return the SET_PARAMS command line for the current parameters."""
+        return (f"SET_PARAMS pulsePerRev={self.pulse_per_rev} maxRPM={self.max_rpm} lead={self.lead} "
+                f"maxAcceleration={self.max_acceleration} totalLength={self.total_length}\n")
+
+    def playback_command(self, sample_rate=DEFAULT_SAMPLE_RATE):
+        """Return the SET_PLAYBACK command line for a record sampled at `sample_rate` Hz."""
+        if self.interpolation == "step":
+            return f"SET_PLAYBACK sampleRate={sample_rate:g} interpolation=step\n"
+        if self.control_rate < sample_rate:
+            raise ValueError(f"Control rate {self.control_rate} Hz is below the sample rate {sample_rate:g} Hz.")
+        return (f"SET_PLAYBACK sampleRate={sample_rate:g} interpolation={self.interpolation} "
+                f"controlRate={self.control_rate:g}\n")
+
+    def telemetry_command(self, rate):
+        """Return the SET_TELEMETRY command line; rate 0 switches accelerometer telemetry off."""
+        from shakebot.telemetry import MAX_TELEMETRY_RATE
+
+        if self.board not in TELEMETRY_BOARDS:
+            raise ValueError(f"The {self.board} controller has no accelerometer telemetry.")
+        if not 0 <= rate <= MAX_TELEMETRY_RATE:
+            raise ValueError(f"Telemetry rate must be between 0 and {MAX_TELEMETRY_RATE} Hz.")
+        return f"SET_TELEMETRY rate={rate:g}\n"
+
+    def displacement_to_steps(self, displacement):
+        """
+        Convert displacement in meters to motor steps.
+
+        Args:
+            displacement (float or np.ndarray): Displacement(s) in meters.
+
+        Returns:
+            int or np.ndarray: Corresponding motor step count(s).
+        """
+        if isinstance(displacement, np.ndarray):
+            return (displacement / self.lead * self.pulse_per_rev).astype(int)
+        return int(displacement / self.lead * self.pulse_per_rev)
+
+    def record_to_steps(self, data, check_buffer=True):
+        """
+        Convert a time/displacement record to step counts after checking its limits.
+
+        Args:
+            data (np.ndarray): (N, 2) array of time and displacement.
+            check_buffer (bool): Require the record to fit the controller buffer;
+                False for records played with stream().
+
+        Returns:
+            np.ndarray: (N,) step counts.
+        """
+        data = np.asarray(data)
+        if data.ndim != 2 or data.shape[1] != 2:
+            raise ValueError("Record must have one time and one displacement column; the controller drives one axis.")
+        displacements = data[:, 1]
+        if displacements.size == 0:
+            raise ValueError("No data to send. Please generate or load ground motion data.")
+        if np.any(np.abs(displacements) > self.total_length):
+            raise ValueError("Displacement exceeds the maximum limit. Please reduce the displacement.")
+        if check_buffer and displacements.size > self.buffer_size:
+            raise ValueError(f"Record has {displacements.size} samples; the controller holds {self.buffer_size}.")
+        return self.displacement_to_steps(displacements)
+
+    def _write(self, line):
+        self.port.write(line.encode())
+
+    def send_parameters(self):
+        """Send the table parameters (SET_PARAMS)."""
+        self._write(self.parameter_command())
+
+    def set_playback(self, sample_rate=DEFAULT_SAMPLE_RATE):
+        """Tell the controller the sample rate of the next record and how to interpolate it (SET_PLAYBACK)."""
+        self._write(self.playback_command(sample_rate))
+
+    def set_telemetry(self, rate):
+        """
+        Stream accelerometer samples at `rate` Hz during every following START (SET_TELEMETRY).
+
+        The samples arrive as binary packets between the controller's lines,
+        so read the port through a shakebot.telemetry.TelemetryRecorder
+        (wait_for(recorder=...)) while telemetry is on; rate 0 switches it off.
+        """
+        self._write(self.telemetry_command(rate))
+        self.telemetry_rate = rate
+
+    def upload(self, steps, binary=True, sample_rate=None):
+        """
+        Upload step counts to the controller buffer.
+
+        Args:
+            steps (array-like): Step counts.
+            binary (bool): Use CRC-checked binary frames; otherwise one ASCII line per sample.
+            sample_rate (float): Sample rate of the steps in Hz; when given, SET_PLAYBACK
+                is sent first so the controller plays them at that rate.
+
+        Returns:
+            dict: Upload statistics (samples, frames, bytes, retransmissions, seconds).
+        """
+        steps = np.asarray(steps, dtype=np.int64)
+        if sample_rate is not None:
+            self.set_playback(sample_rate)
+        if binary:
+            return upload_steps(self.port, steps, on_line=self.on_line, metrics=self.metrics)
+
+        start_time = time.perf_counter()
+        sent = 0
+        for value in steps:
+            line = f"{value}\n"
+            self._write(line)
+            sent += len(line)
+            time.sleep(0.001)  # 1 ms delay for high baud rates
+        seconds = time.perf_counter() - start_time
+        if self.metrics is not None:
+            self.metrics.record("upload_throughput", sent / seconds if seconds > 0 else 0.0)
+        return {"samples": int(steps.size), "frames": 0, "bytes": sent, "retransmissions": 0, "seconds": seconds,
+                "bytes_per_second": sent / seconds if seconds > 0 else 0.0}
+
+    def arm(self, timeout=2.0):
+        """
+        Check that START would play the uploaded record now (ARM), the first
+        phase of a synchronized start of several tables.
+
+        Args:
+            timeout (float): Seconds to wait for the reply.
+
+        Returns:
+            int: Samples the controller holds.
+        """
+        self._write("ARM\n")
+        parts = self.wait_for("ARMED", timeout).split()
+        if parts[0] != "ARMED":
+            raise RuntimeError(f"Controller is not ready to start ({' '.join(parts[1:]) or 'unknown'}).")
+        return int(parts[1])
+
+    def start(self):
+        """Start executing the uploaded record (START)."""
+        self._write("START\n")
+
+    def cancel(self):
+        """Stop the motion and clear the controller buffer (CANCEL)."""
+        self._write("CANCEL\n")
+
+    def set_displacement(self, steps):
+        """Home against the left limit, then move to `steps` (SET_DISPLACEMENT)."""
+        self._write(f"{steps}\n")
+        time.sleep(0.1)
+        self._write("SET_DISPLACEMENT\n")
+
+    def calibrate(self, steps):
+        """Home against both limits, then move to `steps` (CALIBRATE_DISPLACEMENT)."""
+        self._write(f"{steps}\n")
+        time.sleep(0.1)
+        self._write("CALIBRATE_DISPLACEMENT\n")
+
+    def read_stats(self, timeout=2.0):
+        """
+        Ask the controller for its timing statistics (STATS) and restart its counters.
+
+        Args:
+            timeout (float): Seconds to wait for the reply.
+
+        Returns:
+            dict: The fields of the reply (see shakebot.instrumentation); also
+            stored in `metrics` when there is one.
+        """
+        from shakebot.instrumentation import parse_stats
+
+        self._write("STATS\n")
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            line = self.port.readline().decode("utf-8", errors="replace").strip()
+            if line and self.on_line:
+                self.on_line(line)
+            stats = parse_stats(line)
+            if stats is not None:
+                if self.metrics is not None:
+                    self.metrics.record_stats(stats)
+                return stats
+        raise TimeoutError("Timed out waiting for 'STATS'.")
+
+    def wait_for(self, text, timeout=None, recorder=None):
+        """
+        Read controller lines until one contains `text`.
+
+        Args:
+            text (str): Text to wait for.
+            timeout (float): Seconds to wait, or None to wait indefinitely.
+            recorder (TelemetryRecorder): Read through this recorder, which keeps
+                the telemetry packets and returns the lines between them.
+
+        Returns:
+            str: The matching line.
+        """
+        from shakebot.instrumentation import parse_stats
+
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        polling = self.metrics is not None and self.stats_interval
+        next_poll = time.perf_counter()
+        while deadline is None or time.perf_counter() < deadline:
+            if polling and time.perf_counter() >= next_poll:
+                self._write("STATS\n")
+                next_poll = time.perf_counter() + self.stats_interval
+            if recorder is None:
+                lines = [self.port.readline().decode("utf-8", errors="replace").strip()]
+            else:
+                lines = recorder.feed(self.port.read(self.port.in_waiting or 1))
+            for line in lines:
+                if not line:
+                    continue
+                if self.on_line:
+                    self.on_line(line)
+                if polling and line.startswith("STATS"):
+                    stats = parse_stats(line)
+                    if stats is not None:
+                        self.metrics.record_stats(stats)
+                if text in line:
+                    return line
+        raise TimeoutError(f"Timed out waiting for '{text}'.")
+
+    def _wait_for_capture(self, recorder, timeout=2.0):
+        # Samples taken up to the end of the motion follow the completion line
+        deadline = time.perf_counter() + timeout
+        while not recorder.finished and time.perf_counter() < deadline:
+            for line in recorder.feed(self.port.read(self.port.in_waiting or 1)):
+                if self.on_line:
+                    self.on_line(line)
+
+    def run_record(self, data, binary=True, timeout=None, recorder=None, telemetry_rate=None):
+        """
+        Upload a record, start it and wait for the motion to complete.
+
+        Args:
+            data (np.ndarray): (N, 2) array of time and displacement.
+            binary (bool): Upload with binary frames.
+            timeout (float): Seconds to wait for completion; defaults to the
+                record duration plus 30 s.
+            recorder (TelemetryRecorder): Capture the table accelerometer during
+                the motion into this recorder (Due only).
+            telemetry_rate (float): Accelerometer sample rate in Hz
+                (default: shakebot.telemetry.DEFAULT_TELEMETRY_RATE).
+
+        Returns:
+            dict: Upload statistics plus the firmware's completion line under
+            "completed" and, with a recorder, its statistics under "telemetry".
+        """
+        from shakebot.telemetry import DEFAULT_TELEMETRY_RATE
+
+        steps = self.record_to_steps(data)
+        sample_rate = record_sample_rate(data)
+        stats = self.upload(steps, binary=binary, sample_rate=sample_rate)
+        if recorder is not None:
+            self.set_telemetry(telemetry_rate or DEFAULT_TELEMETRY_RATE)
+        elif self.telemetry_rate:
+            self.set_telemetry(0)  # Packets would otherwise arrive between the lines read below
+        self.start()
+        if timeout is None:
+            timeout = len(steps) / sample_rate + 30.0
+        stats["completed"] = self.wait_for(MOTION_COMPLETED, timeout, recorder)
+        if recorder is not None:
+            self._wait_for_capture(recorder)
+            stats["telemetry"] = dict(recorder.stats)
+        return stats
+
+    def stream(self, data, frame_samples=None, prefill=1.0, timeout=2.0):
+        """
+        Play a record of any length through the controller's ring buffer (STREAM).
+
+        The record is sent while it plays, so it is not limited by buffer_size;
+        the controller plays one target per sample whatever the interpolation mode.
+
+        Args:
+            data (np.ndarray): (N, 2) array of time and displacement.
+            frame_samples (int): Samples per binary frame
+                (default: shakebot.streaming.DEFAULT_STREAM_FRAME_SAMPLES).
+            prefill (float): Fraction of the ring buffer to fill before START.
+            timeout (float): Seconds to wait for any controller message.
+
+        Returns:
+            dict: Streaming statistics (see StreamProducer.run()) plus the
+            firmware's completion line under "completed".
+        """
+        from shakebot.streaming import DEFAULT_STREAM_FRAME_SAMPLES, StreamProducer, iter_chunks
+
+        steps = self.record_to_steps(data, check_buffer=False)
+        frame_samples = frame_samples or DEFAULT_STREAM_FRAME_SAMPLES
+        self.set_playback(record_sample_rate(data))
+        if self.telemetry_rate:
+            self.set_telemetry(0)  # StreamProducer reads lines only
+        producer = StreamProducer(self.port, iter_chunks(steps, frame_samples), frame_samples=frame_samples,
+                                  prefill=prefill, timeout=timeout, on_line=self.on_line, metrics=self.metrics)
+        stats = producer.run()
+        stats["completed"] = self.wait_for(MOTION_COMPLETED, timeout)
+        return stats
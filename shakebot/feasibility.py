@@ -0,0 +1,211 @@
+"""
+Kinematic feasibility of a record on a given table, and ways to make it feasible.
+
+The firmware follows the uploaded samples with AccelStepper, which silently
+limits speed and acceleration, so a record that asks for more than the motor
+can deliver is played distorted. check_record() finds those parts before the
+upload; make_feasible() changes the record as little as possible so it fits.
+
+Velocity and acceleration are estimated with second-order finite differences
+(np.gradient) on the record's own time axis.
+"""
+import numpy as np
+
+GRAVITY = 9.8  # m/s²; the value the firmware uses to convert maxAcceleration to steps/s²
+FEASIBILITY_METHODS = ("lowpass", "time", "amplitude")
+
+
+def table_limits(table):
+    """
+    Kinematic limits of a table.
+
+    Args:
+        table (shakebot.device.Shakebot): Table whose parameters to use.
+
+    Returns:
+        dict: "displacement" (m), "velocity" (m/s, max_rpm * lead / 60) and
+        "acceleration" (m/s², max_acceleration * g).
+    """
+    return {
+        "displacement": float(table.total_length),
+        "velocity": table.max_rpm * table.lead / 60.0,
+        "acceleration": table.max_acceleration * GRAVITY,
+    }
+
+
+def kinematics(data):
+    """
+    Velocity and acceleration of a (N, 2) time/displacement record.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Time, displacement, velocity and acceleration.
+    """
+    data = np.asarray(data, dtype=float)
+    time, displacement = data[:, 0], data[:, 1]
+    if len(time) < 3:
+        zeros = np.zeros_like(displacement)
+        return time, displacement, zeros, zeros
+    velocity = np.gradient(displacement, time)
+    acceleration = np.gradient(velocity, time)
+    return time, displacement, velocity, acceleration
+
+
+def violating_segments(values, limit, time=None):
+    """
+    Contiguous runs where |values| > limit.
+
+    Args:
+        values (np.ndarray): Signal to check.
+        limit (float): Allowed magnitude.
+        time (np.ndarray): Time of each sample, for the reported start/end times.
+
+    Returns:
+        list[dict]: One dict per run with start/end sample index (end exclusive),
+        start/end time and the peak magnitude inside the run.
+    """
+    over = np.abs(values) > limit
+    if not over.any():
+        return []
+    # Rising and falling edges of the mask give the run boundaries
+    edges = np.diff(np.concatenate(([0], over.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    # reduceat spans up to the next start, but the samples between runs are all within the limit
+    peaks = np.maximum.reduceat(np.abs(values), starts)
+    if time is None:
+        time = np.arange(len(values), dtype=float)
+    return [{"start": int(s), "end": int(e), "start_time": float(time[s]), "end_time": float(time[e - 1]),
+             "peak": float(peak)} for s, e, peak in zip(starts, ends, peaks)]
+
+
+def check_record(data, limits):
+    """
+    Check a record against displacement, velocity and acceleration limits.
+
+    Args:
+        data (np.ndarray): (N, 2) array of time and displacement.
+        limits (dict): From table_limits().
+
+    Returns:
+        dict: "feasible", the peak of each quantity under "peaks", the limits,
+        and the violating segments per quantity under "segments".
+    """
+    time, displacement, velocity, acceleration = kinematics(data)
+    values = {"displacement": displacement, "velocity": velocity, "acceleration": acceleration}
+    segments = {name: violating_segments(signal, limits[name], time) for name, signal in values.items()}
+    return {
+        "feasible": not any(segments.values()),
+        "peaks": {name: float(np.abs(signal).max()) if signal.size else 0.0 for name, signal in values.items()},
+        "limits": dict(limits),
+        "segments": segments,
+    }
+
+
+def describe(report):
+    """Human-readable summary of a check_record() report."""
+    units = {"displacement": "m", "velocity": "m/s", "acceleration": "m/s²"}
+    lines = []
+    for name, segments in report["segments"].items():
+        if not segments:
+            continue
+        worst = max(segments, key=lambda segment: segment["peak"])
+        lines.append(f"{name.capitalize()} exceeds {report['limits'][name]:.3g} {units[name]} in {len(segments)} "
+                     f"segment(s); peak {worst['peak']:.3g} {units[name]} at "
+                     f"{worst['start_time']:.2f}-{worst['end_time']:.2f} s.")
+    return "\n".join(lines) if lines else "Record is within the table limits."
+
+
+def lowpass(data, cutoff, order=4):
+    """
+    Zero-phase Butterworth-magnitude low-pass applied in the frequency domain.
+
+    Args:
+        data (np.ndarray): (N, 2) array of time and displacement, uniformly sampled.
+        cutoff (float): Corner frequency in Hz.
+        order (int): Filter order; higher is sharper.
+
+    Returns:
+        np.ndarray: Filtered (N, 2) record on the same time axis.
+    """
+    data = np.asarray(data, dtype=float)
+    displacement = data[:, 1]
+    dt = (data[-1, 0] - data[0, 0]) / (len(data) - 1)
+    nfft = 2 * len(displacement)  # Zero padding so the ends do not wrap into each other
+    frequencies = np.fft.rfftfreq(nfft, dt)
+    response = 1.0 / np.sqrt(1.0 + (frequencies / cutoff) ** (2 * order))
+    filtered = np.fft.irfft(np.fft.rfft(displacement, nfft) * response, nfft)[:len(displacement)]
+    return np.column_stack((data[:, 0], filtered))
+
+
+def time_scale(data, factor):
+    """
+    Stretch a record in time by `factor` and resample it at its original sample interval.
+
+    Velocities drop by `factor` and accelerations by `factor`², displacements are unchanged.
+    """
+    data = np.asarray(data, dtype=float)
+    dt = (data[-1, 0] - data[0, 0]) / (len(data) - 1)
+    stretched = data[0, 0] + (data[:, 0] - data[0, 0]) * factor
+    time = np.arange(stretched[0], stretched[-1] + dt / 2, dt)
+    return np.column_stack((time, np.interp(time, stretched, data[:, 1])))
+
+
+def make_feasible(data, limits, method="lowpass", margin=0.95):
+    """
+    Return a feasible version of a record.
+
+    Methods:
+        "lowpass": highest low-pass corner whose output meets the velocity and
+            acceleration limits, then amplitude scaling for whatever is still too
+            large. Keeps timing and most of the waveform.
+        "time": slow the record down just enough for velocity and acceleration,
+            then scale the amplitude if the displacement is too large. Keeps
+            the waveform shape but makes it longer.
+        "amplitude": scale the whole record down by one factor.
+
+    Args:
+        data (np.ndarray): (N, 2) array of time and displacement.
+        limits (dict): From table_limits().
+        method (str): One of FEASIBILITY_METHODS.
+        margin (float): Fraction of each limit to aim for.
+
+    Returns:
+        tuple[np.ndarray, dict]: The new record and a dict with the method, the
+        applied "cutoff" / "time_factor" / "amplitude_factor" and the new report.
+    """
+    if method not in FEASIBILITY_METHODS:
+        raise ValueError(f"Unknown method {method!r}; choose one of {', '.join(FEASIBILITY_METHODS)}.")
+    target = {name: limit * margin for name, limit in limits.items()}
+    data = np.asarray(data, dtype=float)
+    info = {"method": method, "cutoff": None, "time_factor": 1.0, "amplitude_factor": 1.0}
+
+    peaks = check_record(data, limits)["peaks"]
+    dynamic = ("velocity", "acceleration")
+    if method == "lowpass" and any(peaks[name] > target[name] for name in dynamic):
+        dt = (data[-1, 0] - data[0, 0]) / (len(data) - 1)
+        # Bisect the corner frequency on a log scale between 0.05 Hz and Nyquist
+        low, high = np.log(0.05), np.log(0.5 / dt)
+        for _ in range(30):
+            middle = (low + high) / 2
+            filtered = check_record(lowpass(data, np.exp(middle)), limits)["peaks"]
+            if any(filtered[name] > target[name] for name in dynamic):
+                high = middle
+            else:
+                low = middle
+        info["cutoff"] = float(np.exp(low))
+        data = lowpass(data, info["cutoff"])
+    elif method == "time":
+        factor = max(1.0, peaks["velocity"] / target["velocity"],
+                     np.sqrt(peaks["acceleration"] / target["acceleration"]))
+        if factor > 1.0:
+            info["time_factor"] = float(factor)
+            data = time_scale(data, factor)
+
+    # Whatever is left over is removed by scaling the amplitude
+    peaks = check_record(data, limits)["peaks"]
+    scale = min([1.0] + [target[name] / peaks[name] for name in peaks if peaks[name] > 0])
+    if scale < 1.0:
+        info["amplitude_factor"] = float(scale)
+        data = np.column_stack((data[:, 0], data[:, 1] * scale))
+    info["report"] = check_record(data, limits)
+    return data, info
@@ -0,0 +1,263 @@
+"""
+Several shakebot tables driven together, each on its own serial port.
+
+TableGroup talks to every table from its own thread, so uploads, homing and
+waiting for the motion run in parallel and a group takes as long as its
+slowest table, not the sum of all of them. Records start with a two-phase
+commit:
+
+    arm      ARM on every port; each controller answers "ARMED <samples>" once
+             its record is buffered and it is idle, otherwise "NOT_ARMED
+             <reason>" and the group cancels every table
+    commit   START written to all ports back to back
+
+START restarts the firmware's motion timer, so each table plays its first
+sample one ISR period (10 ms at 100 Hz) after START arrives, and the tables
+start within the spread of the START writes plus the USB latency instead of
+anywhere within a tick of their free-running timers. The spread of the
+tables' "Start executing" replies is reported as the start skew.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+STATES = ("idle", "homing", "uploaded", "armed", "running", "done", "failed")
+
+
+class GroupError(RuntimeError):
+    """Raised when an operation fails on one or more tables; `errors` maps table names to exceptions."""
+
+    def __init__(self, action, errors):
+        self.errors = errors
+        details = "; ".join(f"{name}: {error}" for name, error in errors.items())
+        super().__init__(f"{action} failed on {len(errors)} table(s): {details}")
+
+
+class TableGroup:
+    """
+    Tables operated together.
+
+    Args:
+        tables (list[shakebot.device.Shakebot]): Connected tables.
+        names (list[str]): Labels for status and errors (default: table0, table1, ...).
+    """
+
+    def __init__(self, tables, names=None):
+        self.tables = list(tables)
+        self.names = list(names) if names else [f"table{i}" for i in range(len(self.tables))]
+        self.state = {name: "idle" for name in self.names}
+        self.detail = {name: "" for name in self.names}
+        self._workers = ThreadPoolExecutor(max_workers=max(1, len(self.tables)), thread_name_prefix="shakebot-table")
+
+    @classmethod
+    def connect(cls, devices, baud_rate=250000, **kwargs):
+        """
+        Open every device in parallel (see Shakebot.connect()).
+
+        Args:
+            devices (list[str]): Serial devices, one per table.
+            baud_rate (int): Baud rate for all tables.
+            **kwargs: Passed on to Shakebot() for every table.
+
+        Returns:
+            TableGroup: The connected group, named after the devices.
+        """
+        from shakebot.device import Shakebot
+
+        with ThreadPoolExecutor(max_workers=max(1, len(devices))) as workers:
+            futures = [workers.submit(Shakebot.connect, device, baud_rate, **kwargs) for device in devices]
+            tables, errors = [], {}
+            for device, future in zip(devices, futures):
+                try:
+                    tables.append(future.result())
+                except Exception as e:
+                    errors[device] = e
+        if errors:
+            for table in tables:
+                table.close()
+            raise GroupError("Connecting", errors)
+        return cls(tables, devices)
+
+    def close(self):
+        self._workers.shutdown()
+        for table in self.tables:
+            table.close()
+
+    def __len__(self):
+        return len(self.tables)
+
+    def _each(self, action, function, arguments=None, state=None):
+        # Run function(table, argument) for every table in parallel; raise GroupError if any failed
+        arguments = arguments if arguments is not None else [None] * len(self.tables)
+        futures = [self._workers.submit(function, table, argument) for table, argument in zip(self.tables, arguments)]
+        results, errors = [], {}
+        for name, future in zip(self.names, futures):
+            try:
+                results.append(future.result())
+                if state:
+                    self.state[name] = state
+            except Exception as e:
+                results.append(None)
+                errors[name] = e
+                self.state[name] = "failed"
+                self.detail[name] = f"{action}: {e}"
+        if errors:
+            raise GroupError(action, errors)
+        return results
+
+    def _per_table(self, records):
+        # One record for every table, or a list with one per table
+        if isinstance(records, (list, tuple)):
+            if len(records) != len(self.tables):
+                raise ValueError(f"Got {len(records)} records for {len(self.tables)} tables.")
+            return list(records)
+        return [records] * len(self.tables)
+
+    def home(self, position=None, calibrate=False, timeout=120.0):
+        """
+        Re-home every table in parallel.
+
+        Args:
+            position (float): Position in meters to move to after homing (default: mid-stroke).
+            calibrate (bool): Calibrate against both limits instead of the left one.
+            timeout (float): Seconds allowed per table.
+        """
+        from shakebot.device import CALIBRATION_COMPLETED, DISPLACEMENT_SET
+
+        def home(table, _):
+            steps = table.displacement_to_steps(table.total_length / 2 if position is None else position)
+            if calibrate:
+                table.calibrate(steps)
+                return table.wait_for(CALIBRATION_COMPLETED, timeout)
+            table.set_displacement(steps)
+            return table.wait_for(DISPLACEMENT_SET, timeout)
+
+        self._set_all("homing")
+        self._each("Homing", home, state="idle")
+
+    def upload(self, records, binary=True):
+        """
+        Upload records to every table in parallel.
+
+        Args:
+            records (np.ndarray | list[np.ndarray]): One (N, 2) record for all
+                tables, or one per table.
+            binary (bool): Upload with binary frames.
+
+        Returns:
+            list[dict]: Upload statistics per table.
+        """
+        from shakebot.device import record_sample_rate
+
+        def upload(table, data):
+            return table.upload(table.record_to_steps(data), binary=binary, sample_rate=record_sample_rate(data))
+
+        return self._each("Upload", upload, self._per_table(records), state="uploaded")
+
+    def arm(self, timeout=2.0):
+        """
+        First phase of a synchronized start: every table must confirm that it
+        holds its record and is idle. If any table refuses, all are cancelled.
+
+        Returns:
+            list[int]: Samples buffered per table.
+        """
+        try:
+            return self._each("Arming", lambda table, _: table.arm(timeout), state="armed")
+        except GroupError:
+            self.cancel()
+            raise
+
+    def commit(self):
+        """
+        Second phase: write START to every table back to back.
+
+        Returns:
+            float: Seconds between the first and the last START write.
+        """
+        times = []
+        for table in self.tables:
+            table.start()
+            times.append(time.perf_counter())
+        self._set_all("running")
+        return times[-1] - times[0]
+
+    def wait(self, timeout):
+        """
+        Wait in parallel for every table to report the start and the end of its motion.
+
+        Args:
+            timeout (float): Seconds allowed per table.
+
+        Returns:
+            tuple[list[float], list[str]]: perf_counter() times at which each
+            table's "Start executing" reply arrived, and its completion line.
+        """
+        from shakebot.device import MOTION_COMPLETED, MOTION_STARTED
+
+        def wait(table, _):
+            deadline = time.perf_counter() + timeout
+            table.wait_for(MOTION_STARTED, timeout)
+            started = time.perf_counter()
+            return started, table.wait_for(MOTION_COMPLETED, max(0.0, deadline - time.perf_counter()))
+
+        results = self._each("Waiting for the motion", wait, state="done")
+        for name, (_, completed) in zip(self.names, results):
+            self.detail[name] = completed
+        return [started for started, _ in results], [completed for _, completed in results]
+
+    def play(self, records, binary=True, timeout=None):
+        """
+        Upload, arm, start together and wait for every table.
+
+        Args:
+            records (np.ndarray | list[np.ndarray]): One record for all tables, or one per table.
+            binary (bool): Upload with binary frames.
+            timeout (float): Seconds to wait for the motion; defaults to the
+                longest record plus 30 s.
+
+        Returns:
+            dict: "uploads" (statistics per table), "write_spread" (seconds
+            between the first and last START), "start_skew" (seconds between
+            the first and last "Start executing" reply), "completed" (lines per
+            table) and "seconds" (the whole play).
+        """
+        from shakebot.device import record_sample_rate
+
+        start = time.perf_counter()
+        records = self._per_table(records)
+        uploads = self.upload(records, binary)
+        self.arm()
+        spread = self.commit()
+        if timeout is None:
+            timeout = max(len(data) / record_sample_rate(data) for data in records) + 30.0
+        try:
+            started, completed = self.wait(timeout)
+        except GroupError:
+            self.cancel()
+            raise
+        return {"uploads": uploads, "write_spread": spread, "start_skew": max(started) - min(started),
+                "completed": completed, "seconds": time.perf_counter() - start}
+
+    def cancel(self):
+        """Send CANCEL to every table, ignoring tables whose port has failed."""
+        for name, table in zip(self.names, self.tables):
+            try:
+                table.cancel()
+                if self.state[name] != "failed":
+                    self.state[name] = "idle"
+            except Exception as e:
+                self.detail[name] = f"Cancel: {e}"
+
+    def status(self):
+        """
+        Aggregate status.
+
+        Returns:
+            list[dict]: Per table "name", "state" (see STATES) and "detail"
+            (the last completion line or error).
+        """
+        return [{"name": name, "state": self.state[name], "detail": self.detail[name]} for name in self.names]
+
+    def _set_all(self, state):
+        for name in self.names:
+            self.state[name] = state
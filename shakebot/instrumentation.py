@@ -0,0 +1,173 @@
+"""
+Timing instrumentation for the host and the controller.
+
+Host side, a Metrics object passed to Shakebot, upload_steps(), StreamProducer
+or SerialWorker collects time series of:
+
+    frame_latency      seconds from writing a binary frame to reading its ACK/NAK
+    frame_bytes        bytes per frame
+    upload_throughput  bytes per second of each completed upload
+    stream_buffered    samples in the controller's ring buffer at each CREDIT
+    outbound_depth     writes and jobs waiting for the SerialWorker thread
+    inbound_depth      messages the GUI has not drained yet
+
+Controller side, the firmware answers STATS with one line of counters for the
+window since the previous STATS (see printStats() in due.ino and micro.ino):
+
+    STATS window_us=1000000 ticks=100 period_us=10000 jitter_mean_us=2.10 jitter_rms_us=2.50
+          jitter_max_us=9 missed=0 rx_full=0 loop_hz=84211
+
+jitter_* compare the micros() between consecutive updateMotorPosition() calls
+with the nominal timer period, missed counts timer periods that passed without
+a call, rx_full counts loop passes that found the serial receive buffer full
+and loop_hz is the rate of stepper.run() calls. Shakebot polls STATS while it
+waits for the controller when given a `stats_interval`, and each field is
+stored as the series "firmware_<field>".
+"""
+import csv
+import threading
+import time
+
+import numpy as np
+
+STATS_FIELDS = ("window_us", "ticks", "period_us", "jitter_mean_us", "jitter_rms_us", "jitter_max_us", "missed",
+                "rx_full", "loop_hz")
+DEFAULT_STATS_INTERVAL = 1.0  # Seconds between STATS requests while waiting for the controller
+
+
+def parse_stats(line):
+    """
+    Parse a STATS reply.
+
+    Args:
+        line (str): Controller line.
+
+    Returns:
+        dict | None: Field values as floats, or None when the line is not a STATS reply.
+    """
+    parts = line.split()
+    if not parts or parts[0] != "STATS":
+        return None
+    values = {}
+    for token in parts[1:]:
+        name, _, value = token.partition("=")
+        try:
+            values[name] = float(value)
+        except ValueError:
+            return None
+    return values if all(name in values for name in STATS_FIELDS) else None
+
+
+class Metrics:
+    """
+    Thread-safe store of named time series.
+
+    Timestamps are seconds since the Metrics object was created.
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def now(self):
+        """Seconds since creation."""
+        return time.perf_counter() - self._start
+
+    def record(self, name, value, timestamp=None):
+        """
+        Append one measurement.
+
+        Args:
+            name (str): Series name.
+            value (float): Measured value.
+            timestamp (float): Seconds since creation (default: now).
+        """
+        timestamp = self.now() if timestamp is None else timestamp
+        with self._lock:
+            times, values = self._series.setdefault(name, ([], []))
+            times.append(timestamp)
+            values.append(float(value))
+
+    def record_stats(self, stats, timestamp=None):
+        """Store the fields of a parse_stats() result as "firmware_<field>" series."""
+        timestamp = self.now() if timestamp is None else timestamp
+        for name, value in stats.items():
+            self.record(f"firmware_{name}", value, timestamp)
+
+    def names(self):
+        with self._lock:
+            return sorted(self._series)
+
+    def series(self, name):
+        """
+        Return one series.
+
+        Args:
+            name (str): Series name.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Timestamps and values (empty if never recorded).
+        """
+        with self._lock:
+            times, values = self._series.get(name, ([], []))
+            return np.array(times), np.array(values)
+
+    def summary(self):
+        """
+        Summarise every series.
+
+        Returns:
+            dict: {name: {"count", "mean", "p50", "p95", "max"}}.
+        """
+        result = {}
+        for name in self.names():
+            _, values = self.series(name)
+            p50, p95 = np.percentile(values, [50, 95])
+            result[name] = {"count": len(values), "mean": float(values.mean()), "p50": float(p50),
+                            "p95": float(p95), "max": float(values.max())}
+        return result
+
+    def save(self, path):
+        """
+        Write every series to a CSV file with time, metric and value columns,
+        or to an .npz file with <metric>_time and <metric> arrays.
+
+        Args:
+            path (str): Output path; the extension selects the format.
+        """
+        if path.endswith(".npz"):
+            arrays = {}
+            for name in self.names():
+                arrays[f"{name}_time"], arrays[name] = self.series(name)
+            np.savez(path, **arrays)
+            return
+        rows = []
+        for name in self.names():
+            times, values = self.series(name)
+            rows.extend(zip(times, [name] * len(times), values))
+        rows.sort(key=lambda row: row[0])
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("time", "metric", "value"))
+            writer.writerows((f"{t:.6f}", name, f"{value:.9g}") for t, name, value in rows)
+
+
+def describe(summary, names=None):
+    """
+    Format a Metrics.summary() as one line per series.
+
+    Args:
+        summary (dict): From Metrics.summary().
+        names (list[str]): Series to include (default: all).
+
+    Returns:
+        str: Text table of count, mean, median, 95th percentile and maximum.
+    """
+    lines = [f"{'metric':<26} {'count':>7} {'mean':>11} {'p50':>11} {'p95':>11} {'max':>11}"]
+    for name in names or sorted(summary):
+        if name in summary:
+            s = summary[name]
+            lines.append(f"{name:<26} {s['count']:>7} {s['mean']:>11.4g} {s['p50']:>11.4g} {s['p95']:>11.4g} "
+                         f"{s['max']:>11.4g}")
+    return "\n".join(lines)
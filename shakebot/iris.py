@@ -0,0 +1,273 @@
+"""
+Download earthquake records from IRIS and turn them into displacement records.
+
+All obspy imports happen inside the functions so importing this module stays cheap.
+"""
+import random
+import time
+from contextlib import contextmanager
+
+DEFAULT_STATION = ("IU", "ANMO", "00")  # Network, station, location
+HORIZONTAL_CHANNELS = ("BH1", "BH2")
+ALL_CHANNELS = ("BH1", "BH2", "BHZ")
+PRE_FILT = (0.01, 0.02, 30.0, 35.0)  # Pre-filter corner frequencies for response removal
+WINDOW_PADDING = 60.0  # Seconds of waveform requested before the P arrival, for the taper and pre-filter
+TARGET_SAMPLING_RATE = 100.0  # Hz; the firmware plays one sample per 10 ms
+
+
+def default_client(offline=False, root=None):
+    """Return a cached IRIS client, using the default cache directory unless `root` is given."""
+    from shakebot.cache import CachedClient, WaveformCache
+
+    cache = WaveformCache(offline=offline) if root is None else WaveformCache(root, offline=offline)
+    return CachedClient(cache)
+
+
+@contextmanager
+def timed(timings, stage):
+    """Add the wall time of the with-block to timings[stage] (no-op when timings is None)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def event_summary(event):
+    """Return time, latitude, longitude, depth (km) and magnitude of an obspy Event as a dict."""
+    origin = event.origins[0]
+    return {
+        "resource_id": str(event.resource_id),
+        "time": origin.time,
+        "latitude": origin.latitude,
+        "longitude": origin.longitude,
+        "depth_km": origin.depth / 1000,  # Depth in km
+        "magnitude": event.magnitudes[0].mag,
+    }
+
+
+def p_wave_arrival(event_time, distance_km, depth_km=0.0, table=None):
+    """
+    First P arrival time from the iasp91 travel-time table (see shakebot.traveltimes).
+
+    Args:
+        event_time (UTCDateTime): Origin time.
+        distance_km (float): Epicentral distance in km.
+        depth_km (float): Source depth in km.
+        table (shakebot.traveltimes.TravelTimeTable): Table to use (default: load_table()).
+    """
+    from shakebot.traveltimes import load_table
+
+    table = table or load_table()
+    return event_time + float(table.p_time(distance_km, depth_km))
+
+
+def process_stream(st, inventory, p_arrival, duration, pre_filt=PRE_FILT, sampling_rate=TARGET_SAMPLING_RATE,
+                   timings=None):
+    """
+    Convert raw waveforms to displacement trimmed to `duration` seconds after the P arrival.
+
+    Removes the instrument response to acceleration, integrates twice, resamples
+    and trims. The input stream is left untouched.
+
+    Args:
+        st (obspy.Stream): Raw waveforms.
+        inventory (obspy.Inventory): Response-level inventory for the channels.
+        p_arrival (UTCDateTime): P-wave arrival time.
+        duration (float): Seconds to keep after the arrival.
+        pre_filt (tuple): Pre-filter corner frequencies for response removal.
+        sampling_rate (float): Target sampling rate in Hz.
+        timings (dict): Accumulates seconds per stage when given.
+
+    Returns:
+        obspy.Stream: Displacement traces in meters.
+    """
+    st_disp = st.copy()
+    # Remove the instrument response to convert the raw data to acceleration (m/s²)
+    with timed(timings, "remove_response"):
+        st_disp.remove_response(inventory=inventory, output="ACC", pre_filt=pre_filt)
+    # Convert acceleration to displacement by performing double integration
+    with timed(timings, "integrate"):
+        st_disp.integrate()  # First integration to get velocity
+        st_disp.integrate()  # Second integration to get displacement
+    # Resample the data to the target rate (if the original sampling rate is different)
+    with timed(timings, "resample"):
+        for tr in st_disp:
+            tr.resample(sampling_rate=sampling_rate)
+    # Trim the waveform to the duration after the P-wave arrival
+    with timed(timings, "trim"):
+        for tr in st_disp:
+            tr.trim(starttime=p_arrival, endtime=p_arrival + duration)
+    return st_disp
+
+
+def stream_to_records(st, reftime):
+    """
+    Split a displacement stream into (N, 2) time/displacement arrays.
+
+    Args:
+        st (obspy.Stream): Displacement traces.
+        reftime (UTCDateTime): Time that becomes t = 0.
+
+    Returns:
+        dict[str, np.ndarray]: Arrays keyed by channel code.
+    """
+    import numpy as np
+
+    return {tr.stats.channel: np.column_stack((tr.times(reftime=reftime), tr.data)) for tr in st}
+
+
+def prepare_station_records(client, event, duration, network=DEFAULT_STATION[0], station=DEFAULT_STATION[1],
+                            location=DEFAULT_STATION[2], channels=HORIZONTAL_CHANNELS, timings=None):
+    """
+    Download and process the records of one event at one station.
+
+    With a CachedClient the processed arrays themselves are cached, so a
+    repeated request skips the download and the processing.
+
+    Args:
+        client: obspy FDSN Client or shakebot.cache.CachedClient.
+        event (dict): Event summary as returned by event_summary().
+        duration (float): Seconds to keep after the P arrival.
+        network, station, location (str): Station to use.
+        channels (tuple[str]): Channel codes.
+        timings (dict): Accumulates seconds per stage when given.
+
+    Returns:
+        dict: "records" ((N, 2) time/displacement arrays keyed by channel, t = 0
+        at the P arrival), "distance_km", "azimuth", "back_azimuth", "p_arrival"
+        and "orientations" ((azimuth, dip) in degrees keyed by channel).
+    """
+    from obspy import UTCDateTime
+    from obspy.geodetics import gps2dist_azimuth
+
+    event_time = UTCDateTime(event["time"])
+    with timed(timings, "stations"):
+        inv = client.get_stations(network=network, station=station, location=location, channel=",".join(channels),
+                                  starttime=event_time, endtime=event_time, level="channel")
+    station_lat = inv[0][0].latitude
+    station_lon = inv[0][0].longitude
+    # Sensor orientation per channel, for rotating the horizontals (see shakebot.multichannel)
+    orientations = {ch.code: (ch.azimuth, ch.dip) for ch in inv[0][0].channels
+                    if ch.azimuth is not None and ch.dip is not None}
+
+    # Calculate the distance between the earthquake and the station (in meters)
+    distance_m, az, baz = gps2dist_azimuth(event["latitude"], event["longitude"], station_lat, station_lon)
+    p_arrival = p_wave_arrival(event_time, distance_m / 1000, event.get("depth_km") or 0.0)
+    # Only the window around the record; at teleseismic distances the P wave arrives many minutes after the origin
+    start_time = max(event_time, p_arrival - WINDOW_PADDING)
+    end_time = p_arrival + duration
+
+    def download_and_process():
+        with timed(timings, "waveforms"):
+            st = client.get_waveforms(network, station, location, ",".join(channels), start_time, end_time)
+        # Download the instrument response information
+        with timed(timings, "response"):
+            inv = client.get_stations(network=network, station=station, location=location, channel=",".join(channels),
+                                      starttime=start_time, endtime=end_time, level="response")
+        return stream_to_records(process_stream(st, inv, p_arrival, duration, timings=timings), p_arrival)
+
+    result = {"distance_km": distance_m / 1000, "azimuth": az, "back_azimuth": baz, "p_arrival": p_arrival,
+              "orientations": orientations}
+    if not hasattr(client, "get_array"):
+        result["records"] = download_and_process()
+        return result
+
+    processed = {}
+
+    def compute(channel):
+        # Download and process all channels once, on the first cache miss
+        if not processed:
+            processed.update(download_and_process())
+        return processed[channel]
+
+    result["records"] = {}
+    for channel in channels:
+        result["records"][channel] = client.get_array(
+            lambda channel=channel: compute(channel),
+            network=network, station=station, location=location, channel=channel, starttime=start_time,
+            endtime=end_time, p_arrival=p_arrival, duration=duration,
+            pre_filt=PRE_FILT, sampling_rate=TARGET_SAMPLING_RATE)
+    return result
+
+
+def station_record(prepared):
+    """
+    Combine the output of prepare_station_records() into one MultiChannelRecord.
+
+    The record knows the channel orientations and the back azimuth, so it can
+    be rotated to N/E or radial/transverse components.
+    """
+    from shakebot.multichannel import MultiChannelRecord
+
+    return MultiChannelRecord.from_records(prepared["records"], prepared["orientations"], prepared["back_azimuth"])
+
+
+def fetch_event_displacement(client, event, duration, network=DEFAULT_STATION[0], station=DEFAULT_STATION[1],
+                             location=DEFAULT_STATION[2], channels=HORIZONTAL_CHANNELS):
+    """
+    Download and process the records of one obspy Event; see prepare_station_records().
+
+    Returns:
+        dict[str, np.ndarray]: (N, 2) time/displacement arrays keyed by channel.
+    """
+    return prepare_station_records(client, event_summary(event), duration, network, station, location,
+                                   channels)["records"]
+
+
+def fetch_random_event(client, duration, years=5, min_magnitude=6.0, limit=50, rng=random,
+                       channels=HORIZONTAL_CHANNELS, stations=None, max_km=None):
+    """
+    Pick a random recent earthquake and return its processed records.
+
+    The search window ends at today's UTC midnight, so repeated calls on the
+    same day issue the same (cacheable) catalog request.
+
+    By default the records come from DEFAULT_STATION. With a station index
+    they come from the station nearest to the epicenter that records all
+    `channels` and was running at the event time.
+
+    Args:
+        stations (shakebot.stations.StationIndex): Stations to choose from.
+        max_km (float): Only draw events with such a station within this epicentral distance.
+
+    Returns:
+        tuple[dict, shakebot.multichannel.MultiChannelRecord]: Event summary
+        (plus "network", "station", "location" and "distance_km" of the station
+        used) and the station's channels on one time base; record.channel("BH1")
+        gives one (N, 2) time/displacement array.
+    """
+    from obspy import UTCDateTime
+
+    now = UTCDateTime()
+    end_time = UTCDateTime(now.year, now.month, now.day)
+    start_time = end_time - (365 * years * 24 * 60 * 60)
+    cat = client.get_events(starttime=start_time, endtime=end_time, minmagnitude=min_magnitude, limit=limit)
+    if not cat:
+        raise LookupError("No events found in the specified time range.")
+
+    # Randomly select an event from the fetched catalog
+    events = [event_summary(event) for event in cat]
+    if stations is None:
+        summary = rng.choice(events)
+        station = dict(zip(("network", "station", "location"), DEFAULT_STATION))
+    else:
+        stations = stations.select(channels=channels)
+        if max_km is None:
+            summary = rng.choice(events)
+            nearest = stations.nearest(summary["latitude"], summary["longitude"], time=summary["time"])
+        else:
+            pairs = stations.pairs(events, max_km)
+            if not len(pairs["event"]):
+                raise LookupError(f"No station with {', '.join(channels)} within {max_km} km of any event.")
+            summary = events[rng.choice(sorted(set(pairs["event"].tolist())))]
+            nearest = stations.nearest(summary["latitude"], summary["longitude"], time=summary["time"], max_km=max_km)
+        if not nearest:
+            raise LookupError(f"No station with {', '.join(channels)} was running at {summary['time']}.")
+        station = nearest[0]
+    prepared = prepare_station_records(client, summary, duration, station["network"], station["station"],
+                                       station["location"], channels=channels)
+    summary.update(network=station["network"], station=station["station"], location=station["location"],
+                   distance_km=prepared["distance_km"])
+    return summary, station_record(prepared)
@@ -0,0 +1,219 @@
+"""
+Multi-channel ground-motion records.
+
+A MultiChannelRecord keeps all channels of one station on a shared time base
+in a single C-contiguous (N, 1 + C) float64 array: column 0 is time, columns
+1..C are the channels in `channels` order. Every channel has an orientation
+(azimuth clockwise from north and dip below horizontal, in degrees, as in a
+StationXML inventory), so the record can be projected onto any direction.
+
+Projections are one matrix product over the whole record: the channel unit
+vectors U (C × 3, north/east/up) are inverted once, and the weights for K
+target directions D (K × 3) are D @ pinv(U), so
+
+    projected = values @ (D @ pinv(U)).T        # (N, C) @ (C, K)
+
+works for orthogonal and slightly non-orthogonal sensors alike, and for
+horizontal-only records (the vertical then contributes nothing).
+"""
+import numpy as np
+
+# Orientation (azimuth, dip) assumed from the last letter of a SEED channel
+# code when the inventory does not say; 1/2 are nominally north/east
+DEFAULT_ORIENTATIONS = {
+    "N": (0.0, 0.0), "1": (0.0, 0.0),
+    "E": (90.0, 0.0), "2": (90.0, 0.0),
+    "Z": (0.0, -90.0), "3": (0.0, -90.0),
+}
+
+# Names accepted by MultiChannelRecord.component() besides channel codes and azimuths
+COMPONENTS = ("N", "E", "Z", "R", "T")
+
+
+def default_orientation(channel):
+    """Return the (azimuth, dip) implied by a channel code, e.g. "BHE" -> (90, 0)."""
+    try:
+        return DEFAULT_ORIENTATIONS[channel[-1].upper()]
+    except (IndexError, KeyError):
+        raise ValueError(f"Unknown orientation for channel {channel!r}; pass it explicitly.") from None
+
+
+def unit_vectors(orientations):
+    """
+    North/east/up unit vectors for (azimuth, dip) pairs in degrees.
+
+    Args:
+        orientations (array-like): (C, 2) azimuths and dips.
+
+    Returns:
+        np.ndarray: (C, 3) unit vectors.
+    """
+    azimuth, dip = np.radians(np.asarray(orientations, dtype=float).reshape(-1, 2)).T
+    return np.column_stack((np.cos(dip) * np.cos(azimuth), np.cos(dip) * np.sin(azimuth), -np.sin(dip)))
+
+
+class MultiChannelRecord:
+    """
+    Several channels of one station on a shared time base.
+
+    Args:
+        data (np.ndarray): (N, 1 + C) array of time and channel values; copied
+            to a C-contiguous float64 array if it is not one already.
+        channels (list[str]): Channel names, one per value column.
+        orientations (dict): (azimuth, dip) in degrees per channel; missing
+            channels use default_orientation().
+        back_azimuth (float): Back azimuth from the station to the event in
+            degrees, needed for the radial and transverse components.
+    """
+
+    def __init__(self, data, channels, orientations=None, back_azimuth=None):
+        data = np.ascontiguousarray(data, dtype=np.float64)
+        if data.ndim != 2 or data.shape[1] != len(channels) + 1:
+            raise ValueError(f"Expected an (N, {len(channels) + 1}) array for {len(channels)} channels, "
+                             f"got {data.shape}.")
+        self.data = data
+        self.channels = tuple(channels)
+        orientations = orientations or {}
+        self.orientations = {channel: tuple(orientations.get(channel) or default_orientation(channel))
+                             for channel in self.channels}
+        self.back_azimuth = back_azimuth
+
+    @classmethod
+    def from_records(cls, records, orientations=None, back_azimuth=None):
+        """
+        Combine (N, 2) time/value arrays keyed by channel, as returned by shakebot.iris.
+
+        Channels are cut to their common time span; channels whose time axis
+        differs from the first one are interpolated onto it.
+        """
+        if not records:
+            raise ValueError("No channels to combine.")
+        channels = list(records)
+        arrays = [np.asarray(records[channel], dtype=np.float64) for channel in channels]
+        start = max(array[0, 0] for array in arrays)
+        stop = min(array[-1, 0] for array in arrays)
+        time = arrays[0][:, 0]
+        time = time[(time >= start) & (time <= stop)]
+
+        data = np.empty((len(time), len(channels) + 1))
+        data[:, 0] = time
+        for column, array in enumerate(arrays, start=1):
+            if len(array) == len(time) and np.array_equal(array[:, 0], time):
+                data[:, column] = array[:, 1]
+            else:
+                data[:, column] = np.interp(time, array[:, 0], array[:, 1])
+        return cls(data, channels, orientations, back_azimuth)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.data if dtype is None else self.data.astype(dtype)
+
+    def __repr__(self):
+        return f"MultiChannelRecord({len(self)} samples, channels={', '.join(self.channels)})"
+
+    @property
+    def time(self):
+        """Time axis (view)."""
+        return self.data[:, 0]
+
+    @property
+    def values(self):
+        """(N, C) channel values (view)."""
+        return self.data[:, 1:]
+
+    def channel(self, name):
+        """Return one channel as an (N, 2) time/value array."""
+        if name not in self.channels:
+            raise KeyError(f"No channel {name!r}; the record has {', '.join(self.channels)}.")
+        return self.data[:, [0, self.channels.index(name) + 1]]
+
+    def select(self, names):
+        """Return a record with only the named channels, in the given order."""
+        columns = [0] + [self.channels.index(name) + 1 for name in names]
+        return MultiChannelRecord(self.data[:, columns], names, self.orientations, self.back_azimuth)
+
+    def weights(self, directions):
+        """
+        Projection weights for target directions.
+
+        Args:
+            directions (array-like): (K, 2) azimuths and dips in degrees.
+
+        Returns:
+            np.ndarray: (K, C) weights; values @ weights.T gives the projections.
+        """
+        sensors = unit_vectors([self.orientations[channel] for channel in self.channels])
+        return unit_vectors(directions) @ np.linalg.pinv(sensors)
+
+    def project(self, azimuths, dips=0.0):
+        """
+        Ground motion along one or more directions, as one matrix product.
+
+        Args:
+            azimuths (float or array-like): Directions in degrees clockwise from north.
+            dips (float or array-like): Dips in degrees below horizontal (-90 is up).
+
+        Returns:
+            np.ndarray: (N, K) projected values, one column per direction.
+        """
+        azimuths, dips = np.broadcast_arrays(np.atleast_1d(np.asarray(azimuths, dtype=float)),
+                                             np.asarray(dips, dtype=float))
+        return self.values @ self.weights(np.column_stack((azimuths, dips))).T
+
+    def _direction(self, name):
+        # (azimuth, dip) of a named component or a numeric azimuth
+        if name in ("R", "T"):
+            if self.back_azimuth is None:
+                raise ValueError("The radial and transverse components need the back azimuth.")
+            # Radial points away from the event; transverse is 90° clockwise from it
+            return ((self.back_azimuth + (180.0 if name == "R" else 270.0)) % 360.0, 0.0)
+        if name in ("N", "E", "Z"):
+            return {"N": (0.0, 0.0), "E": (90.0, 0.0), "Z": (0.0, -90.0)}[name]
+        return (float(name) % 360.0, 0.0)
+
+    def rotate(self, components=("N", "E")):
+        """
+        Rotate to other components.
+
+        Args:
+            components (list): Channel codes (copied as they are), names from
+                COMPONENTS ("R"/"T" need back_azimuth) and/or horizontal
+                azimuths in degrees.
+
+        Returns:
+            MultiChannelRecord: One channel per component, named as given
+            (azimuths become e.g. "H045").
+        """
+        names, orientations = [], {}
+        weights = np.empty((len(components), len(self.channels)))
+        projected = [i for i, component in enumerate(components) if component not in self.channels]
+        directions = [self._direction(components[i]) for i in projected]
+        if projected:
+            weights[projected] = self.weights(directions)
+        for i, component in enumerate(components):
+            if component in self.channels:
+                weights[i] = np.eye(len(self.channels))[self.channels.index(component)]
+                names.append(component)
+                orientations[component] = self.orientations[component]
+            else:
+                names.append(component if component in COMPONENTS else f"H{float(component) % 360.0:03.0f}")
+                orientations[names[-1]] = directions[projected.index(i)]
+
+        data = np.empty((len(self), len(components) + 1))
+        data[:, 0] = self.time
+        np.matmul(self.values, weights.T, out=data[:, 1:])
+        return MultiChannelRecord(data, names, orientations, self.back_azimuth)
+
+    def component(self, name):
+        """
+        Return one component as an (N, 2) time/value array ready for upload.
+
+        Args:
+            name (str or float): A channel code, one of COMPONENTS, or a
+                horizontal azimuth in degrees.
+        """
+        if name in self.channels:
+            return self.channel(name)
+        return self.rotate([name]).data
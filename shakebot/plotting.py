@@ -0,0 +1,156 @@
+"""
+Fast plotting of long records in the GUI.
+
+RecordPlot keeps one Figure, one canvas and one Line2D for the whole session
+and only replaces the line's data. The line never holds more than about two
+points per horizontal pixel: minmax_decimate() keeps the minimum and maximum of
+each pixel column, so peaks stay visible, and the visible range is decimated
+again whenever the x limits change (zoom/pan from the toolbar).
+"""
+import numpy as np
+
+
+def minmax_decimate(x, y, x_min=None, x_max=None, pixels=1000):
+    """
+    Reduce a line to the minimum and maximum of each pixel column inside [x_min, x_max].
+
+    Args:
+        x (np.ndarray): Sorted x values (time).
+        y (np.ndarray): y values.
+        x_min, x_max (float): Visible range; defaults to the whole record.
+        pixels (int): Number of columns to keep.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Decimated x and y, at most 2 * pixels + 2 points
+        including one sample on each side of the visible range.
+    """
+    start = 0 if x_min is None else max(int(np.searchsorted(x, x_min)) - 1, 0)
+    stop = len(x) if x_max is None else min(int(np.searchsorted(x, x_max, side="right")) + 1, len(x))
+    x, y = x[start:stop], y[start:stop]
+    pixels = max(int(pixels), 1)
+    if len(x) <= 2 * pixels:
+        return x, y
+
+    # Equal-count columns: one row per pixel, the remainder goes into a last short column
+    per_column = len(x) // pixels
+    body = per_column * pixels
+    columns = y[:body].reshape(pixels, per_column)
+    offsets = np.arange(pixels) * per_column
+    lows = columns.argmin(axis=1) + offsets
+    highs = columns.argmax(axis=1) + offsets
+    indices = np.column_stack((np.minimum(lows, highs), np.maximum(lows, highs))).ravel()
+    if body < len(x):
+        tail = y[body:]
+        indices = np.concatenate((indices, np.sort([body + tail.argmin(), body + tail.argmax()])))
+    return x[indices], y[indices]
+
+
+class RecordPlot:
+    """
+    Persistent displacement plot embedded in a Tk frame.
+
+    Args:
+        master (tk.Widget): Frame that holds the canvas and the navigation toolbar.
+        figsize (tuple): Figure size in inches.
+        dpi (int): Figure resolution.
+    """
+
+    def __init__(self, master, figsize=(5, 4), dpi=100):
+        import tkinter as tk
+
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.ax = self.figure.add_subplot(111)
+        (self.line,) = self.ax.plot([], [], animated=True)
+        self.ax.set_title('Ground Motion')
+        self.ax.set_xlabel('Time Steps')
+        self.ax.set_xlim(0, 60)
+        # add grid with minor ticks and dashed lines
+        self.ax.grid(which='both', linestyle='--')
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.toolbar = NavigationToolbar2Tk(self.canvas, master, pack_toolbar=False)
+        self.toolbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+        self.time = np.empty(0)
+        self.displacement = np.empty(0)
+        self._background = None
+        self._decimated_range = None
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        self.ax.callbacks.connect("xlim_changed", self._on_xlim_changed)
+        self.canvas.draw()
+
+    def _pixels(self):
+        return max(int(self.ax.bbox.width), 100)
+
+    def _decimate(self):
+        x_min, x_max = self.ax.get_xlim()
+        self.line.set_data(*minmax_decimate(self.time, self.displacement, x_min, x_max, self._pixels()))
+        self._decimated_range = (x_min, x_max, self._pixels())
+
+    def _on_xlim_changed(self, ax):
+        # Zooming or panning: decimate the newly visible part; the draw that follows shows it
+        if self.time.size:
+            self._decimate()
+
+    def _on_draw(self, event):
+        # Save the axes without the line so later updates with the same limits can blit
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        if self._decimated_range and self._decimated_range[2] != self._pixels():
+            self._decimate()  # The window was resized
+        self.ax.draw_artist(self.line)
+
+    def set_data(self, data=None):
+        """
+        Show a (N, 2) time/displacement record, or clear the plot when `data` is None.
+
+        When the new record fits inside the current view of a previous record, only
+        the line is redrawn (blitted) and the view is kept; otherwise the axes are
+        rescaled to the record and redrawn once.
+        """
+        if data is None or not len(data):
+            self.time, self.displacement = np.empty(0), np.empty(0)
+            self.line.set_data([], [])
+            self._decimated_range = None
+            self._background = None  # Shows the old record's labels; the next draw saves a new one
+            self.ax.set_title('Ground Motion')
+            self.ax.set_xlabel('Time Steps')
+            self.ax.set_ylabel('')
+            self.canvas.draw_idle()
+            return
+
+        data = np.asarray(data, dtype=float)
+        self.time, self.displacement = data[:, 0], data[:, 1]
+        x_limits = (self.time[0], self.time[-1])
+        if x_limits[1] <= x_limits[0]:
+            x_limits = (x_limits[0] - 1, x_limits[0] + 1)
+        y_span = float(self.displacement.max() - self.displacement.min()) or 1e-3
+        y_limits = (self.displacement.min() - 0.05 * y_span, self.displacement.max() + 0.05 * y_span)
+
+        if self._background is not None and self._fits_view(x_limits):
+            self._decimate()
+            self.canvas.restore_region(self._background)
+            self.ax.draw_artist(self.line)
+            self.canvas.blit(self.ax.bbox)
+            return
+
+        self.ax.set_title('Ground Motion Displacement')
+        self.ax.set_xlabel('Time Steps (s)')
+        self.ax.set_ylabel('Displacement (m)')
+        self.ax.set_ylim(*y_limits)
+        self.ax.set_xlim(*x_limits)
+        self._decimate()
+        self.toolbar.update()        # New home view for the toolbar
+        self.canvas.draw_idle()
+
+    def _fits_view(self, x_limits):
+        # The saved background shows a record's axes and labels, and the new record lies inside its limits
+        if self.ax.get_title() != 'Ground Motion Displacement':
+            return False
+        x_min, x_max = sorted(self.ax.get_xlim())
+        y_min, y_max = sorted(self.ax.get_ylim())
+        return (x_min <= x_limits[0] and x_limits[1] <= x_max and y_min <= self.displacement.min()
+                and self.displacement.max() <= y_max)
@@ -0,0 +1,244 @@
+"""
+Preprocessing between loading a record and uploading it.
+
+The firmware plays one buffered sample per timer tick (100 Hz unless
+SET_PLAYBACK says otherwise) and holds at most Shakebot.buffer_size samples,
+so a record is brought to that budget in five vectorized stages:
+
+    1. detect_sample_rate()   rate and uniformity of the time column
+    2. resample()             polyphase anti-aliased resampling (scipy.signal.resample_poly)
+    3. baseline_correct()     remove polynomial drift (e.g. from double integration), optional
+       bandpass()             zero-phase Butterworth band-pass, optional
+    4. fit_to_buffer()        trim, keep the strongest window, or split into segments
+    5. taper()                cosine ramps so the table starts and ends every piece at rest, optional
+
+prepare_record() runs them in that order. Every function takes and returns
+(N, 1 + C) arrays (time plus one or more channels), never modifies its input
+(records may be read-only memory maps) and works on whole columns at once, so
+multi-hour inputs take seconds.
+"""
+from fractions import Fraction
+
+import numpy as np
+
+from shakebot.device import DEFAULT_SAMPLE_RATE
+
+FIT_MODES = ("trim", "strongest", "segment")
+RATE_TOLERANCE = 0.01      # Largest relative deviation of a sample interval that still counts as uniform
+MAX_RATIO_DENOMINATOR = 1000  # Largest up/down factor used to express the resampling ratio
+
+
+def detect_sample_rate(time):
+    """
+    Sample rate of a time column.
+
+    Args:
+        time (np.ndarray): Sample times in seconds.
+
+    Returns:
+        tuple[float, bool]: Rate in Hz from the median interval, and whether
+        every interval is within RATE_TOLERANCE of it.
+    """
+    time = np.asarray(time, dtype=float)
+    if len(time) < 2:
+        return DEFAULT_SAMPLE_RATE, True
+    intervals = np.diff(time)
+    dt = float(np.median(intervals))
+    if dt <= 0:
+        raise ValueError("Time column must be increasing.")
+    uniform = bool(np.abs(intervals - dt).max() <= RATE_TOLERANCE * dt)
+    return 1.0 / dt, uniform
+
+
+def regularize(data, sample_rate):
+    """Interpolate a record with irregular sample times onto a uniform grid at `sample_rate`."""
+    data = np.asarray(data, dtype=float)
+    time = np.arange(data[0, 0], data[-1, 0] + 0.5 / sample_rate, 1.0 / sample_rate)
+    out = np.empty((len(time), data.shape[1]))
+    out[:, 0] = time
+    for column in range(1, data.shape[1]):
+        out[:, column] = np.interp(time, data[:, 0], data[:, column])
+    return out
+
+
+def resample(data, sample_rate=DEFAULT_SAMPLE_RATE, source_rate=None):
+    """
+    Resample a uniformly sampled record with a polyphase anti-aliasing filter.
+
+    Args:
+        data (np.ndarray): (N, 1 + C) time and values.
+        sample_rate (float): Target rate in Hz.
+        source_rate (float): Rate of `data`; detected from its time column when None.
+
+    Returns:
+        np.ndarray: (M, 1 + C) record at `sample_rate`, starting at the same time.
+    """
+    from scipy.signal import resample_poly
+
+    data = np.asarray(data, dtype=float)
+    source_rate = source_rate or detect_sample_rate(data[:, 0])[0]
+    ratio = Fraction(sample_rate / source_rate).limit_denominator(MAX_RATIO_DENOMINATOR)
+    if ratio == 1:
+        return data
+    values = resample_poly(data[:, 1:], ratio.numerator, ratio.denominator, axis=0, padtype="line")
+    out = np.empty((len(values), data.shape[1]))
+    out[:, 0] = data[0, 0] + np.arange(len(values)) / sample_rate
+    out[:, 1:] = values
+    return out
+
+
+def baseline_correct(data, order=2):
+    """
+    Subtract the least-squares polynomial of `order` from every channel.
+
+    Order 2 removes the offset, trend and quadratic drift that double
+    integration of an acceleration record with a small offset leaves behind.
+    """
+    data = np.asarray(data, dtype=float)
+    time = data[:, 0]
+    # Scaled time keeps the Vandermonde matrix well conditioned for long records
+    x = (time - time[0]) / max(time[-1] - time[0], 1e-12) * 2 - 1
+    basis = np.polynomial.legendre.legvander(x, order)
+    coefficients, *_ = np.linalg.lstsq(basis, data[:, 1:], rcond=None)
+    out = data.copy()
+    out[:, 1:] -= basis @ coefficients
+    return out
+
+
+def bandpass(data, low=None, high=None, order=4, sample_rate=None):
+    """
+    Zero-phase Butterworth band-pass (sosfiltfilt) on every channel.
+
+    Args:
+        data (np.ndarray): (N, 1 + C) uniformly sampled time and values.
+        low (float): High-pass corner in Hz, or None.
+        high (float): Low-pass corner in Hz, or None.
+        order (int): Filter order (doubled by the forward-backward pass).
+        sample_rate (float): Rate of `data`; detected when None.
+
+    Returns:
+        np.ndarray: Filtered record on the same time axis.
+    """
+    from scipy.signal import butter, sosfiltfilt
+
+    data = np.asarray(data, dtype=float)
+    if not low and not high:
+        return data
+    sample_rate = sample_rate or detect_sample_rate(data[:, 0])[0]
+    nyquist = sample_rate / 2
+    if high and high >= nyquist:
+        high = None
+    if low and high:
+        sos = butter(order, (low, high), btype="bandpass", fs=sample_rate, output="sos")
+    elif low:
+        sos = butter(order, low, btype="highpass", fs=sample_rate, output="sos")
+    elif high:
+        sos = butter(order, high, btype="lowpass", fs=sample_rate, output="sos")
+    else:
+        return data
+    out = data.copy()
+    out[:, 1:] = sosfiltfilt(sos, data[:, 1:], axis=0)
+    return out
+
+
+def taper(data, seconds=1.0):
+    """Multiply the first and last `seconds` of every channel by half-cosine ramps."""
+    data = np.asarray(data, dtype=float)
+    sample_rate = detect_sample_rate(data[:, 0])[0]
+    length = min(int(round(seconds * sample_rate)), len(data) // 2)
+    out = data.copy()
+    if length > 0:
+        ramp = 0.5 - 0.5 * np.cos(np.pi * np.arange(length) / length)
+        out[:length, 1:] *= ramp[:, None]
+        out[len(out) - length:, 1:] *= ramp[::-1, None]
+    return out
+
+
+def fit_to_buffer(data, buffer_size, mode="trim"):
+    """
+    Make a record fit the controller buffer.
+
+    Args:
+        data (np.ndarray): (N, 1 + C) record.
+        buffer_size (int): Samples the controller holds (Shakebot.buffer_size).
+        mode (str): "trim" keeps the first buffer_size samples, "strongest"
+            the window with the largest sum of squared sample-to-sample
+            changes (the most energetic part), "segment" splits the record
+            into consecutive pieces.
+
+    Returns:
+        list[np.ndarray]: The pieces; a single one unless mode is "segment".
+    """
+    if mode not in FIT_MODES:
+        raise ValueError(f"Unknown mode {mode!r}; choose one of {', '.join(FIT_MODES)}.")
+    if len(data) <= buffer_size:
+        return [data]
+    if mode == "trim":
+        return [data[:buffer_size]]
+    if mode == "segment":
+        return [data[start:start + buffer_size] for start in range(0, len(data), buffer_size)]
+
+    # Energy of each window from one cumulative sum over all channels
+    changes = np.square(np.diff(np.asarray(data)[:, 1:], axis=0)).sum(axis=1)
+    cumulative = np.concatenate(([0.0], np.cumsum(changes)))
+    energy = cumulative[buffer_size - 1:] - cumulative[:len(cumulative) - buffer_size + 1]
+    start = int(np.argmax(energy))
+    return [data[start:start + buffer_size]]
+
+
+def prepare_record(data, sample_rate=DEFAULT_SAMPLE_RATE, buffer_size=None, fit="trim", baseline=None,
+                   band=(None, None), taper_seconds=0.0):
+    """
+    Run the preprocessing stages on a loaded record.
+
+    Args:
+        data (np.ndarray): (N, 1 + C) time and values at any rate.
+        sample_rate (float): Rate the controller plays.
+        buffer_size (int): Controller buffer in samples; None skips fitting.
+        fit (str): Mode for fit_to_buffer().
+        baseline (int): Polynomial order for baseline_correct(), or None.
+        band (tuple): (low, high) corners in Hz for bandpass(); None skips a side.
+        taper_seconds (float): Length of the start and end ramps of every piece, 0 for none.
+
+    Returns:
+        tuple[list[np.ndarray], dict]: The record pieces and a summary with
+        source_rate, uniform, sample_rate, resampled, input_seconds,
+        output_seconds and segments.
+    """
+    data = np.asarray(data, dtype=float)
+    if data.ndim != 2 or data.shape[1] < 2 or len(data) < 2:
+        raise ValueError("Expected an (N, 2) or wider array of time and displacement with at least 2 samples.")
+    source_rate, uniform = detect_sample_rate(data[:, 0])
+    info = {"source_rate": source_rate, "uniform": uniform, "sample_rate": float(sample_rate),
+            "input_seconds": float(data[-1, 0] - data[0, 0]) + 1.0 / source_rate}
+
+    if not uniform:
+        data = regularize(data, source_rate)
+    resampled = resample(data, sample_rate, source_rate)
+    info["resampled"] = resampled is not data
+    data = resampled
+    if baseline is not None:
+        data = baseline_correct(data, baseline)
+    if any(band):
+        data = bandpass(data, *band, sample_rate=sample_rate)
+
+    pieces = fit_to_buffer(data, buffer_size, fit) if buffer_size else [data]
+    if taper_seconds:
+        # After fitting, so a trimmed, windowed or split piece also starts and ends at rest
+        pieces = [taper(piece, taper_seconds) for piece in pieces]
+    info["segments"] = len(pieces)
+    info["output_seconds"] = float(sum(len(piece) for piece in pieces) / sample_rate)
+    return pieces, info
+
+
+def describe(info):
+    """Human-readable summary of a prepare_record() summary."""
+    text = f"{info['source_rate']:.4g} Hz"
+    if not info["uniform"]:
+        text += " (irregular, interpolated)"
+    if info["resampled"]:
+        text += f" resampled to {info['sample_rate']:.4g} Hz"
+    text += f"; {info['output_seconds']:.1f} of {info['input_seconds']:.1f} s kept"
+    if info["segments"] > 1:
+        text += f" in {info['segments']} segments"
+    return text + "."
@@ -0,0 +1,332 @@
+"""
+Binary framed upload of step counts to the shakebot controllers.
+
+Every frame carries a contiguous block of step counts and is checked by the
+firmware (arduino/due/due.ino, arduino/micro/micro.ino) before it is stored:
+
+    offset  size  field
+    0       2     sync bytes 0xA5 0x5A
+    2       1     encoding (ENCODING_INT32 or ENCODING_DELTA16)
+    3       4     uint32 LE index of the first sample in the controller buffer
+    7       2     uint16 LE number of samples in the frame
+    9       n     payload
+    9+n     2     uint16 LE CRC-16/CCITT-FALSE over bytes 2 .. 9+n
+
+ENCODING_INT32 payloads hold `count` int32 LE step counts. ENCODING_DELTA16
+payloads hold the first step count as int32 LE followed by `count - 1` int16 LE
+differences, which halves the size of smooth records.
+
+The controller answers every frame with one text line:
+    "ACK <dataSize>"            frame stored, <dataSize> samples now buffered
+    "NAK <dataSize> <reason>"   frame rejected (CRC, SYNC, TYPE, TIMEOUT, OFFSET, FULL)
+
+While streaming (see shakebot/streaming.py) offsets and replies count samples
+since STREAM instead of the buffer size.
+"""
+import binascii
+import struct
+import time
+
+import numpy as np
+
+FRAME_SYNC = b"\xa5\x5a"
+ENCODING_INT32 = 0x01
+ENCODING_DELTA16 = 0x02
+ENCODING_AUTO = 0x00  # Pick DELTA16 whenever the frame's differences fit in int16
+
+HEADER_FORMAT = "<2sBIH"  # sync, encoding, offset, count
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+CRC_SIZE = 2
+DEFAULT_FRAME_SAMPLES = 256  # Samples per frame; small enough for the Micro to drain comfortably
+
+INT16_MIN, INT16_MAX = -32768, 32767
+
+
+class ProtocolError(Exception):
+    """Raised when a frame cannot be encoded, decoded or delivered."""
+
+
+def crc16(data, crc=0xFFFF):
+    """
+    Compute the CRC-16/CCITT-FALSE checksum used by the frame trailer.
+
+    Args:
+        data (bytes): Bytes to checksum.
+        crc (int): Initial value, or the running checksum of preceding bytes.
+
+    Returns:
+        int: 16-bit checksum.
+    """
+    return binascii.crc_hqx(data, crc)
+
+
+def encode_frame(steps, offset=0, encoding=ENCODING_AUTO):
+    """
+    Pack a block of step counts into one frame.
+
+    Args:
+        steps (array-like): Step counts for the frame (at most 65535 samples).
+        offset (int): Index of the first sample in the controller buffer.
+        encoding (int): ENCODING_INT32, ENCODING_DELTA16 or ENCODING_AUTO.
+
+    Returns:
+        bytes: The complete frame including sync bytes and CRC.
+    """
+    steps = np.asarray(steps, dtype=np.int64)
+    count = steps.size
+    if count == 0 or count > 0xFFFF:
+        raise ProtocolError(f"Frame must hold 1 to 65535 samples, got {count}.")
+    if np.any(steps < np.iinfo(np.int32).min) or np.any(steps > np.iinfo(np.int32).max):
+        raise ProtocolError("Step count exceeds the int32 range.")
+
+    deltas = np.diff(steps)
+    fits_delta16 = deltas.size == 0 or (deltas.min() >= INT16_MIN and deltas.max() <= INT16_MAX)
+    if encoding == ENCODING_AUTO:
+        encoding = ENCODING_DELTA16 if fits_delta16 else ENCODING_INT32
+
+    if encoding == ENCODING_INT32:
+        payload = steps.astype("<i4").tobytes()
+    elif encoding == ENCODING_DELTA16:
+        if not fits_delta16:
+            raise ProtocolError("Sample-to-sample difference exceeds the int16 range.")
+        payload = steps[:1].astype("<i4").tobytes() + deltas.astype("<i2").tobytes()
+    else:
+        raise ProtocolError(f"Unknown frame encoding {encoding}.")
+
+    body = struct.pack(HEADER_FORMAT, FRAME_SYNC, encoding, offset, count)[2:] + payload
+    return FRAME_SYNC + body + struct.pack("<H", crc16(body))
+
+
+def encode_frames(steps, frame_samples=DEFAULT_FRAME_SAMPLES, encoding=ENCODING_AUTO, offset=0):
+    """
+    Split a whole step array into consecutive frames.
+
+    Args:
+        steps (array-like): Step counts to upload.
+        frame_samples (int): Maximum number of samples per frame.
+        encoding (int): ENCODING_INT32, ENCODING_DELTA16 or ENCODING_AUTO.
+        offset (int): Controller buffer index of the first sample.
+
+    Returns:
+        list[bytes]: Frames in upload order.
+    """
+    steps = np.asarray(steps, dtype=np.int64)
+    return [encode_frame(steps[i:i + frame_samples], offset + i, encoding)
+            for i in range(0, steps.size, frame_samples)]
+
+
+def payload_size(encoding, count):
+    """Return the payload length in bytes for a frame of `count` samples."""
+    if encoding == ENCODING_INT32:
+        return 4 * count
+    if encoding == ENCODING_DELTA16:
+        return 4 + 2 * (count - 1)
+    raise ProtocolError(f"Unknown frame encoding {encoding}.")
+
+
+def decode_frame(frame):
+    """
+    Unpack and verify one complete frame.
+
+    Args:
+        frame (bytes): Frame as produced by encode_frame.
+
+    Returns:
+        tuple[int, np.ndarray]: The buffer offset and the int32 step counts.
+    """
+    if len(frame) < HEADER_SIZE + CRC_SIZE:
+        raise ProtocolError("Frame is shorter than its header.")
+    sync, encoding, offset, count = struct.unpack_from(HEADER_FORMAT, frame)
+    if sync != FRAME_SYNC:
+        raise ProtocolError("Frame does not start with the sync bytes.")
+    size = payload_size(encoding, count)
+    if len(frame) != HEADER_SIZE + size + CRC_SIZE:
+        raise ProtocolError(f"Frame length {len(frame)} does not match its header.")
+    (crc,) = struct.unpack_from("<H", frame, HEADER_SIZE + size)
+    if crc != crc16(frame[2:HEADER_SIZE + size]):
+        raise ProtocolError("Frame CRC mismatch.")
+
+    payload = frame[HEADER_SIZE:HEADER_SIZE + size]
+    if encoding == ENCODING_INT32:
+        steps = np.frombuffer(payload, dtype="<i4").astype(np.int32)
+    else:
+        first = np.frombuffer(payload[:4], dtype="<i4").astype(np.int64)
+        deltas = np.frombuffer(payload[4:], dtype="<i2").astype(np.int64)
+        steps = np.cumsum(np.concatenate((first, deltas))).astype(np.int32)
+    return offset, steps
+
+
+class FrameDecoder:
+    """
+    Incremental decoder that extracts frames from an arbitrary byte stream.
+
+    Bytes that are not part of a frame (e.g. ASCII command lines) are kept in
+    `text` so a receiver can handle both on the same port.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.text = bytearray()
+
+    def feed(self, data):
+        """
+        Append received bytes and return every frame completed by them.
+
+        Args:
+            data (bytes): Newly received bytes.
+
+        Returns:
+            list[tuple[int, np.ndarray] | ProtocolError]: Decoded frames, or the
+            error raised for a frame that failed its checks.
+        """
+        self._buffer += data
+        frames = []
+        while self._buffer:
+            start = self._buffer.find(FRAME_SYNC[:1])
+            if start != 0:
+                # Everything before the next sync byte is plain text
+                end = len(self._buffer) if start < 0 else start
+                self.text += self._buffer[:end]
+                del self._buffer[:end]
+                continue
+            if len(self._buffer) < 2:
+                break
+            if self._buffer[1] != FRAME_SYNC[1]:
+                # A lone first sync byte does not start a frame: keep it as text and look for the next one
+                self.text += self._buffer[:1]
+                del self._buffer[:1]
+                continue
+            if len(self._buffer) < HEADER_SIZE:
+                break
+            _, encoding, _, count = struct.unpack_from(HEADER_FORMAT, self._buffer)
+            try:
+                size = HEADER_SIZE + payload_size(encoding, count) + CRC_SIZE
+            except ProtocolError as e:
+                # Unknown encoding: drop the sync byte and resynchronise
+                del self._buffer[:1]
+                frames.append(e)
+                continue
+            if len(self._buffer) < size:
+                break
+            frame = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            try:
+                frames.append(decode_frame(frame))
+            except ProtocolError as e:
+                frames.append(e)
+        return frames
+
+
+def parse_reply(line):
+    """
+    Parse a controller reply line.
+
+    Args:
+        line (str): Line read from the controller.
+
+    Returns:
+        tuple[str, int, str] | None: ("ACK" or "NAK", buffered sample count,
+        reason) or None when the line is not a frame reply.
+    """
+    parts = line.split()
+    if len(parts) < 2 or parts[0] not in ("ACK", "NAK") or not parts[1].isdigit():
+        return None
+    return parts[0], int(parts[1]), parts[2] if len(parts) > 2 else ""
+
+
+def upload_steps(port, steps, frame_samples=DEFAULT_FRAME_SAMPLES, encoding=ENCODING_AUTO,
+                 retries=3, timeout=1.0, on_line=None, metrics=None):
+    """
+    Upload step counts to the controller with one frame in flight at a time.
+
+    The controller only accepts a frame whose offset equals its current buffer
+    size, so a lost ACK or a corrupted frame is repaired by resending from the
+    offset the controller reports.
+
+    Args:
+        port (serial.Serial): Open connection to the controller.
+        steps (array-like): Step counts to upload; the controller buffer must be empty.
+        frame_samples (int): Maximum number of samples per frame.
+        encoding (int): ENCODING_INT32, ENCODING_DELTA16 or ENCODING_AUTO.
+        retries (int): Number of consecutive failures tolerated per frame.
+        timeout (float): Seconds to wait for the reply to a frame.
+        on_line (callable): Called with every non-reply line read meanwhile.
+        metrics (shakebot.instrumentation.Metrics): Records frame_latency,
+            frame_bytes and upload_throughput.
+
+    Returns:
+        dict: Upload statistics (samples, frames, bytes, retransmissions, seconds,
+        bytes_per_second and the mean and largest frame round trip in seconds,
+        latency_mean and latency_max).
+    """
+    steps = np.asarray(steps, dtype=np.int64)
+    stats = {"samples": int(steps.size), "frames": 0, "bytes": 0, "retransmissions": 0, "seconds": 0.0}
+    latencies = []
+    start_time = time.perf_counter()
+    offset = 0
+    failures = 0
+
+    while offset < steps.size:
+        frame = encode_frame(steps[offset:offset + frame_samples], offset, encoding)
+        sent = time.perf_counter()
+        port.write(frame)
+        stats["frames"] += 1
+        stats["bytes"] += len(frame)
+
+        reply = read_reply(port, timeout, on_line)
+        latencies.append(time.perf_counter() - sent)
+        if metrics is not None:
+            metrics.record("frame_latency", latencies[-1])
+            metrics.record("frame_bytes", len(frame))
+        if reply is None:
+            kind, buffered, reason = "NAK", offset, "TIMEOUT"
+        else:
+            kind, buffered, reason = reply
+
+        if kind == "ACK" and buffered == offset + min(frame_samples, steps.size - offset):
+            offset = buffered
+            failures = 0
+            continue
+
+        if reason == "FULL":
+            raise ProtocolError(f"Controller buffer full after {buffered} samples.")
+        if buffered > steps.size or (offset == 0 and buffered != 0 and reason == "OFFSET"):
+            raise ProtocolError(f"Controller already holds {buffered} samples; send CANCEL first.")
+        failures += 1
+        if failures > retries:
+            raise ProtocolError(f"Frame at offset {offset} failed {failures} times ({reason or kind}).")
+        stats["retransmissions"] += 1
+        offset = buffered  # Resume from whatever the controller has stored
+
+    stats["seconds"] = time.perf_counter() - start_time
+    stats["bytes_per_second"] = stats["bytes"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    stats["latency_mean"] = float(np.mean(latencies)) if latencies else 0.0
+    stats["latency_max"] = max(latencies, default=0.0)
+    if metrics is not None:
+        metrics.record("upload_throughput", stats["bytes_per_second"])
+    return stats
+
+
+def read_reply(port, timeout, on_line=None):
+    """
+    Read lines until a frame reply arrives or the timeout expires.
+
+    Args:
+        port (serial.Serial): Open connection to the controller.
+        timeout (float): Seconds to wait for the reply.
+        on_line (callable): Called with every non-reply line read meanwhile.
+
+    Returns:
+        tuple[str, int, str] | None: The parsed reply, or None on timeout.
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        line = port.readline().decode("utf-8", errors="replace").strip()
+        if not line:
+            continue
+        reply = parse_reply(line)
+        if reply is not None:
+            return reply
+        if on_line:
+            on_line(line)
+    return None
@@ -0,0 +1,308 @@
+"""
+Velocity-pulse library for fragility sweeps.
+
+Every pulse is a unit-peak velocity waveform g(s) of one normalised time
+s = f t, scaled so that its peak velocity is PGV and its peak acceleration
+is PGA:
+
+    v(t) = PGV g(f t),      f = 9.807 PGA / (PGV max|g'|),      d(t) = PGV / f G(f t)
+
+with G the running integral of g. Only max|g'|, G and the pulse length S
+depend on the shape and the cycle count, so they are tabulated once per
+(shape, cycles) (shape_table(), cached) and every other quantity (frequency,
+duration, peak and residual displacement, sample count, table feasibility)
+is a closed-form array expression. A grid of 10^5 (PGV, PGA, cycles) points
+is evaluated in a few array operations (PulseGrid), and waveforms are
+interpolated from the tables for whole batches at once (pulse_batch()).
+
+Shapes (PGA in g, as in signals.cosine_pulse(), and PGV in m/s):
+
+    cosine          one-sided cosine displacement A(1 - cos 2πft), the GUI and
+                    `generate cosine` pulse (the older signals.cosine_pulse() takes
+                    f = PGA / (2π PGV) without g, so its peak velocity is 9.807 PGV)
+    tapered-sine    sine velocity under a Hann window spanning `cycles` cycles
+    ricker          Ricker-wavelet velocity (cycles is ignored)
+    mp              Mavroeidis-Papageorgiou pulse with γ = cycles and ν = 0
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from shakebot.signals import DEFAULT_SAMPLE_RATE
+
+PULSE_SHAPES = ("cosine", "tapered-sine", "ricker", "mp")
+G = 9.807                  # m/s² per g, as in signals.cosine_pulse()
+TABLE_RESOLUTION = 4096    # Table points per unit of normalised time
+RICKER_HALF_WIDTH = 1.5    # Normalised half-length of the Ricker pulse; the wavelet is below 1e-9 beyond it
+MIN_SAMPLES_PER_CYCLE = 10  # Pulses faster than sample_rate / this are not resolved by the playback
+
+
+def _velocity(shape, s, cycles):
+    # Unnormalised velocity waveform of a shape on normalised time s in [0, length]
+    if shape == "cosine":
+        return np.sin(2 * np.pi * s)
+    if shape == "tapered-sine":
+        return np.sin(2 * np.pi * s) * np.sin(np.pi * s / cycles)**2
+    if shape == "ricker":
+        tau = (np.pi * (s - RICKER_HALF_WIDTH))**2
+        return (1 - 2 * tau) * np.exp(-tau)
+    tau = s - cycles / 2  # Mavroeidis-Papageorgiou, centred
+    return 0.5 * (1 + np.cos(2 * np.pi * tau / cycles)) * np.cos(2 * np.pi * tau)
+
+
+def _length(shape, cycles):
+    # Length of a shape in normalised time (cycles of the pulse frequency)
+    return 2 * RICKER_HALF_WIDTH if shape == "ricker" else float(cycles)
+
+
+@lru_cache(maxsize=None)
+def shape_table(shape, cycles=1.0):
+    """
+    Normalised waveform constants of one shape and cycle count (cached).
+
+    Returns:
+        dict: "length" S, "slope" max|g'| of the unit-peak velocity, the
+        normalised time "s" and displacement "G" table (running integral of
+        g), and the "peak" max|G| and "residual" G(S).
+    """
+    if shape not in PULSE_SHAPES:
+        raise ValueError(f"Unknown pulse shape {shape!r}; choose one of {', '.join(PULSE_SHAPES)}.")
+    if cycles <= 0:
+        raise ValueError("Cycles must be positive.")
+    length = _length(shape, cycles)
+    s = np.linspace(0.0, length, int(np.ceil(length * TABLE_RESOLUTION)) + 1)
+    g = _velocity(shape, s, cycles)
+    g /= np.abs(g).max()
+    ds = s[1] - s[0]
+    displacement = np.concatenate(([0.0], np.cumsum((g[1:] + g[:-1]) * (ds / 2))))
+    for array in (s, displacement):
+        array.flags.writeable = False  # Shared by every caller through the cache
+    return {"length": length, "slope": float(np.abs(np.gradient(g, ds)).max()), "s": s, "G": displacement,
+            "peak": float(np.abs(displacement).max()), "residual": float(displacement[-1])}
+
+
+def _constants(shape, cycles):
+    # Per-element length, slope, peak and residual for an array of cycle counts (one table per unique value)
+    cycles = np.asarray(cycles, dtype=float)
+    unique, inverse = np.unique(cycles, return_inverse=True)
+    tables = [shape_table(shape, float(value)) for value in unique]
+    return tuple(np.array([table[name] for table in tables])[inverse].reshape(cycles.shape)
+                 for name in ("length", "slope", "peak", "residual"))
+
+
+def pulse_parameters(shape, pgv, pga, cycles=1, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Closed-form properties of pulses; all arguments broadcast against each other.
+
+    Args:
+        shape (str): One of PULSE_SHAPES.
+        pgv (array-like): Peak ground velocity in m/s.
+        pga (array-like): Peak ground acceleration in g.
+        cycles (array-like): Cycles (γ for "mp"; ignored for "ricker").
+        sample_rate (float): Playback rate in Hz, for the sample count.
+
+    Returns:
+        dict: "frequency" (Hz), "duration" (s), "peak_displacement" and
+        "residual_displacement" (m) and "samples", broadcast to a common shape.
+    """
+    pgv, pga, cycles = np.broadcast_arrays(np.asarray(pgv, dtype=float), np.asarray(pga, dtype=float),
+                                           np.asarray(cycles, dtype=float))
+    if np.any(pgv <= 0) or np.any(pga <= 0):
+        raise ValueError("PGV and PGA must be positive.")
+    length, slope, peak, residual = _constants(shape, cycles)
+    frequency = G * pga / (pgv * slope)
+    duration = length / frequency
+    return {"frequency": frequency, "duration": duration, "peak_displacement": pgv / frequency * peak,
+            "residual_displacement": pgv / frequency * residual,
+            "samples": np.floor(duration * sample_rate).astype(np.int64) + 1}
+
+
+def feasibility_mask(pgv, pga, parameters, limits, sample_rate=DEFAULT_SAMPLE_RATE, buffer_size=None, margin=1.0):
+    """
+    Which pulses the table can play.
+
+    Args:
+        pgv, pga (array-like): As passed to pulse_parameters().
+        parameters (dict): From pulse_parameters().
+        limits (dict): From feasibility.table_limits() (or Shakebot.limits).
+        sample_rate (float): Playback rate in Hz; pulses above
+            sample_rate / MIN_SAMPLES_PER_CYCLE are not resolved.
+        buffer_size (int): Controller buffer in samples, or None.
+        margin (float): Fraction of each limit to allow.
+
+    Returns:
+        dict: One boolean array per check ("displacement", "velocity",
+        "acceleration", "resolution", "buffer") and their conjunction under "feasible".
+    """
+    masks = {
+        "displacement": parameters["peak_displacement"] <= limits["displacement"] * margin,
+        "velocity": np.asarray(pgv) <= limits["velocity"] * margin,
+        "acceleration": np.asarray(pga) * G <= limits["acceleration"] * margin,
+        "resolution": parameters["frequency"] <= sample_rate / MIN_SAMPLES_PER_CYCLE,
+        "buffer": (parameters["samples"] <= buffer_size if buffer_size
+                   else np.ones(parameters["samples"].shape, dtype=bool)),
+    }
+    masks = {name: np.broadcast_to(mask, parameters["samples"].shape) for name, mask in masks.items()}
+    masks["feasible"] = np.logical_and.reduce(list(masks.values()))
+    return masks
+
+
+def pulse_batch(shape, pgv, pga, cycles=1, sample_rate=DEFAULT_SAMPLE_RATE, samples=None, out=None, chunk=1024):
+    """
+    Displacement waveforms of many pulses at once.
+
+    Args:
+        shape (str): One of PULSE_SHAPES.
+        pgv, pga, cycles (array-like): One value (or broadcastable array) per pulse.
+        sample_rate (float): Samples per second.
+        samples (int): Length of every row; defaults to the longest pulse.
+            Shorter pulses hold their final displacement.
+        out (np.ndarray): Optional (count, samples) array to fill, e.g. a memory map.
+        chunk (int): Pulses interpolated per step; bounds the temporary memory.
+
+    Returns:
+        np.ndarray: (count, samples) displacement in meters.
+    """
+    pgv, pga, cycles = (array.ravel() for array in np.broadcast_arrays(
+        np.asarray(pgv, dtype=float), np.asarray(pga, dtype=float), np.asarray(cycles, dtype=float)))
+    parameters = pulse_parameters(shape, pgv, pga, cycles, sample_rate)
+    if samples is None:
+        samples = int(parameters["samples"].max()) if len(pgv) else 0
+    if out is None:
+        out = np.empty((len(pgv), samples))
+    time = np.arange(samples) / sample_rate
+    scale = pgv / parameters["frequency"]
+    # Rows sharing a cycle count share a table, so each group is one interpolation over (rows, samples)
+    for value in np.unique(cycles):
+        table = shape_table(shape, float(value))
+        rows = np.flatnonzero(cycles == value)
+        for start in range(0, len(rows), chunk):
+            batch = rows[start:start + chunk]
+            s = parameters["frequency"][batch, None] * time
+            out[batch] = scale[batch, None] * np.interp(s, table["s"], table["G"])
+    return out
+
+
+def pulse(shape, pgv, pga, cycles=1, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    One pulse as an (N, 2) time/displacement record.
+
+    Args:
+        shape (str): One of PULSE_SHAPES.
+        pgv (float): Peak ground velocity in m/s.
+        pga (float): Peak ground acceleration in g.
+        cycles (float): Cycles (γ for "mp"; ignored for "ricker").
+        sample_rate (float): Samples per second.
+    """
+    displacement = pulse_batch(shape, pgv, pga, cycles, sample_rate)[0]
+    return np.column_stack((np.arange(len(displacement)) / sample_rate, displacement))
+
+
+class PulseGrid:
+    """
+    Pulse properties and table feasibility over a full (PGV, PGA, cycles) grid.
+
+    Every quantity is an array of shape (len(pgv), len(pga), len(cycles))
+    computed once on construction; lookup() then finds the nearest grid point
+    by binary search on the sorted axes, so planning a sweep never recomputes
+    anything. save() and load() keep a grid between sessions.
+
+    Args:
+        shape (str): One of PULSE_SHAPES.
+        pgv, pga, cycles (array-like): Grid axes (sorted and de-duplicated).
+        limits (dict): Table limits for the feasibility mask, or None to skip it.
+        sample_rate (float): Playback rate in Hz.
+        buffer_size (int): Controller buffer in samples, or None.
+        margin (float): Fraction of each limit to allow.
+    """
+
+    QUANTITIES = ("frequency", "duration", "peak_displacement", "residual_displacement", "samples")
+
+    def __init__(self, shape, pgv, pga, cycles=(1,), limits=None, sample_rate=DEFAULT_SAMPLE_RATE, buffer_size=None,
+                 margin=1.0):
+        self.shape = shape
+        self.pgv = np.unique(np.asarray(pgv, dtype=float))
+        self.pga = np.unique(np.asarray(pga, dtype=float))
+        self.cycles = np.unique(np.asarray(cycles, dtype=float))
+        self.sample_rate = float(sample_rate)
+        pgv, pga, cycles = np.meshgrid(self.pgv, self.pga, self.cycles, indexing="ij", sparse=True)
+        self.parameters = pulse_parameters(shape, pgv, pga, cycles, sample_rate)
+        self.masks = {}
+        if limits is not None:
+            self.masks = feasibility_mask(pgv, pga, self.parameters, limits, sample_rate, buffer_size, margin)
+        self.feasible = self.masks.get("feasible", np.ones(self.parameters["samples"].shape, dtype=bool))
+
+    def __len__(self):
+        return self.feasible.size
+
+    def __repr__(self):
+        return (f"PulseGrid({self.shape}, {len(self.pgv)} PGV x {len(self.pga)} PGA x {len(self.cycles)} cycles, "
+                f"{int(self.feasible.sum())} feasible)")
+
+    @staticmethod
+    def _nearest(axis, values):
+        # Index of the nearest axis value for each value (binary search, then the closer neighbour)
+        right = np.clip(np.searchsorted(axis, values), 1, max(len(axis) - 1, 1))
+        left = right - 1
+        if len(axis) == 1:
+            return np.zeros(np.shape(values), dtype=np.intp)
+        return np.where(np.abs(values - axis[left]) <= np.abs(axis[right] - values), left, right)
+
+    def index(self, pgv, pga, cycles=None):
+        """Nearest grid indices (i, j, k) for one or many points."""
+        cycles = self.cycles[0] if cycles is None else cycles
+        return (self._nearest(self.pgv, np.asarray(pgv, dtype=float)),
+                self._nearest(self.pga, np.asarray(pga, dtype=float)),
+                self._nearest(self.cycles, np.asarray(cycles, dtype=float)))
+
+    def lookup(self, pgv, pga, cycles=None):
+        """
+        Properties at the nearest grid point(s).
+
+        Returns:
+            dict: The grid "pgv", "pga" and "cycles", every pulse_parameters()
+            quantity, "feasible" and the individual masks.
+        """
+        index = self.index(pgv, pga, cycles)
+        result = {"pgv": self.pgv[index[0]], "pga": self.pga[index[1]], "cycles": self.cycles[index[2]]}
+        result.update((name, values[index]) for name, values in self.parameters.items())
+        result.update((name, mask[index]) for name, mask in self.masks.items())
+        result["feasible"] = self.feasible[index]
+        return result
+
+    def points(self, feasible=True):
+        """(M, 3) array of (PGV, PGA, cycles), only the feasible points unless feasible=False."""
+        mask = self.feasible if feasible else np.ones_like(self.feasible)
+        i, j, k = np.nonzero(mask)
+        return np.column_stack((self.pgv[i], self.pga[j], self.cycles[k]))
+
+    def summary(self):
+        """Counts of points passing each check, plus "total"."""
+        counts = {name: int(mask.sum()) for name, mask in self.masks.items()}
+        counts["total"] = len(self)
+        return counts
+
+    def waveforms(self, feasible=True, out=None, chunk=1024):
+        """Displacement batch of the grid points, (M, samples); see pulse_batch()."""
+        points = self.points(feasible)
+        return pulse_batch(self.shape, points[:, 0], points[:, 1], points[:, 2], self.sample_rate, out=out,
+                           chunk=chunk)
+
+    def save(self, path):
+        """Write the grid, its properties and masks to one .npz file."""
+        np.savez(path, shape=self.shape, pgv=self.pgv, pga=self.pga, cycles=self.cycles,
+                 sample_rate=self.sample_rate, **self.parameters,
+                 **{f"mask_{name}": mask for name, mask in self.masks.items()})
+
+    @classmethod
+    def load(cls, path):
+        """Read a grid written by save() without recomputing it."""
+        grid = cls.__new__(cls)
+        with np.load(path) as data:
+            grid.shape = str(data["shape"])
+            grid.pgv, grid.pga, grid.cycles = data["pgv"], data["pga"], data["cycles"]
+            grid.sample_rate = float(data["sample_rate"])
+            grid.parameters = {name: data[name] for name in cls.QUANTITIES}
+            grid.masks = {name[5:]: data[name] for name in data.files if name.startswith("mask_")}
+        grid.feasible = grid.masks.get("feasible", np.ones(grid.parameters["samples"].shape, dtype=bool))
+        return grid
@@ -0,0 +1,232 @@
+"""
+Reading and writing ground motion records as (N, 2) time/displacement arrays.
+
+load_record() picks a loader by file extension. Large inputs avoid copies:
+.npy files and uncompressed HDF5 datasets are memory-mapped, and a parsed CSV
+is cached as a .npy sidecar so opening it again is a memory-mapped load too.
+"""
+import csv
+import hashlib
+import os
+
+import numpy as np
+
+from shakebot.signals import DEFAULT_SAMPLE_RATE
+
+DEFAULT_SIDECAR_DIR = os.path.join(os.path.expanduser("~"), ".cache", "shakebot", "records")
+CSV_BLOCK_SIZE = 1024 * 1024  # Bytes of CSV text per block; the threaded reader keeps several in flight
+
+
+def _match_columns(names):
+    # First "time" and first "displacement" column, matched case-insensitively after stripping spaces
+    possible_time_columns = [name for name in names if "time" in name.strip().lower()]
+    possible_displacement_columns = [name for name in names if "displacement" in name.strip().lower()]
+    if not possible_time_columns or not possible_displacement_columns:
+        raise ValueError("Required columns not found.")
+    return possible_time_columns[0], possible_displacement_columns[0]
+
+
+def _sidecar_path(path, cache_dir):
+    # Named after the file's absolute path, size and modification time, so an edited file is parsed again
+    stat = os.stat(path)
+    key = hashlib.sha256(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()
+    return os.path.join(cache_dir, key[:2], key + ".npy")
+
+
+def load_csv(path, sidecar=True, cache_dir=DEFAULT_SIDECAR_DIR):
+    """
+    Load a ground motion CSV with a "time" column and a "displacement" column.
+
+    Column names are matched case-insensitively and may carry units, e.g.
+    "Time (s)" and "Displacement (BH1) (m)"; the first match of each is used.
+    Only those two columns are parsed (with pyarrow when installed, pandas
+    otherwise). The parsed array is kept as a .npy sidecar in `cache_dir`, so
+    opening the same unchanged file again is a memory-mapped load.
+
+    Args:
+        path (str): CSV file path.
+        sidecar (bool): Use and write the parsed sidecar.
+        cache_dir (str): Directory for sidecars.
+
+    Returns:
+        np.ndarray: (N, 2) array of time and displacement (read-only when memory-mapped).
+    """
+    cached = _sidecar_path(path, cache_dir) if sidecar else None
+    if cached and os.path.exists(cached):
+        return np.load(cached, mmap_mode="r")
+
+    # Read the header only to pick the two columns
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        names = next(csv.reader(f), [])
+    time_column, displacement_column = _match_columns(names)
+
+    try:
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        import pandas as pd
+
+        df = pd.read_csv(path, usecols=[time_column, displacement_column], dtype=np.float64, engine="c")
+        data = np.empty((len(df), 2))
+        data[:, 0] = df[time_column].to_numpy()
+        data[:, 1] = df[displacement_column].to_numpy()
+    else:
+        # Stream the file in blocks so only the two parsed columns are ever held in memory
+        reader = pa_csv.open_csv(path, read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+                                 convert_options=pa_csv.ConvertOptions(
+                                     include_columns=[time_column, displacement_column],
+                                     column_types={time_column: "float64", displacement_column: "float64"}))
+        size = os.path.getsize(path)
+        data = np.empty((0, 2))
+        row = blocks = 0
+        for batch in reader:
+            blocks += 1
+            if row + batch.num_rows > len(data):
+                # Size the output from the rows per block seen so far (each block is about CSV_BLOCK_SIZE
+                # bytes); np.empty only commits pages as they are written, so overestimating is free
+                estimate = int(size / (blocks * CSV_BLOCK_SIZE) * (row + batch.num_rows) * 1.1)
+                grown = np.empty((max(estimate, row + batch.num_rows), 2))
+                grown[:row] = data[:row]
+                data = grown
+            data[row:row + batch.num_rows, 0] = batch.column(0).to_numpy()
+            data[row:row + batch.num_rows, 1] = batch.column(1).to_numpy()
+            row += batch.num_rows
+        data = data[:row]
+
+    if cached:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        temporary = f"{cached}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            np.save(f, data)
+        os.replace(temporary, cached)  # Atomic, so a concurrent reader never sees a partial file
+    return data
+
+
+def load_npy(path, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Memory-map a .npy record: a (N, 2) time/displacement array, or a 1-D displacement array sampled at `sample_rate`.
+    """
+    data = np.load(path, mmap_mode="r")
+    if data.ndim == 2 and data.shape[1] == 2:
+        return data
+    if data.ndim == 1:
+        return np.column_stack((np.arange(len(data)) / sample_rate, data))
+    raise ValueError(f"Expected an (N, 2) or 1-D array, got shape {data.shape}.")
+
+
+def load_parquet(path):
+    """Load the "time" and "displacement" columns of a Parquet file, batch by batch."""
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    time_column, displacement_column = _match_columns(parquet.schema_arrow.names)
+    # The row count is in the metadata, so batches are copied straight into the output
+    data = np.empty((parquet.metadata.num_rows, 2))
+    row = 0
+    for batch in parquet.iter_batches(columns=[time_column, displacement_column]):
+        data[row:row + batch.num_rows, 0] = batch.column(0).to_numpy()
+        data[row:row + batch.num_rows, 1] = batch.column(1).to_numpy()
+        row += batch.num_rows
+    return data
+
+
+def load_hdf5(path, dataset=None, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Load a record from HDF5.
+
+    Uses `dataset` if given, else an (N, 2) dataset or a pair of "time" and
+    "displacement" datasets at the top level. An uncompressed, contiguous
+    dataset is memory-mapped instead of read.
+    """
+    import h5py
+
+    def read(node):
+        offset = node.id.get_offset()
+        if node.chunks is None and node.compression is None and offset is not None:
+            return np.memmap(path, mode="r", dtype=node.dtype, offset=offset, shape=node.shape)
+        return node[...]
+
+    with h5py.File(path, "r") as f:
+        if dataset is not None:
+            data = read(f[dataset])
+        else:
+            datasets = {name: node for name, node in f.items() if isinstance(node, h5py.Dataset)}
+            pairs = [node for node in datasets.values() if node.ndim == 2 and node.shape[1] == 2]
+            if pairs:
+                data = read(pairs[0])
+            else:
+                time_column, displacement_column = _match_columns(list(datasets))
+                return np.column_stack((read(datasets[time_column]), read(datasets[displacement_column])))
+    if data.ndim == 1:
+        return np.column_stack((np.arange(len(data)) / sample_rate, data))
+    return data
+
+
+def load_mseed(path, channel=None):
+    """
+    Load one trace of a MiniSEED file; the trace data is taken as displacement in meters.
+
+    Args:
+        path (str): MiniSEED file path.
+        channel (str): Channel code to use; defaults to the first trace.
+    """
+    from obspy import read
+
+    st = read(path, format="MSEED")
+    if channel is not None:
+        st = st.select(channel=channel)
+        if not st:
+            raise ValueError(f"Channel {channel} not found.")
+    st.merge(fill_value=0)
+    tr = st[0]
+    return np.column_stack((tr.times(), tr.data.astype(np.float64)))
+
+
+LOADERS = {
+    ".csv": load_csv, ".txt": load_csv,
+    ".npy": load_npy,
+    ".parquet": load_parquet, ".pq": load_parquet,
+    ".h5": load_hdf5, ".hdf5": load_hdf5,
+    ".mseed": load_mseed, ".miniseed": load_mseed, ".msd": load_mseed,
+}
+# File dialog filter covering LOADERS
+RECORD_FILETYPES = [
+    ("Ground motion files", " ".join("*" + extension for extension in LOADERS)),
+    ("CSV files", "*.csv *.txt"),
+    ("NumPy arrays", "*.npy"),
+    ("Parquet files", "*.parquet *.pq"),
+    ("HDF5 files", "*.h5 *.hdf5"),
+    ("MiniSEED files", "*.mseed *.miniseed *.msd"),
+    ("All files", "*.*"),
+]
+
+
+def load_record(path, **kwargs):
+    """
+    Load a (N, 2) time/displacement record from CSV, .npy, Parquet, HDF5 or MiniSEED, chosen by extension.
+
+    Args:
+        path (str): File path.
+        **kwargs: Passed on to the format's loader (e.g. channel, dataset, sample_rate, sidecar);
+            sample_rate only applies to 1-D .npy and HDF5 data and is ignored for formats with a time column.
+
+    Returns:
+        np.ndarray: (N, 2) array of time and displacement; may be a read-only memory map.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in LOADERS:
+        raise ValueError(f"Unsupported file type {extension or path!r}; use one of {', '.join(sorted(LOADERS))}.")
+    loader = LOADERS[extension]
+    if loader not in (load_npy, load_hdf5):
+        kwargs.pop("sample_rate", None)
+    return loader(path, **kwargs)
+
+
+def save_csv(path, data):
+    """
+    Save a (N, 2) time/displacement array in the layout load_csv expects.
+
+    Args:
+        path (str): CSV file path.
+        data (np.ndarray): (N, 2) array of time and displacement.
+    """
+    np.savetxt(path, data, delimiter=",", header="Time (s),Displacement (m)", comments="")
@@ -0,0 +1,311 @@
+"""
+Unattended experiment campaigns with resumable state.
+
+A campaign is a queue of runs (record path × repetition) kept in a SQLite
+file and updated after every run, so an overnight campaign survives a crash of the
+host, a reset of the controller or a dropped USB connection: opening the
+campaign again picks up at the first run that has not finished, and a run
+that was playing when the host died is played again.
+
+Every run goes through the same phases, each timed and stored with the run:
+
+    prepare   load, preprocess and convert the record to steps
+    home      re-center against the limit switch (SET_DISPLACEMENT) or both
+              switches (CALIBRATE_DISPLACEMENT)
+    upload    send the steps to the controller
+    settle    let the table and specimen come to rest before START
+    motion    START until "Motion completed"
+
+Homing clears the controller buffer, so the upload has to follow it; the
+scheduler uploads while the settle time runs and only waits out what is
+left of it. The next record is prepared on a worker thread while the current
+one plays, so neither phase adds to the time between runs.
+"""
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REHOME_MODES = ("displacement", "calibrate", "none")
+DEFAULT_SETTLE_SECONDS = 5.0
+DEFAULT_MAX_ATTEMPTS = 3       # Plays of one run that may be cut short by a lost connection
+HOMING_TIMEOUT = 120.0         # Seconds allowed for SET_DISPLACEMENT / CALIBRATE_DISPLACEMENT
+RECONNECT_DELAY = 5.0          # Seconds between reconnection attempts
+PHASES = ("prepare", "home", "upload", "settle", "motion")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    repetition INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    completed TEXT,
+    started REAL, finished REAL,
+    prepare_seconds REAL, home_seconds REAL, upload_seconds REAL, settle_seconds REAL, motion_seconds REAL,
+    total_seconds REAL
+);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status, id);
+"""
+
+
+class Campaign:
+    """
+    Queue of runs and their outcomes in a SQLite file.
+
+    Runs are "pending", "running", "done" or "failed". Opening a campaign puts
+    runs left "running" by a crash back in the queue.
+
+    Args:
+        path (str): State file; created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.executescript(SCHEMA)
+        self.db.execute("UPDATE runs SET status = 'pending' WHERE status = 'running'")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def add(self, paths, repeat=1, settings=None):
+        """
+        Queue every path `repeat` times, the whole list once per repetition.
+
+        Args:
+            paths (list[str]): Records, in playing order.
+            repeat (int): Repetitions of the list.
+            settings (dict): JSON-serializable options stored with the campaign,
+                e.g. the preprocessing used, so a resumed campaign plays the same way.
+        """
+        self.db.executemany("INSERT INTO runs (path, repetition) VALUES (?, ?)",
+                            [(os.path.abspath(path), repetition) for repetition in range(1, repeat + 1)
+                             for path in paths])
+        for name, value in (settings or {}).items():
+            self.db.execute("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)", (name, json.dumps(value)))
+        self.db.commit()
+
+    def settings(self):
+        """Return the options stored by add()."""
+        return {name: json.loads(value) for name, value in self.db.execute("SELECT name, value FROM settings")}
+
+    def retry_failed(self):
+        """Put failed runs back in the queue. Returns how many."""
+        count = self.db.execute("UPDATE runs SET status = 'pending', error = NULL WHERE status = 'failed'").rowcount
+        self.db.commit()
+        return count
+
+    def pending(self):
+        """Return (id, path) of every run still to play, in order."""
+        return self.db.execute("SELECT id, path FROM runs WHERE status = 'pending' ORDER BY id").fetchall()
+
+    def attempts(self, run_id):
+        """Return how many times a run has been started."""
+        return self.db.execute("SELECT attempts FROM runs WHERE id = ?", (run_id,)).fetchone()[0]
+
+    def begin(self, run_id):
+        self.db.execute("UPDATE runs SET status = 'running', attempts = attempts + 1, started = ? WHERE id = ?",
+                        (time.time(), run_id))
+        self.db.commit()
+
+    def finish(self, run_id, status, timings, completed=None, error=None):
+        """
+        Record the outcome of a run.
+
+        Args:
+            run_id (int): Run id from pending().
+            status (str): "done", "failed", or "pending" to play it again.
+            timings (dict): Seconds per phase (see PHASES).
+            completed (str): The controller's completion line.
+            error (str): Why the run failed.
+        """
+        self.db.execute(
+            "UPDATE runs SET status = ?, error = ?, completed = ?, finished = ?, prepare_seconds = ?, "
+            "home_seconds = ?, upload_seconds = ?, settle_seconds = ?, motion_seconds = ?, total_seconds = ? "
+            "WHERE id = ?",
+            (status, error, completed, time.time(), *(timings.get(phase) for phase in PHASES),
+             sum(timings.values()), run_id))
+        self.db.commit()
+
+    def summary(self):
+        """
+        Progress and throughput of the campaign.
+
+        Returns:
+            dict: Run counts per status ("pending", "running", "done", "failed"),
+            "total", "runs_per_hour" (finished runs over the time spent playing
+            them, so pauses between sessions do not count) and the mean seconds
+            per phase of finished runs as "<phase>_seconds".
+        """
+        result = dict.fromkeys(("pending", "running", "done", "failed"), 0)
+        result.update(self.db.execute("SELECT status, COUNT(*) FROM runs GROUP BY status").fetchall())
+        result["total"] = sum(result[status] for status in ("pending", "running", "done", "failed"))
+        columns = ", ".join(f"AVG({phase}_seconds)" for phase in PHASES)
+        means = self.db.execute(f"SELECT {columns} FROM runs WHERE status = 'done'").fetchone()
+        result.update({f"{phase}_seconds": mean or 0.0 for phase, mean in zip(PHASES, means)})
+        busy = self.db.execute(
+            "SELECT SUM(finished - started) FROM runs WHERE status IN ('done', 'failed')").fetchone()[0]
+        result["runs_per_hour"] = result["done"] * 3600.0 / busy if busy else 0.0
+        return result
+
+
+def describe(summary):
+    """One-line description of a Campaign.summary()."""
+    phases = ", ".join(f"{phase} {summary[f'{phase}_seconds']:.1f} s" for phase in PHASES)
+    return (f"{summary['done']}/{summary['total']} runs done, {summary['failed']} failed, "
+            f"{summary['pending']} pending; {summary['runs_per_hour']:.1f} runs/hour ({phases} per run).")
+
+
+def run_campaign(campaign, connect, prepare, rehome="displacement", home=None, settle=DEFAULT_SETTLE_SECONDS,
+                 binary=True, calibrate_first=False, keep_going=True, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 reconnects=3, on_run=None):
+    """
+    Play the pending runs of a campaign.
+
+    Args:
+        campaign (Campaign): Runs to play; updated after every run.
+        connect (callable): connect() -> shakebot.device.Shakebot; called at
+            the start and again after the connection is lost.
+        prepare (callable): prepare(path) -> list of (N, 2) records to play back
+            to back (e.g. preprocess.prepare_record() pieces). Runs on a worker thread.
+        rehome (str): Before every record, "displacement" homes against the left
+            limit and moves to `home`, "calibrate" also measures the stroke
+            against the right limit, "none" plays from wherever the table is.
+        home (float): Position in meters to re-center to (default: mid-stroke).
+        settle (float): Seconds between homing and START.
+        binary (bool): Upload with binary frames.
+        calibrate_first (bool): Calibrate against both limits before the first run.
+        keep_going (bool): Continue after a run fails; otherwise stop.
+        max_attempts (int): Plays of a run before a lost connection fails it.
+        reconnects (int): Attempts to reconnect before giving up on the campaign.
+        on_run (callable): Called with (run id, path, status, timings, detail) after each run.
+
+    Returns:
+        dict: Campaign.summary() at the end.
+    """
+    from shakebot.device import CALIBRATION_COMPLETED, DISPLACEMENT_SET, MOTION_COMPLETED, record_sample_rate
+
+    if rehome not in REHOME_MODES:
+        raise ValueError(f"Re-homing must be one of {', '.join(REHOME_MODES)}, not {rehome!r}.")
+    queue = campaign.pending()
+    if not queue:
+        return campaign.summary()
+    table = connect()
+    recalibrate = calibrate_first
+
+    def convert(path):
+        # Worker thread: everything up to the serial port
+        start = time.perf_counter()
+        pieces = [(table.record_to_steps(piece), record_sample_rate(piece)) for piece in prepare(path)]
+        return pieces, time.perf_counter() - start
+
+    def go_home():
+        position = table.total_length / 2 if home is None else home
+        if recalibrate or rehome == "calibrate":
+            table.calibrate(table.displacement_to_steps(position))
+            table.wait_for(CALIBRATION_COMPLETED, HOMING_TIMEOUT)
+        elif rehome == "displacement":
+            table.set_displacement(table.displacement_to_steps(position))
+            table.wait_for(DISPLACEMENT_SET, HOMING_TIMEOUT)
+
+    workers = ThreadPoolExecutor(max_workers=1)
+    prepared = {}
+
+    def prefetch(position):
+        if position < len(queue) and position not in prepared:
+            prepared[position] = workers.submit(convert, queue[position][1])
+
+    try:
+        index = 0
+        while index < len(queue):
+            run_id, path = queue[index]
+            prefetch(index)
+            prefetch(index + 1)  # Prepared on the worker while this run plays
+            campaign.begin(run_id)
+            timings = dict.fromkeys(PHASES, 0.0)
+            completed = None
+            try:
+                pieces, timings["prepare"] = prepared[index].result()
+            except Exception as e:
+                # The record cannot be loaded or converted (missing file, bad data): fail it without touching
+                # the table; the connection is fine, and playing it again would only repeat the same error
+                campaign.finish(run_id, "failed", timings, error=f"{type(e).__name__}: {e}")
+                if on_run:
+                    on_run(run_id, path, "failed", timings, str(e))
+                del prepared[index]
+                index += 1
+                if not keep_going:
+                    break
+                continue
+            try:
+                for steps, sample_rate in pieces:
+                    start = time.perf_counter()
+                    go_home()
+                    recalibrate = False
+                    homed = time.perf_counter()
+                    table.upload(steps, binary=binary, sample_rate=sample_rate)
+                    uploaded = time.perf_counter()
+                    time.sleep(max(0.0, settle - (uploaded - homed)))
+                    table.start()
+                    started = time.perf_counter()
+                    completed = table.wait_for(MOTION_COMPLETED, len(steps) / sample_rate + 30.0)
+                    timings["home"] += homed - start
+                    timings["upload"] += uploaded - homed
+                    timings["settle"] += started - uploaded
+                    timings["motion"] += time.perf_counter() - started
+            except OSError as e:
+                # Serial errors (serial.SerialException) and TimeoutError from wait_for(): the controller may
+                # have reset or the cable dropped out
+                status = "failed" if campaign.attempts(run_id) >= max_attempts else "pending"
+                campaign.finish(run_id, status, timings, error=f"{type(e).__name__}: {e}")
+                if on_run:
+                    on_run(run_id, path, status, timings, str(e))
+                table = _reconnect(table, connect, reconnects)
+                recalibrate = rehome != "none"  # The position is unknown after a reset
+                if status == "pending":
+                    continue  # Play the same run again
+                if not keep_going:
+                    break
+            except Exception as e:
+                campaign.finish(run_id, "failed", timings, error=f"{type(e).__name__}: {e}")
+                if on_run:
+                    on_run(run_id, path, "failed", timings, str(e))
+                table.cancel()
+                if not keep_going:
+                    break
+            else:
+                campaign.finish(run_id, "done", timings, completed=completed)
+                if on_run:
+                    on_run(run_id, path, "done", timings, completed)
+            del prepared[index]
+            index += 1
+    finally:
+        workers.shutdown(cancel_futures=True)
+        table.close()
+    return campaign.summary()
+
+
+def _reconnect(table, connect, attempts):
+    try:
+        table.close()
+    except OSError:
+        pass
+    for attempt in range(attempts):
+        time.sleep(RECONNECT_DELAY)
+        try:
+            return connect()
+        except OSError:
+            if attempt == attempts - 1:
+                raise
+    raise ConnectionError("Could not reconnect to the controller.")
@@ -0,0 +1,211 @@
+"""
+Background serial I/O so the GUI thread never blocks on the controller.
+
+The worker thread owns the serial.Serial handle. It reads whatever is waiting
+in bulk, splits it into lines and posts them to `inbound`; writes and longer
+jobs (uploads, streaming) are queued on `outbound` and run on the same thread,
+so only one piece of code ever touches the port.
+
+While a TelemetryRecorder is attached (record()), received bytes go through
+it instead, so accelerometer packets are stored and only the text lines
+between them are posted.
+
+Messages posted to `inbound` are (kind, value) tuples:
+    ("line", str)                        one line from the controller
+    ("done", (callback, result, error))  a submitted job finished
+    ("telemetry", recorder)              the attached recorder received the end of its capture
+    ("error", exception)                 the port failed; the worker has stopped
+"""
+import queue
+import threading
+import time
+
+READ_TIMEOUT = 0.02  # Seconds a single read may block, bounding the latency of queued writes
+
+
+class SerialWorker(threading.Thread):
+    """
+    Thread that owns a serial port and exchanges data with the GUI through queues.
+
+    Args:
+        port (serial.Serial): Open connection to the controller.
+        line_timeout (float): Seconds a job's readline() waits for a complete line.
+        metrics (shakebot.instrumentation.Metrics): Records outbound_depth and
+            inbound_depth whenever the thread has work.
+    """
+
+    def __init__(self, port, line_timeout=1.0, metrics=None):
+        super().__init__(name="SerialWorker", daemon=True)
+        self.port = port
+        self.port.timeout = READ_TIMEOUT
+        self.line_timeout = line_timeout
+        self.metrics = metrics
+        self.inbound = queue.SimpleQueue()
+        self.outbound = queue.SimpleQueue()
+        self._rx = bytearray()
+        self._recorder = None
+        self._stop_event = threading.Event()
+
+    def write(self, data):
+        """Queue bytes (or a str, encoded as UTF-8) to be written to the port."""
+        self.outbound.put(data.encode() if isinstance(data, str) else bytes(data))
+
+    def submit(self, job, on_done=None):
+        """
+        Queue a job to run on the worker thread with exclusive use of the port.
+
+        Args:
+            job (callable): Called with a port-like object offering write(),
+                readline() and forward(); its return value is the result.
+            on_done (callable): Called on the GUI thread as on_done(result, error)
+                when the GUI drains the corresponding "done" message.
+        """
+        self.outbound.put((job, on_done))
+
+    def record(self, recorder):
+        """
+        Route received bytes through `recorder` (a shakebot.telemetry.TelemetryRecorder)
+        from the next queued write on, until its capture ends.
+        """
+        self.submit(lambda port: setattr(self, "_recorder", recorder))
+
+    def drain(self, max_messages=1000):
+        """
+        Return the messages currently waiting in `inbound`, without blocking.
+
+        Args:
+            max_messages (int): Upper bound on the batch size.
+
+        Returns:
+            list[tuple[str, object]]: Messages in arrival order.
+        """
+        messages = []
+        while len(messages) < max_messages:
+            try:
+                messages.append(self.inbound.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def stop(self, timeout=2.0):
+        """
+        Stop the thread and wait up to `timeout` seconds for it to exit.
+
+        The port is closed by the thread on its way out, so a job that is still
+        running after the timeout (e.g. a long upload) never sees it closed
+        underneath it; a worker that was never started closes it here.
+        """
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+        if not self.is_alive():
+            self.port.close()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                if self.metrics is not None and not self.outbound.empty():
+                    self.metrics.record("outbound_depth", self.outbound.qsize())
+                self._flush_outbound()
+                self._read_available()
+                lines = self._record() if self._recorder else self._pop_lines()
+                for line in lines:
+                    self.inbound.put(("line", line))
+                if self.metrics is not None and lines:
+                    self.metrics.record("inbound_depth", self.inbound.qsize())
+        except Exception as e:
+            if not self._stop_event.is_set():
+                self.inbound.put(("error", e))
+        finally:
+            if self._stop_event.is_set():
+                self.port.close()
+
+    def _flush_outbound(self):
+        # Perform every queued write and job in order
+        while True:
+            try:
+                item = self.outbound.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, bytes):
+                self.port.write(item)
+                continue
+            job, on_done = item
+            try:
+                result, error = job(_JobPort(self)), None
+            except Exception as e:
+                result, error = None, e
+            self.inbound.put(("done", (on_done, result, error)))
+
+    def _read_available(self):
+        # Read everything waiting in one call; when idle, block briefly for the first byte
+        waiting = self.port.in_waiting
+        data = self.port.read(waiting if waiting else 1)
+        if data:
+            self._rx += data
+
+    def _record(self):
+        # Hand everything received to the recorder; detach it once its capture has ended
+        recorder = self._recorder
+        lines = recorder.feed(bytes(self._rx))
+        self._rx.clear()
+        if recorder.finished:
+            self._rx += recorder.pending  # Anything after the end of the capture is ordinary output
+            self._recorder = None
+            self.inbound.put(("telemetry", recorder))
+        return lines
+
+    def _pop_lines(self):
+        # Split the receive buffer into complete, decoded lines
+        end = self._rx.rfind(b"\n")
+        if end < 0:
+            return []
+        chunk = bytes(self._rx[:end + 1])
+        del self._rx[:end + 1]
+        lines = chunk.decode("utf-8", errors="replace").splitlines()
+        return [line.strip() for line in lines if line.strip()]
+
+    def _pop_line(self):
+        # Remove and return one complete raw line, or None
+        end = self._rx.find(b"\n")
+        if end < 0:
+            return None
+        line = bytes(self._rx[:end + 1])
+        del self._rx[:end + 1]
+        return line
+
+
+class _JobPort:
+    """Port-like view handed to jobs; readline() serves lines from the worker's buffer."""
+
+    def __init__(self, worker):
+        self._worker = worker
+
+    @property
+    def in_waiting(self):
+        return len(self._worker._rx) + self._worker.port.in_waiting
+
+    def write(self, data):
+        return self._worker.port.write(data)
+
+    def read(self, size=1):
+        """Return up to `size` bytes, from the worker's buffer first (e.g. for a TelemetryRecorder)."""
+        if not self._worker._rx:
+            self._worker._read_available()
+        data = bytes(self._worker._rx[:size])
+        del self._worker._rx[:size]
+        return data
+
+    def readline(self):
+        deadline = time.perf_counter() + self._worker.line_timeout
+        while True:
+            line = self._worker._pop_line()
+            if line is not None:
+                return line
+            if time.perf_counter() > deadline:
+                return b""
+            self._worker._read_available()
+
+    def forward(self, line):
+        """Pass a line the job does not handle on to the GUI."""
+        self._worker.inbound.put(("line", line))
@@ -0,0 +1,237 @@
+"""
+Ground motion generators.
+
+Every generator returns a (N, 2) array whose columns are time (s) and
+displacement (m), the layout used throughout the GUI and the device class.
+"""
+import numpy as np
+
+DEFAULT_SAMPLE_RATE = 100  # Hz; the firmware plays one sample per 10 ms ISR tick
+
+
+def cosine_pulse(pgv, pga, cycles, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    One-sided cosine displacement pulse D = A - A*cos(2*pi*t/T) matching a PGV and PGA.
+
+    The frequency is PGA / (2*pi*PGV) without converting g, so the realised peak
+    velocity is 9.807 PGV; the GUI and the CLI use pulses.pulse("cosine", ...),
+    which peaks at PGV.
+
+    Args:
+        pgv (float): Peak ground velocity.
+        pga (float): Peak ground acceleration in g.
+        cycles (int): Number of cycles.
+        sample_rate (float): Samples per second.
+
+    Returns:
+        np.ndarray: (N, 2) array of time and displacement.
+    """
+    if pga == 0:
+        raise ValueError("Peak Ground Acceleration cannot be zero.")
+
+    PGV_2_PGA = pgv / pga
+    F = 1./(2*np.pi*PGV_2_PGA)
+    A = 9.807*pga/(4*np.pi**2*F**2)
+    T = 1./F
+    # Generate time vector and scale it to the period
+    time_steps = np.linspace(0, T * cycles, int(sample_rate * cycles * T))
+    displacement = A - A * np.cos(2 * np.pi * time_steps / T)
+    return np.column_stack((time_steps, displacement))
+
+
+def multisine_batch(count, duration, components=1, sample_rate=DEFAULT_SAMPLE_RATE, rng=None, out=None,
+                    chunk=256):
+    """
+    Many random ground motions at once: 3-5 sinusoids under a decaying envelope plus noise.
+
+    Same recipe as the original random record generator, drawn from a
+    numpy Generator and evaluated for all records in broadcast array operations.
+
+    Args:
+        count (int): Number of records.
+        duration (float): Record length in seconds.
+        components (int): Components per record (e.g. 2 for two horizontal axes).
+        sample_rate (float): Samples per second.
+        rng: Seed or np.random.Generator; the same seed gives the same batch.
+        out (np.ndarray): Optional (count, components, samples) array to fill,
+            e.g. np.lib.format.open_memmap() for batches larger than memory.
+        chunk (int): Records evaluated per step; bounds the temporary memory.
+
+    Returns:
+        np.ndarray: (count, components, samples) displacement in meters.
+    """
+    if duration <= 0:
+        raise ValueError("Duration must be a positive number.")
+    rng = np.random.default_rng(rng)
+    time = np.arange(0, duration, 1/sample_rate)
+    shape = (count, components)
+
+    # Draw every random parameter up front; unused sinusoids (beyond 3-5 per record) get zero amplitude
+    num_frequencies = rng.integers(3, 6, size=shape)
+    frequencies = rng.uniform(0.5, 5.0, shape + (5,))  # Frequencies between 0.5 Hz and 5 Hz
+    amplitudes = rng.uniform(0.01, 0.05, shape + (5,))  # Amplitudes between 0.01 and 0.05 meters
+    amplitudes[np.arange(5) >= num_frequencies[..., None]] = 0.0
+    phases = rng.uniform(0, 2 * np.pi, shape + (5,))
+    decay_rates = rng.uniform(0.01, 0.05, shape)
+    noise_amplitudes = rng.uniform(0.002, 0.01, shape)
+
+    if out is None:
+        out = np.empty(shape + (len(time),))
+    for start in range(0, count, chunk):
+        batch = slice(start, start + chunk)
+        # (n, K, 5, 1) against (samples,) broadcasts to (n, K, 5, samples), summed over the sinusoids
+        waves = np.sin(2 * np.pi * frequencies[batch, ..., None] * time + phases[batch, ..., None])
+        displacement = np.einsum("nkc,nkcs->nks", amplitudes[batch], waves)
+        displacement *= np.exp(-decay_rates[batch, ..., None] * time)
+        displacement += noise_amplitudes[batch, ..., None] * rng.standard_normal(displacement.shape)
+        out[batch] = displacement
+    return out
+
+
+def kanai_tajimi(frequencies, omega_g=5 * np.pi, zeta_g=0.6, omega_f=0.5 * np.pi, zeta_f=0.6):
+    """
+    Kanai-Tajimi ground acceleration PSD shape with the Clough-Penzien low-frequency filter (unit S0).
+
+    Args:
+        frequencies (np.ndarray): Frequencies in Hz.
+        omega_g, zeta_g (float): Ground filter frequency (rad/s) and damping.
+        omega_f, zeta_f (float): High-pass filter frequency (rad/s) and damping; omega_f=0 gives plain Kanai-Tajimi.
+
+    Returns:
+        np.ndarray: Relative power at each frequency.
+    """
+    omega = 2 * np.pi * np.asarray(frequencies, dtype=float)
+    r_g = (omega / omega_g) ** 2
+    psd = (1 + 4 * zeta_g**2 * r_g) / ((1 - r_g) ** 2 + 4 * zeta_g**2 * r_g)
+    if omega_f:
+        r_f = (omega / omega_f) ** 2
+        psd *= r_f**2 / ((1 - r_f) ** 2 + 4 * zeta_f**2 * r_f)
+    return psd
+
+
+def strong_motion_envelope(time, rise=0.1, strong=0.3, residual=0.05):
+    """
+    Jennings-type envelope: quadratic build-up, constant strong phase, exponential decay.
+
+    Args:
+        time (np.ndarray): Time vector starting at zero.
+        rise, strong (float): Build-up and strong-phase lengths as fractions of the duration.
+        residual (float): Envelope value left at the end of the record.
+    """
+    duration = time[-1] if len(time) > 1 else 1.0
+    t1, t2 = rise * duration, (rise + strong) * duration
+    decay = np.log(1 / residual) / max(duration - t2, 1e-9)
+    return np.where(time < t1, (time / max(t1, 1e-9)) ** 2, np.where(time <= t2, 1.0, np.exp(-decay * (time - t2))))
+
+
+def stochastic_batch(count, duration, components=1, sample_rate=DEFAULT_SAMPLE_RATE, rng=None, pga=0.3,
+                     spectrum=None, highpass=0.1, taper=0.05, out=None, chunk=256, **kanai_tajimi_args):
+    """
+    Spectrally shaped stochastic ground motions built with inverse FFTs.
+
+    Enveloped white noise is shaped in the frequency domain by the target
+    Fourier amplitude spectrum (Kanai-Tajimi/Clough-Penzien by default, or
+    `spectrum`), scaled to the target PGA and integrated twice in the
+    frequency domain below a high-pass corner. The displacement ends are
+    tapered so every record starts and ends at rest.
+
+    Args:
+        count (int): Number of records.
+        duration (float): Record length in seconds.
+        components (int): Components per record.
+        sample_rate (float): Samples per second.
+        rng: Seed or np.random.Generator.
+        pga (float): Peak ground acceleration in g before tapering.
+        spectrum: Target Fourier amplitude spectrum as a callable of frequency (Hz)
+            or a (frequencies, amplitudes) pair to interpolate; only its shape matters.
+        highpass (float): Frequencies below this (Hz) are removed before integrating.
+        taper (float): Fraction of the record tapered at each end.
+        out (np.ndarray): Optional (count, components, samples) array to fill.
+        chunk (int): Records transformed per step.
+        **kanai_tajimi_args: omega_g, zeta_g, omega_f, zeta_f for kanai_tajimi().
+
+    Returns:
+        np.ndarray: (count, components, samples) displacement in meters.
+    """
+    if duration <= 0:
+        raise ValueError("Duration must be a positive number.")
+    rng = np.random.default_rng(rng)
+    time = np.arange(0, duration, 1/sample_rate)
+    samples = len(time)
+    nfft = 2 * samples  # Zero padding keeps the frequency-domain integration from wrapping around
+    frequencies = np.fft.rfftfreq(nfft, 1/sample_rate)
+
+    if spectrum is None:
+        target = np.sqrt(kanai_tajimi(frequencies, **kanai_tajimi_args))
+    elif callable(spectrum):
+        target = np.asarray(spectrum(frequencies), dtype=float)
+    else:
+        target = np.interp(frequencies, *spectrum, left=0.0, right=0.0)
+    target[0] = 0.0
+    target /= np.sqrt(np.mean(target**2))  # Unit RMS so white noise keeps its power
+
+    # Double integration 1/(i*omega)^2 with a cosine roll-off below the high-pass corner
+    omega = 2 * np.pi * frequencies
+    integrate = np.zeros_like(omega)
+    integrate[1:] = -1 / omega[1:] ** 2
+    integrate *= np.clip(frequencies / highpass - 1, 0, 1) if highpass else 1
+    ramp = max(int(taper * samples), 1)
+    end_taper = np.ones(samples)
+    end_taper[:ramp] = 0.5 - 0.5 * np.cos(np.pi * np.arange(ramp) / ramp)
+    end_taper[-ramp:] = end_taper[:ramp][::-1]
+    envelope = strong_motion_envelope(time)
+
+    if out is None:
+        out = np.empty((count, components, samples))
+    for start in range(0, count, chunk):
+        batch = slice(start, start + chunk)
+        noise = rng.standard_normal((min(chunk, count - start), components, samples)) * envelope
+        acceleration = np.fft.irfft(np.fft.rfft(noise, nfft) * target, nfft)[..., :samples]
+        acceleration *= pga * 9.807 / np.abs(acceleration).max(axis=-1, keepdims=True)
+        displacement = np.fft.irfft(np.fft.rfft(acceleration, nfft) * integrate, nfft)[..., :samples]
+        out[batch] = displacement * end_taper
+    return out
+
+
+def batch_record(batch, index, component=0, sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    One record of a batch as the usual (N, 2) time/displacement array.
+    """
+    displacement = np.asarray(batch[index, component], dtype=float)
+    return np.column_stack((np.arange(len(displacement)) / sample_rate, displacement))
+
+
+def save_batch(path, batch, sample_rate=DEFAULT_SAMPLE_RATE, **metadata):
+    """
+    Write a (count, components, samples) batch and its metadata (seed, model, ...) to one .npz file.
+    """
+    np.savez(path, displacement=batch, sample_rate=sample_rate, **metadata)
+
+
+def load_batch(path):
+    """
+    Read a file written by save_batch().
+
+    Returns:
+        tuple[np.ndarray, float, dict]: Displacement batch, sample rate and the remaining metadata.
+    """
+    with np.load(path) as data:
+        metadata = {name: data[name].item() if data[name].ndim == 0 else data[name]
+                    for name in data.files if name not in ("displacement", "sample_rate")}
+        return data["displacement"], float(data["sample_rate"]), metadata
+
+
+def random_ground_motion(duration, sample_rate=DEFAULT_SAMPLE_RATE, rng=None):
+    """
+    Synthetic ground motion: a few random sinusoids under a decaying envelope plus noise.
+
+    Args:
+        duration (float): Record length in seconds.
+        sample_rate (float): Samples per second.
+        rng: Seed or np.random.Generator; None draws fresh entropy.
+
+    Returns:
+        np.ndarray: (N, 2) array of time and displacement.
+    """
+    batch = multisine_batch(1, duration, sample_rate=sample_rate, rng=rng)
+    return batch_record(batch, 0, sample_rate=sample_rate)
@@ -0,0 +1,1005 @@
+"""
+Firmware-in-the-loop simulator of arduino/due/due.ino (and micro.ino).
+
+FirmwareSimulator reproduces the controller's serial protocol (BR:, SET_PARAMS,
+SET_PLAYBACK, SET_TELEMETRY, ARM, START, CANCEL, SET_DISPLACEMENT,
+CALIBRATE_DISPLACEMENT, STATS, raw step lines, binary frames and streaming)
+and the updateMotorPosition() ISR (100 Hz by default, the control rate while
+interpolating) driving an AccelStepper-like stepper between two limit switches.
+On the Due, the sampleAccelerometer() ISR measures the carriage acceleration
+(plus gravity on Z and sensor noise) and streams telemetry packets like the
+firmware, including the samples it drops when the serial port falls behind.
+Serial traffic is delayed by the time it takes on the wire at the current baud
+rate.
+
+Two transports connect host code to it:
+
+    FakeSerial(sim)      in-process object with the serial.Serial methods the
+                         repo uses; pass it to Shakebot(port=...) or SerialWorker
+    PtyTransport(sim)    a pseudo terminal; open transport.device with
+                         serial.Serial, the GUI or `python -m shakebot run`
+
+Every completed motion appends a report of the commanded and achieved
+trajectories to FirmwareSimulator.runs (see trajectory_report()).
+"""
+import os
+import re
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from shakebot.device import BOARDS, INTERPOLATION_MODES, MAX_CONTROL_RATE
+from shakebot.protocol import (CRC_SIZE, FRAME_SYNC, HEADER_FORMAT, HEADER_SIZE, ProtocolError, crc16, decode_frame,
+                               payload_size)
+from shakebot.telemetry import (ACCEL_SCALE, MAX_TELEMETRY_RATE, PACKET_SAMPLES, SAMPLE_DTYPE, STANDARD_GRAVITY,
+                                encode_packet)
+
+TICK = 0.01                # Seconds between ISR calls until SET_PLAYBACK (10 ms timer interrupt)
+SUBSTEP = 0.00025          # Integration step of the stepper model
+FRAME_TIMEOUT = 0.1        # FRAME_TIMEOUT_MS in the firmware
+COMMAND_LINE_SIZE = 128    # COMMAND_LINE_SIZE of the firmware's CommandParser: longest line plus the terminator
+CREDIT_INTERVAL = 20       # CREDIT_INTERVAL in the firmware
+USB_PACKET = 64            # Bytes delivered together on the wire
+DEFAULT_BAUD_RATE = 250000
+GRAVITY = 9.8              # Constant used by the firmware's setAcceleration()
+PATH_INTERVAL = 0.001      # Seconds between logged carriage positions during a motion
+PHASE_ONE = 65536          # One sample in the firmware's 16.16 fixed-point playback phase
+POSITION_GAIN = 0.1        # POSITION_GAIN in the firmware: share of the position error corrected per control tick
+TELEMETRY_RING = 256       # TELEMETRY_RING in the firmware: samples queued for the serial port
+SERIAL_TX_BUFFER = 128     # Serial.availableForWrite() of an empty transmit buffer on the Due
+ACCEL_NOISE = 0.0015       # Accelerometer noise in g RMS (ADXL362 at 400 Hz)
+STEP_LINE = re.compile(r"[+-]?[0-9]+")  # A step count line; any other unknown line is reported
+FLOAT_PREFIX = re.compile(r"[+-]?[0-9]*(\.[0-9]*)?([eE][+-]?[0-9]+)?")
+RX_FULL = {"due": 127, "micro": 64}  # RX_FULL in the firmware: Serial.available() of a full receive buffer
+
+
+class StepperModel:
+    """
+    AccelStepper-like motor: accelerates at a constant rate towards moveTo()
+    targets, cruises at the maximum speed and starts braking when the
+    stopping distance reaches the distance to go. After set_speed() it runs
+    at that constant speed instead (runSpeed()) until set_current_position().
+
+    Positions are in steps; the logical position (currentPosition) is offset
+    from the physical one by setCurrentPosition(), as on the real driver.
+    """
+
+    def __init__(self, max_speed, acceleration, position=0.0):
+        self.max_speed = float(max_speed)
+        self.acceleration = float(acceleration)
+        self.physical = float(position)  # Steps from the left limit switch
+        self.offset = 0.0                # physical - logical
+        self.speed = 0.0                 # Steps per second
+        self.constant_speed = False      # runSpeed() instead of run()
+        self.target = self.current_position()
+
+    def current_position(self):
+        return int(round(self.physical - self.offset))
+
+    def distance_to_go(self):
+        return self.target - self.current_position()
+
+    def move_to(self, target):
+        self.target = int(target)
+
+    def set_current_position(self, position):
+        # AccelStepper also zeroes the speed here
+        self.offset = self.physical - position
+        self.target = int(position)
+        self.speed = 0.0
+        self.constant_speed = False
+
+    def set_speed(self, speed):
+        # setSpeed() + runSpeed(): constant speed, limited to the maximum speed
+        self.speed = float(np.clip(speed, -self.max_speed, self.max_speed))
+        self.constant_speed = True
+
+    def stop(self):
+        # Brake as quickly as allowed: the new target is the stopping distance ahead
+        stopping = self.speed * self.speed / (2 * self.acceleration)
+        self.target = self.current_position() + int(np.copysign(np.ceil(stopping), self.speed))
+
+    def advance(self, dt, low=None, high=None):
+        """Integrate the motion for `dt` seconds, stopping hard at the physical range [low, high]."""
+        steps = max(1, int(round(dt / SUBSTEP)))
+        h = dt / steps
+        a = self.acceleration * h
+        if self.constant_speed:
+            self.physical += self.speed * dt
+            if low is not None and self.physical < low:
+                self.physical, self.speed = low, 0.0
+            if high is not None and self.physical > high:
+                self.physical, self.speed = high, 0.0
+            return
+        for _ in range(steps):
+            distance = self.target - (self.physical - self.offset)
+            if self.speed == 0.0 and abs(distance) < 0.5:
+                break
+            stopping = self.speed * self.speed / (2 * self.acceleration)
+            if self.speed * distance < 0 or stopping >= abs(distance):
+                # Moving away from the target, or close enough that we must brake
+                self.speed = 0.0 if abs(self.speed) <= a else self.speed - np.copysign(a, self.speed)
+            else:
+                self.speed = float(np.clip(self.speed + np.copysign(a, distance), -self.max_speed, self.max_speed))
+            self.physical += self.speed * h
+            if self.speed == 0.0 and abs(self.target - (self.physical - self.offset)) < 1.0:
+                self.physical = self.target + self.offset  # Settle on the last step
+            if low is not None and self.physical < low:
+                self.physical, self.speed = low, 0.0
+            if high is not None and self.physical > high:
+                self.physical, self.speed = high, 0.0
+
+
+class FirmwareSimulator:
+    """
+    Simulated shakebot controller.
+
+    Args:
+        board (str): "due" or "micro"; selects the default parameters and buffer size.
+        baud_rate (int): Initial baud rate; None delivers bytes without wire delay (native USB).
+        start_position (float): Carriage position in meters from the left limit switch.
+        rail_length (float): Distance between the limit switches in meters
+            (default: the board's total_length).
+        speedup (float): Run the simulated clock this many times faster than real time.
+        on_run (callable): Called with each trajectory report.
+    """
+
+    def __init__(self, board="due", baud_rate=DEFAULT_BAUD_RATE, start_position=0.1, rail_length=None,
+                 speedup=1.0, on_run=None):
+        parameters, self.max_displacement = BOARDS[board]
+        self.board = board
+        self.baud_rate = baud_rate
+        self.speedup = speedup
+        self.on_run = on_run
+
+        self.pulse_per_rev = parameters["pulse_per_rev"]
+        self.max_rpm = float(parameters["max_rpm"])
+        self.lead = parameters["lead"]
+        self.max_acceleration = parameters["max_acceleration"]
+        self.total_length = parameters["total_length"]
+        self.rail_steps = (rail_length or self.total_length) / self.lead * self.pulse_per_rev
+        self.stepper = StepperModel(self.pulse_per_rev * self.max_rpm, self._acceleration_steps(),
+                                    start_position / self.lead * self.pulse_per_rev)
+
+        # Firmware state, named after the variables in due.ino
+        self.displacement_data = np.zeros(self.max_displacement, dtype=np.int64)
+        self.data_size = 0
+        self.current_index = 0
+        self.execute_motion = False
+        self.start_time = 0
+        self.end_time = 0
+        self.is_setting_displacement = False
+        self.is_calibrating = False
+        self.left_limit_reached = False
+        self.right_limit_reached = False
+        self.stream_mode = False
+        self.stream_ended = False
+        self.stream_finished = False
+        self.stream_written = 0
+        self.stream_consumed = 0
+        self.underrun_count = 0
+        self.last_credit_report = 0
+        self.sample_rate = 100.0
+        self.control_rate = 1000.0
+        self.interpolation = "step"
+        self.phase_increment = PHASE_ONE
+        self.playback_phase = 0
+        self.segment_speed = 0.0
+        self.segment_target = 0.0
+        self.tick = TICK
+        self.telemetry_rate = 0.0
+        self.telemetry_ring = deque()   # (sequence, sample) waiting for the serial port
+        self.telemetry_sequence = 0
+        self.telemetry_active = False
+        self.telemetry_ended = False
+        self.telemetry_dropped = 0
+        self._next_sample = None        # Time of the next sampleAccelerometer() call
+        self._last_speed = 0.0
+        self._noise = np.random.default_rng(0)
+        # STATS counters; the simulated ISR runs exactly on time, so its jitter and missed ticks stay 0
+        self.stats_ticks = 0
+        self.stats_loops = 0
+        self.stats_rx_full = 0
+        self.stats_window_start = 0.0
+
+        self.runs = []             # Trajectory reports of completed motions
+        self._trajectory = []      # (time, commanded, achieved) per sample of the current motion
+        self._path = []            # (time, position) every PATH_INTERVAL during the current motion
+        self._rx = bytearray()     # Bytes that have arrived at the controller
+        self._rx_pending = deque() # (arrival time, bytes) still on the wire
+        self._rx_clock = 0.0       # When the wire towards the controller is free again
+        self._rx_last = 0.0        # Arrival time of the latest byte; read timeouts count from it
+        self._tx = deque()         # (ready time, bytes) on the wire towards the host
+        self._tx_clock = 0.0
+        self._lock = threading.RLock()
+        self._thread = None
+        self._running = False
+        self._wall_start = time.perf_counter()
+        self._now = 0.0
+        self._next_tick = TICK
+
+    # ----- clock and wire -----
+
+    def clock(self):
+        """Simulated seconds since the simulator was created."""
+        return (time.perf_counter() - self._wall_start) * self.speedup
+
+    def millis(self):
+        return int(self._now * 1000)
+
+    def _wire_time(self, length):
+        return 0.0 if not self.baud_rate else length * 10.0 / self.baud_rate  # 8N1: 10 bits per byte
+
+    def receive(self, data):
+        """Bytes written by the host; they arrive after their time on the wire."""
+        with self._lock:
+            now = self.clock()
+            self._rx_clock = max(self._rx_clock, now)
+            for i in range(0, len(data), USB_PACKET):
+                packet = bytes(data[i:i + USB_PACKET])
+                self._rx_clock += self._wire_time(len(packet))
+                self._rx_pending.append((self._rx_clock, packet))
+
+    def transmit(self):
+        """Bytes that have reached the host by now."""
+        with self._lock:
+            now = self.clock()
+            out = bytearray()
+            while self._tx and self._tx[0][0] <= now:
+                out += self._tx.popleft()[1]
+            return bytes(out)
+
+    def pending_output(self):
+        """Time at which the next output byte reaches the host, or None."""
+        with self._lock:
+            return self._tx[0][0] if self._tx else None
+
+    def _print(self, text):
+        # Serial.print: queued behind earlier output at the current baud rate
+        self._write(text.encode())
+
+    def _write(self, data):
+        self._tx_clock = max(self._tx_clock, self._now) + self._wire_time(len(data))
+        self._tx.append((self._tx_clock, data))
+
+    def _available_for_write(self):
+        # Free space in the transmit buffer: bytes still waiting for the wire count against it
+        if not self.baud_rate:
+            return SERIAL_TX_BUFFER
+        backlog = (self._tx_clock - self._now) * self.baud_rate / 10.0
+        return SERIAL_TX_BUFFER - max(0, int(np.ceil(backlog)))
+
+    def _println(self, text=""):
+        self._print(text + "\r\n")
+
+    # ----- main loop -----
+
+    def start(self):
+        """Run the simulator in a background thread in real time (times `speedup`)."""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="shakebot-simulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def _run(self):
+        while self._running:
+            self.step(self.clock())
+            time.sleep(0.0005)
+
+    def step(self, now):
+        """Advance the simulation to `now`: deliver bytes, run loop() and every ISR tick that is due."""
+        with self._lock:
+            while True:
+                # Timer1 (motion) and Timer2 (accelerometer) interrupts in time order
+                sample = self._next_sample if self._next_sample is not None else np.inf
+                if min(self._next_tick, sample) > now:
+                    break
+                if self._next_tick <= sample:
+                    self._advance(self._next_tick)
+                    self._update_motor_position()
+                    self._next_tick += self.tick
+                else:
+                    self._advance(sample)
+                    self._sample_accelerometer()
+                    self._next_sample += 1.0 / self.telemetry_rate
+                self._loop()
+            self._advance(now)
+            self._loop()
+
+    def _advance(self, now):
+        while now > self._now:
+            # Log the carriage on a fixed grid while a motion runs, to see what happens between samples
+            until = now
+            if self.execute_motion:
+                until = min(now, (np.floor(self._now / PATH_INTERVAL + 1e-9) + 1) * PATH_INTERVAL)
+            # Hard stops a little beyond the limit switches
+            self.stepper.advance(until - self._now, low=-50.0, high=self.rail_steps + 50.0)
+            self._now = until
+            if self.execute_motion:
+                self._path.append((until, self.stepper.physical - self.stepper.offset))
+        while self._rx_pending and self._rx_pending[0][0] <= now:
+            self._rx_last, packet = self._rx_pending.popleft()
+            self._rx += packet
+
+    def _left_limit(self):
+        return self.stepper.physical <= 0.0  # digitalRead(LEFT_LIMIT_PIN) == LOW
+
+    def _right_limit(self):
+        return self.stepper.physical >= self.rail_steps
+
+    def _consume(self, length):
+        del self._rx[:length]
+
+    def _loop(self):
+        # Equivalent of loop() minus stepper.run(), which _advance() integrates continuously
+        self.stats_loops += 1
+        # The firmware reads frames byte by byte as they arrive; only a backlog of text fills its buffer
+        if len(self._rx) >= RX_FULL[self.board] and self._rx[0] != FRAME_SYNC[0]:
+            self.stats_rx_full += 1
+        self._report_stream()
+        self._send_telemetry()
+        while self._rx:
+            if self._rx[0] == FRAME_SYNC[0]:
+                if not self._receive_step_frame():
+                    return  # Rest of the frame still on the wire
+                continue
+            end = self._rx.find(b"\n")
+            sync = self._rx.find(FRAME_SYNC[:1], 0, len(self._rx) if end < 0 else end)
+            if sync >= 0:
+                self._consume(sync)  # A sync byte starts a frame and drops the partial line before it
+                continue
+            if end < 0:
+                return  # The parser waits for the rest of the line
+            line = bytes(self._rx[:end]).replace(b"\r", b"")
+            self._consume(end + 1)
+            if len(line) >= COMMAND_LINE_SIZE:
+                self._println("Command too long.")
+            elif line:
+                self._command(line.decode("utf-8", errors="replace"))
+
+    def _command(self, command):
+        if command.startswith("BR:"):
+            try:
+                baud_rate = int(command[3:].strip() or 0)
+            except ValueError:
+                baud_rate = 0
+            if baud_rate > 0:
+                self._println("Changing baud rate...")
+                self.baud_rate = baud_rate
+                self._println(f"Baud rate changed to: {baud_rate}")
+        elif command.startswith("SET_PARAMS"):
+            self._set_params(command)
+        elif command.startswith("SET_PLAYBACK"):
+            self._set_playback(command)
+        elif command.startswith("SET_TELEMETRY") and self.board == "due":
+            self._set_telemetry(command)
+        elif command == "STREAM":
+            self._start_stream()
+        elif command == "STREAM_END":
+            self.stream_ended = True
+        elif command == "START":
+            if self.stream_mode:
+                self._println(f"Number of data points buffered: {self.stream_written - self.stream_consumed}")
+            else:
+                self._println(f"Number of data points to be executed: {self.data_size}")
+            self._println("Start executing displacement data.")
+            self._next_tick = self._now + self.tick  # Timer1 restarts, so the first sample is one period away
+            self._start_telemetry()
+            self.playback_phase = 0
+            self.execute_motion = True
+        elif command == "ARM":
+            busy = self.execute_motion or self.is_setting_displacement or self.is_calibrating
+            buffered = self.stream_written - self.stream_consumed if self.stream_mode else self.data_size
+            self._println("NOT_ARMED BUSY" if busy else "NOT_ARMED EMPTY" if not buffered else f"ARMED {buffered}")
+        elif command == "CANCEL":
+            self.execute_motion = False
+            self._stop_segments()
+            self.stepper.stop()
+            self._println("Motion cancelled.")
+            self.execute_motion = False
+            self.stream_mode = False
+            self.data_size = 0
+            self.current_index = 0
+            self._trajectory = []
+            self._path = []
+        elif command == "SET_DISPLACEMENT":
+            self._println("Starting moving displacement...")
+            self.stepper.max_speed = self.pulse_per_rev / 2
+            self.stepper.move_to(-(self.total_length + 0.1) / self.lead * self.pulse_per_rev)
+            self.is_setting_displacement = True
+        elif command == "CALIBRATE_DISPLACEMENT":
+            self._println("Starting calibration...")
+            self.stepper.max_speed = self.pulse_per_rev / 2
+            self._println("Moving to the left limit...")
+            self.stepper.move_to(-(self.total_length + 0.1) / self.lead * self.pulse_per_rev)
+            self.is_calibrating = True
+        elif command == "STATS":
+            self._print_stats()
+        elif STEP_LINE.fullmatch(command):
+            self._receive_step_data(command)
+        else:
+            self._println(f"Unknown command: {command}")
+
+    def _print_stats(self):
+        # printStats(): counters of the window since the previous STATS, then a new window
+        window = int((self._now - self.stats_window_start) * 1e6)
+        self._println(f"STATS window_us={window} ticks={self.stats_ticks} period_us={round(self.tick * 1e6)} "
+                      f"jitter_mean_us=0.00 jitter_rms_us=0.00 jitter_max_us=0 missed=0 "
+                      f"rx_full={self.stats_rx_full} loop_hz={int(self.stats_loops * 1e6 / window) if window else 0}")
+        self.stats_ticks = self.stats_loops = self.stats_rx_full = 0
+        self.stats_window_start = self._now
+
+    def _acceleration_steps(self):
+        return int(self.max_acceleration * self.pulse_per_rev * GRAVITY / self.lead)
+
+    def _set_params(self, command):
+        values = {}
+        for token in command.split()[1:]:
+            name, _, value = token.partition("=")
+            values[name] = value
+        names = ("pulsePerRev", "maxRPM", "lead", "maxAcceleration", "totalLength")
+        if not all(name in values for name in names):
+            self._println("Invalid parameters.")
+            return
+        self.pulse_per_rev = _to_int(values["pulsePerRev"])
+        self.max_rpm = _to_float(values["maxRPM"])
+        self.lead = _to_float(values["lead"])
+        self.max_acceleration = _to_float(values["maxAcceleration"])
+        self.total_length = _to_float(values["totalLength"])
+        self.stepper.max_speed = self.pulse_per_rev * self.max_rpm
+        self.stepper.acceleration = float(self._acceleration_steps())
+        self._println("Parameters updated successfully.")
+        for name, value in (("totalLength", self.total_length), ("pulsePerRev", self.pulse_per_rev),
+                            ("maxRPM", self.max_rpm), ("lead", self.lead),
+                            ("maxAcceleration", self.max_acceleration)):
+            # Serial.println(float) prints two decimals
+            self._println(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
+
+    def _set_playback(self, command):
+        values = dict(token.partition("=")[::2] for token in command.split()[1:])
+        if self.execute_motion:
+            self._println("Cannot change playback while moving.")
+            return
+        sample_rate = _to_float(values["sampleRate"]) if "sampleRate" in values else self.sample_rate
+        control_rate = _to_float(values["controlRate"]) if "controlRate" in values else self.control_rate
+        interpolation = values.get("interpolation", self.interpolation)
+        interpolation = interpolation if interpolation in ("step", "linear", "cubic") else None
+        if interpolation is not None and interpolation not in INTERPOLATION_MODES[self.board]:
+            self._println("Interpolation is not supported on this board.")
+            return
+        if self.board == "micro":
+            control_rate = sample_rate  # The Micro has no control rate; its timer runs at the sample rate
+        highest = 1000.0 if self.board == "micro" else MAX_CONTROL_RATE
+        if sample_rate <= 0 or interpolation is None or control_rate < sample_rate or control_rate > highest:
+            self._println("Invalid playback settings.")
+            return
+
+        self.sample_rate, self.control_rate, self.interpolation = sample_rate, control_rate, interpolation
+        tick_rate = sample_rate if interpolation == "step" else control_rate
+        self.phase_increment = int(sample_rate / tick_rate * PHASE_ONE + 0.5)
+        self.playback_phase = 0
+        self.tick = round(1e6 / tick_rate) / 1e6  # Timer period in whole microseconds
+        self._next_tick = self._now + self.tick   # Timer1.stop(); Timer1.start(period)
+        if self.board == "micro":
+            self._println(f"Playback set: sampleRate={sample_rate:.2f} interpolation=step")
+        else:
+            self._println(f"Playback set: sampleRate={sample_rate:.2f} interpolation={interpolation} "
+                          f"controlRate={control_rate:.2f}")
+
+    def _set_telemetry(self, command):
+        values = dict(token.partition("=")[::2] for token in command.split()[1:])
+        rate = _to_float(values["rate"]) if "rate" in values else -1.0
+        if rate < 0 or rate > MAX_TELEMETRY_RATE:
+            self._println("Invalid telemetry rate.")
+            return
+        self.telemetry_rate = rate
+        # Timer2.stop(); Timer2.start(period) when the rate is not 0
+        self._next_sample = self._now + round(1e6 / rate) / 1e6 if rate else None
+        self._println(f"Telemetry set: rate={rate:.2f}")
+
+    def _start_telemetry(self):
+        # Number the samples of this motion from 0, unless the previous capture is still being sent
+        if not self.telemetry_ring and not self.telemetry_active:
+            self.telemetry_sequence = 0
+            self.telemetry_dropped = 0
+            self.telemetry_ended = False
+            self._last_speed = self.stepper.speed
+
+    def _sample_accelerometer(self):
+        # Timer2 ISR: one accelerometer sample while a motion executes
+        speed = self.stepper.speed
+        acceleration = (speed - self._last_speed) * self.telemetry_rate  # Steps/s² over the last sample period
+        self._last_speed = speed
+        if not self.execute_motion:
+            if self.telemetry_active:
+                self.telemetry_active = False
+                self.telemetry_ended = True
+            return
+        self.telemetry_active = True
+        sequence = self.telemetry_sequence
+        self.telemetry_sequence += 1
+        if len(self.telemetry_ring) >= TELEMETRY_RING:
+            self.telemetry_dropped += 1
+            return
+        g = np.array([acceleration * self.lead / self.pulse_per_rev / STANDARD_GRAVITY, 0.0, 1.0])
+        # 12-bit readings: the sensor saturates at ±2047 LSB
+        raw = np.clip(np.round((g + self._noise.normal(0.0, ACCEL_NOISE, 3)) / ACCEL_SCALE), -2047, 2047).astype(int)
+        sample = np.zeros(1, dtype=SAMPLE_DTYPE)
+        sample[0] = (int(self._now * 1e6) & 0xFFFFFFFF,
+                     self.stream_consumed if self.stream_mode else self.current_index,
+                     self.stepper.current_position(), *raw)
+        self.telemetry_ring.append((sequence, sample))
+
+    def _send_telemetry(self):
+        # loop(): send packets of consecutive samples while they fit in the transmit buffer
+        while self._send_telemetry_packet():
+            pass
+
+    def _send_telemetry_packet(self):
+        ring = self.telemetry_ring
+        if not ring:
+            if self.telemetry_ended and self._available_for_write() >= HEADER_SIZE + CRC_SIZE:
+                self._write(encode_packet(np.zeros(0, dtype=SAMPLE_DTYPE), self.telemetry_sequence))
+                self.telemetry_ended = False  # End of the capture
+            return False
+        if len(ring) < PACKET_SAMPLES and not self.telemetry_ended:
+            return False
+        count = 1
+        while count < min(PACKET_SAMPLES, len(ring)) and ring[count][0] == ring[0][0] + count:
+            count += 1
+        if self._available_for_write() < HEADER_SIZE + count * SAMPLE_DTYPE.itemsize + CRC_SIZE:
+            return False
+        first = ring[0][0]
+        self._write(encode_packet(np.concatenate([ring.popleft()[1] for _ in range(count)]), first))
+        return True
+
+    def _start_stream(self):
+        self.execute_motion = False
+        self.stream_mode = True
+        self.stream_ended = False
+        self.stream_finished = False
+        self.stream_written = 0
+        self.stream_consumed = 0
+        self.underrun_count = 0
+        self.data_size = 0
+        self.current_index = 0
+        self.last_credit_report = 0
+        self._println(f"STREAM_READY {self.max_displacement}")
+
+    def _report_stream(self):
+        if not self.stream_mode and not self.stream_finished:
+            return
+        finished = self.stream_finished
+        self.stream_finished = False
+        if finished:
+            label = "STREAM_DONE"
+        elif self.stream_consumed - self.last_credit_report >= CREDIT_INTERVAL:
+            label = "CREDIT"
+        else:
+            return
+        self.last_credit_report = self.stream_consumed
+        self._println(f"{label} {self.stream_consumed} {self.underrun_count}")
+        if finished:
+            self._println(f"Motion completed in {self.end_time - self.start_time} milliseconds.")
+            self._finish_run("stream")
+
+    def _receive_step_data(self, text):
+        if self.stream_mode:
+            self._println("Use binary frames while streaming.")
+            return
+        if self.data_size < self.max_displacement:
+            self.displacement_data[self.data_size] = _to_int(text)
+            self.data_size += 1
+        else:
+            self._println("Step data buffer full.")
+
+    def _frame_offset(self):
+        return self.stream_written if self.stream_mode else self.data_size
+
+    def _reply_frame(self, reason=None):
+        self._println(f"ACK {self._frame_offset()}" if reason is None else f"NAK {self._frame_offset()} {reason}")
+
+    def _receive_step_frame(self):
+        # Returns False while the frame is incomplete and the byte timeout has not expired
+        timed_out = self._now - self._rx_last > FRAME_TIMEOUT
+        if len(self._rx) < HEADER_SIZE:
+            if timed_out:
+                self._consume(len(self._rx))
+                self._reply_frame("TIMEOUT")
+                return True
+            return False
+        _, encoding, offset, count = struct.unpack_from(HEADER_FORMAT, self._rx)
+        if self._rx[1] != FRAME_SYNC[1]:
+            self._consume(HEADER_SIZE)
+            self._reply_frame("SYNC")
+            return True
+        try:
+            size = HEADER_SIZE + payload_size(encoding, count) + CRC_SIZE
+        except ProtocolError:
+            self._consume(len(self._rx))  # Payload length is unknown; drop what is pending
+            self._reply_frame("TYPE")
+            return True
+        if len(self._rx) < size:
+            if timed_out:
+                self._consume(len(self._rx))
+                self._reply_frame("TIMEOUT")
+                return True
+            return False
+
+        frame = bytes(self._rx[:size])
+        self._consume(size)
+        buffered = self.stream_written - self.stream_consumed if self.stream_mode else self.data_size
+        if crc16(frame[2:-CRC_SIZE]) != int.from_bytes(frame[-CRC_SIZE:], "little"):
+            self._reply_frame("CRC")
+        elif offset != self._frame_offset():
+            self._reply_frame("OFFSET")
+        elif count > self.max_displacement - buffered:
+            self._reply_frame("FULL")
+        else:
+            _, steps = decode_frame(frame)
+            if self.stream_mode:
+                index = (self.stream_written + np.arange(count)) % self.max_displacement
+                self.displacement_data[index] = steps
+                self.stream_written += count
+            else:
+                self.displacement_data[self.data_size:self.data_size + count] = steps
+                self.data_size += count
+            self._reply_frame()
+        return True
+
+    # ----- ISR -----
+
+    def _update_motor_position(self):
+        self.stats_ticks += 1
+        stepper = self.stepper
+        if self.is_calibrating:
+            if self._left_limit() and not self.left_limit_reached:
+                stepper.stop()
+                stepper.set_current_position(0)
+                self._print("Left limit reached")
+                self.left_limit_reached = True
+                self._println("Moving to the right limit...")
+                stepper.max_speed = self.pulse_per_rev / 2
+                stepper.move_to((self.total_length + 0.1) / self.lead * self.pulse_per_rev)
+                return
+            if self._right_limit() and not self.right_limit_reached:
+                stepper.stop()
+                self._println(f"Right limit reached. Steps: {stepper.current_position()}")
+                self.right_limit_reached = True
+                stepper.max_speed = self.pulse_per_rev * self.max_rpm
+                stepper.move_to(self.displacement_data[0])
+                return
+            if stepper.distance_to_go() == 0:
+                self.left_limit_reached = False
+                self.right_limit_reached = False
+                stepper.stop()
+                self._println("Completed calibration.")
+                self.is_calibrating = False
+                self.data_size = 0
+                stepper.set_current_position(0)
+                return
+
+        if self.is_setting_displacement:
+            if self._left_limit() and not self.left_limit_reached:
+                stepper.stop()
+                self._println("Moving to displacementData[0].")
+                self.left_limit_reached = True
+                stepper.set_current_position(0)
+                stepper.max_speed = self.pulse_per_rev * self.max_rpm
+                stepper.move_to(self.displacement_data[0])
+                return
+            if stepper.distance_to_go() == 0:
+                self.left_limit_reached = False
+                stepper.stop()
+                self._println("Displacement set.")
+                self.is_setting_displacement = False
+                self.data_size = 0
+                stepper.set_current_position(0)
+                return
+
+        if self.stream_mode:
+            # One sample per sample period, whatever the ISR rate
+            self.playback_phase += self.phase_increment
+            if self.playback_phase >= PHASE_ONE:
+                self.playback_phase -= PHASE_ONE
+                self._update_stream_position()
+            return
+
+        if self.data_size == 0 or not self.execute_motion:
+            self.start_time = self.millis()
+            return
+
+        if self.interpolation != "step":
+            self._update_interpolated_position()
+            return
+
+        self._command_target(self.displacement_data[self.current_index])
+        self.current_index += 1
+        if self.current_index >= self.data_size:
+            self._finish_playback()
+
+    def _update_interpolated_position(self):
+        following = self.playback_phase + self.phase_increment
+        index = following >> 16
+        if index >= self.data_size - 1:
+            self._stop_segments()
+            self._command_target(self.displacement_data[self.data_size - 1])
+            self._finish_playback()
+            return
+        if index != self.playback_phase >> 16 or self.playback_phase == 0:
+            # A sample boundary: log the sample against where the carriage is now
+            self._trajectory.append((self._now, int(self.displacement_data[index]), self.stepper.current_position()))
+        self.current_index = index
+        position = self.stepper.current_position()
+        if not self.stepper.constant_speed:
+            self.segment_target = float(position)  # First segment starts where the carriage is
+        target = self._interpolate(index, (following & (PHASE_ONE - 1)) / PHASE_ONE)
+        speed = ((target - self.segment_target) + POSITION_GAIN * (self.segment_target - position)) * self.control_rate
+        self.segment_target = target
+        max_change = self._acceleration_steps() / self.control_rate
+        self.segment_speed = float(np.clip(speed, self.segment_speed - max_change, self.segment_speed + max_change))
+        self.stepper.set_speed(self.segment_speed)
+        self.playback_phase = following
+
+    def _interpolate(self, index, t):
+        data = self.displacement_data
+        p1, p2 = float(data[index]), float(data[index + 1])
+        if self.interpolation == "linear":
+            return p1 + (p2 - p1) * t
+        p0 = float(data[index - 1]) if index > 0 else p1
+        p3 = float(data[index + 2]) if index + 2 < self.data_size else p2
+        return p1 + 0.5 * t * (p2 - p0 + t * (2 * p0 - 5 * p1 + 4 * p2 - p3 + t * (3 * (p1 - p2) + p3 - p0)))
+
+    def _stop_segments(self):
+        if self.stepper.constant_speed:
+            self.segment_speed = 0.0
+            self.stepper.set_current_position(self.stepper.current_position())
+
+    def _finish_playback(self):
+        self.current_index = 0
+        self.execute_motion = False
+        self.data_size = 0
+        self.end_time = self.millis()
+        self._println(f"Motion completed in {self.end_time - self.start_time} milliseconds.")
+        self._finish_run("buffer" if self.interpolation == "step" else self.interpolation)
+
+    def _update_stream_position(self):
+        if not self.execute_motion:
+            self.start_time = self.millis()
+            return
+        if self.stream_consumed == self.stream_written:
+            if self.stream_ended:
+                self.execute_motion = False
+                self.stream_mode = False
+                self.stream_finished = True
+                self.end_time = self.millis()
+            else:
+                self.underrun_count += 1
+                self._trajectory.append((self._now, self.stepper.target, self.stepper.current_position()))
+            return
+        self._command_target(self.displacement_data[self.stream_consumed % self.max_displacement])
+        self.stream_consumed += 1
+
+    def _command_target(self, target):
+        # Record where the carriage is when the ISR hands it the next target
+        self._trajectory.append((self._now, int(target), self.stepper.current_position()))
+        self.stepper.move_to(target)
+
+    def _finish_run(self, mode):
+        trajectory, self._trajectory = self._trajectory, []
+        path, self._path = self._path, []
+        if not trajectory:
+            return
+        time_, commanded, achieved = (np.array(column) for column in zip(*trajectory))
+        report = trajectory_report(time_, commanded, achieved, self.lead / self.pulse_per_rev,
+                                   np.array(path).reshape(-1, 2))
+        report.update(mode=mode, duration_ms=self.end_time - self.start_time,
+                      underruns=self.underrun_count if mode == "stream" else 0)
+        self.runs.append(report)
+        if self.on_run:
+            self.on_run(report)
+
+
+def trajectory_report(time, commanded, achieved, meters_per_step, path=None):
+    """
+    Compare commanded and achieved positions sampled at the ISR ticks.
+
+    The position reached at tick k + lag is compared with the target handed
+    out at tick k; the lag (in ticks) that minimises the RMS error is reported.
+
+    When `path` is given, the carriage path between the samples is compared
+    with the commanded samples joined by straight lines, shifted by the best
+    lag (searched in PATH_INTERVAL steps); position errors there show the
+    waypoint-to-waypoint ramps that the sample instants hide, and velocity
+    errors show the stop-and-go they cause.
+
+    Args:
+        path (np.ndarray): (M, 2) times and carriage positions (steps) on a fine grid.
+
+    Returns:
+        dict: time, commanded and achieved (steps), samples, lag_ticks,
+        rms_error_m and max_error_m at that lag, plus path_rms_error_m and
+        velocity_rms_error (m/s) when a path is given.
+    """
+    commanded = np.asarray(commanded, dtype=float)
+    achieved = np.asarray(achieved, dtype=float)
+    best = (np.inf, 0, 0.0)
+    for lag in range(0, min(11, len(commanded))):
+        error = achieved[lag:] - commanded[:len(commanded) - lag]
+        rms = float(np.sqrt(np.mean(error**2))) if error.size else 0.0
+        if rms < best[0]:
+            best = (rms, lag, float(np.abs(error).max()) if error.size else 0.0)
+    rms, lag, worst = best
+    report = {"time": np.asarray(time), "commanded": commanded, "achieved": achieved, "samples": len(commanded),
+              "lag_ticks": lag, "rms_error_m": rms * meters_per_step, "max_error_m": worst * meters_per_step}
+    if path is not None and len(path) > 2 and len(commanded) > 2:
+        time = np.asarray(time, dtype=float)
+        path_time, position = path[:, 0], path[:, 1]
+        velocity = np.gradient(position, path_time)
+        slopes = np.diff(commanded) / np.diff(time)  # Velocity of the straight lines between the samples
+        dt = float(np.median(np.diff(time)))
+        inside = (path_time >= time[0] + 2 * dt) & (path_time <= time[-1] - 2 * dt)
+        best = (np.inf, 0.0)
+        for shift in np.arange(0.0, 10 * dt, PATH_INTERVAL):
+            error = position[inside] - np.interp(path_time[inside] - shift, time, commanded)
+            rms = float(np.sqrt(np.mean(error**2))) if error.size else 0.0
+            if rms < best[0]:
+                best = (rms, shift)
+        shift = best[1]
+        interval = np.clip(np.searchsorted(time, path_time[inside] - shift) - 1, 0, len(slopes) - 1)
+        velocity_error = velocity[inside] - slopes[interval]
+        report["path_rms_error_m"] = best[0] * meters_per_step
+        report["velocity_rms_error"] = (float(np.sqrt(np.mean(velocity_error**2))) if velocity_error.size else 0.0
+                                        ) * meters_per_step
+    return report
+
+
+def describe_run(report):
+    """One-line summary of a trajectory report."""
+    text = (f"{report['mode']} run: {report['samples']} ticks in {report['duration_ms']} ms, "
+            f"lag {report['lag_ticks']} ticks, RMS error {report['rms_error_m'] * 1000:.2f} mm, "
+            f"max error {report['max_error_m'] * 1000:.2f} mm, {report['underruns']} underruns")
+    if "path_rms_error_m" in report:
+        text += (f"; between samples RMS {report['path_rms_error_m'] * 1000:.2f} mm, "
+                 f"velocity RMS {report['velocity_rms_error'] * 1000:.1f} mm/s")
+    return text
+
+
+class FakeSerial:
+    """
+    In-process stand-in for serial.Serial connected to a running FirmwareSimulator.
+
+    Args:
+        simulator (FirmwareSimulator): Started simulator.
+        timeout (float): Read timeout in seconds, as in serial.Serial.
+    """
+
+    def __init__(self, simulator, timeout=1.0):
+        self.simulator = simulator
+        self.timeout = timeout
+        self.is_open = True
+        self._buffer = bytearray()
+
+    @property
+    def baudrate(self):
+        return self.simulator.baud_rate
+
+    def _fill(self):
+        self._buffer += self.simulator.transmit()
+
+    @property
+    def in_waiting(self):
+        self._fill()
+        return len(self._buffer)
+
+    def write(self, data):
+        self.simulator.receive(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._fill()
+        self._buffer.clear()
+
+    def _read_until(self, done):
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while True:
+            self._fill()
+            size = done(self._buffer)
+            if size:
+                data = bytes(self._buffer[:size])
+                del self._buffer[:size]
+                return data
+            if deadline is not None and time.perf_counter() >= deadline:
+                data = bytes(self._buffer)
+                self._buffer.clear()
+                return data
+            time.sleep(0.0005)
+
+    def read(self, size=1):
+        return self._read_until(lambda buffer: size if len(buffer) >= size else 0)
+
+    def readline(self):
+        return self._read_until(lambda buffer: buffer.find(b"\n") + 1)
+
+    def close(self):
+        self.is_open = False
+
+
+class PtyTransport:
+    """
+    Expose a FirmwareSimulator on a pseudo terminal (Linux and macOS).
+
+    Args:
+        simulator (FirmwareSimulator): Started simulator.
+
+    Attributes:
+        device (str): Path of the terminal to open, e.g. /dev/pts/5.
+    """
+
+    def __init__(self, simulator):
+        import pty
+        import tty
+
+        self.simulator = simulator
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.device = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._pump, name="shakebot-pty", daemon=True)
+        self._thread.start()
+
+    def _pump(self):
+        import select
+
+        while self._running:
+            readable, _, _ = select.select([self._master], [], [], 0.0005)
+            if readable:
+                try:
+                    data = os.read(self._master, 65536)
+                except OSError:
+                    data = b""
+                if data:
+                    self.simulator.receive(data)
+            output = self.simulator.transmit()
+            if output:
+                os.write(self._master, output)
+
+    def close(self):
+        self._running = False
+        self._thread.join(1.0)
+        os.close(self._master)
+        os.close(self._slave)
+
+
+def _to_int(text):
+    # String.toInt(): leading integer, 0 when there is none
+    text = text.strip()
+    digits = len(text) - len(text.lstrip("+-"))
+    while digits < len(text) and text[digits].isdigit():
+        digits += 1
+    try:
+        return int(text[:digits])
+    except ValueError:
+        return 0
+
+
+def _to_float(text):
+    # String.toFloat(): leading number, 0 when there is none
+    match = FLOAT_PREFIX.match(text.strip())
+    try:
+        return float(match.group())
+    except ValueError:
+        return 0.0
@@ -0,0 +1,187 @@
+"""
+Streaming playback for records longer than the controller buffer.
+
+The firmware treats displacementData as a ring buffer while streaming:
+
+    host                                controller
+    STREAM                       ->
+                                 <-     STREAM_READY <capacity>
+    binary frames (offset = samples sent since STREAM)
+                                 <-     ACK <received> / NAK <received> <reason>
+    START                        ->     playback begins at 100 Hz
+                                 <-     CREDIT <consumed> <underruns>   (every CREDIT_INTERVAL ticks)
+    STREAM_END                   ->     no more samples will follow
+                                 <-     STREAM_DONE <consumed> <underruns>
+
+The producer only sends a frame when the last reported credit guarantees room
+for it, so memory stays constant on both sides regardless of record length.
+"""
+import time
+
+import numpy as np
+
+from shakebot.protocol import ENCODING_AUTO, ProtocolError, encode_frame, read_reply
+
+DEFAULT_STREAM_FRAME_SAMPLES = 32  # Short frames keep loop() responsive during playback
+
+
+def iter_chunks(steps, chunk_samples=DEFAULT_STREAM_FRAME_SAMPLES):
+    """
+    Yield consecutive blocks of a step array, for feeding StreamProducer.
+
+    Args:
+        steps (array-like): Step counts.
+        chunk_samples (int): Samples per block.
+
+    Yields:
+        np.ndarray: Blocks of at most `chunk_samples` step counts.
+    """
+    steps = np.asarray(steps, dtype=np.int64)
+    for i in range(0, steps.size, chunk_samples):
+        yield steps[i:i + chunk_samples]
+
+
+class StreamProducer:
+    """
+    Keep the controller's ring buffer topped up from a generator of step counts.
+
+    Args:
+        port (serial.Serial): Open connection to the controller.
+        chunks (iterable): Yields array-like blocks of step counts of any length.
+        frame_samples (int): Maximum number of samples per frame.
+        prefill (float): Fraction of the ring buffer to fill before START.
+        encoding (int): Frame encoding passed to encode_frame.
+        timeout (float): Seconds to wait for any controller message before giving up.
+        retries (int): Consecutive frame failures tolerated.
+        on_line (callable): Called with every line that is not part of the protocol.
+        metrics (shakebot.instrumentation.Metrics): Records frame_latency,
+            frame_bytes and stream_buffered (samples queued at each CREDIT).
+    """
+
+    def __init__(self, port, chunks, frame_samples=DEFAULT_STREAM_FRAME_SAMPLES, prefill=1.0,
+                 encoding=ENCODING_AUTO, timeout=2.0, retries=3, on_line=None, metrics=None):
+        self.port = port
+        self.chunks = iter(chunks)
+        self.frame_samples = frame_samples
+        self.prefill = prefill
+        self.encoding = encoding
+        self.timeout = timeout
+        self.retries = retries
+        self.on_line = on_line
+        self.metrics = metrics
+
+        self.capacity = 0      # Ring buffer size reported by STREAM_READY
+        self.sent = 0          # Samples acknowledged by the controller
+        self.consumed = 0      # Samples played, from the latest CREDIT
+        self.underruns = 0     # Empty-buffer ISR ticks, from the latest CREDIT
+        self.min_buffered = None  # Lowest buffered sample count seen at a CREDIT
+        self.done = False
+        self._pending = np.empty(0, dtype=np.int64)
+        self._exhausted = False
+
+    def run(self):
+        """
+        Stream every sample, start playback and wait until it completes.
+
+        Returns:
+            dict: Streaming statistics (samples, frames, retransmissions, underruns,
+            min_buffered, capacity, seconds).
+        """
+        stats = {"frames": 0, "retransmissions": 0}
+        start_time = time.perf_counter()
+
+        self.port.write(b"STREAM\n")
+        self._wait_for(lambda: self.capacity > 0, "STREAM_READY")
+
+        # Prefill the ring buffer before starting the motion
+        target = max(1, int(self.capacity * self.prefill))
+        while self.sent < target and self._send_next(stats, limit=target - self.sent):
+            pass
+        self.port.write(b"START\n")
+
+        while True:
+            room = self.capacity - (self.sent - self.consumed)
+            if room > 0 and self._send_next(stats, limit=room):
+                continue
+            if self._exhausted and not self._pending.size:
+                break
+            # Ring buffer full: wait for the ISR to free some space
+            self._wait_for(lambda: self.capacity - (self.sent - self.consumed) > 0, "CREDIT")
+
+        self.port.write(b"STREAM_END\n")
+        self._wait_for(lambda: self.done, "STREAM_DONE")
+
+        stats.update(samples=self.sent, underruns=self.underruns, min_buffered=self.min_buffered,
+                     capacity=self.capacity, seconds=time.perf_counter() - start_time)
+        return stats
+
+    def _next_block(self, limit):
+        # Take up to `limit` samples from the generator, buffering any remainder
+        while self._pending.size < limit and not self._exhausted:
+            try:
+                chunk = np.atleast_1d(np.asarray(next(self.chunks), dtype=np.int64))
+            except StopIteration:
+                self._exhausted = True
+                break
+            self._pending = np.concatenate((self._pending, chunk))
+        block, self._pending = self._pending[:limit], self._pending[limit:]
+        return block
+
+    def _send_next(self, stats, limit):
+        # Send one frame of at most `limit` samples; False when nothing is left
+        block = self._next_block(min(limit, self.frame_samples))
+        if not block.size:
+            return False
+
+        failures = 0
+        while True:
+            frame = encode_frame(block, self.sent, self.encoding)
+            sent = time.perf_counter()
+            self.port.write(frame)
+            stats["frames"] += 1
+            reply = read_reply(self.port, self.timeout, self._handle_line)
+            if self.metrics is not None:
+                self.metrics.record("frame_latency", time.perf_counter() - sent)
+                self.metrics.record("frame_bytes", len(frame))
+            kind, received, reason = reply if reply else ("NAK", self.sent, "TIMEOUT")
+            if kind == "ACK" and received == self.sent + block.size:
+                self.sent = received
+                return True
+            if kind == "NAK" and reason == "OFFSET" and received == self.sent + block.size:
+                self.sent = received  # The ACK was lost but the frame arrived
+                return True
+            failures += 1
+            stats["retransmissions"] += 1
+            if failures > self.retries:
+                raise ProtocolError(f"Stream frame at sample {self.sent} failed {failures} times ({reason or kind}).")
+
+    def _wait_for(self, condition, what):
+        # Read controller messages until `condition` holds
+        deadline = time.perf_counter() + self.timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise ProtocolError(f"Timed out waiting for {what}.")
+            line = self.port.readline().decode("utf-8", errors="replace").strip()
+            if line and self._handle_line(line):
+                deadline = time.perf_counter() + self.timeout
+
+    def _handle_line(self, line):
+        # Track STREAM_READY / CREDIT / STREAM_DONE; returns True for streaming messages
+        parts = line.split()
+        if len(parts) == 2 and parts[0] == "STREAM_READY" and parts[1].isdigit():
+            self.capacity = int(parts[1])
+            return True
+        if len(parts) == 3 and parts[0] in ("CREDIT", "STREAM_DONE") and parts[1].isdigit() and parts[2].isdigit():
+            self.consumed = int(parts[1])
+            self.underruns = int(parts[2])
+            # The ring buffer only drains on purpose once the generator is exhausted
+            buffered = self.sent - self.consumed
+            if not self._exhausted and (self.min_buffered is None or buffered < self.min_buffered):
+                self.min_buffered = buffered
+            if self.metrics is not None:
+                self.metrics.record("stream_buffered", buffered)
+            self.done = parts[0] == "STREAM_DONE"
+            return True
+        if self.on_line:
+            self.on_line(line)
+        return False
@@ -0,0 +1,343 @@
+"""
+Accelerometer telemetry recorded while the table moves.
+
+The Due firmware samples the ADXL362 on the table (test/accelerometer) from a
+second timer while a motion executes and streams the samples to the host in
+binary packets, between its text lines. Packets use the header of the step
+frames in shakebot/protocol.py with their own type:
+
+    offset  size  field
+    0       2     sync bytes 0xA5 0x5A
+    2       1     type TELEMETRY_TYPE
+    3       4     uint32 LE sequence number of the first sample since START
+    7       2     uint16 LE number of samples (0 marks the end of the capture)
+    9       18n   samples, SAMPLE_DTYPE each
+    9+18n   2     uint16 LE CRC-16/CCITT-FALSE over bytes 2 .. 9+18n
+
+Every sample holds micros() when it was taken, the number of samples handed to
+the motor so far (currentIndex, or the samples consumed while streaming), the
+executed step position and the raw X/Y/Z readings. A sample the firmware could
+not queue (the serial port fell behind) still takes a sequence number, so the
+recorder counts it as dropped.
+
+TelemetryRecorder splits the incoming bytes into text lines and packets and
+copies each packet's samples straight into a preallocated array, optionally a
+memory-mapped .npy file, so a capture costs one frombuffer() per packet.
+"""
+import struct
+
+import numpy as np
+
+from shakebot.protocol import CRC_SIZE, FRAME_SYNC, HEADER_FORMAT, HEADER_SIZE, crc16
+
+TELEMETRY_TYPE = 0x10          # FRAME_TELEMETRY in the firmware
+SAMPLE_DTYPE = np.dtype([("time_us", "<u4"), ("index", "<u4"), ("position", "<i4"),
+                         ("x", "<i2"), ("y", "<i2"), ("z", "<i2")])
+PACKET_SAMPLES = 4             # TELEMETRY_PACKET_SAMPLES in the firmware
+DEFAULT_TELEMETRY_RATE = 400   # Hz; the ADXL362's highest output data rate
+MAX_TELEMETRY_RATE = 400       # MAX_TELEMETRY_RATE in the firmware
+ACCEL_SCALE = 0.004            # g per LSB in the ±8 g range the firmware selects
+STANDARD_GRAVITY = 9.80665
+PACKET_HEADER = FRAME_SYNC + bytes((TELEMETRY_TYPE,))  # Start of every packet
+
+
+def encode_packet(samples, sequence):
+    """
+    Pack telemetry samples into one packet, as the firmware does.
+
+    Args:
+        samples (np.ndarray): Structured array of SAMPLE_DTYPE (may be empty).
+        sequence (int): Sequence number of the first sample.
+
+    Returns:
+        bytes: The complete packet including sync bytes and CRC.
+    """
+    samples = np.asarray(samples, dtype=SAMPLE_DTYPE)
+    body = struct.pack(HEADER_FORMAT, FRAME_SYNC, TELEMETRY_TYPE, sequence & 0xFFFFFFFF, len(samples))[2:]
+    body += samples.tobytes()
+    return FRAME_SYNC + body + struct.pack("<H", crc16(body))
+
+
+def synthetic_stream(acceleration, rate=DEFAULT_TELEMETRY_RATE, index=None, position=None, drop=(),
+                     lines=(), packet_samples=PACKET_SAMPLES, scale=ACCEL_SCALE):
+    """
+    Bytes a controller would send for a known acceleration, for testing the recorder.
+
+    Args:
+        acceleration (np.ndarray): (N, 3) accelerations in g.
+        rate (float): Sample rate in Hz; timestamps start at 0 µs.
+        index (np.ndarray): Executed sample index per sample (default: zeros).
+        position (np.ndarray): Executed step position per sample (default: zeros).
+        drop (iterable): Sequence numbers to leave out, as if the firmware had dropped them.
+        lines (iterable): Text lines to interleave, one after each packet in turn.
+        packet_samples (int): Samples per packet.
+        scale (float): g per LSB.
+
+    Returns:
+        bytes: Packets followed by the end-of-capture packet.
+    """
+    acceleration = np.asarray(acceleration, dtype=float).reshape(-1, 3)
+    samples = np.zeros(len(acceleration), dtype=SAMPLE_DTYPE)
+    samples["time_us"] = np.round(np.arange(len(samples)) * 1e6 / rate).astype(np.int64) & 0xFFFFFFFF
+    samples["index"] = 0 if index is None else index
+    samples["position"] = 0 if position is None else position
+    raw = np.clip(np.round(acceleration / scale), -32768, 32767).astype(np.int16)
+    samples["x"], samples["y"], samples["z"] = raw.T
+
+    kept = np.ones(len(samples), dtype=bool)
+    kept[list(drop)] = False
+    lines = list(lines)
+    out = bytearray()
+    sequence = 0
+    while sequence < len(samples):
+        # Packets only hold consecutive sequence numbers
+        if not kept[sequence]:
+            sequence += 1
+            continue
+        stop = sequence
+        while stop < len(samples) and stop - sequence < packet_samples and kept[stop]:
+            stop += 1
+        out += encode_packet(samples[sequence:stop], sequence)
+        if lines:
+            out += (lines.pop(0) + "\r\n").encode()
+        sequence = stop
+    out += encode_packet(samples[:0], len(samples))
+    return bytes(out)
+
+
+class TelemetryRecorder:
+    """
+    Demultiplex controller output into text lines and telemetry samples.
+
+    Args:
+        capacity (int): Samples to preallocate; later samples are counted in
+            stats["overflow"] and discarded.
+        path (str): Write the samples to this .npy file through a memory map
+            instead of keeping them in memory; close() trims it to the samples
+            received.
+        on_line (callable): Called with every complete text line.
+        on_samples (callable): Called with the samples of every packet as they
+            are stored, e.g. to stream them to a shakebot.archive.Run.
+    """
+
+    def __init__(self, capacity, path=None, on_line=None, on_samples=None):
+        self.path = path
+        self.on_line = on_line
+        self.on_samples = on_samples
+        if path:
+            self.samples = np.lib.format.open_memmap(path, mode="w+", dtype=SAMPLE_DTYPE, shape=(capacity,))
+        else:
+            self.samples = np.empty(capacity, dtype=SAMPLE_DTYPE)
+        self.count = 0
+        self.finished = False
+        self.stats = {"packets": 0, "samples": 0, "dropped": 0, "crc_errors": 0, "overflow": 0}
+        self._next_sequence = 0
+        self._buffer = bytearray()
+        self._text = bytearray()
+
+    @classmethod
+    def for_record(cls, duration, rate=DEFAULT_TELEMETRY_RATE, margin=5.0, **kwargs):
+        """Recorder sized for a motion of `duration` seconds sampled at `rate` Hz, plus `margin` seconds."""
+        return cls(int((duration + margin) * rate) + PACKET_SAMPLES, **kwargs)
+
+    @property
+    def data(self):
+        """Samples received so far (view)."""
+        return self.samples[:self.count]
+
+    def feed(self, data):
+        """
+        Consume received bytes.
+
+        Args:
+            data (bytes): Newly received bytes.
+
+        Returns:
+            list[str]: Text lines completed by them, stripped.
+        """
+        self._buffer += data
+        buffer = self._buffer
+        while buffer:
+            start = buffer.find(FRAME_SYNC[:1])
+            if start != 0:
+                # Everything before the next sync byte is text
+                end = len(buffer) if start < 0 else start
+                self._text += buffer[:end]
+                del buffer[:end]
+                continue
+            if len(buffer) < HEADER_SIZE:
+                break
+            sync, kind, sequence, count = struct.unpack_from(HEADER_FORMAT, buffer)
+            if sync != FRAME_SYNC or kind != TELEMETRY_TYPE:
+                del buffer[:1]  # Not a packet; resynchronise on the next sync byte
+                continue
+            size = HEADER_SIZE + count * SAMPLE_DTYPE.itemsize + CRC_SIZE
+            if len(buffer) < size:
+                break
+            (crc,) = struct.unpack_from("<H", buffer, size - CRC_SIZE)
+            if crc != crc16(bytes(buffer[2:size - CRC_SIZE])):
+                # Skip the whole packet, or up to the next packet header if one starts inside it (the
+                # count was corrupted), so neither its payload nor the text after it is misread
+                self.stats["crc_errors"] += 1
+                following = buffer.find(PACKET_HEADER, 2, size)
+                del buffer[:size if following < 0 else following]
+                continue
+            self._store(sequence, count, buffer[HEADER_SIZE:size - CRC_SIZE])
+            del buffer[:size]
+        return self._pop_lines()
+
+    @property
+    def pending(self):
+        """Received bytes not yet returned as lines or stored as samples."""
+        return bytes(self._text + self._buffer)
+
+    def _store(self, sequence, count, payload):
+        self.stats["packets"] += 1
+        if sequence > self._next_sequence:
+            self.stats["dropped"] += sequence - self._next_sequence
+        self._next_sequence = max(self._next_sequence, sequence + count)
+        if count == 0:
+            self.finished = True
+            return
+        room = len(self.samples) - self.count
+        taken = min(count, room)
+        self.samples[self.count:self.count + taken] = np.frombuffer(payload, dtype=SAMPLE_DTYPE, count=taken)
+        self.count += taken
+        self.stats["samples"] += taken
+        self.stats["overflow"] += count - taken
+        if self.on_samples and taken:
+            self.on_samples(self.samples[self.count - taken:self.count])
+
+    def _pop_lines(self):
+        end = self._text.rfind(b"\n")
+        if end < 0:
+            return []
+        chunk = bytes(self._text[:end + 1])
+        del self._text[:end + 1]
+        lines = [line.strip() for line in chunk.decode("utf-8", errors="replace").splitlines() if line.strip()]
+        if self.on_line:
+            for line in lines:
+                self.on_line(line)
+        return lines
+
+    def close(self):
+        """
+        Finish the capture; a memory-mapped file is flushed and trimmed to the received samples.
+
+        Returns:
+            np.ndarray: The received samples (read from the file when there is one).
+        """
+        if not self.path:
+            return self.data
+        self.samples.flush()
+        offset = self.samples.offset
+        del self.samples
+        trim_npy(self.path, self.count, offset)
+        self.samples = np.load(self.path, mmap_mode="r")
+        return self.samples
+
+
+def trim_npy(path, rows, offset):
+    """
+    Shrink the first axis of a 1-D .npy file to `rows` in place.
+
+    NumPy pads .npy headers so the shape can grow or shrink without moving the
+    data, so only the header is rewritten and the file truncated.
+    """
+    import io
+
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        read_header, write_header = {(1, 0): (np.lib.format.read_array_header_1_0,
+                                              np.lib.format.write_array_header_1_0),
+                                     (2, 0): (np.lib.format.read_array_header_2_0,
+                                              np.lib.format.write_array_header_2_0)}[version]
+        _, fortran_order, dtype = read_header(f)
+        header = io.BytesIO()
+        write_header(header, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": fortran_order,
+                              "shape": (rows,)})
+        if len(header.getvalue()) != offset:
+            raise ValueError(f"Cannot trim {path}: its header would change size.")
+        f.seek(0)
+        f.write(header.getvalue())
+        f.truncate(offset + rows * dtype.itemsize)
+
+
+def to_physical(samples, scale=ACCEL_SCALE):
+    """
+    Convert raw samples to physical units.
+
+    Args:
+        samples (np.ndarray): Structured array of SAMPLE_DTYPE.
+        scale (float): g per LSB.
+
+    Returns:
+        dict: time (s since the first sample; micros() wrap-around removed),
+        acceleration ((N, 3) m/s²), index and position (steps).
+    """
+    samples = np.asarray(samples)
+    time_us = samples["time_us"].astype(np.uint32)
+    # Differences in uint32 arithmetic are correct across the 71-minute micros() wrap
+    elapsed = np.concatenate(([0], np.cumsum(np.diff(time_us).astype(np.int64))))
+    acceleration = np.column_stack((samples["x"], samples["y"], samples["z"])) * (scale * STANDARD_GRAVITY)
+    return {"time": elapsed / 1e6, "acceleration": acceleration,
+            "index": samples["index"].astype(np.int64), "position": samples["position"].astype(np.int64)}
+
+
+def acceleration_report(samples, data, axis=0, scale=ACCEL_SCALE, meters_per_step=None):
+    """
+    Compare the measured acceleration with the acceleration the record commands.
+
+    The commanded acceleration is the second derivative of the record's
+    displacement, read at the record time each sample was taken (the time
+    since START). The accelerometer offset (mounting tilt) is removed by
+    subtracting the mean, since a record starts and ends at rest.
+
+    Args:
+        samples (np.ndarray): Telemetry samples of one motion.
+        data (np.ndarray): (N, 2) time/displacement record that was played.
+        axis (int): Accelerometer axis along the table (0, 1 or 2 for X, Y, Z).
+        scale (float): g per LSB.
+        meters_per_step (float): Also report the acceleration of the executed
+            step positions when given (lead / pulse_per_rev).
+
+    Returns:
+        dict: samples, rate_hz (achieved), peak_commanded, peak_measured,
+        rms_error (m/s²) and correlation, plus peak_executed when
+        meters_per_step is given.
+    """
+    physical = to_physical(samples, scale)
+    time = physical["time"]
+    if len(time) < 3:
+        raise ValueError("Too few telemetry samples to compare.")
+    data = np.asarray(data, dtype=float)
+    record_time = data[:, 0] - data[0, 0]
+    commanded = np.interp(time, record_time, np.gradient(np.gradient(data[:, 1], record_time), record_time))
+    measured = physical["acceleration"][:, axis]
+    measured = measured - measured.mean()
+    error = measured - commanded
+    spread = measured.std() * commanded.std()
+    report = {"samples": len(time), "rate_hz": (len(time) - 1) / time[-1] if time[-1] > 0 else 0.0,
+              "peak_commanded": float(np.abs(commanded).max()), "peak_measured": float(np.abs(measured).max()),
+              "rms_error": float(np.sqrt(np.mean(error**2))),
+              "correlation": float(np.mean((measured - measured.mean()) * (commanded - commanded.mean())) / spread)
+              if spread > 0 else 0.0}
+    if meters_per_step:
+        position = physical["position"] * meters_per_step
+        executed = np.gradient(np.gradient(position, time), time)
+        report["peak_executed"] = float(np.abs(executed).max())
+    return report
+
+
+def describe(stats, report=None):
+    """One-line summary of a recorder's stats and, optionally, an acceleration_report()."""
+    text = f"{stats['samples']} accelerometer samples, {stats['dropped']} dropped"
+    if stats["crc_errors"]:
+        text += f", {stats['crc_errors']} corrupt packets"
+    if stats["overflow"]:
+        text += f", {stats['overflow']} beyond the recorder's capacity"
+    if report:
+        text += (f"; {report['rate_hz']:.0f} Hz, peak {report['peak_measured']:.2f} m/s² measured vs "
+                 f"{report['peak_commanded']:.2f} m/s² commanded, RMS error {report['rms_error']:.2f} m/s², "
+                 f"correlation {report['correlation']:.2f}")
+    return text
@@ -0,0 +1,205 @@
+"""
+P and S travel times from a precomputed distance × depth grid.
+
+The grid is computed once with obspy's TauP for a 1-D Earth model (iasp91 by
+default) by `python -m shakebot traveltimes --generate` and saved as an .npz
+file; after that a lookup is a binary search and a bilinear interpolation,
+vectorized over any number of event-station pairs and without obspy:
+
+    table = traveltimes.load_table()
+    p, s = table.arrivals(distance_km, depth_km)   # seconds after the origin time
+
+Each grid point holds the first arriving P-type (p, P, Pn, Pdiff, PKP, ...) and
+S-type phase. The distance axis is finer close to the source, where the
+curves bend most. The interpolation error is a fraction of a second, except
+for a few seconds beyond about 145° where the first arrival switches between
+core phases (`python -m shakebot traveltimes --check` measures it).
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DEFAULT_MODEL = "iasp91"
+DEFAULT_TABLE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "shakebot", "traveltimes")
+# Epicentral distances in degrees: 0.1° to 2°, 0.5° to 20°, then 1° to the antipode
+DEFAULT_DISTANCES = np.concatenate((np.arange(0.0, 2.0, 0.1), np.arange(2.0, 20.0, 0.5), np.arange(20.0, 180.5, 1.0)))
+DEFAULT_DEPTHS = np.array([0.0, 5.0, 10.0, 15.0, 20.0, 30.0, 40.0, 60.0, 80.0, 100.0, 150.0, 200.0, 250.0, 300.0, 400.0,
+                           500.0, 600.0, 700.0])  # km
+KM_PER_DEGREE = 6371.0 * np.pi / 180.0  # Great-circle km per degree on the mean-radius sphere
+
+_tables = {}  # Loaded tables by path, so repeated lookups do not read the file again
+
+
+def _compute_depth(model, depth_km, distances):
+    # One depth row of the grid; runs in a worker process
+    from obspy.taup import TauPyModel
+
+    taup = TauPyModel(model=model)
+    p = np.full(len(distances), np.nan)
+    s = np.full(len(distances), np.nan)
+    for i, distance in enumerate(distances):
+        for arrival in taup.get_travel_times(source_depth_in_km=depth_km, distance_in_degree=distance,
+                                             phase_list=["ttp", "tts"]):
+            # Arrivals come sorted by time, so the first of each kind is the first arrival
+            grid = p if arrival.name[0] in "Pp" else s
+            if np.isnan(grid[i]):
+                grid[i] = arrival.time
+    return p, s
+
+
+class TravelTimeTable:
+    """
+    First-arrival P and S travel times on a distance × depth grid.
+
+    Args:
+        distances (np.ndarray): Increasing epicentral distances in degrees.
+        depths (np.ndarray): Increasing source depths in km.
+        p, s (np.ndarray): (depths, distances) travel times in seconds; NaN where the phase does not arrive.
+        model (str): Name of the Earth model the times come from.
+    """
+
+    def __init__(self, distances, depths, p, s, model=DEFAULT_MODEL):
+        self.distances = np.asarray(distances, dtype=float)
+        self.depths = np.asarray(depths, dtype=float)
+        self.p = np.asarray(p, dtype=float)
+        self.s = np.asarray(s, dtype=float)
+        self.model = model
+
+    @classmethod
+    def generate(cls, model=DEFAULT_MODEL, distances=DEFAULT_DISTANCES, depths=DEFAULT_DEPTHS, workers=None,
+                 on_progress=None):
+        """
+        Compute the grid with obspy TauP, one depth per task in a process pool.
+
+        Takes about 25 ms per grid point on one core, so about three minutes for the
+        default grid; on_progress(done, total) is called as each depth row finishes.
+        """
+        distances = np.asarray(distances, dtype=float)
+        depths = np.asarray(depths, dtype=float)
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for row in pool.map(_compute_depth, [model] * len(depths), depths, [distances] * len(depths)):
+                rows.append(row)
+                if on_progress:
+                    on_progress(len(rows), len(depths))
+        return cls(distances, depths, np.array([p for p, _ in rows]), np.array([s for _, s in rows]), model)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["distances"], data["depths"], data["p"], data["s"], str(data["model"]))
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temporary, distances=self.distances, depths=self.depths, p=self.p, s=self.s, model=self.model)
+        os.replace(temporary, path)  # Atomic, so a concurrent load never sees a partial file
+
+    def _interpolate(self, grid, distance_km, depth_km):
+        # Bilinear interpolation; binary search for the cell on both (non-uniform) axes
+        distance = np.clip(np.asarray(distance_km, dtype=float) / KM_PER_DEGREE, self.distances[0],
+                           self.distances[-1])
+        depth = np.clip(np.asarray(depth_km, dtype=float), self.depths[0], self.depths[-1])
+        i = np.clip(np.searchsorted(self.distances, distance, side="right") - 1, 0, len(self.distances) - 2)
+        j = np.clip(np.searchsorted(self.depths, depth, side="right") - 1, 0, len(self.depths) - 2)
+        u = (distance - self.distances[i]) / (self.distances[i + 1] - self.distances[i])
+        v = (depth - self.depths[j]) / (self.depths[j + 1] - self.depths[j])
+        return ((1 - v) * ((1 - u) * grid[j, i] + u * grid[j, i + 1])
+                + v * ((1 - u) * grid[j + 1, i] + u * grid[j + 1, i + 1]))
+
+    def p_time(self, distance_km, depth_km=0.0):
+        """First P arrival in seconds after the origin time; arguments broadcast."""
+        return self._interpolate(self.p, distance_km, depth_km)
+
+    def s_time(self, distance_km, depth_km=0.0):
+        """First S arrival in seconds after the origin time; NaN where no S phase arrives."""
+        return self._interpolate(self.s, distance_km, depth_km)
+
+    def arrivals(self, distance_km, depth_km=0.0):
+        """
+        P and S arrivals for many pairs at once.
+
+        Args:
+            distance_km (np.ndarray): Epicentral distances in km.
+            depth_km (np.ndarray): Source depths in km (deeper than the grid clips to its last depth).
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: P and S travel times in seconds.
+        """
+        return self.p_time(distance_km, depth_km), self.s_time(distance_km, depth_km)
+
+    def windows(self, distance_km, depth_km, duration, padding=0.0):
+        """
+        Waveform windows that start `padding` seconds before the P arrival and
+        end `duration` seconds after it.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Start and end in seconds after the
+            origin time; the start is never before the origin.
+        """
+        p = self.p_time(distance_km, depth_km)
+        return np.maximum(p - padding, 0.0), p + duration
+
+
+def table_path(model=DEFAULT_MODEL, directory=DEFAULT_TABLE_DIR):
+    return os.path.join(directory, f"{model}.npz")
+
+
+def load_table(model=DEFAULT_MODEL, path=None):
+    """
+    Travel-time table for `model`, as saved by `python -m shakebot traveltimes --generate`.
+
+    The table is never computed here: that takes minutes, and callers such as
+    the GUI must not stall on it.
+
+    Args:
+        model (str): TauP model name.
+        path (str): Table file (default: ~/.cache/shakebot/traveltimes/<model>.npz).
+
+    Returns:
+        TravelTimeTable: The table; later calls return the same object.
+
+    Raises:
+        FileNotFoundError: The table has not been generated yet.
+    """
+    path = path or table_path(model)
+    if path not in _tables:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No {model} travel-time table at {path}; generate it first with "
+                                    f"'python -m shakebot traveltimes --generate --model {model}'.")
+        _tables[path] = TravelTimeTable.load(path)
+    return _tables[path]
+
+
+def check_table(table, samples=200, seed=0):
+    """
+    Compare interpolated times with TauP at random distances and depths between the grid points.
+
+    Returns:
+        dict: "p_max_error" and "s_max_error" in seconds, and "seconds_per_lookup"
+        for a vectorized lookup of `samples` pairs.
+    """
+    from obspy.taup import TauPyModel
+
+    rng = np.random.default_rng(seed)
+    distances = rng.uniform(table.distances[0], table.distances[-1], samples)
+    depths = rng.uniform(table.depths[0], table.depths[-1], samples)
+    start = time.perf_counter()
+    p, s = table.arrivals(distances * KM_PER_DEGREE, depths)
+    elapsed = time.perf_counter() - start
+
+    taup = TauPyModel(model=table.model)
+    p_error, s_error = [], []
+    for distance, depth, p_table, s_table in zip(distances, depths, p, s):
+        arrivals = taup.get_travel_times(source_depth_in_km=depth, distance_in_degree=distance,
+                                         phase_list=["ttp", "tts"])
+        p_exact = next((arrival.time for arrival in arrivals if arrival.name[0] in "Pp"), np.nan)
+        s_exact = next((arrival.time for arrival in arrivals if arrival.name[0] in "Ss"), np.nan)
+        p_error.append(abs(p_table - p_exact))
+        s_error.append(abs(s_table - s_exact))
+    return {"p_max_error": float(np.nanmax(p_error)), "s_max_error": float(np.nanmax(s_error)),
+            "seconds_per_lookup": elapsed / samples}
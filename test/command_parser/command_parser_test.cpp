@@ -0,0 +1,308 @@
+// Host tests and benchmark of the firmware's command parser (arduino/libraries/CommandParser).
+//
+//   make -C test/command_parser            build and run the tests
+//   make -C test/command_parser benchmark  also measure lines/s and frame samples/s
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <vector>
+
+#include "CommandParser.h"
+
+static int failures = 0;
+
+#define CHECK(condition)                                                  \
+  do {                                                                    \
+    if (!(condition)) {                                                   \
+      std::printf("%s:%d: CHECK failed: %s\n", __FILE__, __LINE__, #condition); \
+      failures++;                                                         \
+    }                                                                     \
+  } while (0)
+
+// Feed `text` and return the commands it completed, NONE excluded
+static std::vector<CommandType> feedAll(CommandParser &parser, const std::string &text, unsigned long now = 0) {
+  std::vector<CommandType> commands;
+  for (unsigned char byte : text) {
+    CommandType command = parser.feed(byte, now);
+    if (command != COMMAND_NONE) {
+      commands.push_back(command);
+    }
+  }
+  return commands;
+}
+
+// Feed one line and return the single command it completed
+static CommandType feedLine(CommandParser &parser, const std::string &line) {
+  std::vector<CommandType> commands = feedAll(parser, line);
+  return commands.size() == 1 ? commands[0] : COMMAND_NONE;
+}
+
+static void putLittleEndian(std::string &buffer, unsigned long value, int length) {
+  for (int i = 0; i < length; i++) {
+    buffer.push_back((char)((value >> (8 * i)) & 0xFF));
+  }
+}
+
+// Binary step frame as written by shakebot.protocol.encode_frame()
+static std::string encodeFrame(const std::vector<long> &steps, unsigned long offset, bool delta) {
+  std::string frame;
+  frame.push_back((char)FRAME_SYNC_0);
+  frame.push_back((char)FRAME_SYNC_1);
+  frame.push_back((char)(delta ? FRAME_DELTA16 : FRAME_INT32));
+  putLittleEndian(frame, offset, 4);
+  putLittleEndian(frame, steps.size(), 2);
+  for (size_t i = 0; i < steps.size(); i++) {
+    if (delta && i > 0) {
+      putLittleEndian(frame, (unsigned long)(steps[i] - steps[i - 1]), 2);
+    } else {
+      putLittleEndian(frame, (unsigned long)steps[i], 4);
+    }
+  }
+  uint16_t crc = crc16Update(0xFFFF, (const uint8_t *)frame.data() + 2, frame.size() - 2);
+  putLittleEndian(frame, crc, 2);
+  return frame;
+}
+
+static void testStepLines() {
+  CommandParser parser;
+  CHECK(feedLine(parser, "123\n") == COMMAND_STEP && parser.value() == 123);
+  CHECK(feedLine(parser, "-4500\n") == COMMAND_STEP && parser.value() == -4500);
+  CHECK(feedLine(parser, "+7\r\n") == COMMAND_STEP && parser.value() == 7);
+  CHECK(feedLine(parser, "0\n") == COMMAND_STEP && parser.value() == 0);
+  CHECK(feedLine(parser, "2147483647\n") == COMMAND_STEP && parser.value() == 2147483647L);
+  CHECK(feedLine(parser, "12a\n") == COMMAND_UNKNOWN && std::strcmp(parser.line(), "12a") == 0);
+  CHECK(feedLine(parser, "-\n") == COMMAND_UNKNOWN);
+  CHECK(feedAll(parser, "\n\r\n").empty());  // Empty lines are ignored
+}
+
+static void testCommands() {
+  CommandParser parser;
+  CHECK(feedLine(parser, "START\n") == COMMAND_START);
+  CHECK(feedLine(parser, "CANCEL\n") == COMMAND_CANCEL);
+  CHECK(feedLine(parser, "ARM\n") == COMMAND_ARM);
+  CHECK(feedLine(parser, "STREAM\n") == COMMAND_STREAM);
+  CHECK(feedLine(parser, "STREAM_END\n") == COMMAND_STREAM_END);
+  CHECK(feedLine(parser, "STATS\n") == COMMAND_STATS);
+  CHECK(feedLine(parser, "SET_DISPLACEMENT\n") == COMMAND_SET_DISPLACEMENT);
+  CHECK(feedLine(parser, "CALIBRATE_DISPLACEMENT\r\n") == COMMAND_CALIBRATE_DISPLACEMENT);
+  CHECK(feedLine(parser, "STARTED\n") == COMMAND_UNKNOWN);
+  CHECK(feedLine(parser, "SET_SOMETHING\n") == COMMAND_UNKNOWN);
+  CHECK(feedLine(parser, "BR:115200\n") == COMMAND_BAUD_RATE && parser.value() == 115200);
+  CHECK(feedLine(parser, "BR:fast\n") == COMMAND_BAUD_RATE && parser.value() == 0);
+
+  // A line split over several reads completes on its newline only
+  CHECK(feedAll(parser, "STA").empty());
+  CHECK(feedLine(parser, "RT\n") == COMMAND_START);
+}
+
+static void testFields() {
+  CommandParser parser;
+  CHECK(feedLine(parser, "SET_PARAMS pulsePerRev=200 maxRPM=1200 lead=0.02 maxAcceleration=5.1 "
+                         "totalLength=0.6\n") == COMMAND_SET_PARAMS);
+  long pulsePerRev = 0;
+  float lead = 0, maxAcceleration = 0, missing = 3;
+  CHECK(parser.fieldLong("pulsePerRev", pulsePerRev) && pulsePerRev == 200);
+  CHECK(parser.fieldFloat("lead", lead) && lead == 0.02f);
+  CHECK(parser.fieldFloat("maxAcceleration", maxAcceleration) && maxAcceleration == 5.1f);
+  CHECK(!parser.fieldFloat("rate", missing) && missing == 3);
+  CHECK(parser.field("Length") == NULL);  // Only whole keys match
+
+  CHECK(feedLine(parser, "SET_PLAYBACK sampleRate=200 interpolation=cubic controlRate=1e3\n") == COMMAND_SET_PLAYBACK);
+  float sampleRate = 0, controlRate = 0;
+  CHECK(parser.fieldFloat("sampleRate", sampleRate) && sampleRate == 200);
+  CHECK(parser.fieldFloat("controlRate", controlRate) && controlRate == 1000);
+  CHECK(parser.fieldIs("interpolation", "cubic"));
+  CHECK(!parser.fieldIs("interpolation", "cub"));
+
+  CHECK(feedLine(parser, "SET_TELEMETRY rate=abc\n") == COMMAND_SET_TELEMETRY);
+  float rate = -1;
+  CHECK(parser.fieldFloat("rate", rate) && rate == 0);  // Like String::toFloat()
+
+  CHECK(parseFloat("-1.25") == -1.25f);
+  CHECK(std::fabs(parseFloat("2.5e-3") - 0.0025f) < 1e-9f);
+  CHECK(parseLong("-42 steps") == -42);
+}
+
+static void testLongLines() {
+  CommandParser parser;
+  std::string line(COMMAND_LINE_SIZE * 2, '1');
+  CHECK(feedLine(parser, line + "\n") == COMMAND_TOO_LONG);
+  CHECK(feedLine(parser, "START\n") == COMMAND_START);
+  std::string longest(COMMAND_LINE_SIZE - 1, '2');
+  CHECK(feedLine(parser, longest + "\n") == COMMAND_STEP);
+}
+
+static void testFrames() {
+  CommandParser parser;
+  std::vector<long> steps = {100, -200, 300, 30000, -70000};
+  for (bool delta : {false, true}) {
+    std::vector<long> expected = delta ? std::vector<long>{5, 4, -3, 1000, 1001} : steps;
+    std::string frame = encodeFrame(expected, 40, delta);
+    std::vector<long> values;
+    bool started = false, ended = false;
+    for (unsigned char byte : frame) {
+      switch (parser.feed(byte, 0)) {
+        case COMMAND_FRAME_START:
+          started = parser.frameOffset() == 40 && parser.frameCount() == expected.size();
+          break;
+        case COMMAND_FRAME_VALUE:
+          CHECK(parser.frameIndex() == values.size());
+          values.push_back(parser.value());
+          break;
+        case COMMAND_FRAME_END:
+          ended = true;
+          break;
+        case COMMAND_NONE:
+          break;
+        default:
+          CHECK(false);
+      }
+    }
+    CHECK(started && ended && values == expected);
+    CHECK(feedLine(parser, "START\n") == COMMAND_START);  // Back to text after the frame
+  }
+
+  // Empty frame: header, then the CRC
+  std::vector<CommandType> commands = feedAll(parser, encodeFrame({}, 0, false));
+  CHECK(commands.size() == 2 && commands[0] == COMMAND_FRAME_START && commands[1] == COMMAND_FRAME_END);
+
+  // Corrupted payload
+  std::string frame = encodeFrame(steps, 0, false);
+  frame[12] ^= 0x01;
+  commands = feedAll(parser, frame);
+  CHECK(!commands.empty() && commands.back() == COMMAND_FRAME_ERROR && std::strcmp(parser.frameError(), "CRC") == 0);
+
+  // Wrong second sync byte
+  frame = encodeFrame(steps, 0, false);
+  frame[1] = 0x00;
+  commands = feedAll(parser, frame.substr(0, FRAME_HEADER_SIZE));
+  CHECK(commands.size() == 1 && commands[0] == COMMAND_FRAME_ERROR && std::strcmp(parser.frameError(), "SYNC") == 0);
+
+  // Unknown type: everything pending is dropped, then text is parsed again
+  frame = encodeFrame(steps, 0, false);
+  frame[2] = 0x07;
+  commands = feedAll(parser, frame + "12\n");
+  CHECK(commands.size() == 1 && std::strcmp(parser.frameError(), "TYPE") == 0);
+  CHECK(parser.poll(0) == COMMAND_NONE);
+  CHECK(feedLine(parser, "12\n") == COMMAND_STEP);
+
+  // Bytes that stop arriving time out after FRAME_TIMEOUT_MS
+  frame = encodeFrame(steps, 0, false);
+  feedAll(parser, frame.substr(0, 15), 1000);
+  CHECK(parser.poll(1000 + FRAME_TIMEOUT_MS) == COMMAND_NONE);
+  CHECK(parser.poll(1001 + FRAME_TIMEOUT_MS) == COMMAND_FRAME_ERROR);
+  CHECK(std::strcmp(parser.frameError(), "TIMEOUT") == 0);
+  CHECK(feedLine(parser, "ARM\n") == COMMAND_ARM);
+
+  // A sync byte ends a partial text line
+  commands = feedAll(parser, "garbage" + encodeFrame(steps, 0, true));
+  CHECK(commands.size() == steps.size() + 2 && commands.back() == COMMAND_FRAME_END);
+}
+
+static void testCrc() {
+  const char *check = "123456789";
+  CHECK(crc16Update(0xFFFF, (const uint8_t *)check, 9) == 0x29B1);  // CRC-16/CCITT-FALSE check value
+}
+
+// Throughput of feed() over `input`, repeated until at least a second has passed
+static void benchmark(const char *name, const std::string &input, size_t items, const char *unit) {
+  CommandParser parser;
+  size_t repeats = 0;
+  unsigned long checksum = 0;
+  auto start = std::chrono::steady_clock::now();
+  double seconds = 0;
+  while (seconds < 1.0) {
+    for (unsigned char byte : input) {
+      if (parser.feed(byte, 0) != COMMAND_NONE) {
+        checksum += parser.value();
+      }
+    }
+    repeats++;
+    seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+  }
+  std::printf("%-24s %12.0f %s/s %10.1f MB/s  (checksum %lu)\n", name, repeats * items / seconds, unit,
+              repeats * input.size() / seconds / 1e6, checksum);
+}
+
+// The dispatch the firmware used before the parser, with std::string standing in for Arduino's String:
+// a heap-allocated copy of every line, compared against each command in turn, then toInt()
+static void benchmarkStringDispatch(const char *name, const std::string &input, size_t items) {
+  const char *prefixes[] = {"BR:", "SET_PARAMS", "SET_PLAYBACK", "SET_TELEMETRY"};
+  const char *commands[] = {"STREAM", "STREAM_END", "ARM", "START", "CANCEL", "STATS", "SET_DISPLACEMENT",
+                            "CALIBRATE_DISPLACEMENT"};
+  size_t repeats = 0;
+  unsigned long checksum = 0;
+  auto start = std::chrono::steady_clock::now();
+  double seconds = 0;
+  while (seconds < 1.0) {
+    size_t begin = 0;
+    while (begin < input.size()) {
+      size_t end = input.find('\n', begin);
+      std::string command = input.substr(begin, end - begin);  // readStringUntil('\n')
+      begin = end + 1;
+      bool matched = false;
+      for (const char *prefix : prefixes) {
+        matched = matched || command.compare(0, std::strlen(prefix), prefix) == 0;
+      }
+      for (const char *text : commands) {
+        matched = matched || command == text;
+      }
+      if (!matched) {
+        checksum += std::atol(command.c_str());
+      }
+    }
+    repeats++;
+    seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count();
+  }
+  std::printf("%-24s %12.0f lines/s %10.1f MB/s  (checksum %lu)\n", name, repeats * items / seconds,
+              repeats * input.size() / seconds / 1e6, checksum);
+}
+
+static void runBenchmarks() {
+  std::string lines;
+  for (int i = 0; i < 10000; i++) {
+    lines += std::to_string((i * 7919) % 60000 - 30000) + "\n";
+  }
+  benchmark("step lines", lines, 10000, "lines");
+  benchmarkStringDispatch("step lines (String)", lines, 10000);
+
+  std::string commands;
+  const char *mixed[] = {"SET_PARAMS pulsePerRev=200 maxRPM=1200 lead=0.02 maxAcceleration=5.1 totalLength=0.6\n",
+                         "SET_PLAYBACK sampleRate=100 interpolation=cubic controlRate=1000\n", "ARM\n", "START\n",
+                         "STATS\n", "CANCEL\n", "BR:250000\n", "SET_DISPLACEMENT\n"};
+  for (int i = 0; i < 1000; i++) {
+    commands += mixed[i % 8];
+  }
+  benchmark("command lines", commands, 1000, "lines");
+
+  std::string frames;
+  for (int i = 0; i < 100; i++) {
+    std::vector<long> frame(100);
+    for (int j = 0; j < 100; j++) {
+      frame[j] = (long)(3000 * std::sin((i * 100 + j) * 0.01));
+    }
+    frames += encodeFrame(frame, i * 100, true);
+  }
+  benchmark("delta16 frames", frames, 10000, "samples");
+}
+
+int main(int argc, char **argv) {
+  testStepLines();
+  testCommands();
+  testFields();
+  testLongLines();
+  testFrames();
+  testCrc();
+  if (failures) {
+    std::printf("%d check(s) failed\n", failures);
+    return 1;
+  }
+  std::printf("All command parser tests passed\n");
+  if (argc > 1 && std::strcmp(argv[1], "--benchmark") == 0) {
+    runBenchmarks();
+  }
+  return 0;
+}
@@ -0,0 +1,35 @@
+"""
+Fixtures shared by the tests: firmware simulators running in the background
+and a Shakebot connected to one through FakeSerial.
+"""
+import pytest
+
+from shakebot.device import Shakebot
+from shakebot.simulator import FakeSerial, FirmwareSimulator
+
+SPEEDUP = 10.0  # Simulated seconds per wall-clock second
+
+
+@pytest.fixture
+def simulator():
+    """Started Due simulator; stopped after the test."""
+    sim = FirmwareSimulator(board="due", speedup=SPEEDUP).start()
+    yield sim
+    sim.stop()
+
+
+@pytest.fixture
+def simulators():
+    """Three started Due simulators, for several tables driven together."""
+    sims = [FirmwareSimulator(board="due", speedup=SPEEDUP).start() for _ in range(3)]
+    yield sims
+    for sim in sims:
+        sim.stop()
+
+
+@pytest.fixture
+def table(simulator):
+    """Shakebot talking to `simulator`, with the table parameters already sent."""
+    bot = Shakebot(FakeSerial(simulator, timeout=0.1), board="due")
+    bot.send_parameters()
+    return bot
@@ -0,0 +1,105 @@
+"""
+Commanded-versus-achieved analysis on synthetic runs with known answers.
+"""
+import numpy as np
+import pytest
+from scipy import signal
+
+from shakebot import analysis
+
+SAMPLE_RATE = 100.0
+
+
+def band_limited(samples, low, high, seed):
+    # Zero-phase band-passed white noise
+    sos = signal.butter(4, [low, high], btype="band", fs=SAMPLE_RATE, output="sos")
+    return signal.sosfiltfilt(sos, np.random.default_rng(seed).standard_normal(samples))
+
+
+def record(samples=1500, seed=2):
+    time = np.arange(samples) / SAMPLE_RATE
+    return np.column_stack((time, 0.01 * band_limited(samples, 0.2, 8.0, seed)))
+
+
+def test_align_recovers_a_known_delay():
+    data = record()
+    # The response lags by a fraction of a sample and is logged at 400 Hz, like telemetry
+    delay = 0.1234
+    time = np.arange(0.0, data[-1, 0] + 0.5, 1 / 400.0)
+    response = np.interp(time - delay, data[:, 0], data[:, 1], left=0.0)
+
+    target, aligned, found = analysis.align(data, time, response)
+    assert found == pytest.approx(delay, abs=0.1 / SAMPLE_RATE)
+    np.testing.assert_array_equal(target, data[:, 1])
+    inner = slice(50, -50)  # Away from the zero-filled start
+    assert np.abs(aligned - target)[inner].max() < 0.01 * np.abs(target).max()
+
+
+def test_identical_response_has_unit_gain_and_coherence():
+    commands = [record(), record(1000, seed=3)]
+    responses = [(data[:, 0], data[:, 1]) for data in commands]
+    result = analysis.analyze_runs(commands, responses, band=(0.5, 5.0))
+
+    np.testing.assert_allclose(result["delay"], 0.0, atol=1e-12)
+    np.testing.assert_allclose(result["rms_error"], 0.0, atol=1e-15)
+    in_band = (result["frequencies"] > 0.3) & (result["frequencies"] < 8.0)
+    np.testing.assert_allclose(np.abs(result["transfer"][:, in_band]), 1.0, atol=1e-9)
+    np.testing.assert_allclose(np.angle(result["transfer"][:, in_band]), 0.0, atol=1e-9)
+    np.testing.assert_allclose(result["coherence"][:, in_band], 1.0, atol=1e-9)
+    np.testing.assert_allclose(result["psa_achieved"], result["psa_target"])
+    assert result["qualified"].all()
+
+
+@pytest.mark.parametrize("period, tolerance", [(0.1, 0.05), (0.2, 0.01), (0.5, 0.01), (1.0, 0.01), (2.0, 0.01)])
+def test_response_spectrum_matches_a_time_domain_oscillator(period, tolerance):
+    acceleration = band_limited(2000, 0.3, 15.0, seed=1)
+    psa = analysis.response_spectrum(acceleration, SAMPLE_RATE, [period])[0]
+
+    # u'' + 2ζωu' + ω²u = -a, integrated by lsim (linear between samples) past the end of the record
+    omega = 2 * np.pi / period
+    damping = analysis.DEFAULT_DAMPING
+    padded = np.concatenate((acceleration, np.zeros(3000)))
+    _, displacement, _ = signal.lsim(([-1.0], [1.0, 2 * damping * omega, omega**2]), padded,
+                                     np.arange(len(padded)) / SAMPLE_RATE)
+    # The FFT solution treats the record as band-limited; the linear interpolation differs most at short periods
+    assert psa == pytest.approx(omega**2 * np.abs(displacement).max(), rel=tolerance)
+
+
+def test_response_spectrum_of_many_runs():
+    runs = np.stack([band_limited(800, 0.3, 15.0, seed) for seed in range(3)])
+    periods = [0.1, 0.5, 2.0]
+    together = analysis.response_spectrum(runs, SAMPLE_RATE, periods)
+    assert together.shape == (3, 3)
+    for row, acceleration in zip(together, runs):
+        np.testing.assert_allclose(row, analysis.response_spectrum(acceleration, SAMPLE_RATE, periods))
+
+
+def synthetic_result(gain_db, coherence, psa_ratio):
+    # An analyze_runs() result with a flat transfer function, one run per entry
+    frequencies = np.linspace(0.0, 10.0, 21)
+    periods = np.array([0.15, 0.5, 1.5])
+    gain_db, coherence, psa_ratio = (np.atleast_1d(np.asarray(value, dtype=float))
+                                     for value in (gain_db, coherence, psa_ratio))
+    shape = (len(gain_db), len(frequencies))
+    return {"frequencies": frequencies, "periods": periods,
+            "transfer": np.broadcast_to((10 ** (gain_db / 20))[:, None], shape).astype(complex),
+            "coherence": np.broadcast_to(coherence[:, None], shape),
+            "psa_target": np.ones((len(gain_db), len(periods))),
+            "psa_achieved": np.broadcast_to(psa_ratio[:, None], (len(gain_db), len(periods)))}
+
+
+def test_qualify_at_the_tolerances():
+    # Each run is just inside or just outside one default tolerance (1 dB, coherence 0.9, PSA 20 %)
+    result = synthetic_result(gain_db=[0.9, 1.1, -1.1, 0.0, 0.0, 0.0, 0.0],
+                              coherence=[0.95, 0.95, 0.95, 0.91, 0.89, 0.95, 0.95],
+                              psa_ratio=[1.0, 1.0, 1.0, 1.0, 1.0, 1.19, 0.79])
+    verdict = analysis.qualify(result, (1.0, 5.0))
+    assert verdict["qualified"].tolist() == [True, False, False, True, False, True, False]
+    np.testing.assert_allclose(verdict["gain_error_db"], [0.9, 1.1, 1.1, 0, 0, 0, 0], atol=1e-12)
+    np.testing.assert_allclose(verdict["psa_error"], [0, 0, 0, 0, 0, 0.19, 0.21], atol=1e-12)
+
+    strict = analysis.qualify(result, (1.0, 5.0), gain_tolerance_db=0.5, min_coherence=0.92, psa_tolerance=0.1)
+    assert strict["qualified"].tolist() == [False, False, False, False, False, False, False]
+
+    with pytest.raises(ValueError, match="widen"):
+        analysis.qualify(result, (7.2, 7.3))
@@ -0,0 +1,118 @@
+"""
+Experiment archive: run files round-tripped through the HDF5 datasets and the SQLite index.
+"""
+import itertools
+import time
+import types
+
+import numpy as np
+import pytest
+
+from shakebot import archive as archive_module
+from shakebot.archive import Archive
+from shakebot.telemetry import SAMPLE_DTYPE
+
+pytest.importorskip("h5py")
+
+SAMPLE_RATE = 100.0
+
+
+def sine_record(amplitude, frequency=1.0, seconds=2.0):
+    time = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return np.column_stack((time, amplitude * np.sin(2 * np.pi * frequency * time)))
+
+
+def telemetry_samples(count, start=0):
+    samples = np.zeros(count, dtype=SAMPLE_DTYPE)
+    samples["time_us"] = (start + np.arange(count)) * 2500
+    samples["index"] = start + np.arange(count)
+    return samples
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Advance the archive's clock by one second per call, so run order never depends on timer resolution."""
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(archive_module, "time", types.SimpleNamespace(time=lambda: float(next(ticks)),
+                                                                      perf_counter=time.perf_counter))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = Archive(str(tmp_path / "archive"))
+    yield archive
+    archive.close()
+
+
+def test_run_round_trip(archive):
+    command = sine_record(0.01)
+    steps = np.round(command[:, 1] / 0.02 * 200).astype(np.int64)
+    run = archive.start_run(command, steps, table_name="table1", board="due", parameters={"lead": 0.02},
+                            source="sine", metadata={"event_id": "ev1", "magnitude": 6.5, "note": "test"})
+    run.log("Start executing displacement data.")
+    run.append("telemetry", telemetry_samples(100))
+    run.append("telemetry", telemetry_samples(50, start=100))
+    run.log(["Motion completed in 2000 milliseconds.", "bin\x00ary"])
+    run.finish("done", "Motion completed in 2000 milliseconds.", measured_pga=0.4)
+
+    data = archive.load(run.id)
+    np.testing.assert_array_equal(data["command"], command)
+    np.testing.assert_array_equal(data["steps"], steps)
+    assert data["telemetry"].dtype == SAMPLE_DTYPE
+    np.testing.assert_array_equal(data["telemetry"]["index"], np.arange(150))
+    assert data["serial"] == ["Start executing displacement data.", "Motion completed in 2000 milliseconds.",
+                              "binary"]
+    assert len(data["serial_time"]) == 3 and np.all(np.diff(data["serial_time"]) >= 0)
+    assert data["attributes"]["status"] == "done"
+    assert data["attributes"]["run_id"] == run.id
+
+    (row,) = archive.find()
+    assert row["status"] == "done"
+    assert row["table_name"] == "table1"
+    assert row["samples"] == len(command)
+    assert row["sample_rate"] == pytest.approx(SAMPLE_RATE)
+    assert row["telemetry_samples"] == 150
+    assert row["measured_pga"] == 0.4
+    assert row["event_id"] == "ev1" and row["magnitude"] == 6.5
+    assert row["parameters"] == {"lead": 0.02}
+    assert row["metadata"]["note"] == "test"
+    # The commanded peaks of a sine: A, 2πfA and (2πf)²A, up to the finite differences
+    assert row["pgd"] == pytest.approx(0.01, rel=1e-3)
+    assert row["pgv"] == pytest.approx(2 * np.pi * 0.01, rel=1e-2)
+    assert row["pga"] == pytest.approx((2 * np.pi) ** 2 * 0.01, rel=1e-2)
+
+
+def test_find_filters(archive):
+    # Peak accelerations of about 0.4, 1.6 and 3.9 m/s² on two tables
+    for table_name, amplitude in (("table1", 0.01), ("table2", 0.04), ("table1", 0.1)):
+        archive.start_run(sine_record(amplitude), table_name=table_name, source=f"sine {amplitude}").finish("done")
+    failed = archive.start_run(sine_record(0.04), table_name="table2")
+    failed.finish("failed", error="Timed out")
+
+    assert len(archive) == 4
+    assert [row["source"] for row in archive.find(table_name="table1")] == ["sine 0.01", "sine 0.1"]
+    assert [row["source"] for row in archive.find(min_pga=1.0)] == ["sine 0.04", "sine 0.1", None]
+    assert [row["source"] for row in archive.find(table_name="table1", min_pga=1.0)] == ["sine 0.1"]
+    assert [row["source"] for row in archive.find(max_pga=1.0)] == ["sine 0.01"]
+    assert [row["id"] for row in archive.find(status="failed")] == [failed.id]
+    assert archive.find(status="failed")[0]["error"] == "Timed out"
+    assert [row["source"] for row in archive.find(limit=2)] == ["sine 0.1", None]
+
+
+def test_finish_twice_keeps_the_first_outcome(archive):
+    run = archive.start_run(sine_record(0.01), table_name="table1")
+    run.append("telemetry", telemetry_samples(10))
+    run.finish("done", "Motion completed in 2000 milliseconds.")
+
+    # run_queue's error path finishes every run it started, including ones that already finished
+    run.finish("failed", error="later failure")
+    run.append("telemetry", telemetry_samples(10))
+    run.log("ignored")
+
+    (row,) = archive.find()
+    assert row["status"] == "done"
+    assert row["error"] is None
+    assert row["telemetry_samples"] == 10
+    data = archive.load(run.id)
+    assert len(data["telemetry"]) == 10
+    assert "serial" not in data
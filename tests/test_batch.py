@@ -0,0 +1,183 @@
+"""
+Batch preparation with a fake FDSN client, a synthetic travel-time table and one worker.
+"""
+import pickle
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+from obspy.core.inventory import Channel, Inventory, Network, Response, Station
+
+from shakebot import batch, iris, traveltimes
+from shakebot.cache import CachedClient, WaveformCache
+from shakebot.stations import StationIndex
+from shakebot.traveltimes import KM_PER_DEGREE, TravelTimeTable
+
+EVENTS = [
+    {"resource_id": "smi:local/event/1", "time": UTCDateTime("2024-01-01T00:00:00"), "latitude": 35.0,
+     "longitude": -106.0, "depth_km": 10.0, "magnitude": 6.1},
+    {"resource_id": "smi:local/event/2", "time": UTCDateTime("2024-02-01T00:00:00"), "latitude": 36.0,
+     "longitude": -107.0, "depth_km": 20.0, "magnitude": 6.4},
+]
+STATIONS = {("IU", "ANMO", "00"): (34.9, -106.5), ("IU", "TUC", "00"): (32.3, -110.8)}
+DURATION = 10.0
+P_VELOCITY = 8.0  # km/s of the synthetic travel-time table
+
+
+class FakeClient:
+    """Stands in for obspy.clients.fdsn.Client: flat-response BH1/BH2 stations and 20 Hz sine waveforms."""
+
+    def __init__(self):
+        self.requests = []
+
+    def get_stations(self, network, station, location, channel, starttime=None, endtime=None, level="station"):
+        self.requests.append(("stations", network, station, level))
+        if (network, station, location) not in STATIONS:
+            raise LookupError(f"No data for {network}.{station}.{location}")
+        latitude, longitude = STATIONS[network, station, location]
+        # Counts are acceleration times 1e6
+        response = Response.from_paz([], [], 1e6, input_units="M/S**2", output_units="COUNTS")
+        channels = [Channel(code, location, latitude, longitude, 0.0, 0.0, azimuth=azimuth, dip=0.0,
+                            sample_rate=20.0, start_date=UTCDateTime("2000-01-01"), response=response)
+                    for code, azimuth in zip(channel.split(","), (30.0, 120.0))]
+        return Inventory([Network(network, [Station(station, latitude, longitude, 0.0, channels=channels)])],
+                         source="fake")
+
+    def get_waveforms(self, network, station, location, channel, starttime, endtime, **kwargs):
+        self.requests.append(("waveforms", network, station))
+        samples = int((endtime - starttime) * 20) + 1
+        time = np.arange(samples) / 20.0
+        return Stream([Trace(data=1e6 * (k + 1) * np.sin(2 * np.pi * 0.5 * time),
+                             header={"network": network, "station": station, "location": location, "channel": code,
+                                     "starttime": starttime, "sampling_rate": 20.0})
+                       for k, code in enumerate(channel.split(","))])
+
+
+@pytest.fixture(autouse=True)
+def travel_times(monkeypatch):
+    """A P velocity of 8 km/s in place of the generated iasp91 table."""
+    distances = np.array([0.0, 10.0, 180.0])
+    depths = np.array([0.0, 700.0])
+    p = np.add.outer(depths, distances * KM_PER_DEGREE) / P_VELOCITY
+    table = TravelTimeTable(distances, depths, p, 1.8 * p, model="synthetic")
+    monkeypatch.setitem(traveltimes._tables, traveltimes.table_path(), table)
+    return table
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    """FakeClient behind a CachedClient on a temporary cache, as every batch worker gets one."""
+    fake = FakeClient()
+    monkeypatch.setattr(iris, "default_client",
+                        lambda offline=False, root=None: CachedClient(WaveformCache(str(tmp_path / "cache")), fake))
+    return fake
+
+
+def test_make_tasks():
+    stations = list(STATIONS)
+    tasks = batch.make_tasks(EVENTS, stations, DURATION)
+    assert len(tasks) == 4
+    assert [(task["event"]["resource_id"], task["station"]) for task in tasks] == [
+        ("smi:local/event/1", "ANMO"), ("smi:local/event/1", "TUC"),
+        ("smi:local/event/2", "ANMO"), ("smi:local/event/2", "TUC")]
+    assert tasks[0]["event"]["time"] == "2024-01-01T00:00:00.000000Z"
+    assert tasks[0]["channels"] == iris.HORIZONTAL_CHANNELS and tasks[0]["duration"] == DURATION
+    assert pickle.loads(pickle.dumps(tasks)) == tasks  # Sent to the worker processes
+    assert batch.parse_station("IU.ANMO") == ("IU", "ANMO", "00")
+    assert batch.parse_station("IU.ANMO.10") == ("IU", "ANMO", "10")
+    with pytest.raises(ValueError):
+        batch.parse_station("ANMO")
+
+
+def test_make_pair_tasks():
+    index = StationIndex([{"network": network, "station": station, "location": location, "channels": "BH1,BH2",
+                           "latitude": latitude, "longitude": longitude}
+                          for (network, station, location), (latitude, longitude) in STATIONS.items()])
+    pairs = index.pairs(EVENTS, max_km=150.0)
+    tasks = batch.make_pair_tasks(EVENTS, index, pairs, DURATION)
+    # ANMO is within 150 km of both events, TUC of neither
+    assert [(task["event"]["resource_id"], task["network"], task["station"], task["location"]) for task in tasks] == [
+        ("smi:local/event/1", "IU", "ANMO", "00"), ("smi:local/event/2", "IU", "ANMO", "00")]
+
+
+def test_prepare_task_captures_errors(fake):
+    client = iris.default_client()
+    good, bad = batch.make_tasks(EVENTS[:1], [("IU", "ANMO", "00"), ("XX", "BAD", "00")], DURATION)
+
+    result = batch.prepare_task(good, client)
+    assert result["error"] is None
+    assert set(result["records"]) == {"BH1", "BH2"}
+    assert result["orientations"] == {"BH1": (30.0, 0.0), "BH2": (120.0, 0.0)}
+    assert result["timings"]["waveforms"] > 0 and result["seconds"] > 0
+
+    result = batch.prepare_task(bad, client)
+    assert result["error"] == "LookupError: No data for XX.BAD.00"
+    assert result["records"] == {}
+    assert result["station"] == "BAD"
+    client.cache.close()
+
+
+def test_run_batch_in_process(fake):
+    tasks = batch.make_tasks(EVENTS, list(STATIONS) + [("XX", "BAD", "00")], DURATION)
+    progress = []
+    results = batch.run_batch(tasks, workers=1, on_progress=lambda done, total, result: progress.append((done, total)))
+    assert progress == [(i, 6) for i in range(1, 7)]
+    assert sum(result["error"] is None for result in results) == 4
+
+    for result in results:
+        if result["error"]:
+            continue
+        assert result["station"] in ("ANMO", "TUC")
+        for record in result["records"].values():
+            # Trimmed to DURATION seconds from the P arrival of the synthetic table, at 100 Hz
+            assert record[0, 0] == pytest.approx(0.0, abs=0.01)
+            assert len(record) == pytest.approx(DURATION * iris.TARGET_SAMPLING_RATE + 1, abs=1)
+
+    # A second batch on the same cache reads the processed arrays without a download
+    downloads = sum(request[0] == "waveforms" for request in fake.requests)
+    again = batch.run_batch(tasks, workers=1)
+    assert sum(request[0] == "waveforms" for request in fake.requests) == downloads
+    for first, second in zip(results, again):
+        for channel, record in first["records"].items():
+            np.testing.assert_array_equal(second["records"][channel], record)
+
+
+def test_run_batch_needs_the_travel_time_table(fake, monkeypatch, tmp_path):
+    monkeypatch.setattr(traveltimes, "_tables", {})
+    monkeypatch.setattr(traveltimes, "table_path", lambda model: str(tmp_path / f"{model}.npz"))
+    with pytest.raises(FileNotFoundError, match="--generate"):
+        batch.run_batch(batch.make_tasks(EVENTS, list(STATIONS), DURATION), workers=1)
+    assert fake.requests == []
+
+
+def test_summarize_timings():
+    results = [{"timings": {"waveforms": 1.0, "remove_response": 0.5}, "seconds": 2.0},
+               {"timings": {"waveforms": 0.5, "custom": 0.25}, "seconds": 1.0},
+               {"timings": {}, "seconds": 0.1}]
+    totals = batch.summarize_timings(results)
+    assert totals["waveforms"] == 1.5 and totals["remove_response"] == 0.5 and totals["custom"] == 0.25
+    assert totals["trim"] == 0.0  # Stages that never ran
+    assert set(batch.STAGES) <= set(totals)
+    assert totals["total"] == pytest.approx(3.1)
+
+
+def test_parquet_round_trip(fake, tmp_path):
+    pytest.importorskip("pyarrow")
+    client = iris.default_client()
+    results = [batch.prepare_task(task, client)
+               for task in batch.make_tasks(EVENTS, [("IU", "ANMO", "00"), ("XX", "BAD", "00")], DURATION)]
+    client.cache.close()
+    path = str(tmp_path / "records.parquet")
+
+    assert batch.write_parquet(path, results) == 4  # Two channels of two events; the failures are left out
+    rows = batch.load_parquet(path)
+    assert [(row["event_id"], row["channel"]) for row in rows] == [
+        ("smi:local/event/1", "BH1"), ("smi:local/event/1", "BH2"),
+        ("smi:local/event/2", "BH1"), ("smi:local/event/2", "BH2")]
+    for row, (result, channel) in zip(rows, [(results[0], "BH1"), (results[0], "BH2"),
+                                             (results[2], "BH1"), (results[2], "BH2")]):
+        np.testing.assert_allclose(row["displacement"], result["records"][channel], atol=1e-9)
+        assert row["channel_azimuth"] == result["orientations"][channel][0]
+        assert row["distance_km"] == result["distance_km"]
+        assert row["event_time"] == result["event"]["time"]
+        assert row["magnitude"] == result["event"]["magnitude"]
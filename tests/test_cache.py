@@ -0,0 +1,91 @@
+"""
+CachedClient and WaveformCache with a fake FDSN client.
+"""
+import itertools
+import types
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+from shakebot import cache as cache_module
+from shakebot.cache import CachedClient, CacheMiss, WaveformCache
+
+START = UTCDateTime("2024-01-01T00:00:00")
+
+
+class FakeClient:
+    """Stands in for obspy.clients.fdsn.Client and counts its downloads."""
+
+    def __init__(self):
+        self.requests = []
+
+    def get_waveforms(self, network, station, location, channel, starttime, endtime, **kwargs):
+        self.requests.append((network, station, location, channel, starttime, endtime))
+        samples = int((endtime - starttime) * 20)
+        data = np.arange(samples, dtype=np.int32) + len(self.requests)
+        header = {"network": network, "station": station, "location": location, "channel": channel,
+                  "starttime": starttime, "sampling_rate": 20.0}
+        return Stream([Trace(data=data, header=header)])
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Advance the cache's clock by one second per call, so LRU order never depends on timer resolution."""
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(cache_module, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def fetch(client, station, seconds=60):
+    return client.get_waveforms("IU", station, "00", "BHZ", START, START + seconds)
+
+
+def test_hit_skips_download(tmp_path):
+    fake = FakeClient()
+    client = CachedClient(WaveformCache(str(tmp_path)), client=fake)
+
+    first = fetch(client, "ANMO")
+    second = fetch(client, "ANMO")
+
+    assert len(fake.requests) == 1
+    np.testing.assert_array_equal(first[0].data, second[0].data)
+    assert second[0].stats.station == "ANMO"
+
+    fetch(client, "ANMO", seconds=30)  # Different time window: a different entry
+    assert len(fake.requests) == 2
+
+
+def test_lru_eviction(tmp_path):
+    fake = FakeClient()
+    cache = WaveformCache(str(tmp_path))
+    client = CachedClient(cache, client=fake)
+    for station in ("A", "B", "C"):
+        fetch(client, station)
+    entry_size = cache.size() // 3
+
+    fetch(client, "A")  # A becomes the most recently used entry
+    cache.max_bytes = 3 * entry_size
+    fetch(client, "D")  # Over the limit: B, the least recently used entry, goes
+
+    assert len(fake.requests) == 4
+    stations = {row[0] for row in cache.db.execute("SELECT station FROM entries")}
+    assert stations == {"A", "C", "D"}
+    assert cache.size() <= cache.max_bytes
+
+    fetch(client, "A")
+    assert len(fake.requests) == 4
+    fetch(client, "B")
+    assert len(fake.requests) == 5
+
+
+def test_offline_miss_raises(tmp_path):
+    fake = FakeClient()
+    cache = WaveformCache(str(tmp_path))
+    fetch(CachedClient(cache, client=fake), "ANMO")
+
+    cache.offline = True
+    client = CachedClient(cache, client=fake)
+    assert fetch(client, "ANMO")[0].stats.station == "ANMO"
+    with pytest.raises(CacheMiss):
+        fetch(client, "COLA")
+    assert len(fake.requests) == 1
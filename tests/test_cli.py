@@ -0,0 +1,98 @@
+"""
+Command line: help and argument parsing for every command, and `run` against the firmware simulator.
+"""
+import numpy as np
+import pytest
+
+from shakebot import cli
+from shakebot.device import MICRO_BUFFER_SIZE, Shakebot
+from shakebot.simulator import FakeSerial, FirmwareSimulator
+
+SAMPLE_RATE = 100.0
+HOME = 0.1  # m; where the simulator's carriage starts
+COMMANDS = ["run", "schedule", "check", "analyze", "compensate", "sync", "stats", "simulate", "generate", "batch",
+            "stations", "archive", "traveltimes"]
+
+
+@pytest.mark.parametrize("command", COMMANDS)
+def test_help(command, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main([command, "--help"])
+    assert exit_info.value.code == 0
+    assert capsys.readouterr().out.startswith(f"usage: shakebot {command}")
+
+
+def test_parse_run_arguments(tmp_path):
+    queue = tmp_path / "queue.txt"
+    queue.write_text("a.csv\nb.csv\n")
+    args = cli.build_parser().parse_args(["run", "/dev/ttyACM0", f"@{queue}", "c.csv", "--repeat", "3",
+                                          "--band", "0.1", "20", "--archive"])
+    assert args.records == ["a.csv", "b.csv", "c.csv"]
+    assert args.repeat == 3 and args.band == [0.1, 20.0]
+    assert args.archive == cli.DEFAULT_ARCHIVE_DIR
+    assert not args.stream and args.interpolation == "step" and args.board == "due"
+
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args(["run", "/dev/ttyACM0"])  # No records
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args(["run", "/dev/ttyACM0", "a.csv", "--board", "uno"])
+    with pytest.raises(SystemExit):
+        cli.build_parser().parse_args([])
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    """Make Shakebot.connect() open a FakeSerial on a fresh simulator of the requested board."""
+    simulators = []
+
+    def fake_connect(cls, device, baud_rate=250000, **kwargs):
+        simulators.append(FirmwareSimulator(board=kwargs.get("board", "due"), speedup=10.0).start())
+        table = cls(FakeSerial(simulators[-1], timeout=0.1), **kwargs)
+        table.send_parameters()
+        return table
+
+    monkeypatch.setattr(Shakebot, "connect", classmethod(fake_connect))
+    yield simulators
+    for sim in simulators:
+        sim.stop()
+
+
+def write_record(path, samples):
+    time = np.arange(samples) / SAMPLE_RATE
+    data = np.column_stack((time, HOME + 0.005 * np.sin(2 * np.pi * 0.5 * time)))
+    np.savetxt(path, data, delimiter=",", header="Time (s),Displacement (m)", comments="")
+    return str(path)
+
+
+def test_run_against_the_simulator(connect, tmp_path, capsys):
+    path = write_record(tmp_path / "record.csv", 200)
+    assert cli.main(["run", "sim", path, "--repeat", "2", "--metrics", str(tmp_path / "metrics.csv")]) == 0
+    out = capsys.readouterr().out
+    assert out.count("200 samples uploaded") == 2
+    assert "Finished 2/2 runs" in out
+    assert (tmp_path / "metrics.csv").exists()
+
+    (simulator,) = connect
+    assert len(simulator.runs) == 2
+    assert all(run["samples"] == 200 and run["underruns"] == 0 for run in simulator.runs)
+
+
+def test_run_stream_on_the_micro(connect, tmp_path, capsys):
+    path = write_record(tmp_path / "long.csv", 3 * MICRO_BUFFER_SIZE)
+    assert cli.main(["run", "sim", path, "--board", "micro", "--stream"]) == 0
+    assert f"{3 * MICRO_BUFFER_SIZE} samples uploaded" in capsys.readouterr().out
+    (simulator,) = connect
+    assert simulator.runs[-1]["mode"] == "stream"
+    assert simulator.runs[-1]["samples"] == 3 * MICRO_BUFFER_SIZE
+
+
+def test_run_reports_failures(connect, tmp_path, capsys):
+    good = write_record(tmp_path / "good.csv", 200)
+    missing = str(tmp_path / "missing.csv")
+    assert cli.main(["run", "sim", missing, good]) == 1
+    assert "missing.csv: FAILED" in capsys.readouterr().err
+    assert cli.main(["run", "sim", missing, good, "--keep-going"]) == 1
+    assert "Finished 1/2 runs" in capsys.readouterr().out
+
+    assert cli.main(["run", "sim", good, "--stream", "--ascii"]) == 1
+    assert "--stream" in capsys.readouterr().err
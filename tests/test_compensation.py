@@ -0,0 +1,60 @@
+"""
+Drive-signal compensation against the linear table model.
+"""
+import numpy as np
+import pytest
+
+from shakebot.compensation import compensate, linear_plant
+from shakebot.device import Shakebot
+from shakebot.feasibility import check_record, make_feasible
+from shakebot.signals import random_ground_motion
+
+
+@pytest.fixture(scope="module")
+def record():
+    """150 s (15,000 samples) of ground motion within the Due's limits."""
+    data, _ = make_feasible(random_ground_motion(150.0, rng=0), Shakebot().limits)
+    return data
+
+
+def recording(plant):
+    """Wrap a plant so every drive it plays is kept."""
+    played = []
+
+    def play(drive):
+        played.append(np.array(drive))
+        return plant(drive)
+
+    return play, played
+
+
+def test_converges(record):
+    # A 2 Hz table follows the record poorly at first: about 13 % NRMSE
+    drive, info = compensate(record, linear_plant(natural_frequency=2.0, seed=0), limits=Shakebot().limits)
+
+    nrmse = [entry["nrmse"] for entry in info["history"]]
+    assert nrmse[0] > 0.1
+    assert all(later < earlier / 2.5 for earlier, later in zip(nrmse, nrmse[1:]))
+    assert info["converged"] and len(nrmse) <= 3
+    assert info["nrmse"] == min(nrmse) <= 0.02
+    assert drive.shape == record.shape
+    # Each update is a handful of FFTs over the whole record
+    assert max(entry["update_seconds"] for entry in info["history"]) < 1.0
+
+
+def test_updates_are_shortened_to_the_limits(record):
+    peaks = check_record(record, Shakebot().limits)["peaks"]
+    limits = {"displacement": Shakebot().total_length, "velocity": 1.02 * peaks["velocity"],
+              "acceleration": 1.02 * peaks["acceleration"]}
+    plant = linear_plant(natural_frequency=2.0, seed=0)
+
+    free, free_drives = recording(plant)
+    compensate(record, free, iterations=2, tolerance=0.0)
+    assert not check_record(free_drives[1], limits)["feasible"]  # The full update needs more than the limits
+
+    limited, limited_drives = recording(plant)
+    drive, info = compensate(record, limited, iterations=3, tolerance=0.0, limits=limits)
+    assert len(limited_drives) >= 2
+    assert all(check_record(played, limits)["feasible"] for played in limited_drives)
+    assert check_record(drive, limits)["feasible"]
+    assert info["history"][1]["nrmse"] < info["history"][0]["nrmse"]
@@ -0,0 +1,20 @@
+"""
+Shakebot settings that are checked before anything is sent.
+"""
+import pytest
+
+from shakebot.device import Shakebot
+
+
+def test_interpolation_is_checked_against_board():
+    micro = Shakebot(board="micro")
+    with pytest.raises(ValueError, match="micro"):
+        micro.interpolation = "cubic"
+    assert micro.interpolation == "step"
+    with pytest.raises(ValueError):
+        Shakebot(board="micro", interpolation="linear")
+
+    due = Shakebot(board="due")
+    due.interpolation = "cubic"
+    assert "interpolation=cubic" in due.playback_command(100.0)
+    assert due.with_port(None).interpolation == "cubic"
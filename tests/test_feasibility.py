@@ -0,0 +1,81 @@
+"""
+Feasibility checks: violating segment boundaries and records made to fit the table limits.
+"""
+import numpy as np
+import pytest
+
+from shakebot import feasibility
+from shakebot.feasibility import check_record, make_feasible, violating_segments
+
+SAMPLE_RATE = 100.0
+LIMITS = {"displacement": 0.1, "velocity": 0.3, "acceleration": 3.0}
+
+
+@pytest.mark.parametrize("values, segments", [
+    ([0, 0, 0], []),
+    ([2, 0, 0], [(0, 1)]),  # Starts at the first sample
+    ([0, 0, 2], [(2, 3)]),  # Ends at the last sample
+    ([2, 2, 2], [(0, 3)]),
+    ([0, 2, -3, 0, 1, 0, -2], [(1, 3), (6, 7)]),
+    ([1, 1, 1.0000001], [(2, 3)]),  # Exactly at the limit is allowed
+])
+def test_violating_segment_boundaries(values, segments):
+    found = violating_segments(np.array(values, dtype=float), 1.0)
+    assert [(segment["start"], segment["end"]) for segment in found] == segments
+
+
+def test_violating_segment_peaks_and_times():
+    values = np.array([0.0, 2.0, -3.0, 0.5, -5.0, 4.0, 0.0, 1.5])
+    time = 10.0 + np.arange(len(values)) / SAMPLE_RATE
+    found = violating_segments(values, 1.0, time)
+    assert [segment["peak"] for segment in found] == [3.0, 5.0, 1.5]
+    assert found[0]["start_time"] == time[1] and found[0]["end_time"] == time[2]
+    assert found[2]["start_time"] == found[2]["end_time"] == time[7]
+
+
+def sine(amplitude, frequency, seconds=10.0):
+    time = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return np.column_stack((time, amplitude * np.sin(2 * np.pi * frequency * time)))
+
+
+def test_check_record():
+    # Peaks of about 0.05 m, 0.31 m/s and 2.0 m/s²
+    report = check_record(sine(0.05, 1.0), LIMITS)
+    assert not report["feasible"]
+    assert not report["segments"]["displacement"] and not report["segments"]["acceleration"]
+    # Around every velocity peak: both ends of the record and the 19 half cycles between them
+    assert len(report["segments"]["velocity"]) == 21
+    assert report["segments"]["velocity"][0]["start"] == 0 and report["segments"]["velocity"][-1]["end"] == 1000
+    assert report["peaks"]["velocity"] == pytest.approx(2 * np.pi * 0.05, rel=1e-3)
+    assert "Velocity exceeds 0.3 m/s in 21 segment(s)" in feasibility.describe(report)
+    assert feasibility.describe(check_record(sine(0.01, 1.0), LIMITS)) == "Record is within the table limits."
+
+
+@pytest.mark.parametrize("method", feasibility.FEASIBILITY_METHODS)
+@pytest.mark.parametrize("amplitude, frequency", [(0.15, 0.2), (0.05, 1.0), (0.01, 4.0), (0.2, 3.0)])
+def test_make_feasible(method, amplitude, frequency):
+    data = sine(amplitude, frequency)
+    assert not check_record(data, LIMITS)["feasible"]
+    fitted, info = make_feasible(data, LIMITS, method=method)
+    assert info["method"] == method
+    assert info["report"]["feasible"]
+    assert check_record(fitted, LIMITS)["feasible"]
+    for name, peak in info["report"]["peaks"].items():
+        assert peak <= 0.95 * LIMITS[name] * (1 + 1e-9)
+
+    if method == "time":
+        assert info["time_factor"] > 1.0 or info["amplitude_factor"] < 1.0
+        assert fitted[-1, 0] == pytest.approx(data[-1, 0] * info["time_factor"], abs=1 / SAMPLE_RATE)
+    else:
+        np.testing.assert_array_equal(fitted[:, 0], data[:, 0])
+    if method == "amplitude":
+        np.testing.assert_allclose(fitted[:, 1], data[:, 1] * info["amplitude_factor"])
+
+
+def test_make_feasible_keeps_feasible_records():
+    data = sine(0.01, 1.0)
+    fitted, info = make_feasible(data, LIMITS)
+    np.testing.assert_array_equal(fitted, data)
+    assert info["cutoff"] is None and info["amplitude_factor"] == 1.0
+    with pytest.raises(ValueError, match="Unknown method"):
+        make_feasible(data, LIMITS, method="clip")
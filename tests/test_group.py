@@ -0,0 +1,57 @@
+"""
+TableGroup driving three simulated controllers.
+"""
+import numpy as np
+import pytest
+
+from shakebot.device import MOTION_COMPLETED, Shakebot
+from shakebot.group import GroupError, TableGroup
+from shakebot.simulator import FakeSerial
+
+HOME = 0.1  # Meters from the left limit; where the simulators' carriages start
+
+
+@pytest.fixture
+def group(simulators):
+    tables = []
+    for sim in simulators:
+        table = Shakebot(FakeSerial(sim, timeout=0.1), board="due")
+        table.send_parameters()
+        tables.append(table)
+    group = TableGroup(tables, names=["left", "middle", "right"])
+    yield group
+    group._workers.shutdown()
+
+
+def record(peak=0.005, samples=100):
+    time = np.arange(samples) / 100.0
+    return np.column_stack((time, HOME + peak * np.sin(np.pi * time / time[-1]) ** 2))
+
+
+def test_play_together(simulators, group):
+    result = group.play([record(0.005), record(0.01), record(0.015)])
+
+    assert all(line.startswith(MOTION_COMPLETED) for line in result["completed"])
+    assert [stats["samples"] for stats in result["uploads"]] == [100] * 3
+    assert result["write_spread"] < 0.005
+    assert result["start_skew"] < 0.01  # About a millisecond: the START writes plus the reply polling
+    assert [state["state"] for state in group.status()] == ["done"] * 3
+    peaks = [np.max(sim.runs[-1]["commanded"]) for sim in simulators]
+    assert peaks[0] < peaks[1] < peaks[2]
+
+
+def test_arm_with_empty_buffer_cancels_all(simulators, group):
+    for table in group.tables[:2]:
+        table.upload(table.record_to_steps(record()), sample_rate=100.0)
+
+    with pytest.raises(GroupError) as raised:
+        group.arm()
+
+    assert list(raised.value.errors) == ["right"]
+    assert "EMPTY" in str(raised.value.errors["right"])
+    states = {state["name"]: state["state"] for state in group.status()}
+    assert states == {"left": "idle", "middle": "idle", "right": "failed"}
+    # CANCEL went to every table, so the two that were ready no longer hold a record either
+    for table, sim in zip(group.tables, simulators):
+        table.wait_for("Motion cancelled.", 2.0)
+        assert sim.data_size == 0
@@ -0,0 +1,105 @@
+"""
+Timing instrumentation: STATS parsing, the metric store and its CSV/NPZ files.
+"""
+import csv
+
+import numpy as np
+import pytest
+
+from shakebot.device import MOTION_COMPLETED, Shakebot
+from shakebot.instrumentation import STATS_FIELDS, Metrics, describe, parse_stats
+from shakebot.simulator import FakeSerial
+
+STATS_LINE = ("STATS window_us=1000000 ticks=100 period_us=10000 jitter_mean_us=2.10 jitter_rms_us=2.50 "
+              "jitter_max_us=9 missed=0 rx_full=0 loop_hz=84211")
+
+
+def test_parse_stats():
+    stats = parse_stats(STATS_LINE)
+    assert set(stats) == set(STATS_FIELDS)
+    assert stats["ticks"] == 100.0 and stats["jitter_mean_us"] == 2.1 and stats["loop_hz"] == 84211.0
+    # Fields in any order, and newer firmware may add some
+    assert parse_stats("STATS " + " ".join(reversed(STATS_LINE.split()[1:])) + " extra=1")["extra"] == 1.0
+
+
+@pytest.mark.parametrize("line", [
+    "",
+    "Motion completed in 2000 milliseconds.",
+    "STATS",
+    STATS_LINE.replace(" missed=0", ""),  # A field missing
+    STATS_LINE.replace("ticks=100", "ticks=abc"),  # Not a number
+    STATS_LINE.replace("ticks=100", "ticks"),
+    STATS_LINE.replace("STATS", "STATISTICS"),
+    "ACK 0 32",
+])
+def test_parse_stats_rejects(line):
+    assert parse_stats(line) is None
+
+
+def filled_metrics():
+    metrics = Metrics()
+    for i in range(10):
+        metrics.record("frame_latency", 0.001 * (i + 1), timestamp=0.1 * i)
+    metrics.record("frame_bytes", 136, timestamp=0.05)
+    metrics.record_stats(parse_stats(STATS_LINE), timestamp=0.5)
+    return metrics
+
+
+def test_series_and_summary():
+    metrics = filled_metrics()
+    assert metrics.names()[:3] == ["firmware_jitter_max_us", "firmware_jitter_mean_us", "firmware_jitter_rms_us"]
+    times, values = metrics.series("frame_latency")
+    np.testing.assert_allclose(times, 0.1 * np.arange(10))
+    assert metrics.series("never")[0].size == 0
+
+    summary = metrics.summary()
+    assert summary["frame_latency"]["count"] == 10
+    assert summary["frame_latency"]["mean"] == pytest.approx(0.0055)
+    assert summary["frame_latency"]["max"] == pytest.approx(0.01)
+    assert summary["firmware_ticks"]["p50"] == 100.0
+    text = describe(summary, names=["frame_latency", "missing"])
+    assert len(text.splitlines()) == 2 and text.splitlines()[1].startswith("frame_latency")
+
+
+def test_save_csv(tmp_path):
+    metrics = filled_metrics()
+    path = str(tmp_path / "metrics.csv")
+    metrics.save(path)
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["time", "metric", "value"]
+    assert len(rows) == 1 + 10 + 1 + len(STATS_FIELDS)
+    times = [float(row[0]) for row in rows[1:]]
+    assert times == sorted(times)  # All series interleaved in time order
+    assert rows[1] == ["0.000000", "frame_latency", "0.001"]
+    assert rows[2] == ["0.050000", "frame_bytes", "136"]
+    assert ["0.500000", "firmware_loop_hz", "84211"] in rows
+
+
+def test_save_npz(tmp_path):
+    metrics = filled_metrics()
+    path = str(tmp_path / "metrics.npz")
+    metrics.save(path)
+    with np.load(path) as data:
+        assert set(data.files) == {name + suffix for name in metrics.names() for suffix in ("", "_time")}
+        for name in metrics.names():
+            times, values = metrics.series(name)
+            np.testing.assert_array_equal(data[name], values)
+            np.testing.assert_array_equal(data[f"{name}_time"], times)
+
+
+def test_stats_polled_while_playing(simulator):
+    metrics = Metrics()
+    table = Shakebot(FakeSerial(simulator, timeout=0.05), board="due", metrics=metrics, stats_interval=0.05)
+    table.send_parameters()
+    time = np.arange(200) / 100.0
+    steps = table.record_to_steps(np.column_stack((time, 0.1 + 0.002 * np.sin(2 * np.pi * time))))
+    table.upload(steps, sample_rate=100.0)
+    table.start()
+    table.wait_for(MOTION_COMPLETED, timeout=10.0)
+
+    assert metrics.series("frame_latency")[0].size >= 1
+    ticks = metrics.series("firmware_ticks")[1]
+    assert ticks.size >= 2
+    assert metrics.series("firmware_missed")[1].max() == 0.0
+    assert np.all(metrics.series("firmware_period_us")[1] == 10000.0)
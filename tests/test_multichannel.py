@@ -0,0 +1,117 @@
+"""
+Multi-channel records: rotation against obspy, channel selection and projection of non-orthogonal sensors.
+"""
+import numpy as np
+import pytest
+
+from shakebot.multichannel import MultiChannelRecord, default_orientation
+
+SAMPLE_RATE = 100.0
+
+
+def three_channels(samples=1000, seed=0):
+    time = np.arange(samples) / SAMPLE_RATE
+    values = np.random.default_rng(seed).standard_normal((samples, 3))
+    return np.column_stack((time, values))
+
+
+@pytest.mark.parametrize("back_azimuth", [0.0, 37.5, 90.0, 211.0, 359.0])
+def test_rotation_matches_obspy(back_azimuth):
+    rotate = pytest.importorskip("obspy.signal.rotate")
+    data = three_channels()
+    record = MultiChannelRecord(data, ["BHN", "BHE", "BHZ"], back_azimuth=back_azimuth)
+
+    radial, transverse = rotate.rotate_ne_rt(data[:, 1], data[:, 2], back_azimuth)
+    rotated = record.rotate(["R", "T", "BHZ"])
+    assert rotated.channels == ("R", "T", "BHZ")
+    np.testing.assert_allclose(rotated.values[:, 0], radial, rtol=0, atol=1e-15)
+    np.testing.assert_allclose(rotated.values[:, 1], transverse, rtol=0, atol=1e-15)
+    np.testing.assert_array_equal(rotated.values[:, 2], data[:, 3])  # Copied as it is
+    np.testing.assert_array_equal(rotated.time, data[:, 0])
+
+    np.testing.assert_allclose(record.component("R")[:, 1], radial, rtol=0, atol=1e-15)
+    with pytest.raises(ValueError, match="back azimuth"):
+        MultiChannelRecord(data, ["BHN", "BHE", "BHZ"]).rotate(["R"])
+
+
+def test_azimuth_components():
+    data = three_channels()
+    record = MultiChannelRecord(data, ["BH1", "BH2", "BHZ"])
+    rotated = record.rotate([45.0, -90.0, "N"])
+    assert rotated.channels == ("H045", "H270", "N")
+    np.testing.assert_allclose(rotated.values[:, 0], (data[:, 1] + data[:, 2]) / np.sqrt(2), atol=1e-14)
+    np.testing.assert_allclose(rotated.values[:, 1], -data[:, 2], atol=1e-14)
+    np.testing.assert_allclose(rotated.values[:, 2], data[:, 1], atol=1e-14)
+    assert rotated.orientations["H045"] == (45.0, 0.0)
+
+
+def test_select():
+    data = three_channels()
+    orientations = {"BH1": (10.0, 0.0), "BH2": (100.0, 0.0)}
+    record = MultiChannelRecord(data, ["BH1", "BH2", "BHZ"], orientations, back_azimuth=20.0)
+
+    selected = record.select(["BHZ", "BH1"])
+    assert selected.channels == ("BHZ", "BH1")
+    np.testing.assert_array_equal(selected.data, data[:, [0, 3, 1]])
+    assert selected.data.flags.c_contiguous
+    assert selected.orientations == {"BHZ": (0.0, -90.0), "BH1": (10.0, 0.0)}
+    assert selected.back_azimuth == 20.0
+    np.testing.assert_array_equal(record.channel("BH2"), data[:, [0, 2]])
+    with pytest.raises(KeyError, match="BHX"):
+        record.channel("BHX")
+
+
+def test_project_non_orthogonal_sensors():
+    # Ground motion in north/east/up, recorded by horizontals 3° and 95° from north and a slightly tilted vertical
+    rng = np.random.default_rng(1)
+    ground = rng.standard_normal((500, 3))
+    orientations = {"BH1": (3.0, 0.0), "BH2": (95.0, 0.0), "BHZ": (40.0, -88.0)}
+    azimuth, dip = np.radians(np.array(list(orientations.values()))).T
+    sensors = np.column_stack((np.cos(dip) * np.cos(azimuth), np.cos(dip) * np.sin(azimuth), -np.sin(dip)))
+    values = ground @ sensors.T
+    record = MultiChannelRecord(np.column_stack((np.arange(500) / SAMPLE_RATE, values)), list(orientations),
+                                orientations)
+
+    projected = record.project([0.0, 90.0, 0.0, 30.0], dips=[0.0, 0.0, -90.0, 0.0])
+    assert projected.shape == (500, 4)
+    np.testing.assert_allclose(projected[:, 0], ground[:, 0], atol=1e-12)
+    np.testing.assert_allclose(projected[:, 1], ground[:, 1], atol=1e-12)
+    np.testing.assert_allclose(projected[:, 2], ground[:, 2], atol=1e-12)
+    np.testing.assert_allclose(projected[:, 3], np.cos(np.radians(30)) * ground[:, 0]
+                               + np.sin(np.radians(30)) * ground[:, 1], atol=1e-12)
+
+    # Horizontal sensors alone recover the horizontal motion when there is no vertical
+    flat = ground.copy()
+    flat[:, 2] = 0.0
+    horizontal = record.select(["BH1", "BH2"])
+    horizontal.data[:, 1:] = flat @ sensors[:2].T
+    np.testing.assert_allclose(horizontal.project([0.0, 90.0]), flat[:, :2], atol=1e-12)
+
+
+def test_from_records_interpolates_onto_the_first_time_axis():
+    time = np.arange(0.0, 10.0, 0.01)
+    first = np.column_stack((time, np.sin(time)))
+    # Starts later, ends earlier and is sampled half a sample off
+    shifted = np.arange(0.5, 9.5, 0.01) + 0.005
+    second = np.column_stack((shifted, 2 * shifted + 1))
+
+    record = MultiChannelRecord.from_records({"BHN": first, "BHE": second})
+    assert record.channels == ("BHN", "BHE")
+    assert record.time[0] >= shifted[0] and record.time[-1] <= shifted[-1]
+    inside = (time >= shifted[0]) & (time <= shifted[-1])
+    np.testing.assert_array_equal(record.time, time[inside])
+    np.testing.assert_array_equal(record.values[:, 0], first[inside, 1])  # Same time axis: copied
+    np.testing.assert_allclose(record.values[:, 1], 2 * record.time + 1, atol=1e-12)  # Linear, so exact
+
+    with pytest.raises(ValueError):
+        MultiChannelRecord.from_records({})
+
+
+def test_default_orientation():
+    assert default_orientation("BHE") == (90.0, 0.0)
+    assert default_orientation("HH1") == (0.0, 0.0)
+    assert default_orientation("BHZ") == (0.0, -90.0)
+    with pytest.raises(ValueError, match="explicitly"):
+        default_orientation("BHX")
+    with pytest.raises(ValueError, match=r"\(N, 3\)"):
+        MultiChannelRecord(np.zeros((10, 2)), ["BHN", "BHE"])
@@ -0,0 +1,20 @@
+"""
+prepare_record() stages.
+"""
+import numpy as np
+import pytest
+
+from shakebot.preprocess import prepare_record
+
+
+@pytest.mark.parametrize("fit", ["trim", "strongest", "segment"])
+def test_every_piece_is_tapered(fit):
+    time = np.arange(0, 100, 0.01)
+    data = np.column_stack((time, 0.02 + 0.01 * np.sin(2 * np.pi * 0.3 * time)))
+    pieces, info = prepare_record(data, buffer_size=3000, fit=fit, taper_seconds=1.0)
+
+    assert info["segments"] == len(pieces) == (4 if fit == "segment" else 1)
+    for piece in pieces:
+        assert len(piece) <= 3000
+        assert piece[0, 1] == 0.0 and piece[-1, 1] == 0.0
+        np.testing.assert_allclose(piece[150:-150, 1], np.interp(piece[150:-150, 0], time, data[:, 1]))
@@ -0,0 +1,99 @@
+"""
+Binary frames: encoding, incremental decoding and uploads to the simulator.
+"""
+import numpy as np
+import pytest
+
+from shakebot.protocol import (ENCODING_DELTA16, ENCODING_INT32, FRAME_SYNC, FrameDecoder, ProtocolError,
+                               decode_frame, encode_frame, encode_frames, upload_steps)
+from shakebot.simulator import FakeSerial
+
+
+class CorruptingSerial(FakeSerial):
+    """FakeSerial that flips one payload byte of the frames listed in `corrupt` (by write count)."""
+
+    def __init__(self, simulator, corrupt=(), timeout=0.1):
+        super().__init__(simulator, timeout=timeout)
+        self.corrupt = set(corrupt)
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        if len(self.writes) - 1 in self.corrupt:
+            data = bytearray(data)
+            data[12] ^= 0xFF
+        return super().write(bytes(data))
+
+
+@pytest.mark.parametrize("encoding", [ENCODING_INT32, ENCODING_DELTA16])
+def test_encode_decode_round_trip(encoding):
+    steps = np.array([1000, 1003, 990, -5, 20000, 19999])
+    frame = encode_frame(steps, offset=512, encoding=encoding)
+    assert frame[:2] == FRAME_SYNC
+    assert frame[2] == encoding
+
+    offset, decoded = decode_frame(frame)
+    assert offset == 512
+    np.testing.assert_array_equal(decoded, steps)
+
+
+def test_delta16_rejects_large_differences():
+    with pytest.raises(ProtocolError):
+        encode_frame([0, 40000], encoding=ENCODING_DELTA16)
+    _, decoded = decode_frame(encode_frame([0, 40000]))  # ENCODING_AUTO falls back to int32
+    np.testing.assert_array_equal(decoded, [0, 40000])
+
+
+def test_decode_detects_corruption():
+    frame = bytearray(encode_frame(np.arange(10)))
+    frame[12] ^= 0x01
+    with pytest.raises(ProtocolError, match="CRC"):
+        decode_frame(bytes(frame))
+
+
+def test_decoder_splits_frames_and_text():
+    steps = np.arange(600) * 3
+    stream = b"SET_PARAMS lead=0.02\n" + b"".join(encode_frames(steps)) + b"START\n"
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(0, len(stream), 7):  # Arbitrary chunking, as reads from a serial port
+        frames += decoder.feed(stream[i:i + 7])
+
+    assert [offset for offset, _ in frames] == [0, 256, 512]
+    np.testing.assert_array_equal(np.concatenate([values for _, values in frames]), steps)
+    assert bytes(decoder.text) == b"SET_PARAMS lead=0.02\nSTART\n"
+
+
+def test_decoder_skips_lone_first_sync_byte():
+    frame = encode_frame([7, 8, 9], offset=3)
+    decoder = FrameDecoder()
+    frames = decoder.feed(b"x" + FRAME_SYNC[:1] + b"\x01" + frame)
+
+    assert len(frames) == 1
+    offset, values = frames[0]
+    assert offset == 3
+    np.testing.assert_array_equal(values, [7, 8, 9])
+    assert bytes(decoder.text) == b"x" + FRAME_SYNC[:1] + b"\x01"
+
+
+def test_upload_over_fake_serial(simulator):
+    steps = 1000 + np.round(300 * np.sin(np.linspace(0, 4 * np.pi, 1000))).astype(np.int64)
+    stats = upload_steps(FakeSerial(simulator, timeout=0.1), steps)
+
+    assert stats["frames"] == 4
+    assert stats["retransmissions"] == 0
+    assert simulator.data_size == steps.size
+    np.testing.assert_array_equal(simulator.displacement_data[:steps.size], steps)
+
+
+def test_corrupted_frame_is_resent_from_reported_offset(simulator):
+    steps = np.arange(700) + 1000
+    port = CorruptingSerial(simulator, corrupt={1})
+    stats = upload_steps(port, steps)
+
+    assert stats["retransmissions"] == 1
+    assert stats["frames"] == 4
+    offsets = [decode_frame(frame)[0] for frame in port.writes]
+    assert offsets == [0, 256, 256, 512]  # NAK 256 CRC: the second frame is sent again
+    assert simulator.data_size == steps.size
+    np.testing.assert_array_equal(simulator.displacement_data[:steps.size], steps)
@@ -0,0 +1,65 @@
+"""
+Velocity pulses: realised peaks of the generated waveforms and the closed-form feasibility mask.
+"""
+import numpy as np
+import pytest
+
+from shakebot import feasibility, pulses
+from shakebot.pulses import G, PULSE_SHAPES, PulseGrid
+
+SAMPLE_RATE = 2000.0  # Fine enough that the finite differences of kinematics() resolve the peaks
+LIMITS = {"displacement": 0.2, "velocity": 0.5, "acceleration": 9.8}
+
+
+@pytest.mark.parametrize("shape", PULSE_SHAPES)
+@pytest.mark.parametrize("pgv, pga, cycles", [(0.5, 1.0, 1), (0.2, 0.3, 2), (0.05, 0.8, 3)])
+def test_realised_peak_velocity_and_acceleration(shape, pgv, pga, cycles):
+    data = pulses.pulse(shape, pgv, pga, cycles, SAMPLE_RATE)
+    _, displacement, velocity, acceleration = feasibility.kinematics(data)
+    assert np.abs(velocity).max() == pytest.approx(pgv, rel=5e-3)
+    assert np.abs(acceleration).max() == pytest.approx(pga * G, rel=1e-2)
+
+    parameters = pulses.pulse_parameters(shape, pgv, pga, cycles, SAMPLE_RATE)
+    assert np.abs(displacement).max() == pytest.approx(parameters["peak_displacement"], rel=1e-3)
+    # The last sample falls up to one sample before the end of the pulse
+    assert displacement[-1] == pytest.approx(parameters["residual_displacement"],
+                                             abs=1e-3 * parameters["peak_displacement"])
+    assert len(data) == parameters["samples"]
+
+
+def test_cosine_peaks_at_pgv_unlike_the_legacy_pulse():
+    # The GUI's values: PGV 0.5 m/s and PGA 1 g give 0.5 m/s, not 9.807 * 0.5 m/s
+    data = pulses.pulse("cosine", 0.5, 1.0, 1, SAMPLE_RATE)
+    assert np.abs(feasibility.kinematics(data)[2]).max() == pytest.approx(0.5, rel=1e-3)
+    assert pulses.PulseGrid("cosine", [0.5], [1.0]).lookup(0.5, 1.0)["duration"] == pytest.approx(
+        data[-1, 0], abs=1.0 / SAMPLE_RATE)
+
+
+@pytest.mark.parametrize("shape", PULSE_SHAPES)
+def test_feasibility_mask_agrees_with_check_record(shape):
+    grid = PulseGrid(shape, np.geomspace(0.05, 1.0, 7), np.geomspace(0.1, 2.0, 7), cycles=(1, 2), limits=LIMITS,
+                     sample_rate=SAMPLE_RATE)
+    compared = 0
+    for index in np.ndindex(grid.feasible.shape):
+        pgv, pga, cycles = grid.pgv[index[0]], grid.pga[index[1]], grid.cycles[index[2]]
+        report = feasibility.check_record(pulses.pulse(shape, pgv, pga, cycles, SAMPLE_RATE), LIMITS)
+        for name in ("displacement", "velocity", "acceleration"):
+            # Peaks within 2% of a limit depend on the finite differences; skip them
+            if abs(report["peaks"][name] / LIMITS[name] - 1.0) < 0.02:
+                continue
+            assert bool(grid.masks[name][index]) == (not report["segments"][name]), (name, pgv, pga, cycles)
+            compared += 1
+    assert compared > 0.9 * 3 * len(grid)
+    assert 0 < grid.feasible.sum() < len(grid)
+
+
+def test_parameters_scale_in_closed_form():
+    low = pulses.pulse_parameters("mp", 0.1, 0.5, 2)
+    high = pulses.pulse_parameters("mp", 0.2, 0.5, 2)
+    # Doubling PGV at fixed PGA halves the frequency and quadruples the displacement
+    assert high["frequency"] == pytest.approx(low["frequency"] / 2)
+    assert high["peak_displacement"] == pytest.approx(4 * low["peak_displacement"])
+    with pytest.raises(ValueError):
+        pulses.pulse_parameters("cosine", 0.0, 0.5)
+    with pytest.raises(ValueError):
+        pulses.shape_table("square")
@@ -0,0 +1,145 @@
+"""
+Record loaders: CSV sidecars, column matching, .npy layouts and HDF5 memory maps.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from shakebot import records
+from shakebot.records import load_csv, load_record
+
+SAMPLE_RATE = 100.0
+
+
+def sample_record(samples=500, scale=0.01):
+    time = np.arange(samples) / SAMPLE_RATE
+    return np.column_stack((time, scale * np.sin(2 * np.pi * time)))
+
+
+def write_csv(path, data, header="Time (s),Displacement (m)"):
+    np.savetxt(path, data, delimiter=",", header=header, comments="")
+    return str(path)
+
+
+def test_csv_sidecar_is_reused(tmp_path):
+    path = write_csv(tmp_path / "record.csv", sample_record())
+    cache_dir = str(tmp_path / "sidecars")
+
+    first = load_csv(path, cache_dir=cache_dir)
+    assert not isinstance(first, np.memmap)
+    sidecar = records._sidecar_path(path, cache_dir)
+    assert os.path.exists(sidecar)
+
+    second = load_csv(path, cache_dir=cache_dir)
+    assert isinstance(second, np.memmap)  # Loaded from the sidecar
+    np.testing.assert_array_equal(second, first)
+    np.testing.assert_allclose(first, sample_record(), atol=1e-15)
+
+    assert not isinstance(load_csv(path, sidecar=False, cache_dir=cache_dir), np.memmap)
+
+
+def test_csv_sidecar_is_invalidated_by_changes(tmp_path):
+    path = write_csv(tmp_path / "record.csv", sample_record())
+    cache_dir = str(tmp_path / "sidecars")
+    load_csv(path, cache_dir=cache_dir)
+    stat = os.stat(path)
+
+    # Same size, new modification time
+    write_csv(path, sample_record(scale=0.02))
+    assert os.path.getsize(path) == stat.st_size
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    changed = load_csv(path, cache_dir=cache_dir)
+    assert not isinstance(changed, np.memmap)
+    np.testing.assert_allclose(changed, sample_record(scale=0.02), atol=1e-15)
+
+    # Different size, with the modification time put back
+    write_csv(path, sample_record(300))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert len(load_csv(path, cache_dir=cache_dir)) == 300
+
+
+def test_csv_columns_with_units(tmp_path):
+    data = sample_record()
+    table = np.column_stack((np.zeros(len(data)), data[:, 0], data[:, 1], data[:, 1] * 2))
+    path = write_csv(tmp_path / "units.csv", table,
+                     header="Acceleration (g), Time (s),Displacement (BH1) (m),displacement (BH2) (m)")
+    # The first matching column of each kind, whatever its position, case or units
+    np.testing.assert_allclose(load_csv(path, sidecar=False), data, atol=1e-15)
+
+    path = write_csv(tmp_path / "missing.csv", data, header="Time (s),Velocity (m/s)")
+    with pytest.raises(ValueError, match="columns"):
+        load_csv(path, sidecar=False)
+
+
+def test_npy_layouts(tmp_path):
+    data = sample_record()
+    np.save(tmp_path / "pairs.npy", data)
+    pairs = load_record(str(tmp_path / "pairs.npy"))
+    assert isinstance(pairs, np.memmap)
+    np.testing.assert_array_equal(pairs, data)
+
+    np.save(tmp_path / "flat.npy", data[:, 1])
+    flat = load_record(str(tmp_path / "flat.npy"))
+    np.testing.assert_allclose(flat, data)  # 100 Hz by default
+    flat = load_record(str(tmp_path / "flat.npy"), sample_rate=50.0)
+    np.testing.assert_allclose(flat[:, 0], np.arange(len(data)) / 50.0)
+
+    np.save(tmp_path / "wide.npy", np.zeros((10, 3)))
+    with pytest.raises(ValueError, match="shape"):
+        load_record(str(tmp_path / "wide.npy"))
+
+
+def test_hdf5_memmap_and_chunked(tmp_path):
+    h5py = pytest.importorskip("h5py")
+    data = sample_record()
+    path = str(tmp_path / "record.h5")
+    with h5py.File(path, "w") as f:
+        f.create_dataset("contiguous", data=data)
+        f.create_dataset("compressed", data=data, chunks=(64, 2), compression="gzip")
+        f.create_dataset("flat", data=data[:, 1])
+
+    contiguous = load_record(path, dataset="contiguous")
+    assert isinstance(contiguous, np.memmap)
+    np.testing.assert_array_equal(contiguous, data)
+    compressed = load_record(path, dataset="compressed")
+    assert not isinstance(compressed, np.memmap)
+    np.testing.assert_array_equal(compressed, data)
+    np.testing.assert_allclose(load_record(path, dataset="flat", sample_rate=50.0)[:, 0], np.arange(len(data)) / 50.0)
+    # Without a dataset name, the first (N, 2) dataset
+    np.testing.assert_array_equal(load_record(path), data)
+
+    path = str(tmp_path / "columns.h5")
+    with h5py.File(path, "w") as f:
+        f.create_dataset("Time", data=data[:, 0])
+        f.create_dataset("Displacement", data=data[:, 1], chunks=(100,))
+    np.testing.assert_array_equal(load_record(path), data)
+
+
+def test_parquet(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    data = sample_record()
+    path = str(tmp_path / "record.parquet")
+    pq.write_table(pa.table({"Time (s)": data[:, 0], "Displacement (m)": data[:, 1], "Other": data[:, 1]}), path,
+                   row_group_size=128)
+    np.testing.assert_array_equal(load_record(path), data)
+
+
+def test_load_record_dispatch(tmp_path):
+    path = write_csv(tmp_path / "record.CSV", sample_record())
+    # sample_rate is for 1-D arrays; a CSV has its own time column
+    np.testing.assert_allclose(load_record(path, sample_rate=50.0, sidecar=False), sample_record(), atol=1e-15)
+
+    with pytest.raises(ValueError, match="Unsupported file type '.xyz'"):
+        load_record(str(tmp_path / "record.xyz"))
+    with pytest.raises(ValueError, match="Unsupported"):
+        load_record(str(tmp_path / "record"))
+
+
+def test_save_csv_round_trip(tmp_path):
+    data = sample_record()
+    path = str(tmp_path / "saved.csv")
+    records.save_csv(path, data)
+    np.testing.assert_allclose(load_csv(path, sidecar=False), data, atol=1e-15)
@@ -0,0 +1,176 @@
+"""
+Campaigns played on the firmware simulator.
+"""
+import numpy as np
+import pytest
+
+from shakebot import scheduler
+from shakebot.device import Shakebot
+from shakebot.scheduler import Campaign, run_campaign
+from shakebot.simulator import FakeSerial, FirmwareSimulator
+
+HOME = 0.1  # Meters from the left limit; where the simulator's carriage starts
+
+
+def write_record(path, peak=0.005):
+    time = np.arange(100) / 100.0
+    np.save(path, np.column_stack((time, HOME + peak * np.sin(np.pi * time) ** 2)))
+    return str(path)
+
+
+def test_campaign(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, "RECONNECT_DELAY", 0.0)
+    records = [write_record(tmp_path / "a.npy"), str(tmp_path / "missing.npy"), write_record(tmp_path / "b.npy", 0.01)]
+    campaign = Campaign(str(tmp_path / "campaign.sqlite"))
+    campaign.add(records, repeat=2)
+    simulator = FirmwareSimulator(board="due", speedup=40.0).start()  # Homing takes seconds of simulated time
+    connections = []
+
+    def connect():
+        table = Shakebot(FakeSerial(simulator, timeout=0.1), board="due")
+        table.send_parameters()
+        connections.append(table)
+        return table
+
+    def prepare(path):
+        return [np.load(path)]
+
+    outcomes = []
+    try:
+        summary = run_campaign(campaign, connect, prepare, rehome="displacement", home=HOME, settle=0.0,
+                               on_run=lambda run_id, path, status, timings, detail: outcomes.append((path, status)))
+    finally:
+        simulator.stop()
+
+    assert summary["done"] == 4 and summary["failed"] == 2 and summary["pending"] == 0
+    assert [status for _, status in outcomes] == ["done", "failed", "done"] * 2
+    # A record that cannot be prepared fails on its own, without a reconnect or another attempt
+    assert len(connections) == 1
+    assert [attempts for (attempts,) in campaign.db.execute("SELECT attempts FROM runs ORDER BY id")] == [1] * 6
+    error = campaign.db.execute("SELECT error FROM runs WHERE status = 'failed'").fetchone()[0]
+    assert error.startswith("FileNotFoundError")
+    assert len(simulator.runs) == 4
+    assert all(run["samples"] == 100 for run in simulator.runs)
+    campaign.close()
+
+
+class DroppingSerial(FakeSerial):
+    """FakeSerial whose reads fail once a motion has started, like a cable pulled mid-run."""
+
+    def __init__(self, simulator, timeout=0.1):
+        super().__init__(simulator, timeout=timeout)
+        self.started = False
+
+    def write(self, data):
+        if data == b"START\n":
+            self.started = True
+        return super().write(data)
+
+    def readline(self):
+        if self.started:
+            raise OSError("Device disconnected")
+        return super().readline()
+
+
+@pytest.fixture
+def controllers():
+    """Connect to a fresh simulator each time, as after a controller reset; `drop` lists connections that fail."""
+    simulators, tables = [], []
+
+    def connect(drop=()):
+        def connect():
+            simulator = FirmwareSimulator(board="due", speedup=40.0).start()
+            simulators.append(simulator)
+            port_type = DroppingSerial if len(tables) in drop else FakeSerial
+            table = Shakebot(port_type(simulator, timeout=0.1), board="due")
+            table.send_parameters()
+            tables.append(table)
+            return table
+        return connect
+
+    yield connect, simulators, tables
+    for simulator in simulators:
+        simulator.stop()
+
+
+def play(campaign, connect, outcomes, **kwargs):
+    return run_campaign(campaign, connect, lambda path: [np.load(path)], rehome="none", settle=0.0,
+                        on_run=lambda run_id, path, status, timings, detail: outcomes.append((run_id, status)),
+                        **kwargs)
+
+
+def test_reopening_resets_running_runs(tmp_path):
+    path = str(tmp_path / "campaign.sqlite")
+    campaign = Campaign(path)
+    campaign.add([write_record(tmp_path / "a.npy"), write_record(tmp_path / "b.npy")])
+    campaign.begin(1)  # The session crashed while run 1 was playing
+    assert [run_id for run_id, _ in campaign.pending()] == [2]
+    campaign.close()
+
+    campaign = Campaign(path)
+    assert [run_id for run_id, _ in campaign.pending()] == [1, 2]
+    assert campaign.summary()["running"] == 0
+    assert campaign.attempts(1) == 1
+    campaign.close()
+
+
+def test_lost_connection_reconnects_and_replays(tmp_path, monkeypatch, controllers):
+    monkeypatch.setattr(scheduler, "RECONNECT_DELAY", 0.0)
+    connect, simulators, tables = controllers
+    campaign = Campaign(str(tmp_path / "campaign.sqlite"))
+    campaign.add([write_record(tmp_path / "a.npy")])
+
+    outcomes = []
+    summary = play(campaign, connect(drop={0}), outcomes)
+
+    # The first play is cut short and queued again; the second connection plays it
+    assert outcomes == [(1, "pending"), (1, "done")]
+    assert summary["done"] == 1 and summary["failed"] == 0
+    assert len(tables) == 2
+    assert campaign.attempts(1) == 2
+    assert len(simulators[1].runs) == 1 and simulators[1].runs[0]["samples"] == 100
+    campaign.close()
+
+
+def test_max_attempts_fails_the_run(tmp_path, monkeypatch, controllers):
+    monkeypatch.setattr(scheduler, "RECONNECT_DELAY", 0.0)
+    connect, simulators, tables = controllers
+    campaign = Campaign(str(tmp_path / "campaign.sqlite"))
+    campaign.add([write_record(tmp_path / "a.npy"), write_record(tmp_path / "b.npy")])
+
+    outcomes = []
+    summary = play(campaign, connect(drop={0, 1}), outcomes, max_attempts=2)
+
+    # Run 1 loses the connection twice and fails; run 2 plays on the third connection
+    assert outcomes == [(1, "pending"), (1, "failed"), (2, "done")]
+    assert summary["done"] == 1 and summary["failed"] == 1
+    assert campaign.attempts(1) == 2 and campaign.attempts(2) == 1
+    error = campaign.db.execute("SELECT error FROM runs WHERE id = 1").fetchone()[0]
+    assert error == "OSError: Device disconnected"
+    assert len(tables) == 3 and len(simulators[2].runs) == 1
+    campaign.close()
+
+
+def test_resume_starts_at_the_first_unfinished_run(tmp_path, controllers):
+    connect, simulators, _ = controllers
+    path = str(tmp_path / "campaign.sqlite")
+    campaign = Campaign(path)
+    campaign.add([write_record(tmp_path / f"{name}.npy") for name in "abc"])
+
+    def stop_after_first(run_id, path, status, timings, detail):
+        raise KeyboardInterrupt  # Ctrl+C once the first run is recorded
+
+    with pytest.raises(KeyboardInterrupt):
+        run_campaign(campaign, connect(), lambda path: [np.load(path)], rehome="none", settle=0.0,
+                     on_run=stop_after_first)
+    campaign.begin(2)  # ...and a crash that left run 2 "running"
+    campaign.close()
+
+    campaign = Campaign(path)
+    assert [run_id for run_id, _ in campaign.pending()] == [2, 3]
+    outcomes = []
+    summary = play(campaign, connect(), outcomes)
+    assert outcomes == [(2, "done"), (3, "done")]
+    assert summary["done"] == 3 and summary["pending"] == 0
+    assert [len(simulator.runs) for simulator in simulators] == [1, 2]
+    campaign.close()
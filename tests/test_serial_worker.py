@@ -0,0 +1,53 @@
+"""
+SerialWorker against the firmware simulator.
+"""
+import threading
+import time
+
+from shakebot.serial_worker import SerialWorker
+from shakebot.simulator import FakeSerial
+
+
+def drain_until(worker, kind, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    messages = []
+    while time.perf_counter() < deadline:
+        messages += worker.drain()
+        if any(message[0] == kind for message in messages):
+            return messages
+        time.sleep(0.01)
+    raise AssertionError(f"No {kind!r} message within {timeout} s: {messages}")
+
+
+def test_lines_and_jobs(simulator):
+    worker = SerialWorker(FakeSerial(simulator))
+    worker.start()
+    try:
+        worker.write("ARM\n")
+        messages = drain_until(worker, "line")
+        assert ("line", "NOT_ARMED EMPTY") in messages
+
+        worker.submit(lambda port: port.write(b"STATS\n") and port.readline(), on_done=None)
+        _, (_, result, error) = next(m for m in drain_until(worker, "done") if m[0] == "done")
+        assert error is None
+        assert result.startswith(b"STATS")
+    finally:
+        worker.stop()
+
+
+def test_stop_leaves_port_open_for_running_job(simulator):
+    port = FakeSerial(simulator)
+    worker = SerialWorker(port)
+    worker.start()
+    release = threading.Event()
+    worker.submit(lambda port: release.wait(2.0))
+    time.sleep(0.05)
+
+    worker.stop(timeout=0.05)
+    assert worker.is_alive()
+    assert port.is_open  # The job still owns the port
+
+    release.set()
+    worker.join(2.0)
+    assert not worker.is_alive()
+    assert not port.is_open
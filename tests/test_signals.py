@@ -0,0 +1,60 @@
+"""
+Batch ground-motion generators: seeds, chunking and output arrays.
+"""
+import numpy as np
+import pytest
+
+from shakebot import signals
+
+GENERATORS = [signals.multisine_batch, signals.stochastic_batch]
+
+
+@pytest.mark.parametrize("generate", GENERATORS)
+def test_same_seed_same_batch(generate):
+    first = generate(5, 4.0, components=2, rng=42)
+    assert first.shape == (5, 2, 400)
+    np.testing.assert_array_equal(generate(5, 4.0, components=2, rng=42), first)
+    np.testing.assert_array_equal(generate(5, 4.0, components=2, rng=np.random.default_rng(42)), first)
+    assert not np.array_equal(generate(5, 4.0, components=2, rng=43), first)
+
+
+@pytest.mark.parametrize("generate", GENERATORS)
+@pytest.mark.parametrize("chunk", [1, 3, 7, 256])
+def test_chunk_size_does_not_change_the_batch(generate, chunk):
+    # The random draws are consumed in record order whatever the chunk size, including a partial last chunk
+    np.testing.assert_allclose(generate(7, 3.0, components=2, rng=5, chunk=chunk),
+                               generate(7, 3.0, components=2, rng=5, chunk=2), rtol=0, atol=1e-15)
+
+
+@pytest.mark.parametrize("generate", GENERATORS)
+def test_fills_a_memory_map(generate, tmp_path):
+    path = str(tmp_path / "batch.npy")
+    out = np.lib.format.open_memmap(path, mode="w+", shape=(6, 1, 300))
+    assert generate(6, 3.0, rng=9, out=out, chunk=4) is out
+    out.flush()
+    np.testing.assert_array_equal(np.load(path), generate(6, 3.0, rng=9))
+
+
+def test_stochastic_records_start_and_end_at_rest():
+    batch = signals.stochastic_batch(4, 10.0, rng=1, pga=0.3)
+    assert np.all(batch[..., 0] == 0.0)
+    assert np.abs(batch[..., -1]).max() < 0.01 * np.abs(batch).max()
+    with pytest.raises(ValueError, match="positive"):
+        signals.stochastic_batch(1, 0.0)
+
+
+def test_random_ground_motion_is_one_record_of_a_batch():
+    record = signals.random_ground_motion(5.0, rng=3)
+    np.testing.assert_array_equal(record[:, 1], signals.multisine_batch(1, 5.0, rng=3)[0, 0])
+    np.testing.assert_allclose(record[:, 0], np.arange(500) / signals.DEFAULT_SAMPLE_RATE)
+
+
+def test_save_and_load_batch(tmp_path):
+    batch = signals.multisine_batch(3, 2.0, components=2, rng=0)
+    path = str(tmp_path / "batch.npz")
+    signals.save_batch(path, batch, sample_rate=100.0, seed=0, model="multisine")
+    loaded, sample_rate, metadata = signals.load_batch(path)
+    np.testing.assert_array_equal(loaded, batch)
+    assert sample_rate == 100.0
+    assert metadata == {"seed": 0, "model": "multisine"}
+    np.testing.assert_array_equal(signals.batch_record(loaded, 2, component=1)[:, 1], batch[2, 1])
@@ -0,0 +1,46 @@
+"""
+Uploads and playback against the firmware simulator.
+"""
+import numpy as np
+import pytest
+
+from shakebot.device import MOTION_COMPLETED
+
+SAMPLE_RATE = 100.0
+START_STEPS = 1000  # The simulator's carriage starts 0.1 m from the left limit: 0.1 / 0.02 * 200 steps
+
+
+def ramp_steps(samples=100, peak=400):
+    """Step counts that move the carriage `peak` steps out from where it starts and back."""
+    half = START_STEPS + np.linspace(0, peak, samples // 2)
+    return np.round(np.concatenate([half, half[::-1]])).astype(np.int64)
+
+
+@pytest.mark.parametrize("binary", [False, True], ids=["ascii", "binary"])
+def test_upload_and_start(simulator, table, binary):
+    steps = ramp_steps()
+    stats = table.upload(steps, binary=binary, sample_rate=SAMPLE_RATE)
+    assert stats["samples"] == len(steps)
+    assert stats["retransmissions"] == 0
+    if binary:
+        assert stats["frames"] >= 1
+
+    table.start()
+    line = table.wait_for(MOTION_COMPLETED, timeout=10.0)
+    assert line.startswith(MOTION_COMPLETED)
+
+    report = simulator.runs[-1]
+    assert report["mode"] == "buffer"
+    assert report["samples"] == len(steps)
+    assert report["underruns"] == 0
+    assert report["max_error_m"] < 0.001
+    assert report["duration_ms"] == pytest.approx(len(steps) / SAMPLE_RATE * 1000, abs=20)
+
+
+def test_runs_accumulate(simulator, table):
+    for peak in (200, 400):
+        table.upload(ramp_steps(peak=peak), sample_rate=SAMPLE_RATE)
+        table.start()
+        table.wait_for(MOTION_COMPLETED, timeout=10.0)
+    assert len(simulator.runs) == 2
+    assert np.max(simulator.runs[0]["commanded"]) < np.max(simulator.runs[1]["commanded"])
@@ -0,0 +1,173 @@
+"""
+StationIndex queries on synthetic stations, checked against obspy's ellipsoidal gps2dist_azimuth.
+"""
+import types
+
+import numpy as np
+import pytest
+from obspy.geodetics import gps2dist_azimuth
+
+from shakebot import stations
+from shakebot.cache import WaveformCache
+from shakebot.stations import StationIndex
+
+EVENTS = [
+    {"latitude": 35.0, "longitude": -106.5, "time": "2020-06-01T00:00:00"},
+    {"latitude": 36.5, "longitude": -105.0, "time": "2012-01-01T00:00:00"},
+]
+DISTANCE_TOLERANCE = 0.01  # Spherical vs. ellipsoidal distances differ by up to about 0.5%
+AZIMUTH_TOLERANCE = 0.5    # Degrees
+
+
+@pytest.fixture(scope="module")
+def rows():
+    # 300 stations scattered within about 300 km of the events, some of them only running part of the time
+    rng = np.random.default_rng(7)
+    latitude = rng.uniform(33.0, 38.5, 300)
+    longitude = rng.uniform(-109.0, -102.5, 300)
+    rows = []
+    for i, (lat, lon) in enumerate(zip(latitude, longitude)):
+        starttime, endtime = "2000-01-01T00:00:00", None
+        if i % 5 == 1:
+            starttime = "2015-01-01T00:00:00"  # Not yet running for the second event
+        elif i % 5 == 2:
+            endtime = "2018-01-01T00:00:00"    # Already closed for the first event
+        elif i % 5 == 3:
+            starttime = None                   # No start date counts as running
+        rows.append({"network": "XX", "station": f"S{i:03d}", "location": "00", "channels": "BHE,BHN,BHZ",
+                     "latitude": float(lat), "longitude": float(lon), "starttime": starttime, "endtime": endtime})
+    return rows
+
+
+@pytest.fixture(scope="module")
+def index(rows):
+    return StationIndex(rows)
+
+
+def geodesic(event, row):
+    # Distance in km and azimuth from the event to the station on the WGS84 ellipsoid
+    distance_m, azimuth, _ = gps2dist_azimuth(event["latitude"], event["longitude"], row["latitude"],
+                                              row["longitude"])
+    return distance_m / 1000.0, azimuth
+
+
+def running(row, time):
+    return (row["starttime"] is None or row["starttime"] <= time) and (row["endtime"] is None or time <= row["endtime"])
+
+
+def in_window(azimuth, low, high):
+    return low <= azimuth <= high if low <= high else azimuth >= low or azimuth <= high
+
+
+def near(value, bound, tolerance):
+    return abs(value - bound) <= tolerance
+
+
+def check_selection(found, expected, borderline):
+    # The index must find every clear-cut station and nothing else; stations within the
+    # spherical/ellipsoidal difference of a boundary may go either way
+    assert expected - borderline <= found
+    assert found <= expected | borderline
+
+
+def test_distance_and_azimuth_match_gps2dist(index, rows):
+    event = EVENTS[0]
+    distance, azimuth, back_azimuth = stations.distance_azimuth(event["latitude"], event["longitude"],
+                                                                index.latitude, index.longitude)
+    for i, row in enumerate(rows):
+        distance_m, expected_azimuth, expected_back = gps2dist_azimuth(event["latitude"], event["longitude"],
+                                                                       row["latitude"], row["longitude"])
+        assert distance[i] == pytest.approx(distance_m / 1000.0, rel=0.005)
+        assert abs((azimuth[i] - expected_azimuth + 180.0) % 360.0 - 180.0) < AZIMUTH_TOLERANCE
+        assert abs((back_azimuth[i] - expected_back + 180.0) % 360.0 - 180.0) < AZIMUTH_TOLERANCE
+
+
+def test_pairs_distance_band_azimuth_through_north_and_operating_time(index, rows):
+    min_km, max_km, window = 40.0, 150.0, (300.0, 60.0)
+    pairs = index.pairs(EVENTS, max_km, min_km=min_km, azimuth=window)
+    assert len(pairs["event"])
+
+    for e, event in enumerate(EVENTS):
+        found = {int(i) for i in pairs["station"][pairs["event"] == e]}
+        expected, borderline = set(), set()
+        for i, row in enumerate(rows):
+            distance, azimuth = geodesic(event, row)
+            if not running(row, event["time"]):
+                continue
+            if (any(near(distance, bound, DISTANCE_TOLERANCE * bound) for bound in (min_km, max_km))
+                    or any(near(azimuth, bound, AZIMUTH_TOLERANCE) for bound in window)):
+                borderline.add(i)
+            if min_km <= distance <= max_km and in_window(azimuth, *window):
+                expected.add(i)
+        check_selection(found, expected, borderline)
+        # Both sides of north are in the window
+        azimuths = pairs["azimuth"][pairs["event"] == e]
+        assert np.any(azimuths > 300.0) and np.any(azimuths < 60.0)
+        assert not np.any((azimuths > 60.0) & (azimuths < 300.0))
+
+    # Sorted by event and then distance
+    assert np.all(np.diff(pairs["event"]) >= 0)
+    for e in range(len(EVENTS)):
+        assert np.all(np.diff(pairs["distance_km"][pairs["event"] == e]) >= 0)
+
+
+def test_pairs_operating_filter(index, rows):
+    with_time = index.pairs(EVENTS, 200.0)
+    without_time = index.pairs(EVENTS, 200.0, operating=False)
+    assert len(with_time["event"]) < len(without_time["event"])
+    for e, i in zip(with_time["event"], with_time["station"]):
+        assert running(rows[i], EVENTS[e]["time"])
+    # Stations that were not running at the time are only in the unfiltered pairs
+    dropped = set(zip(without_time["event"].tolist(), without_time["station"].tolist())) - set(
+        zip(with_time["event"].tolist(), with_time["station"].tolist()))
+    assert dropped and all(not running(rows[i], EVENTS[e]["time"]) for e, i in dropped)
+
+
+def test_within(index, rows):
+    event = EVENTS[0]
+    radius = 120.0
+    result = index.within(event["latitude"], event["longitude"], radius, time=event["time"])
+    found = {int(r["station"][1:]) for r in result}
+    expected, borderline = set(), set()
+    for i, row in enumerate(rows):
+        distance, _ = geodesic(event, row)
+        if near(distance, radius, DISTANCE_TOLERANCE * radius):
+            borderline.add(i)
+        if distance <= radius and running(row, event["time"]):
+            expected.add(i)
+    check_selection(found, expected, borderline)
+
+    distances = [r["distance_km"] for r in result]
+    assert distances == sorted(distances)
+    for r in result:
+        expected_km, expected_azimuth = geodesic(event, rows[int(r["station"][1:])])
+        assert r["distance_km"] == pytest.approx(expected_km, rel=0.005)
+        assert abs((r["azimuth"] - expected_azimuth + 180.0) % 360.0 - 180.0) < AZIMUTH_TOLERANCE
+
+
+def test_nearest_with_time_filter(index, rows):
+    event = EVENTS[1]
+    result = index.nearest(event["latitude"], event["longitude"], k=5, time=event["time"])
+    assert len(result) == 5
+
+    # The five nearest stations that were running in 2012, by ellipsoidal distance
+    candidates = sorted((geodesic(event, row)[0], i) for i, row in enumerate(rows) if running(row, event["time"]))
+    assert [int(r["station"][1:]) for r in result] == [i for _, i in candidates[:5]]
+    assert all(running(rows[int(r["station"][1:])], event["time"]) for r in result)
+
+    # Without the filter, the nearest station may be one that only opened later
+    unfiltered = index.nearest(event["latitude"], event["longitude"], k=5)
+    assert [int(r["station"][1:]) for r in unfiltered] == [i for _, i in sorted(
+        (geodesic(event, row)[0], i) for i, row in enumerate(rows))[:5]]
+
+    assert index.nearest(event["latitude"], event["longitude"], k=3, max_km=1.0) == []
+
+
+def test_load_index_without_update_needs_stations(tmp_path, rows):
+    cache = WaveformCache(str(tmp_path))
+    client = types.SimpleNamespace(cache=cache)
+    try:
+        with pytest.raises(LookupError, match="stations --update"):
+            stations.load_index(client, update=False)
+    finally:
+        cache.close()
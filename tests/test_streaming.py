@@ -0,0 +1,90 @@
+"""
+Streaming records longer than the controller buffer through the firmware simulator.
+"""
+import numpy as np
+import pytest
+
+from shakebot.device import MICRO_BUFFER_SIZE, Shakebot
+from shakebot.protocol import FRAME_SYNC, decode_frame
+from shakebot.simulator import FakeSerial, FirmwareSimulator
+
+SAMPLE_RATE = 100.0
+HOME = 0.1  # m; where the simulator's carriage starts
+
+
+@pytest.fixture
+def micro():
+    """Started Micro simulator, whose 300-sample buffer a few seconds of record overflow."""
+    sim = FirmwareSimulator(board="micro", speedup=10.0).start()
+    yield sim
+    sim.stop()
+
+
+class LosingSerial(FakeSerial):
+    """FakeSerial that drops the ACK replies listed in `lose` (by ACK count) and keeps the frames it writes."""
+
+    def __init__(self, simulator, lose=(), timeout=0.1):
+        super().__init__(simulator, timeout=timeout)
+        self.lose = set(lose)
+        self.acks = 0
+        self.frames = []
+
+    def write(self, data):
+        if bytes(data[:2]) == FRAME_SYNC:
+            self.frames.append(bytes(data))
+        return super().write(data)
+
+    def readline(self):
+        line = super().readline()
+        if line.startswith(b"ACK"):
+            self.acks += 1
+            if self.acks - 1 in self.lose:
+                return b""
+        return line
+
+
+def long_record(samples=5 * MICRO_BUFFER_SIZE):
+    # A slow sine around the carriage's starting position, five buffers long
+    time = np.arange(samples) / SAMPLE_RATE
+    return np.column_stack((time, HOME + 0.005 * np.sin(2 * np.pi * 0.5 * time)))
+
+
+def test_stream_longer_than_buffer(micro):
+    table = Shakebot(FakeSerial(micro, timeout=0.1), board="micro")
+    table.send_parameters()
+    data = long_record()
+    with pytest.raises(ValueError, match="holds"):
+        table.record_to_steps(data)
+
+    stats = table.stream(data)
+    assert stats["samples"] == len(data)
+    assert stats["underruns"] == 0
+    assert stats["capacity"] == MICRO_BUFFER_SIZE
+    assert stats["retransmissions"] == 0
+    assert stats["completed"].startswith("Motion completed")
+
+    report = micro.runs[-1]
+    assert report["mode"] == "stream"
+    assert report["underruns"] == 0
+    assert report["samples"] == len(data)
+    np.testing.assert_array_equal(report["commanded"], table.record_to_steps(data, check_buffer=False))
+    assert report["max_error_m"] < 0.001
+
+
+def test_stream_recovers_a_lost_ack(micro):
+    port = LosingSerial(micro, lose={2})
+    table = Shakebot(port, board="micro")
+    table.send_parameters()
+    data = long_record(3 * MICRO_BUFFER_SIZE)
+
+    # Without the third ACK the frame is sent again; the controller already has it and replies NAK <end> OFFSET
+    stats = table.stream(data, timeout=0.5)
+    assert stats["retransmissions"] == 1
+    offsets = [decode_frame(frame)[0] for frame in port.frames]
+    assert offsets[:5] == [0, 32, 64, 64, 96]
+    assert stats["samples"] == len(data)
+    assert stats["underruns"] == 0
+
+    report = micro.runs[-1]
+    assert report["underruns"] == 0
+    np.testing.assert_array_equal(report["commanded"], table.record_to_steps(data, check_buffer=False))
@@ -0,0 +1,78 @@
+"""
+TelemetryRecorder on synthetic controller output.
+"""
+import numpy as np
+
+from shakebot.telemetry import (PACKET_HEADER, SAMPLE_DTYPE, TelemetryRecorder, encode_packet, synthetic_stream,
+                                to_physical)
+
+RATE = 400
+
+
+def acceleration(samples):
+    time = np.arange(samples) / RATE
+    return np.column_stack((np.sin(2 * np.pi * 2 * time), np.zeros(samples), np.ones(samples)))
+
+
+def feed_in_chunks(recorder, stream, size=13):
+    lines = []
+    for i in range(0, len(stream), size):
+        lines += recorder.feed(stream[i:i + size])
+    return lines
+
+
+def test_samples_lines_and_drops():
+    expected = acceleration(200)
+    lines = [f"line {i}" for i in range(10)]
+    stream = synthetic_stream(expected, rate=RATE, drop=[5, 6, 100], lines=lines)
+    recorder = TelemetryRecorder(1000)
+
+    assert feed_in_chunks(recorder, stream) == lines
+    assert recorder.finished
+    assert recorder.stats["dropped"] == 3
+    assert recorder.stats["samples"] == 197
+    assert recorder.stats["crc_errors"] == 0
+
+    kept = np.delete(np.arange(200), [5, 6, 100])
+    measured = to_physical(recorder.data)["acceleration"] / 9.80665
+    np.testing.assert_allclose(measured, expected[kept], atol=0.004)
+
+
+def test_overflow():
+    recorder = TelemetryRecorder(50)
+    recorder.feed(synthetic_stream(acceleration(120), rate=RATE))
+
+    assert recorder.count == 50
+    assert recorder.stats["overflow"] == 70
+    assert recorder.finished
+
+
+def test_corrupt_packet_resynchronises_on_next_header():
+    samples = np.zeros(4, dtype=SAMPLE_DTYPE)
+    good = encode_packet(samples, 0)
+    bad = bytearray(encode_packet(samples, 4))
+    bad[12] ^= 0xFF  # Payload byte: the CRC no longer matches
+    # The payload of the corrupt packet also contains a stray sync byte that must not be read as text
+    bad[20] = PACKET_HEADER[0]
+    stream = (good + b"before\r\n" + bytes(bad) + b"after\r\n" + encode_packet(samples, 8)
+              + encode_packet(samples[:0], 12))
+    recorder = TelemetryRecorder(100)
+
+    assert feed_in_chunks(recorder, stream, size=5) == ["before", "after"]
+    assert recorder.stats["crc_errors"] == 1
+    assert recorder.stats["samples"] == 8
+    assert recorder.stats["dropped"] == 4
+    assert recorder.finished
+
+
+def test_corrupt_count_resynchronises_on_next_header():
+    samples = np.zeros(4, dtype=SAMPLE_DTYPE)
+    bad = bytearray(encode_packet(samples, 0))
+    bad[7] = 6  # Claims 6 samples: the next packet starts inside the claimed size
+    stream = bytes(bad) + encode_packet(samples, 4) + encode_packet(samples, 8) + encode_packet(samples[:0], 12)
+    recorder = TelemetryRecorder(100)
+
+    assert feed_in_chunks(recorder, stream) == []
+    assert recorder.stats["crc_errors"] == 1
+    assert recorder.stats["samples"] == 8
+    assert recorder.finished
@@ -0,0 +1,74 @@
+"""
+TravelTimeTable lookups on a small synthetic grid (no obspy needed).
+"""
+import numpy as np
+import pytest
+
+from shakebot import traveltimes
+from shakebot.traveltimes import KM_PER_DEGREE, TravelTimeTable
+
+DISTANCES = np.array([0.0, 1.0, 3.0, 10.0])  # Degrees; cells of different widths
+DEPTHS = np.array([0.0, 10.0, 50.0])         # km
+
+
+def linear_p(distance_deg, depth_km):
+    # Bilinear interpolation reproduces a function that is linear along each axis exactly
+    return 5.0 + 12.0 * distance_deg + 0.1 * depth_km + 0.01 * distance_deg * depth_km
+
+
+@pytest.fixture
+def table():
+    distance, depth = np.meshgrid(DISTANCES, DEPTHS)
+    p = linear_p(distance, depth)
+    s = 1.8 * p
+    s[:, -1] = np.nan  # No S phase at the farthest distance
+    return TravelTimeTable(DISTANCES, DEPTHS, p, s, model="synthetic")
+
+
+def test_interpolation_on_non_uniform_axes(table):
+    distance_deg = np.array([0.0, 0.5, 2.0, 2.9, 7.5, 10.0])
+    depth_km = np.array([0.0, 5.0, 30.0, 49.0, 10.0, 50.0])
+    expected = linear_p(distance_deg, depth_km)
+    np.testing.assert_allclose(table.p_time(distance_deg * KM_PER_DEGREE, depth_km), expected)
+    np.testing.assert_allclose(table._interpolate(table.p, distance_deg * KM_PER_DEGREE, depth_km), expected)
+
+
+def test_broadcasting(table):
+    p = table.p_time(np.array([[1.0], [2.0]]) * KM_PER_DEGREE, np.array([0.0, 10.0, 20.0]))
+    assert p.shape == (2, 3)
+    assert np.ndim(table.p_time(100.0)) == 0
+
+
+def test_clipping_beyond_the_grid(table):
+    far = table.p_time(np.array([10.0, 40.0]) * KM_PER_DEGREE, np.array([50.0, 700.0]))
+    assert far[0] == far[1] == pytest.approx(linear_p(10.0, 50.0))
+    assert table.p_time(-5.0, -3.0) == pytest.approx(linear_p(0.0, 0.0))
+
+
+def test_nan_s_times(table):
+    p, s = table.arrivals(np.array([2.0, 5.0, 10.0]) * KM_PER_DEGREE, 10.0)
+    assert np.all(np.isfinite(p))
+    assert s[0] == pytest.approx(1.8 * p[0])
+    assert np.isnan(s[1]) and np.isnan(s[2])  # Cells next to the missing phase have no S time
+
+
+def test_windows(table):
+    distance_km = np.array([0.0, 2.0, 8.0]) * KM_PER_DEGREE
+    start, end = table.windows(distance_km, 0.0, duration=60.0, padding=20.0)
+    p = table.p_time(distance_km, 0.0)
+    np.testing.assert_allclose(end, p + 60.0)
+    np.testing.assert_allclose(start, np.maximum(p - 20.0, 0.0))
+    assert start[0] == 0.0  # Never before the origin
+
+
+def test_save_load_and_missing_table(table, tmp_path):
+    path = str(tmp_path / "synthetic.npz")
+    with pytest.raises(FileNotFoundError, match="--generate"):
+        traveltimes.load_table("synthetic", path=path)
+
+    table.save(path)
+    loaded = traveltimes.load_table("synthetic", path=path)
+    assert loaded.model == "synthetic"
+    np.testing.assert_array_equal(loaded.p, table.p)
+    assert traveltimes.load_table("synthetic", path=path) is loaded
+    traveltimes._tables.pop(path)
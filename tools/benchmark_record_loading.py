@@ -0,0 +1,105 @@
+"""
+Compare load time and peak memory of the record loaders.
+
+    python tools/benchmark_record_loading.py --rows 4000000
+
+Writes one synthetic record in every supported format to a temporary
+directory, then loads each file in a fresh Python process (so page cache and
+memory high-water marks do not leak between runs) and prints the wall time and
+the peak RSS growth of the load, including touching every sample (Linux only).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO)
+
+# The loading code before shakebot.records.load_record existed
+OLD_PATH = """
+import pandas as pd
+df = pd.read_csv(path)
+df.columns = df.columns.str.strip()
+time_columns = [col for col in df.columns if "time" in col.lower()]
+displacement_columns = [col for col in df.columns if "displacement" in col.lower()]
+data = np.column_stack((df[time_columns[0]].values, df[displacement_columns[0]].values))
+"""
+
+CHILD = """
+import sys, time
+import numpy as np
+sys.path.insert(0, {repo!r})
+from shakebot.records import load_record
+path, cache_dir = {path!r}, {cache_dir!r}
+import pandas, pyarrow.csv, pyarrow.parquet, h5py  # Import cost is not part of the measurement
+
+def peak_rss():
+    # VmHWM belongs to this process image; ru_maxrss would include the parent's peak
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM"))
+
+before = peak_rss()
+start = time.perf_counter()
+{load}
+checksum = float(np.asarray(data)[:, 1].sum())  # Touch every sample
+elapsed = time.perf_counter() - start
+after = peak_rss()
+print(elapsed, (after - before) / 1024, len(data))
+"""
+
+
+def measure(path, load, cache_dir):
+    code = CHILD.format(repo=REPO, path=path, cache_dir=cache_dir, load=load)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    seconds, megabytes, rows = output.split()
+    return float(seconds), float(megabytes), int(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=4_000_000, help="Samples in the record (default: 4000000).")
+    parser.add_argument("--dir", default=None, help="Directory for the test files (default: a temporary one).")
+    args = parser.parse_args()
+
+    import h5py
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from shakebot.records import save_csv
+
+    directory = args.dir or tempfile.mkdtemp(prefix="shakebot-bench-")
+    cache_dir = os.path.join(directory, "sidecars")
+    rng = np.random.default_rng(0)
+    data = np.column_stack((np.arange(args.rows) / 100.0, np.cumsum(rng.standard_normal(args.rows)) * 1e-4))
+
+    paths = {ext: os.path.join(directory, "record" + ext) for ext in (".csv", ".npy", ".parquet", ".h5")}
+    print(f"Writing {args.rows} samples to {directory} ...")
+    save_csv(paths[".csv"], data)
+    np.save(paths[".npy"], data)
+    pq.write_table(pa.table({"Time (s)": data[:, 0], "Displacement (m)": data[:, 1]}), paths[".parquet"])
+    with h5py.File(paths[".h5"], "w") as f:
+        f.create_dataset("record", data=data)
+    print(f"CSV size: {os.path.getsize(paths['.csv']) / 1e6:.0f} MB\n")
+
+    cases = [
+        ("csv, pandas + column_stack (old)", paths[".csv"], OLD_PATH),
+        ("csv, load_record without sidecar", paths[".csv"], "data = load_record(path, sidecar=False)"),
+        ("csv, load_record, sidecar cold", paths[".csv"], "data = load_record(path, cache_dir=cache_dir)"),
+        ("csv, load_record, sidecar warm", paths[".csv"], "data = load_record(path, cache_dir=cache_dir)"),
+        ("npy, memory-mapped", paths[".npy"], "data = load_record(path)"),
+        ("parquet", paths[".parquet"], "data = load_record(path)"),
+        ("hdf5, memory-mapped", paths[".h5"], "data = load_record(path)"),
+    ]
+    print(f"{'case':<36}{'seconds':>10}{'peak RSS MB':>14}")
+    for name, path, load in cases:
+        seconds, megabytes, rows = measure(path, load, cache_dir)
+        assert rows == args.rows, (name, rows)
+        print(f"{name:<36}{seconds:>10.3f}{megabytes:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import os
+import sys
 from obspy.clients.fdsn import Client
 from obspy import UTCDateTime
 from obspy.geodetics import gps2dist_azimuth
@@ -5,8 +7,12 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# Initialize a client to download data from IRIS
-client = Client("IRIS")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shakebot.cache import CachedClient, WaveformCache
+from shakebot.iris import WINDOW_PADDING, p_wave_arrival, process_stream
+
+# Initialize a client to download data from IRIS, keeping a local copy of every download
+client = CachedClient(WaveformCache(), Client("IRIS"))
 
 # Specify the earthquake event time (Example: 2010 Chile earthquake)
 event_time = UTCDateTime("2010-02-27T06:34:14")
@@ -34,23 +40,16 @@ station_lon = inv[0][0].longitude
 distance_m, az, baz = gps2dist_azimuth(eq_lat, eq_lon, station_lat, station_lon)
 distance_km = distance_m / 1000  # Convert to kilometers
 
-# Assume an average P-wave velocity of 6 km/s
-p_wave_velocity = 6.0  # km/s
-
-# Calculate the P-wave travel time (distance / velocity)
-p_wave_travel_time = distance_km / p_wave_velocity
-p_wave_arrival_time = event_time + p_wave_travel_time
+# Look up the P-wave arrival in the iasp91 travel-time table (generated on first use)
+p_wave_arrival_time = p_wave_arrival(event_time, distance_km, eq_depth)
+p_wave_travel_time = p_wave_arrival_time - event_time
 
 # Print the P-wave travel time and arrival time
 print(f"P-wave travel time: {p_wave_travel_time:.2f} seconds")
 print(f"P-wave arrival time: {p_wave_arrival_time}")
 
-# Define the pre-filter for response removal (this should match the frequency range of interest)
-# The values are usually chosen based on the frequency content of the signal.
-pre_filt = (0.01, 0.02, 30.0, 35.0)  # (f1, f2, f3, f4) - lowpass and highpass filter corner frequencies
-
-# Download waveform data for all three channels
-start_time = event_time
+# Download waveform data for all three channels, only around the P-wave arrival
+start_time = max(event_time, p_wave_arrival_time - WINDOW_PADDING)
 end_time = p_wave_arrival_time + 60  # 1 minute after P-wave arrival
 st = client.get_waveforms(network, station, location, ",".join(channels), start_time, end_time)
 
@@ -58,23 +57,8 @@ st = client.get_waveforms(network, station, location, ",".join(channels), start_
 inv = client.get_stations(network=network, station=station, location=location, 
                           channel="BH*", starttime=start_time, endtime=end_time, level="response")
 
-# Remove the instrument response to convert the raw data to acceleration (m/s²)
-st.remove_response(inventory=inv, output="ACC", pre_filt=pre_filt)  # Convert to acceleration
-
-# Convert acceleration to displacement by performing double integration
-st_disp = st.copy()
-st_disp.integrate()  # First integration to get velocity
-st_disp.integrate()  # Second integration to get displacement
-
-# Resample the data to 100 Hz (if the original sampling rate is different)
-target_sampling_rate = 100.0  # Desired frequency in Hz
-for tr in st_disp:
-    # Resample to the target frequency (100 Hz)
-    tr.resample(sampling_rate=target_sampling_rate)
-
-# Truncate the waveform to 1 minute after the P-wave arrival
-for tr in st_disp:
-    tr.trim(starttime=p_wave_arrival_time, endtime=p_wave_arrival_time + 60)
+# Remove the response, integrate to displacement, resample to 100 Hz and keep 1 minute after the P-wave arrival
+st_disp = process_stream(st, inv, p_wave_arrival_time, 60)
 
 # Initialize a dictionary to store displacement data for all channels
 displacement_data = {}
@@ -1,8 +1,12 @@
 import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shakebot.signals import random_ground_motion
+
 # Create a directory called "data" if it doesn't exist
 os.makedirs("../data", exist_ok=True)
 
@@ -11,27 +15,9 @@ duration = 10  # Duration of the signal in seconds
 sampling_rate = 100  # Sampling rate in Hz (100 samples per second)
 time = np.arange(0, duration, 1/sampling_rate)  # Time array
 
-# Generate random frequencies and amplitudes
-num_frequencies = np.random.randint(3, 6)  # Random number of frequency components (between 3 and 5)
-frequencies = np.random.uniform(0.5, 5.0, num_frequencies)  # Frequencies between 0.5 Hz and 5 Hz
-amplitudes = np.random.uniform(0.01, 0.05, num_frequencies)  # Amplitudes between 0.01 and 0.05 meters
-
-# Generate random phase shifts
-phases = np.random.uniform(0, 2 * np.pi, num_frequencies)
-
-# Generate a synthetic displacement signal with random frequencies, amplitudes, and phases
-displacement = np.zeros_like(time)
-for freq, amp, phase in zip(frequencies, amplitudes, phases):
-    displacement += amp * np.sin(2 * np.pi * freq * time + phase)
-
-# Add a decaying envelope to simulate how seismic waves taper off over time
-decay_rate = np.random.uniform(0.01, 0.05)  # Random decay rate between 0.01 and 0.05
-envelope = np.exp(-decay_rate * time)
-displacement *= envelope
-
-# Add random noise to simulate real-world variability
-noise_amplitude = np.random.uniform(0.002, 0.01)  # Random noise amplitude between 0.002 and 0.01
-displacement += noise_amplitude * np.random.randn(len(time))
+# Random sinusoids under a decaying envelope plus noise; change the seed for a different record
+seed = 0
+displacement = random_ground_motion(duration, sampling_rate, rng=seed)[:, 1]
 
 # Save the synthetic ground motion to a CSV file in the "data" folder
 df = pd.DataFrame({